@@ -0,0 +1,77 @@
+"""
+Контроль допуска запросов на запись (token bucket).
+
+В момент открытия записи все ученики одновременно нажимают кнопки, и запросы
+выстраиваются в очередь за блокировкой записи SQLite — часть из них не дожидается
+ответа и падает по таймауту. Ведро токенов пропускает не больше REGISTRATION_RATE
+запросов в секунду (с запасом REGISTRATION_BURST на всплеск). Запрос, которому
+токен достанется в пределах REGISTRATION_MAX_WAIT секунд, ждет своей очереди;
+остальные сразу получают 429 с Retry-After, и бот повторяет их позже.
+"""
+import asyncio
+import math
+import os
+import time
+
+from fastapi import HTTPException
+
+import metrics
+
+REGISTRATION_RATE = float(os.getenv("REGISTRATION_RATE", "20"))
+REGISTRATION_BURST = float(os.getenv("REGISTRATION_BURST", "40"))
+REGISTRATION_MAX_WAIT = float(os.getenv("REGISTRATION_MAX_WAIT", "2"))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        if rate <= 0 or capacity < 1:
+            raise ValueError("Скорость должна быть больше нуля, емкость — не меньше 1")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, max_wait: float) -> float:
+        """
+        Бронирует токен и возвращает, сколько секунд ждать до него.
+        Если ждать дольше max_wait, токен не бронируется и возвращается -1.
+
+        Токены уходят в минус на число ожидающих, поэтому порядок — FIFO
+        и ожидание каждого следующего честно учитывает очередь перед ним.
+        """
+        self._refill(time.monotonic())
+        wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+        if wait > max_wait:
+            return -1
+        self.tokens -= 1
+        return wait
+
+    def retry_after(self) -> float:
+        """Через сколько секунд появится свободный токен"""
+        self._refill(time.monotonic())
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+registration_bucket = TokenBucket(REGISTRATION_RATE, REGISTRATION_BURST)
+
+
+async def admit_registration():
+    """Зависимость FastAPI для эндпоинтов записи"""
+    wait = registration_bucket.reserve(REGISTRATION_MAX_WAIT)
+    if wait < 0:
+        metrics.admission_requests_total.inc("registration", "rejected")
+        raise HTTPException(
+            status_code=429,
+            detail="Слишком много запросов на запись, попробуйте через несколько секунд",
+            headers={"Retry-After": str(math.ceil(registration_bucket.retry_after()))}
+        )
+    if wait > 0:
+        metrics.admission_requests_total.inc("registration", "delayed")
+        metrics.admission_wait_seconds.observe(wait, "registration")
+        await asyncio.sleep(wait)
+    else:
+        metrics.admission_requests_total.inc("registration", "admitted")
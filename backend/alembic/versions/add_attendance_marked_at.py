@@ -0,0 +1,25 @@
+"""add exam_registration.attendance_marked_at for check-in sync
+
+Revision ID: add_attendance_marked_at
+Revises: add_registration_rollup
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_attendance_marked_at'
+down_revision = 'add_registration_rollup'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Время последней отметки явки/сдачи: по нему разрешаются конфликты при синхронизации
+    op.add_column('exam_registration', sa.Column('attendance_marked_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('exam_registration', 'attendance_marked_at')
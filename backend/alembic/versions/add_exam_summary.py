@@ -0,0 +1,44 @@
+"""add exam_summary table
+
+Revision ID: add_exam_summary
+Revises: add_seat_assignment
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_exam_summary'
+down_revision = 'add_seat_assignment'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Сводка результатов по (ученик, тип экзамена). Заполняется при старте
+    # приложения задачей rebuild_exam_summaries: баллы считаются в Python (scoring.py)
+    op.create_table(
+        'exam_summary',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('student_id', sa.Integer(), nullable=False),
+        sa.Column('exam_type_id', sa.Integer(), nullable=False),
+        sa.Column('exam_id', sa.Integer(), nullable=False),
+        sa.Column('primary_score', sa.Integer(), nullable=False),
+        sa.Column('scaled_score', sa.Integer(), nullable=False),
+        sa.Column('percentile', sa.Float(), nullable=False),
+        sa.Column('delta', sa.Integer(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['student_id'], ['student.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['exam_type_id'], ['exam_types.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['exam_id'], ['exam.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('student_id', 'exam_type_id', name='uq_exam_summary_student_type')
+    )
+    op.create_index('ix_exam_summary_exam_type', 'exam_summary', ['exam_type_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_exam_summary_exam_type', table_name='exam_summary')
+    op.drop_table('exam_summary')
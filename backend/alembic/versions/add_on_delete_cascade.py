@@ -0,0 +1,86 @@
+"""add ON DELETE CASCADE to foreign keys
+
+Revision ID: add_on_delete_cascade
+Revises: add_max_registrations
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_on_delete_cascade'
+down_revision = 'add_max_registrations'
+branch_labels = None
+depends_on = None
+
+
+# Имена для безымянных внешних ключей, созданных через create_all
+NAMING_CONVENTION = {
+    "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
+}
+
+# Таблица -> {колонка: (таблица-родитель, действие при удалении родителя)}
+FOREIGN_KEYS = {
+    'group_student': {
+        'group_id': ('study_group', 'CASCADE'),
+        'student_id': ('student', 'CASCADE'),
+    },
+    'exam_types': {
+        'group_id': ('study_group', 'CASCADE'),
+    },
+    'exam': {
+        'exam_type_id': ('exam_types', 'CASCADE'),
+        'id_student': ('student', 'CASCADE'),
+    },
+    'exam_registration': {
+        'student_id': ('student', 'CASCADE'),
+        'probnik_id': ('probnik', 'SET NULL'),
+    },
+}
+
+
+def _rebuild_foreign_keys(table, columns, with_ondelete):
+    """Пересоздает внешние ключи таблицы (в SQLite это делается копированием таблицы)"""
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+
+    if table not in inspector.get_table_names():
+        return
+
+    existing_columns = [col['name'] for col in inspector.get_columns(table)]
+    existing_fks = inspector.get_foreign_keys(table)
+
+    with op.batch_alter_table(table, recreate='always', naming_convention=NAMING_CONVENTION) as batch_op:
+        for fk in existing_fks:
+            column = fk['constrained_columns'][0]
+            if column not in columns:
+                continue
+            name = fk['name'] or NAMING_CONVENTION['fk'] % {
+                'table_name': table,
+                'column_0_name': column,
+                'referred_table_name': fk['referred_table'],
+            }
+            batch_op.drop_constraint(name, type_='foreignkey')
+
+        for column, (referred_table, ondelete) in columns.items():
+            if column not in existing_columns:
+                continue
+            batch_op.create_foreign_key(
+                f'fk_{table}_{column}_{referred_table}',
+                referred_table,
+                [column],
+                ['id'],
+                ondelete=ondelete if with_ondelete else None
+            )
+
+
+def upgrade() -> None:
+    for table, columns in FOREIGN_KEYS.items():
+        _rebuild_foreign_keys(table, columns, with_ondelete=True)
+
+
+def downgrade() -> None:
+    for table, columns in FOREIGN_KEYS.items():
+        _rebuild_foreign_keys(table, columns, with_ondelete=False)
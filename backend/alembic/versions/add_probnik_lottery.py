@@ -0,0 +1,58 @@
+"""add probnik lottery window and lottery_request table
+
+Revision ID: add_probnik_lottery
+Revises: add_waitlist
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_probnik_lottery'
+down_revision = 'add_waitlist'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Режим лотереи при открытии записи на пробник
+    op.add_column('probnik', sa.Column('lottery_minutes', sa.Integer(), nullable=True))
+    op.add_column('probnik', sa.Column('lottery_ends_at', sa.DateTime(), nullable=True))
+    op.add_column('probnik', sa.Column('lottery_seed', sa.Integer(), nullable=True))
+    op.add_column('probnik', sa.Column('lottery_drawn_at', sa.DateTime(), nullable=True))
+    
+    # Заявки, собранные в окно лотереи
+    op.create_table(
+        'lottery_request',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('student_id', sa.Integer(), nullable=False),
+        sa.Column('probnik_id', sa.Integer(), nullable=False),
+        sa.Column('subject', sa.String(length=100), nullable=False),
+        sa.Column('exam_date', sa.DateTime(), nullable=False),
+        sa.Column('exam_time', sa.String(length=10), nullable=False),
+        sa.Column('school', sa.String(length=100), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('registration_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['student_id'], ['student.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['probnik_id'], ['probnik.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['registration_id'], ['exam_registration.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('student_id', 'probnik_id', 'subject', 'exam_date', 'exam_time', name='uq_lottery_request_student_slot')
+    )
+    op.create_index(op.f('ix_lottery_request_id'), 'lottery_request', ['id'], unique=False)
+    op.create_index(op.f('ix_lottery_request_student_id'), 'lottery_request', ['student_id'], unique=False)
+    op.create_index('ix_lottery_request_probnik_status', 'lottery_request', ['probnik_id', 'status'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_lottery_request_probnik_status', table_name='lottery_request')
+    op.drop_index(op.f('ix_lottery_request_student_id'), table_name='lottery_request')
+    op.drop_index(op.f('ix_lottery_request_id'), table_name='lottery_request')
+    op.drop_table('lottery_request')
+    op.drop_column('probnik', 'lottery_drawn_at')
+    op.drop_column('probnik', 'lottery_seed')
+    op.drop_column('probnik', 'lottery_ends_at')
+    op.drop_column('probnik', 'lottery_minutes')
@@ -0,0 +1,62 @@
+"""add registration_rollup table and probnik slot index on exam_registration
+
+Revision ID: add_registration_rollup
+Revises: add_probnik_lottery
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_registration_rollup'
+down_revision = 'add_probnik_lottery'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Подсчет мест в слоте и выборки по пробнику без полного просмотра таблицы
+    op.create_index(
+        'ix_exam_registration_probnik_slot', 'exam_registration',
+        ['probnik_id', 'school', 'exam_date', 'exam_time'], unique=False
+    )
+    
+    # Сводные счетчики записей для статистики
+    op.create_table(
+        'registration_rollup',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('probnik_id', sa.Integer(), nullable=False),
+        sa.Column('school', sa.String(length=100), nullable=True),
+        sa.Column('exam_date', sa.DateTime(), nullable=False),
+        sa.Column('exam_time', sa.String(length=10), nullable=False),
+        sa.Column('subject', sa.String(length=100), nullable=False),
+        sa.Column('registered', sa.Integer(), nullable=False),
+        sa.Column('confirmed', sa.Integer(), nullable=False),
+        sa.Column('attended', sa.Integer(), nullable=False),
+        sa.Column('submitted', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['probnik_id'], ['probnik.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('probnik_id', 'school', 'exam_date', 'exam_time', 'subject', name='uq_registration_rollup_key')
+    )
+    
+    # Заполняем по существующим записям
+    op.execute(
+        """
+        INSERT INTO registration_rollup
+            (probnik_id, school, exam_date, exam_time, subject, registered, confirmed, attended, submitted)
+        SELECT probnik_id, school, exam_date, exam_time, subject, COUNT(*),
+               SUM(CASE WHEN confirmed THEN 1 ELSE 0 END),
+               SUM(CASE WHEN attended THEN 1 ELSE 0 END),
+               SUM(CASE WHEN submitted_work THEN 1 ELSE 0 END)
+        FROM exam_registration
+        WHERE probnik_id IS NOT NULL
+        GROUP BY probnik_id, school, exam_date, exam_time, subject
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('registration_rollup')
+    op.drop_index('ix_exam_registration_probnik_slot', table_name='exam_registration')
@@ -0,0 +1,29 @@
+"""add indexes for group results on exam and exam_types
+
+Revision ID: add_results_indexes
+Revises: add_exam_summary
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_results_indexes'
+down_revision = 'add_exam_summary'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Без индексов выборка экзаменов группы или ученика просматривает всю таблицу exam
+    op.create_index('ix_exam_type_student', 'exam', ['exam_type_id', 'id_student'], unique=False)
+    op.create_index('ix_exam_student', 'exam', ['id_student'], unique=False)
+    op.create_index('ix_exam_types_group', 'exam_types', ['group_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_exam_types_group', table_name='exam_types')
+    op.drop_index('ix_exam_student', table_name='exam')
+    op.drop_index('ix_exam_type_student', table_name='exam')
@@ -0,0 +1,43 @@
+"""add scheduled_reminder table
+
+Revision ID: add_scheduled_reminders
+Revises: add_on_delete_cascade
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_scheduled_reminders'
+down_revision = 'add_on_delete_cascade'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Очередь напоминаний о записях (заполняется бэкендом при старте и при изменении записей)
+    op.create_table(
+        'scheduled_reminder',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('registration_id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=30), nullable=False),
+        sa.Column('due_at', sa.DateTime(), nullable=False),
+        sa.Column('claimed_at', sa.DateTime(), nullable=True),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['registration_id'], ['exam_registration.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_scheduled_reminder_id'), 'scheduled_reminder', ['id'], unique=False)
+    op.create_index(op.f('ix_scheduled_reminder_registration_id'), 'scheduled_reminder', ['registration_id'], unique=False)
+    op.create_index(op.f('ix_scheduled_reminder_due_at'), 'scheduled_reminder', ['due_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_scheduled_reminder_due_at'), table_name='scheduled_reminder')
+    op.drop_index(op.f('ix_scheduled_reminder_registration_id'), table_name='scheduled_reminder')
+    op.drop_index(op.f('ix_scheduled_reminder_id'), table_name='scheduled_reminder')
+    op.drop_table('scheduled_reminder')
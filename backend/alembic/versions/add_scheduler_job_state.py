@@ -0,0 +1,33 @@
+"""add scheduler_job_state table
+
+Revision ID: add_scheduler_job_state
+Revises: add_scheduled_reminders
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_scheduler_job_state'
+down_revision = 'add_scheduled_reminders'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Время последнего запуска периодических задач бэкенда
+    op.create_table(
+        'scheduler_job_state',
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('last_run_at', sa.DateTime(), nullable=True),
+        sa.Column('last_success_at', sa.DateTime(), nullable=True),
+        sa.Column('last_duration', sa.Float(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('scheduler_job_state')
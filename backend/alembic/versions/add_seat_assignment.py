@@ -0,0 +1,49 @@
+"""add probnik rooms and seat_assignment table
+
+Revision ID: add_seat_assignment
+Revises: add_attendance_marked_at
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_seat_assignment'
+down_revision = 'add_attendance_marked_at'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Аудитории филиалов: {"101": 15, "102": 20}
+    op.add_column('probnik', sa.Column('rooms_baikalskaya', sa.JSON(), nullable=True))
+    op.add_column('probnik', sa.Column('rooms_lermontova', sa.JSON(), nullable=True))
+    
+    # Рассадка по аудиториям и местам
+    op.create_table(
+        'seat_assignment',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('registration_id', sa.Integer(), nullable=False),
+        sa.Column('probnik_id', sa.Integer(), nullable=False),
+        sa.Column('school', sa.String(length=100), nullable=False),
+        sa.Column('exam_date', sa.DateTime(), nullable=False),
+        sa.Column('exam_time', sa.String(length=10), nullable=False),
+        sa.Column('room', sa.String(length=50), nullable=False),
+        sa.Column('seat', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['registration_id'], ['exam_registration.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['probnik_id'], ['probnik.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('registration_id'),
+        sa.UniqueConstraint('probnik_id', 'school', 'exam_date', 'exam_time', 'room', 'seat', name='uq_seat_assignment_seat')
+    )
+    op.create_index('ix_seat_assignment_slot', 'seat_assignment', ['probnik_id', 'school', 'exam_date', 'exam_time'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_seat_assignment_slot', table_name='seat_assignment')
+    op.drop_table('seat_assignment')
+    op.drop_column('probnik', 'rooms_lermontova')
+    op.drop_column('probnik', 'rooms_baikalskaya')
@@ -0,0 +1,50 @@
+"""add similarity_flag table
+
+Revision ID: add_similarity_flag
+Revises: add_results_indexes
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_similarity_flag'
+down_revision = 'add_results_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Отметки похожих работ. Заполняются задачей find_similar_sheets или вручную
+    # через POST /similarity/run
+    op.create_table(
+        'similarity_flag',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('exam_name', sa.String(length=200), nullable=False),
+        sa.Column('subject', sa.String(length=100), nullable=False),
+        sa.Column('exam_a_id', sa.Integer(), nullable=False),
+        sa.Column('exam_b_id', sa.Integer(), nullable=False),
+        sa.Column('student_a_id', sa.Integer(), nullable=False),
+        sa.Column('student_b_id', sa.Integer(), nullable=False),
+        sa.Column('matched_tasks', sa.Integer(), nullable=False),
+        sa.Column('total_tasks', sa.Integer(), nullable=False),
+        sa.Column('shared_wrong', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='new'),
+        sa.Column('detected_at', sa.DateTime(), nullable=True),
+        sa.Column('reviewed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['exam_a_id'], ['exam.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['exam_b_id'], ['exam.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['student_a_id'], ['student.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['student_b_id'], ['student.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('exam_a_id', 'exam_b_id', name='uq_similarity_flag_pair')
+    )
+    op.create_index('ix_similarity_flag_exam', 'similarity_flag', ['exam_name', 'subject'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_similarity_flag_exam', table_name='similarity_flag')
+    op.drop_table('similarity_flag')
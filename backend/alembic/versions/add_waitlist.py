@@ -0,0 +1,46 @@
+"""add waitlist_entry table
+
+Revision ID: add_waitlist
+Revises: add_scheduler_job_state
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_waitlist'
+down_revision = 'add_scheduler_job_state'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Лист ожидания на заполненные слоты пробника
+    op.create_table(
+        'waitlist_entry',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('student_id', sa.Integer(), nullable=False),
+        sa.Column('probnik_id', sa.Integer(), nullable=False),
+        sa.Column('subject', sa.String(length=100), nullable=False),
+        sa.Column('exam_date', sa.DateTime(), nullable=False),
+        sa.Column('exam_time', sa.String(length=10), nullable=False),
+        sa.Column('school', sa.String(length=100), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['student_id'], ['student.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['probnik_id'], ['probnik.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('student_id', 'probnik_id', 'subject', 'exam_date', 'exam_time', name='uq_waitlist_entry_student_slot')
+    )
+    op.create_index(op.f('ix_waitlist_entry_id'), 'waitlist_entry', ['id'], unique=False)
+    op.create_index(op.f('ix_waitlist_entry_student_id'), 'waitlist_entry', ['student_id'], unique=False)
+    # Первая запись слота и позиция в очереди — поиском по индексу
+    op.create_index('ix_waitlist_entry_slot', 'waitlist_entry', ['probnik_id', 'school', 'exam_date', 'exam_time', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_waitlist_entry_slot', table_name='waitlist_entry')
+    op.drop_index(op.f('ix_waitlist_entry_student_id'), table_name='waitlist_entry')
+    op.drop_index(op.f('ix_waitlist_entry_id'), table_name='waitlist_entry')
+    op.drop_table('waitlist_entry')
@@ -1,30 +1,52 @@
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
+from typing import Deque
 from jose import jwt
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException
+import asyncio
 import bcrypt
+import os
+import threading
+import time
 
 SECRET_KEY = "CHANGE_ME_TO_SOME_RANDOM_SECRET"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 1 день
 
+# Стоимость bcrypt (log2 числа раундов). 12 — значение по умолчанию в bcrypt
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Размер пула потоков для хеширования. bcrypt отпускает GIL,
+# поэтому потоков достаточно, а ограничение пула не дает всплеску логинов занять весь CPU
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+
+# Ограничение попыток входа: не более LOGIN_RATE_LIMIT попыток за LOGIN_RATE_WINDOW секунд на один логин
+LOGIN_RATE_LIMIT = int(os.getenv("LOGIN_RATE_LIMIT", "5"))
+LOGIN_RATE_WINDOW = int(os.getenv("LOGIN_RATE_WINDOW", "60"))
+# Сколько логинов помнит ограничитель: при переполнении забываются давно не входившие
+LOGIN_RATE_MAX_USERNAMES = int(os.getenv("LOGIN_RATE_MAX_USERNAMES", "10000"))
+
 # Авторизационный схем
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+_password_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash"
+)
+
 
 # ---- Хэширование пароля (используем bcrypt напрямую) ----
 def hash_password(password: str) -> str:
     """Хеширует пароль с автоматической обрезкой до 72 байт"""
-    # Отладка
-    print(f"[DEBUG] Хеширование пароля длиной: {len(password)} символов, {len(password.encode('utf-8'))} байт")
-    
     # Обрезаем до 72 байт
     password_bytes = password.encode('utf-8')[:72]
-    
+
     # Хешируем
-    hashed = bcrypt.hashpw(password_bytes, bcrypt.gensalt())
-    
+    hashed = bcrypt.hashpw(password_bytes, bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+
     # Возвращаем как строку
     return hashed.decode('utf-8')
 
@@ -35,12 +57,102 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         # Обрезаем до 72 байт
         password_bytes = plain_password.encode('utf-8')[:72]
         hashed_bytes = hashed_password.encode('utf-8')
-        
+
         return bcrypt.checkpw(password_bytes, hashed_bytes)
     except Exception:
         return False
 
 
+async def hash_password_async(password: str) -> str:
+    """Хеширует пароль в пуле потоков, не блокируя event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Проверяет пароль в пуле потоков, не блокируя event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, verify_password, plain_password, hashed_password)
+
+
+# ---- Ограничение частоты входа ----
+class LoginRateLimiter:
+    """
+    Скользящее окно попыток входа для каждого логина (хранится в памяти процесса).
+
+    Логины без попыток в окне удаляются раз в окно, а число хранимых логинов
+    ограничено max_usernames: перебор случайных логинов не растит память.
+    Логин с попытками в окне не вытесняется никогда (иначе поток случайных
+    логинов сбрасывал бы блокировку чужой учетной записи): если таблица заполнена
+    живыми записями, попытки с новыми логинами отклоняются до освобождения места.
+    Порядок записей — по последней попытке, поэтому старейшая запись первая.
+    """
+
+    def __init__(self, limit: int, window: int, max_usernames: int = LOGIN_RATE_MAX_USERNAMES):
+        self.limit = limit
+        self.window = window
+        self.max_usernames = max_usernames
+        self._attempts: "OrderedDict[str, Deque[float]]" = OrderedDict()
+        self._swept_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _sweep(self, now: float):
+        """Удаляет логины, у которых все попытки вышли из окна"""
+        if now - self._swept_at < self.window:
+            return
+        self._swept_at = now
+        for username, attempts in list(self._attempts.items()):
+            if now - attempts[-1] > self.window:
+                del self._attempts[username]
+
+    def hit(self, username: str) -> bool:
+        """Регистрирует попытку. Возвращает False, если лимит исчерпан"""
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            attempts = self._attempts.get(username)
+            if attempts is not None:
+                while attempts and now - attempts[0] > self.window:
+                    attempts.popleft()
+                if len(attempts) >= self.limit:
+                    return False
+            elif not self._make_room(now):
+                return False
+            if not attempts:
+                attempts = self._attempts[username] = deque()
+            attempts.append(now)
+            self._attempts.move_to_end(username)
+            return True
+
+    def _make_room(self, now: float) -> bool:
+        """Освобождает место под новый логин, удаляя только записи без попыток в окне"""
+        while len(self._attempts) >= self.max_usernames:
+            oldest = next(iter(self._attempts.values()))
+            if now - oldest[-1] <= self.window:
+                return False
+            self._attempts.popitem(last=False)
+        return True
+
+    def retry_after(self, username: str) -> int:
+        """Через сколько секунд освободится следующая попытка"""
+        with self._lock:
+            attempts = self._attempts.get(username)
+            if attempts is None and len(self._attempts) >= self.max_usernames:
+                # Новый логин при заполненной таблице: ждать, пока выйдет из окна старейшая запись
+                attempts = [next(iter(self._attempts.values()))[-1]]
+            if not attempts:
+                return 0
+            return max(0, int(self.window - (time.monotonic() - attempts[0])) + 1)
+
+    def reset(self, username: str):
+        """Сбрасывает счетчик после успешного входа"""
+        with self._lock:
+            self._attempts.pop(username, None)
+
+
+login_rate_limiter = LoginRateLimiter(LOGIN_RATE_LIMIT, LOGIN_RATE_WINDOW)
+
+
 # ---- Создание токена ----
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -56,4 +168,4 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload  # {sub, role, teacher_name}
     except Exception:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
@@ -4,7 +4,7 @@ from sqlalchemy import select
 from database import get_db
 from models import Employee
 from schemas import EmployeeCreate, EmployeeOut, LoginResponse
-from auth import hash_password, verify_password, create_access_token
+from auth import hash_password_async, verify_password_async, create_access_token, login_rate_limiter
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
@@ -12,6 +12,14 @@ router = APIRouter(prefix="/auth", tags=["Auth"])
 # ----------- LOGIN -----------
 @router.post("/login", response_model=LoginResponse)
 async def login(username: str, password: str, db: AsyncSession = Depends(get_db)):
+    # Ограничиваем частоту попыток для одного логина до обращения к bcrypt
+    if not login_rate_limiter.hit(username):
+        raise HTTPException(
+            status_code=429,
+            detail="Слишком много попыток входа. Попробуйте позже",
+            headers={"Retry-After": str(login_rate_limiter.retry_after(username))}
+        )
+
     # Используем правильный асинхронный запрос
     result = await db.execute(
         select(Employee).where(Employee.username == username)
@@ -21,9 +29,11 @@ async def login(username: str, password: str, db: AsyncSession = Depends(get_db)
     if not user:
         raise HTTPException(status_code=401, detail="Неверный логин или пароль")
 
-    if not verify_password(password, user.password_hash):
+    if not await verify_password_async(password, user.password_hash):
         raise HTTPException(status_code=401, detail="Неверный логин или пароль")
 
+    login_rate_limiter.reset(username)
+
     token = create_access_token({
         "sub": user.username,
         "username": user.username,
@@ -61,7 +71,7 @@ async def register(data: EmployeeCreate, db: AsyncSession = Depends(get_db)):
 
     new_user = Employee(
         username=data.username,
-        password_hash=hash_password(data.password),
+        password_hash=await hash_password_async(data.password),
         role=role,
         teacher_name=data.teacher_name
     )
@@ -0,0 +1,268 @@
+"""
+Бенчмарк горячих эндпоинтов бэкенда.
+
+Запускает приложение в процессе (через httpx.ASGITransport) на базе,
+заполненной generate_data.py, и для каждого сценария печатает пропускную
+способность и p50/p95/p99 задержки. Результаты можно сохранить как эталон
+и сравнивать с ним последующие запуски: если p95 или пропускная способность
+ухудшились больше допуска, сценарий помечается как регрессия, а скрипт
+завершается с кодом 1.
+
+Пример:
+    python generate_data.py --database-url sqlite+aiosqlite:///./bench.db --scale medium
+    python bench_api.py --database-url sqlite+aiosqlite:///./bench.db --save-baseline baseline.json
+    python bench_api.py --database-url sqlite+aiosqlite:///./bench.db --baseline baseline.json
+
+Без --database-url данные генерируются во временную базу (--scale, по умолчанию small).
+Сценарии с записью в базу (--include-writes) меняют данные, поэтому для
+сравнения с эталоном каждый раз нужна свежая база.
+
+Требует httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+from bench_login import percentile
+
+
+class Scenario:
+    """Сценарий: request() возвращает (путь, json); weight — доля от --requests"""
+
+    def __init__(self, name: str, method: str, request: Callable, token: Optional[str] = "admin",
+                 ok_statuses=(200,), weight: float = 1.0, writes: bool = False):
+        self.name = name
+        self.method = method
+        self.request = request
+        self.token = token
+        self.ok_statuses = ok_statuses
+        self.weight = weight
+        self.writes = writes
+
+
+async def load_samples(rng: random.Random) -> Dict[str, list]:
+    """Реальные id из базы, по которым будут строиться запросы"""
+    from sqlalchemy import select
+
+    from database import AsyncSessionLocal
+    from models import ExamRegistration, Probnik, Student, StudyGroup
+
+    async with AsyncSessionLocal() as db:
+        student_ids = (await db.execute(select(Student.id).limit(5000))).scalars().all()
+        user_ids = (await db.execute(
+            select(Student.user_id).where(Student.user_id.isnot(None)).limit(5000)
+        )).scalars().all()
+        fios = (await db.execute(select(Student.fio).limit(500))).scalars().all()
+        group_ids = (await db.execute(select(StudyGroup.id))).scalars().all()
+        registered = (await db.execute(select(ExamRegistration.student_id).distinct().limit(5000))).scalars().all()
+        probnik = (await db.execute(select(Probnik).where(Probnik.is_active == True))).scalar_one_or_none()
+
+    if not student_ids or not group_ids:
+        raise SystemExit("База пустая — сначала запустите generate_data.py")
+
+    dates = [d["date"] for d in (probnik.exam_dates or [])] if probnik else []
+    return {
+        "student_ids": student_ids,
+        "user_ids": user_ids or [0],
+        "fio_parts": [fio.split()[0] for fio in fios],
+        "group_ids": group_ids,
+        "registered_ids": registered or student_ids,
+        "dates": dates or ["2026-01-05"],
+    }
+
+
+def build_scenarios(samples: Dict[str, list], rng: random.Random) -> List[Scenario]:
+    pick = rng.choice
+    return [
+        Scenario("GET /students/", "GET", lambda: ("/students/?limit=100", None)),
+        Scenario("GET /students/{id}", "GET", lambda: (f"/students/{pick(samples['student_ids'])}", None)),
+        Scenario("GET /students/{id}/exams", "GET",
+                 lambda: (f"/students/{pick(samples['student_ids'])}/exams", None)),
+        Scenario("GET /students-with-exams/", "GET", lambda: ("/students-with-exams/", None), weight=0.05),
+        Scenario("GET /exams/ (admin)", "GET", lambda: ("/exams/?limit=100", None)),
+        Scenario("GET /exams/ (teacher)", "GET", lambda: ("/exams/?limit=100", None), token="teacher"),
+        Scenario("GET /exams-with-students/", "GET", lambda: ("/exams-with-students/?limit=100", None)),
+        Scenario("GET /exam-types/?group_id", "GET",
+                 lambda: (f"/exam-types/?group_id={pick(samples['group_ids'])}", None)),
+        Scenario("GET /groups/ (admin)", "GET", lambda: ("/groups/", None)),
+        Scenario("GET /groups/ (teacher)", "GET", lambda: ("/groups/", None), token="teacher"),
+        Scenario("GET /groups/{id}", "GET", lambda: (f"/groups/{pick(samples['group_ids'])}", None)),
+        Scenario("GET /groups-with-students/", "GET", lambda: ("/groups-with-students/", None), weight=0.1),
+        Scenario("GET /teachers/", "GET", lambda: ("/teachers/", None)),
+        Scenario("GET /exam-registrations/", "GET", lambda: ("/exam-registrations/", None), weight=0.2),
+        Scenario("GET /exam-registrations/?date", "GET",
+                 lambda: (f"/exam-registrations/?date={pick(samples['dates'])}&school=Байкальская", None)),
+        Scenario("GET /probnik/active", "GET", lambda: ("/probnik/active", None), token=None),
+        Scenario("GET /telegram/active-probnik", "GET", lambda: ("/telegram/active-probnik", None), token=None),
+        Scenario("GET /telegram/student-by-user-id", "GET",
+                 lambda: (f"/telegram/student-by-user-id/{pick(samples['user_ids'])}", None), token=None),
+        Scenario("POST /telegram/search-student", "POST",
+                 lambda: ("/telegram/search-student", {"fio": pick(samples["fio_parts"])}), token=None, weight=0.2),
+        Scenario("GET /telegram/available-slots", "GET",
+                 lambda: (f"/telegram/available-slots/{pick(samples['dates'])}?school=Лермонтова", None), token=None),
+        Scenario("GET /telegram/student-registrations", "GET",
+                 lambda: (f"/telegram/student-registrations/{pick(samples['registered_ids'])}", None), token=None),
+        Scenario("GET /telegram/subjects/{class}", "GET", lambda: ("/telegram/subjects/11", None), token=None),
+        Scenario("GET /telegram/pending-notifications", "GET",
+                 lambda: ("/telegram/pending-notifications", None), token=None, weight=0.2),
+        Scenario("POST /telegram/register-exam", "POST", lambda: ("/telegram/register-exam", {
+            "student_id": pick(samples["student_ids"]),
+            "subject": "Математика",
+            "exam_date": pick(samples["dates"]),
+            "exam_time": "9:00",
+            "school": "Байкальская",
+        }), token=None, ok_statuses=(200, 400), writes=True),
+    ]
+
+
+async def run_scenario(client, scenario: Scenario, headers: Dict[str, dict], requests: int, concurrency: int):
+    latencies: List[float] = []
+    errors: Dict[int, int] = {}
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            path, body = scenario.request()
+            started = time.perf_counter()
+            response = await client.request(
+                scenario.method, path, json=body, headers=headers.get(scenario.token, {})
+            )
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code not in scenario.ok_statuses:
+                errors[response.status_code] = errors.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "errors": errors,
+    }
+
+
+def compare(result: dict, baseline: Optional[dict], tolerance: float, min_delta_ms: float) -> List[str]:
+    """Список ухудшений относительно эталона (пустой — регрессии нет)"""
+    if not baseline:
+        return []
+    problems = []
+    old_p95, new_p95 = baseline.get("p95_ms", 0), result["p95_ms"]
+    if new_p95 > old_p95 * (1 + tolerance) and new_p95 - old_p95 > min_delta_ms:
+        problems.append(f"p95 {old_p95:.1f} -> {new_p95:.1f} мс")
+    old_rps, new_rps = baseline.get("rps", 0), result["rps"]
+    if old_rps and new_rps < old_rps / (1 + tolerance):
+        problems.append(f"rps {old_rps:.1f} -> {new_rps:.1f}")
+    return problems
+
+
+async def run(args) -> int:
+    import httpx
+
+    from auth import create_access_token
+    from main import app
+
+    rng = random.Random(args.seed)
+    samples = await load_samples(rng)
+    scenarios = [s for s in build_scenarios(samples, rng) if args.include_writes or not s.writes]
+    if args.only:
+        scenarios = [s for s in scenarios if any(part in s.name for part in args.only)]
+
+    headers = {
+        None: {},
+        "admin": {"Authorization": "Bearer " + create_access_token(
+            {"sub": "admin", "username": "admin", "role": "admin", "teacher_name": "Администратор"})},
+        "teacher": {"Authorization": "Bearer " + create_access_token(
+            {"sub": "teacher1", "username": "teacher1", "role": "teacher", "teacher_name": "teacher1"})},
+    }
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    results = {}
+    regressions = {}
+    # Исключения приложения превращаются в 500 и считаются ошибками сценария
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"{'сценарий':<40} {'n':>5} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+        for scenario in scenarios:
+            requests = max(3, int(args.requests * scenario.weight))
+            # Разогрев
+            await run_scenario(client, scenario, headers, min(3, requests), 1)
+            result = await run_scenario(client, scenario, headers, requests, args.concurrency)
+            results[scenario.name] = result
+            problems = compare(result, baseline.get(scenario.name), args.tolerance, args.min_delta_ms)
+            if problems:
+                regressions[scenario.name] = problems
+            mark = "  РЕГРЕССИЯ: " + "; ".join(problems) if problems else ""
+            if result["errors"]:
+                mark += f"  ошибки: {result['errors']}"
+            print(f"{scenario.name:<40} {result['requests']:>5} {result['rps']:>9.1f} "
+                  f"{result['p50_ms']:>7.1f}мс {result['p95_ms']:>7.1f}мс {result['p99_ms']:>7.1f}мс{mark}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"Эталон сохранен в {args.save_baseline}")
+
+    if regressions:
+        print(f"Регрессии в {len(regressions)} сценариях (допуск {args.tolerance:.0%})")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="База, заполненная generate_data.py")
+    parser.add_argument("--scale", default="small", help="Объем данных, если база не указана")
+    parser.add_argument("--requests", type=int, default=200, help="Запросов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=10, help="Одновременных запросов")
+    parser.add_argument("--only", nargs="*", help="Запустить только сценарии, содержащие эти подстроки")
+    parser.add_argument("--include-writes", action="store_true", help="Включить сценарии с записью в базу")
+    parser.add_argument("--baseline", help="JSON с эталонными результатами для сравнения")
+    parser.add_argument("--save-baseline", help="Сохранить результаты как эталон")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Допустимое ухудшение (0.25 = 25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0,
+                        help="Ухудшение p95 меньше этого значения не считается регрессией")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    if not args.database_url:
+        from generate_data import SCALES, generate
+
+        tmp_dir = tempfile.mkdtemp(prefix="bench_api_")
+        args.database_url = f"sqlite+aiosqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+        print(f"Генерация данных ({args.scale}) в {args.database_url}")
+        asyncio.run(generate(args.database_url, seed=args.seed, **SCALES[args.scale]))
+
+    os.environ["DATABASE_URL"] = args.database_url
+    # Лог каждого запроса заметно искажает замеры — оставляем только предупреждения
+    os.environ.setdefault("SLOW_QUERY_MS", "1000")
+    logging.getLogger("exams.request").setLevel(logging.WARNING)
+    logging.getLogger("exams.sql.n_plus_one").setLevel(logging.ERROR)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Бенчмарк: задержка посторонних эндпоинтов во время всплеска логинов.
+
+Запускает приложение в процессе (через httpx.ASGITransport) на временной базе,
+создает сотрудников и одновременно с пачкой запросов /auth/login опрашивает
+легкий эндпоинт /telegram/subjects/9. Печатает p50/p95/p99 задержки опроса
+без нагрузки и во время всплеска.
+
+С флагом --blocking проверка пароля выполняется прямо в event loop
+(как было раньше) — для сравнения.
+
+Пример:
+    python bench_login.py --logins 50 --users 10
+    python bench_login.py --logins 50 --users 10 --blocking
+
+Требует httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def format_stats(name, values):
+    return (
+        f"{name:<24} n={len(values):<5} "
+        f"p50={percentile(values, 50):8.1f} мс  "
+        f"p95={percentile(values, 95):8.1f} мс  "
+        f"p99={percentile(values, 99):8.1f} мс  "
+        f"max={max(values) if values else 0:8.1f} мс"
+    )
+
+
+async def probe(client, stop: asyncio.Event, interval: float):
+    """Опрашивает легкий эндпоинт, пока не выставлен stop.
+
+    Задержка считается от запланированного момента отправки, поэтому время,
+    пока event loop был занят и не мог отправить запрос, тоже учитывается.
+    """
+    latencies = []
+    scheduled = time.perf_counter()
+    while not stop.is_set():
+        response = await client.get("/telegram/subjects/9")
+        latencies.append((time.perf_counter() - scheduled) * 1000)
+        assert response.status_code == 200, response.text
+        scheduled = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def run(args):
+    import httpx
+    from sqlalchemy import delete
+
+    import auth
+    import auth_routes
+    from database import AsyncSessionLocal, create_tables
+    from main import app
+    from models import Employee
+
+    if args.blocking:
+        # Воспроизводим старое поведение: bcrypt в event loop
+        async def blocking_verify(plain_password, hashed_password):
+            return auth.verify_password(plain_password, hashed_password)
+        auth_routes.verify_password_async = blocking_verify
+
+    await create_tables()
+
+    password = "benchmark-password"
+    password_hash = auth.hash_password(password)
+    usernames = [f"bench_user_{i}" for i in range(args.users)]
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(Employee).where(Employee.username.in_(usernames)))
+        db.add_all([
+            Employee(username=u, password_hash=password_hash, role="teacher", teacher_name=u)
+            for u in usernames
+        ])
+        await db.commit()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Разогрев
+        for _ in range(5):
+            await client.get("/telegram/subjects/9")
+
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(probe(client, stop, args.interval))
+        await asyncio.sleep(args.idle)
+        stop.set()
+        idle_latencies = await probe_task
+
+        login_latencies = []
+
+        async def login(i):
+            username = usernames[i % len(usernames)]
+            started = time.perf_counter()
+            response = await client.post("/auth/login", params={"username": username, "password": password})
+            login_latencies.append((time.perf_counter() - started) * 1000)
+            return response.status_code
+
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(probe(client, stop, args.interval))
+        burst_started = time.perf_counter()
+        statuses = await asyncio.gather(*(login(i) for i in range(args.logins)))
+        burst_seconds = time.perf_counter() - burst_started
+        stop.set()
+        burst_latencies = await probe_task
+
+    mode = "bcrypt в event loop" if args.blocking else f"пул потоков ({auth.PASSWORD_HASH_WORKERS})"
+    print(f"Режим: {mode}, BCRYPT_ROUNDS={auth.BCRYPT_ROUNDS}")
+    print(f"Логинов: {args.logins} за {burst_seconds:.2f} с, статусы: "
+          f"{ {s: statuses.count(s) for s in sorted(set(statuses))} }")
+    print(format_stats("probe без нагрузки", idle_latencies))
+    print(format_stats("probe во время логинов", burst_latencies))
+    print(format_stats("/auth/login", login_latencies))
+    if burst_latencies:
+        print(f"Средняя задержка probe во время логинов: {statistics.mean(burst_latencies):.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=40, help="Количество логинов во всплеске")
+    parser.add_argument("--users", type=int, default=10, help="Количество разных логинов")
+    parser.add_argument("--interval", type=float, default=0.005, help="Пауза между запросами probe, с")
+    parser.add_argument("--idle", type=float, default=1.0, help="Длительность замера без нагрузки, с")
+    parser.add_argument("--blocking", action="store_true", help="Проверять пароль прямо в event loop")
+    args = parser.parse_args()
+
+    # Временная база и снятый лимит попыток, чтобы всплеск не упирался в 429
+    tmp_dir = tempfile.mkdtemp(prefix="bench_login_")
+    os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(tmp_dir, 'bench.db')}")
+    os.environ.setdefault("LOGIN_RATE_LIMIT", str(args.logins + 1))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Отметка явки на входе в день пробника с работой без сети.
+
+Устройство на входе заранее скачивает компактный список слота (пробник, школа,
+дата, время): id записи, ФИО, класс, предмет и текущие отметки. Список строится
+одним запросом по индексу ix_exam_registration_probnik_slot, его версия — хеш
+содержимого и одновременно ETag, поэтому повторная загрузка неизменного списка
+возвращает 304 без тела.
+
+Без сети отметки копятся на устройстве вместе со временем отметки и уходят одним
+запросом синхронизации. Конфликты (ту же запись отметили с другого устройства или
+в админке) разрешаются по времени отметки — побеждает последняя
+(crud.mark_attendance). В ответе — дельта и новый список, если он изменился.
+"""
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import ExamRegistration, Student
+
+COLUMNS = ["id", "fio", "class_num", "subject", "attended", "submitted_work"]
+
+
+def slot_condition(probnik_id: int, school: str, exam_date: datetime, exam_time: str):
+    return and_(
+        ExamRegistration.probnik_id == probnik_id,
+        ExamRegistration.school == school,
+        ExamRegistration.exam_date == exam_date,
+        ExamRegistration.exam_time == exam_time,
+    )
+
+
+def version(rows: List[list]) -> str:
+    payload = json.dumps(rows, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+async def snapshot(db: AsyncSession, probnik_id: int, school: str, exam_date: datetime, exam_time: str) -> Dict:
+    """Список слота для устройства на входе (строки в порядке COLUMNS, по ФИО)"""
+    result = await db.execute(
+        select(
+            ExamRegistration.id, Student.fio, Student.class_num, ExamRegistration.subject,
+            ExamRegistration.attended, ExamRegistration.submitted_work
+        )
+        .join(Student, Student.id == ExamRegistration.student_id)
+        .where(slot_condition(probnik_id, school, exam_date, exam_time))
+        .order_by(Student.fio, ExamRegistration.id)
+    )
+    rows = [
+        [registration_id, fio, class_num, subject, bool(attended), bool(submitted_work)]
+        for registration_id, fio, class_num, subject, attended, submitted_work in result.all()
+    ]
+    return {
+        "probnik_id": probnik_id,
+        "school": school,
+        "exam_date": exam_date.strftime("%Y-%m-%d"),
+        "exam_time": exam_time,
+        "version": version(rows),
+        "columns": COLUMNS,
+        "rows": rows,
+    }
+
+
+def etag_matches(if_none_match: Optional[str], current: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = {tag.strip().removeprefix("W/").strip('"') for tag in if_none_match.split(",")}
+    return current in tags
+
+
+def naive_utc(value: datetime) -> datetime:
+    """Время в UTC без часового пояса (как хранится в БД); наивное время считается уже UTC"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def server_time(marked_at: datetime, sent_at: Optional[datetime], now: datetime) -> datetime:
+    """
+    Переводит время отметки с часов устройства на часы сервера: сдвиг часов
+    устройства оценивается по sent_at (время отправки по часам устройства).
+    Отметка не может оказаться в будущем.
+    """
+    marked_at = naive_utc(marked_at)
+    if sent_at is not None:
+        marked_at += now - naive_utc(sent_at)
+    return min(marked_at, now)
@@ -0,0 +1,66 @@
+from fastapi import APIRouter, Depends, Header, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from datetime import datetime
+
+from database import get_db
+from auth import get_current_user
+from route_helpers import parse_date, require_admin
+import checkin
+import crud
+import schemas
+
+router = APIRouter(prefix="/checkin", tags=["checkin"])
+
+
+@router.get("/roster", response_model=schemas.RosterSnapshot)
+async def get_roster(
+    response: Response,
+    probnik_id: int = Query(...),
+    school: str = Query(...),
+    date: str = Query(..., description="Дата в формате YYYY-MM-DD"),
+    time: str = Query(...),
+    if_none_match: Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Список слота для отметки на входе. Поддерживает If-None-Match: неизменный список — 304"""
+    require_admin(user)
+    snapshot = await checkin.snapshot(db, probnik_id, school, parse_date(date, required=True), time)
+    headers = {"ETag": f'"{snapshot["version"]}"', "Cache-Control": "no-cache"}
+    if checkin.etag_matches(if_none_match, snapshot["version"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return snapshot
+
+
+@router.post("/sync", response_model=schemas.CheckinSyncResponse)
+async def sync_checkin(
+    data: schemas.CheckinSyncRequest,
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """
+    Синхронизация отметок, накопленных устройством без сети, за один запрос.
+    Побеждает более поздняя отметка; отметки для записей не из этого слота — в not_found.
+    Список возвращается, только если его версия отличается от версии устройства.
+    """
+    require_admin(user)
+    exam_date = parse_date(data.exam_date, required=True)
+    now = datetime.utcnow()
+    marks = [
+        mark.model_copy(update={"marked_at": checkin.server_time(mark.marked_at, data.sent_at, now)})
+        if mark.marked_at is not None else mark
+        for mark in data.marks
+    ]
+    result = await crud.mark_attendance(
+        db=db,
+        marks=marks,
+        condition=checkin.slot_condition(data.probnik_id, data.school, exam_date, data.exam_time)
+    )
+    snapshot = await checkin.snapshot(db, data.probnik_id, data.school, exam_date, data.exam_time)
+    return {
+        **result,
+        "version": snapshot["version"],
+        "snapshot": snapshot if snapshot["version"] != data.version else None,
+    }
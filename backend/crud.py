@@ -1,10 +1,33 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
-from models import Student, Exam, StudyGroup, Employee, ExamType
-from schemas import StudentCreate, StudentUpdate, ExamCreate, ExamUpdate, GroupCreate, GroupUpdate
-from typing import List, Optional
+from sqlalchemy import and_, insert, delete, update, bindparam
+from models import Student, Exam, ExamSummary, StudyGroup, Employee, ExamType, ExamRegistration, group_student_association
+from schemas import StudentCreate, StudentUpdate, ExamCreate, ExamUpdate, GroupCreate, GroupUpdate, AttendanceMark
+from typing import Dict, Iterable, List, Optional
 import json
+from datetime import datetime
+import logging
+
+import checkin
+import rankings
+import rollups
+import scoring
+import summaries
+import trends
+
+logger = logging.getLogger(__name__)
+
+# SQLite ограничивает число параметров в запросе (999 в старых сборках),
+# поэтому длинные списки для IN (...) режем на части
+IN_CLAUSE_CHUNK_SIZE = 500
+
+
+def chunked(items: Iterable, size: int = IN_CLAUSE_CHUNK_SIZE):
+    """Разбивает последовательность на списки длиной не более size"""
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
 
 # ==================== STUDENT CRUD ====================
 
@@ -69,37 +92,161 @@ async def update_student(db: AsyncSession, student_id: int, student_update: Stud
     await db.refresh(db_student)
     return db_student
 
-async def delete_student(db: AsyncSession, student_id: int):
+async def delete_students(db: AsyncSession, student_ids: List[int]) -> Dict[str, int]:
+    """Удаление студентов со всеми связанными записями набором DELETE-запросов.
+
+    Возвращает количество удаленных строк по таблицам.
+    """
+    counts = {"students": 0, "exams": 0, "registrations": 0, "group_links": 0}
+    for chunk in chunked(set(student_ids)):
+        await summaries.discard(db, ExamSummary.student_id.in_(chunk))
+        # Дочерние строки удаляются и каскадом в БД, но явные запросы дают количество строк
+        result = await db.execute(Exam.__table__.delete().where(Exam.id_student.in_(chunk)))
+        counts["exams"] += result.rowcount
+        await rollups.subtract_matching(db, ExamRegistration.student_id.in_(chunk))
+        result = await db.execute(
+            ExamRegistration.__table__.delete().where(ExamRegistration.student_id.in_(chunk))
+        )
+        counts["registrations"] += result.rowcount
+        result = await db.execute(
+            group_student_association.delete().where(group_student_association.c.student_id.in_(chunk))
+        )
+        counts["group_links"] += result.rowcount
+        result = await db.execute(Student.__table__.delete().where(Student.id.in_(chunk)))
+        counts["students"] += result.rowcount
+
+    await db.commit()
+    rankings.clear()
+    trends.clear()
+    return counts
+
+async def delete_student(db: AsyncSession, student_id: int) -> Optional[Dict[str, int]]:
     """Удаление студента и всех связанных записей"""
-    from models import Exam, ExamRegistration, group_student_association
-    
-    result = await db.execute(select(Student).where(Student.id == student_id))
-    db_student = result.scalar_one_or_none()
-    
-    if db_student is None:
+    counts = await delete_students(db, [student_id])
+    return counts if counts["students"] else None
+
+async def mark_attendance(db: AsyncSession, marks: List[AttendanceMark], condition=None) -> Dict:
+    """Массовая отметка явки и сдачи работы в одной транзакции.
+
+    Текущие значения читаются одним запросом на часть списка, изменившиеся строки
+    обновляются одним UPDATE с executemany. Возвращает только дельту.
+
+    Отметки с marked_at (очередь устройства на входе) разрешаются по правилу
+    «побеждает последняя запись»: отметка старше attendance_marked_at записи
+    пропускается как устаревшая. Отметки без marked_at датируются текущим временем,
+    время с часовым поясом переводится в UTC. Более новая отметка без изменений
+    все равно сдвигает attendance_marked_at (считается в unchanged), чтобы
+    опоздавшая старая отметка ее не перебила.
+    condition ограничивает записи (например, одним слотом) — остальные id
+    попадают в not_found.
+    """
+    now = datetime.utcnow()
+    marks_by_id: Dict[int, AttendanceMark] = {}
+    stamps: Dict[int, datetime] = {}
+    for mark in marks:
+        marked_at = checkin.naive_utc(mark.marked_at) if mark.marked_at is not None else now
+        # Повтор id — действует более поздняя отметка
+        if mark.id not in stamps or marked_at >= stamps[mark.id]:
+            marks_by_id[mark.id] = mark
+            stamps[mark.id] = marked_at
+
+    current = {}
+    for chunk in chunked(marks_by_id):
+        query = select(
+            ExamRegistration.id, ExamRegistration.attended, ExamRegistration.submitted_work,
+            ExamRegistration.attendance_marked_at, ExamRegistration.probnik_id, ExamRegistration.school,
+            ExamRegistration.exam_date, ExamRegistration.exam_time, ExamRegistration.subject
+        ).where(ExamRegistration.id.in_(chunk))
+        if condition is not None:
+            query = query.where(condition)
+        result = await db.execute(query)
+        for row in result.all():
+            current[row.id] = row
+
+    rows = []
+    touched = []
+    stale = []
+    deltas = {}
+    for registration_id, mark in marks_by_id.items():
+        row = current.get(registration_id)
+        if row is None:
+            continue
+        marked_at = stamps[registration_id]
+        if row.attendance_marked_at is not None and marked_at <= row.attendance_marked_at:
+            stale.append(registration_id)
+            continue
+        attended = bool(row.attended) if mark.attended is None else mark.attended
+        submitted_work = bool(row.submitted_work) if mark.submitted_work is None else mark.submitted_work
+        values = {
+            "b_id": registration_id,
+            "b_attended": attended,
+            "b_submitted_work": submitted_work,
+            "b_marked_at": marked_at,
+        }
+        if attended == bool(row.attended) and submitted_work == bool(row.submitted_work):
+            # Значения те же, но время решения новее — сдвигаем только его
+            touched.append(values)
+            continue
+        rows.append(values)
+        if row.probnik_id is not None:
+            counters = deltas.setdefault(
+                (row.probnik_id, row.school, row.exam_date, row.exam_time, row.subject), [0, 0, 0, 0]
+            )
+            counters[2] += int(attended) - int(bool(row.attended))
+            counters[3] += int(submitted_work) - int(bool(row.submitted_work))
+
+    if rows or touched:
+        # UPDATE в обход ORM: события сессии его не видят, сводные счетчики правим сами
+        table = ExamRegistration.__table__
+        await db.execute(
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .values(
+                attended=bindparam("b_attended"),
+                submitted_work=bindparam("b_submitted_work"),
+                attendance_marked_at=bindparam("b_marked_at")
+            ),
+            rows + touched
+        )
+        await rollups.apply_deltas(db, deltas)
+        await db.commit()
+
+    return {
+        "updated": len(rows),
+        "unchanged": len(current) - len(rows) - len(stale),
+        "stale": sorted(stale),
+        "not_found": sorted(set(marks_by_id) - set(current)),
+        "changes": [
+            {"id": row["b_id"], "attended": row["b_attended"], "submitted_work": row["b_submitted_work"]}
+            for row in rows
+        ],
+    }
+
+async def can_access_group(db: AsyncSession, user: dict, group_id: int) -> bool:
+    """Администратору доступна любая группа, учителю — только свои"""
+    if user.get("role") == "admin":
+        return True
+    if user.get("role") != "teacher":
         return False
-    
-    # Удаляем связанные экзамены
-    await db.execute(
-        Exam.__table__.delete().where(Exam.id_student == student_id)
-    )
-    
-    # Удаляем связанные записи на экзамен (telegram)
-    await db.execute(
-        ExamRegistration.__table__.delete().where(ExamRegistration.student_id == student_id)
+    username = user.get("username") or user.get("sub")
+    result = await db.execute(
+        select(StudyGroup.id)
+        .join(Employee, Employee.id == StudyGroup.teacher_id)
+        .where(StudyGroup.id == group_id, Employee.username == username)
     )
-    
-    # Удаляем связи с группами
-    await db.execute(
-        group_student_association.delete().where(
-            group_student_association.c.student_id == student_id
+    return result.scalar_one_or_none() is not None
+
+async def accessible_student_groups(db: AsyncSession, user: dict, student_id: int) -> List[int]:
+    """Группы ученика, доступные пользователю: администратору — все, учителю — свои"""
+    query = select(group_student_association.c.group_id).where(group_student_association.c.student_id == student_id)
+    if user.get("role") != "admin":
+        query = (
+            query.join(StudyGroup, StudyGroup.id == group_student_association.c.group_id)
+            .join(Employee, Employee.id == StudyGroup.teacher_id)
+            .where(Employee.username == (user.get("username") or user.get("sub")))
         )
-    )
-    
-    # Удаляем самого студента
-    await db.delete(db_student)
-    await db.commit()
-    return True
+    result = await db.execute(query)
+    return list(result.scalars().all())
 
 # ==================== EXAM CRUD ====================
 
@@ -124,7 +271,11 @@ async def create_exam(db: AsyncSession, exam: ExamCreate):
 
     db_exam = Exam(**exam.dict())
     db.add(db_exam)
+    await db.flush()
+    await summaries.refresh(db, [(db_exam.id_student, db_exam.exam_type_id)])
     await db.commit()
+    await rankings.refresh(db, [(db_exam.id_student, db_exam.exam_type_id)])
+    trends.discard_exam_types([db_exam.exam_type_id])
     await db.refresh(db_exam)
     # Обновляем студента, чтобы изменения статуса сохранились
     await db.refresh(student)
@@ -150,7 +301,10 @@ async def get_exam(db: AsyncSession, exam_id: int):
 async def get_exams_with_students(db: AsyncSession, skip: int = 0, limit: int = 100):
     result = await db.execute(
         select(Exam)
-        .options(selectinload(Exam.exam_type), selectinload(Exam.student))
+        .options(
+            selectinload(Exam.exam_type),
+            selectinload(Exam.student).selectinload(Student.exam_registrations)
+        )
         .join(Student)
         .offset(skip)
         .limit(limit)
@@ -185,10 +339,16 @@ async def update_exam(db: AsyncSession, exam_id: int, exam_update: ExamUpdate):
         if not exam_type:
             raise ValueError("Тип экзамена не найден")
 
+    pairs = {(db_exam.id_student, db_exam.exam_type_id)}
     for field, value in update_data.items():
         setattr(db_exam, field, value)
-    
+    pairs.add((db_exam.id_student, db_exam.exam_type_id))
+
+    await db.flush()
+    await summaries.refresh(db, pairs)
     await db.commit()
+    await rankings.refresh(db, pairs)
+    trends.discard_exam_types(exam_type_id for _, exam_type_id in pairs)
     await db.refresh(db_exam)
     return db_exam
 
@@ -222,37 +382,19 @@ async def create_exam_type(db: AsyncSession, name: str, group_id: int, completed
         if completed_tasks is not None:
             exam_type.completed_tasks = completed_tasks
             await db.commit()
+            trends.invalidate(group_id)
             await db.refresh(exam_type)
         return exam_type
 
-    # Логируем перед созданием
-    print(f"CRUD: Creating exam type with completed_tasks={completed_tasks}, type={type(completed_tasks)}")
-    
-    # Создаем объект ExamType
-    # Явно устанавливаем completed_tasks, чтобы убедиться, что оно сохраняется
     exam_type = ExamType(
         name=name, 
-        group_id=group_id
+        group_id=group_id,
+        completed_tasks=completed_tasks
     )
-    
-    # Явно устанавливаем completed_tasks после создания объекта
-    if completed_tasks is not None:
-        exam_type.completed_tasks = completed_tasks
-        print(f"CRUD: Set completed_tasks to {exam_type.completed_tasks}")
-    
     db.add(exam_type)
-    await db.flush()  # Flush перед commit, чтобы проверить состояние
-    print(f"CRUD: After flush - completed_tasks={exam_type.completed_tasks}, type={type(exam_type.completed_tasks)}")
     await db.commit()
+    trends.invalidate(group_id)
     await db.refresh(exam_type)
-    print(f"CRUD: After refresh - completed_tasks={exam_type.completed_tasks}, type={type(exam_type.completed_tasks)}")
-    
-    # Проверяем, что данные действительно сохранились
-    # Читаем из БД заново для проверки
-    verify_result = await db.execute(select(ExamType).where(ExamType.id == exam_type.id))
-    verify_exam_type = verify_result.scalar_one_or_none()
-    if verify_exam_type:
-        print(f"CRUD: Verified from DB - completed_tasks={verify_exam_type.completed_tasks}, type={type(verify_exam_type.completed_tasks)}")
     
     return exam_type
 
@@ -264,34 +406,32 @@ async def delete_exam(db: AsyncSession, exam_id: int):
         return False
     
     await db.delete(db_exam)
+    await db.flush()
+    await summaries.refresh(db, [(db_exam.id_student, db_exam.exam_type_id)])
     await db.commit()
+    await rankings.refresh(db, [(db_exam.id_student, db_exam.exam_type_id)])
+    trends.discard_exam_types([db_exam.exam_type_id])
     return True
 
-async def delete_exam_type(db: AsyncSession, exam_type_id: int):
-    """Удаление типа экзамена. Сначала проверяем, есть ли экзамены с этим типом."""
-    # Проверяем, есть ли экзамены с этим типом
-    exams_result = await db.execute(
-        select(Exam).where(Exam.exam_type_id == exam_type_id)
-    )
-    exams = exams_result.scalars().all()
-    
-    if exams:
-        # Если есть экзамены, сначала удаляем их
-        for exam in exams:
-            await db.delete(exam)
-    
-    # Удаляем сам тип экзамена
-    exam_type_result = await db.execute(
-        select(ExamType).where(ExamType.id == exam_type_id)
-    )
-    db_exam_type = exam_type_result.scalar_one_or_none()
-    
-    if db_exam_type is None:
-        return False
-    
-    await db.delete(db_exam_type)
+async def delete_exam_types(db: AsyncSession, exam_type_ids: List[int]) -> Dict[str, int]:
+    """Удаление типов экзаменов вместе со всеми экзаменами этих типов"""
+    counts = {"exam_types": 0, "exams": 0}
+    for chunk in chunked(set(exam_type_ids)):
+        await summaries.discard(db, ExamSummary.exam_type_id.in_(chunk))
+        result = await db.execute(Exam.__table__.delete().where(Exam.exam_type_id.in_(chunk)))
+        counts["exams"] += result.rowcount
+        result = await db.execute(ExamType.__table__.delete().where(ExamType.id.in_(chunk)))
+        counts["exam_types"] += result.rowcount
+
     await db.commit()
-    return True
+    rankings.clear()
+    trends.clear()
+    return counts
+
+async def delete_exam_type(db: AsyncSession, exam_type_id: int) -> Optional[Dict[str, int]]:
+    """Удаление типа экзамена вместе со всеми экзаменами этого типа"""
+    counts = await delete_exam_types(db, [exam_type_id])
+    return counts if counts["exam_types"] else None
 
 # ==================== GROUP CRUD ====================
 
@@ -306,8 +446,6 @@ async def create_group(db: AsyncSession, group: GroupCreate):
             # schedule уже должен быть словарем, SQLAlchemy JSON обработает его автоматически
             pass
         
-        print(f"Creating group with data: {group_data}")  # Отладочный вывод
-        
         db_group = StudyGroup(**group_data)
         db.add(db_group)
         await db.flush()  # Flush перед commit для проверки, но не commit здесь
@@ -316,11 +454,7 @@ async def create_group(db: AsyncSession, group: GroupCreate):
         return db_group
     except Exception as e:
         await db.rollback()
-        print(f"Error creating group: {e}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        traceback.print_exc()
-        print(f"Group data: {group_data if 'group_data' in locals() else 'N/A'}")
+        logger.exception("Ошибка создания группы: %s", group_data if 'group_data' in locals() else 'N/A')
         raise
 
 async def get_groups_with_students(db: AsyncSession):
@@ -341,6 +475,73 @@ async def get_group(db: AsyncSession, group_id: int):
     )
     return result.scalar_one_or_none()
 
+async def get_group_results_matrix(db: AsyncSession, group_id: int) -> Optional[Dict]:
+    """
+    Матрица результатов группы (ученики × типы экзаменов) двумя запросами:
+    группа с типами экзаменов и ученики с их экзаменами этих типов.
+
+    Ответ колоночный: списки учеников и типов, плюс плотные массивы по ячейкам
+    в порядке строк (индекс = номер ученика * число типов + номер типа);
+    пустая ячейка — None.
+    """
+    types_result = await db.execute(
+        select(StudyGroup.name, StudyGroup.subject, ExamType.id, ExamType.name, ExamType.completed_tasks)
+        .outerjoin(ExamType, ExamType.group_id == StudyGroup.id)
+        .where(StudyGroup.id == group_id)
+        .order_by(ExamType.id)
+    )
+    type_rows = types_result.all()
+    if not type_rows:
+        return None
+    group_name, subject = type_rows[0][0], type_rows[0][1]
+    type_rows = [row for row in type_rows if row[2] is not None]
+    type_index = {row[2]: index for index, row in enumerate(type_rows)}
+
+    students_result = await db.execute(
+        select(Student.id, Student.fio, Student.class_num, Exam.id, Exam.exam_type_id, Exam.subject, Exam.answer, Exam.comment)
+        .join(group_student_association, group_student_association.c.student_id == Student.id)
+        .outerjoin(Exam, and_(
+            Exam.id_student == Student.id,
+            Exam.exam_type_id.in_(select(ExamType.id).where(ExamType.group_id == group_id))
+        ))
+        .where(group_student_association.c.group_id == group_id)
+        .order_by(Student.fio, Student.id, Exam.id)
+    )
+
+    width = len(type_rows)
+    matrix = {
+        "student_ids": [], "student_names": [], "class_nums": [],
+        "exam_ids": [], "answers": [], "scores": [], "comments": [],
+    }
+    offsets: Dict[int, int] = {}
+    for student_id, fio, class_num, exam_id, exam_type_id, exam_subject, answer, comment in students_result.all():
+        if student_id not in offsets:
+            offsets[student_id] = len(matrix["student_ids"]) * width
+            matrix["student_ids"].append(student_id)
+            matrix["student_names"].append(fio)
+            matrix["class_nums"].append(class_num)
+            for column in ("exam_ids", "answers", "scores", "comments"):
+                matrix[column].extend([None] * width)
+        if exam_id is None:
+            continue
+        # Несколько экзаменов одного типа — в ячейке последний
+        cell = offsets[student_id] + type_index[exam_type_id]
+        matrix["exam_ids"][cell] = exam_id
+        matrix["answers"][cell] = answer
+        matrix["scores"][cell] = scoring.primary_score(subject or exam_subject, scoring.parse_answer(answer))
+        matrix["comments"][cell] = comment
+
+    return {
+        "group_id": group_id,
+        "group_name": group_name,
+        "subject": subject,
+        "max_score": scoring.max_primary(subject),
+        "exam_type_ids": [row[2] for row in type_rows],
+        "exam_type_names": [row[3] for row in type_rows],
+        "completed_tasks": [row[4] or [] for row in type_rows],
+        **matrix,
+    }
+
 async def update_group(db: AsyncSession, group_id: int, group_update: GroupUpdate):
     """Обновление информации о группе (название, школа, предмет, расписание и т.д.)"""
     result = await db.execute(
@@ -358,6 +559,7 @@ async def update_group(db: AsyncSession, group_id: int, group_update: GroupUpdat
         setattr(db_group, field, value)
     
     await db.commit()
+    trends.invalidate(group_id)
     
     # Перезагружаем группу со всеми связями
     result = await db.execute(
@@ -367,43 +569,139 @@ async def update_group(db: AsyncSession, group_id: int, group_update: GroupUpdat
     )
     return result.scalar_one_or_none()
 
-async def update_group_students(db: AsyncSession, group_id: int, student_ids: List[int]):
-    """Обновление состава студентов в группе"""
-    result = await db.execute(
-        select(StudyGroup)
-        .options(selectinload(StudyGroup.students), selectinload(StudyGroup.teacher))
-        .where(StudyGroup.id == group_id)
+async def group_exists(db: AsyncSession, group_id: int) -> bool:
+    result = await db.execute(select(StudyGroup.id).where(StudyGroup.id == group_id))
+    return result.scalar_one_or_none() is not None
+
+async def _add_group_members(db: AsyncSession, group_id: int, student_ids: List[int]) -> List[int]:
+    """Добавляет в группу существующих студентов, которых в ней еще нет. Возвращает добавленные ID"""
+    current_members = (
+        select(group_student_association.c.student_id)
+        .where(group_student_association.c.group_id == group_id)
     )
-    group = result.scalar_one_or_none()
-    if not group:
+    to_add: List[int] = []
+    for chunk in chunked(student_ids):
+        result = await db.execute(
+            select(Student.id).where(Student.id.in_(chunk), Student.id.not_in(current_members))
+        )
+        to_add.extend(result.scalars().all())
+
+    if to_add:
+        await db.execute(
+            insert(group_student_association),
+            [{"group_id": group_id, "student_id": student_id} for student_id in to_add]
+        )
+    return sorted(to_add)
+
+async def _remove_group_members(db: AsyncSession, group_id: int, student_ids: List[int]) -> int:
+    removed = 0
+    for chunk in chunked(student_ids):
+        result = await db.execute(
+            delete(group_student_association).where(
+                group_student_association.c.group_id == group_id,
+                group_student_association.c.student_id.in_(chunk)
+            )
+        )
+        removed += result.rowcount
+    return removed
+
+async def update_group_students(db: AsyncSession, group_id: int, student_ids: List[int]) -> Optional[Dict]:
+    """Приводит состав группы к student_ids, меняя только отличающиеся строки group_student.
+
+    Возвращает дельту: добавленные, удаленные и несуществующие ID студентов.
+    """
+    if not await group_exists(db, group_id):
         return None
 
-    # Получаем студентов по ID
-    if student_ids:
-        students_res = await db.execute(select(Student).where(Student.id.in_(student_ids)))
-        new_students = students_res.scalars().all()
-    else:
-        new_students = []
+    requested = set(student_ids)
 
-    group.students = new_students
-    await db.commit()
-    await db.refresh(group)
-    # Перезагружаем с учителем
-    result = await db.execute(
-        select(StudyGroup)
-        .options(selectinload(StudyGroup.students), selectinload(StudyGroup.teacher))
-        .where(StudyGroup.id == group_id)
+    # Текущий состав читаем по первичному ключу group_student (group_id, student_id)
+    current_result = await db.execute(
+        select(group_student_association.c.student_id)
+        .where(group_student_association.c.group_id == group_id)
     )
-    return result.scalar_one_or_none()
+    current = set(current_result.scalars().all())
+
+    added = await _add_group_members(db, group_id, sorted(requested - current))
+    removed = sorted(current - requested)
+    await _remove_group_members(db, group_id, removed)
+    await db.commit()
+    trends.invalidate(group_id)
+
+    unknown = sorted(requested - current - set(added))
+    return {"group_id": group_id, "added": added, "removed": removed, "unknown": unknown}
+
+async def add_group_student(db: AsyncSession, group_id: int, student_id: int) -> Optional[Dict]:
+    """Добавление одного студента в группу"""
+    if not await group_exists(db, group_id):
+        return None
+
+    added = await _add_group_members(db, group_id, [student_id])
+    await db.commit()
+    trends.invalidate(group_id)
+
+    unknown = []
+    if not added:
+        student_result = await db.execute(select(Student.id).where(Student.id == student_id))
+        if student_result.scalar_one_or_none() is None:
+            unknown = [student_id]
+    return {"group_id": group_id, "added": added, "removed": [], "unknown": unknown}
+
+async def remove_group_student(db: AsyncSession, group_id: int, student_id: int) -> Optional[Dict]:
+    """Удаление одного студента из группы"""
+    if not await group_exists(db, group_id):
+        return None
+
+    removed = await _remove_group_members(db, group_id, [student_id])
+    await db.commit()
+    trends.invalidate(group_id)
+    return {"group_id": group_id, "added": [], "removed": [student_id] if removed else [], "unknown": []}
+
+async def delete_groups(db: AsyncSession, group_ids: List[int]) -> Dict[str, int]:
+    """Удаление групп вместе с типами экзаменов, экзаменами и связями со студентами"""
+    counts = {"groups": 0, "exam_types": 0, "exams": 0, "group_links": 0}
+    for chunk in chunked(set(group_ids)):
+        group_exam_types = select(ExamType.id).where(ExamType.group_id.in_(chunk))
+        result = await db.execute(Exam.__table__.delete().where(Exam.exam_type_id.in_(group_exam_types)))
+        counts["exams"] += result.rowcount
+        result = await db.execute(ExamType.__table__.delete().where(ExamType.group_id.in_(chunk)))
+        counts["exam_types"] += result.rowcount
+        result = await db.execute(
+            group_student_association.delete().where(group_student_association.c.group_id.in_(chunk))
+        )
+        counts["group_links"] += result.rowcount
+        result = await db.execute(StudyGroup.__table__.delete().where(StudyGroup.id.in_(chunk)))
+        counts["groups"] += result.rowcount
+
+    await db.commit()
+    rankings.clear()
+    trends.clear()
+    return counts
 
-async def delete_group(db: AsyncSession, group_id: int):
+async def delete_group(db: AsyncSession, group_id: int) -> Optional[Dict[str, int]]:
     """Удаление группы"""
-    result = await db.execute(select(StudyGroup).where(StudyGroup.id == group_id))
-    db_group = result.scalar_one_or_none()
-    
-    if db_group is None:
-        return False
-    
-    await db.delete(db_group)
+    counts = await delete_groups(db, [group_id])
+    return counts if counts["groups"] else None
+
+# ==================== EMPLOYEE CRUD ====================
+
+async def delete_teachers(db: AsyncSession, teacher_ids: List[int]) -> Dict:
+    """Удаление учителей без групп. Учителя, у которых есть группы, пропускаются"""
+    counts = {"teachers": 0}
+    skipped: List[int] = []
+    for chunk in chunked(set(teacher_ids)):
+        with_groups = await db.execute(
+            select(StudyGroup.teacher_id).where(StudyGroup.teacher_id.in_(chunk)).distinct()
+        )
+        busy = set(with_groups.scalars().all())
+        skipped.extend(sorted(busy))
+        free = [teacher_id for teacher_id in chunk if teacher_id not in busy]
+        if not free:
+            continue
+        result = await db.execute(
+            Employee.__table__.delete().where(Employee.id.in_(free), Employee.role == "teacher")
+        )
+        counts["teachers"] += result.rowcount
+
     await db.commit()
-    return True
\ No newline at end of file
+    return {"deleted": counts, "skipped": skipped}
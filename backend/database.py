@@ -1,12 +1,29 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy import event
 from models import Base
+from db_instrumentation import instrument_engine
+from metrics import db_pool_wait_seconds, instrument_pool
 import os
+import time
 
 # SQLite база данных (можно заменить на PostgreSQL)
-DATABASE_URL = "sqlite+aiosqlite:///./school.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./school.db")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+# SQL_ECHO=1 включает вывод всех запросов (только для отладки — вывод синхронный и медленный)
+SQL_ECHO = os.getenv("SQL_ECHO", "0") == "1"
+
+engine = create_async_engine(DATABASE_URL, echo=SQL_ECHO)
+instrument_engine(engine)
+instrument_pool(engine)
+
+if engine.dialect.name == "sqlite":
+    # SQLite по умолчанию не проверяет внешние ключи и не выполняет ON DELETE CASCADE
+    @event.listens_for(engine.sync_engine, "connect")
+    def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
 
 AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
@@ -15,6 +32,10 @@ AsyncSessionLocal = sessionmaker(
 async def get_db():
     async with AsyncSessionLocal() as session:
         try:
+            # Берем соединение сразу, чтобы замерить ожидание свободного соединения в пуле
+            started = time.perf_counter()
+            await session.connection()
+            db_pool_wait_seconds.observe(time.perf_counter() - started)
             yield session
         finally:
             await session.close()
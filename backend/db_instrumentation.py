@@ -0,0 +1,166 @@
+"""
+Инструментирование SQL-запросов через события SQLAlchemy.
+
+Для каждого HTTP-запроса считает количество SQL-запросов и суммарное время в БД,
+отдает их в заголовках X-DB-Query-Count / X-DB-Time-Ms и пишет структурированный лог.
+Медленные запросы (дольше SLOW_QUERY_MS) пишутся в отдельный лог: форма SQL и число
+параметров. Значения параметров (хеши паролей, телефоны, ФИО) пишутся, только если
+явно включен SLOW_QUERY_LOG_PARAMS.
+Если за один HTTP-запрос одна и та же форма SQL выполняется больше N_PLUS_ONE_THRESHOLD раз,
+пишется предупреждение о возможной проблеме N+1.
+"""
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG_FILE = os.getenv("SLOW_QUERY_LOG_FILE")
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+# Писать значения параметров в лог медленных запросов (в них бывают персональные данные)
+SLOW_QUERY_LOG_PARAMS = os.getenv("SLOW_QUERY_LOG_PARAMS", "").lower() in ("1", "true", "yes")
+# Сколько параметров запроса писать в лог медленных запросов
+SLOW_QUERY_MAX_PARAMS = 20
+
+request_logger = logging.getLogger("exams.request")
+slow_query_logger = logging.getLogger("exams.sql.slow")
+n_plus_one_logger = logging.getLogger("exams.sql.n_plus_one")
+
+if SLOW_QUERY_LOG_FILE:
+    _slow_handler = logging.FileHandler(SLOW_QUERY_LOG_FILE, encoding="utf-8")
+    _slow_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    slow_query_logger.addHandler(_slow_handler)
+
+# Списки параметров IN (?, ?, ?) разной длины считаем одной формой запроса
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class QueryStats:
+    """Счетчики SQL-запросов в рамках одного HTTP-запроса"""
+
+    __slots__ = ("count", "total_ms", "shapes")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.shapes = Counter()
+
+    def repeated_shapes(self, threshold: int):
+        return [(shape, n) for shape, n in self.shapes.most_common() if n > threshold]
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("db_query_stats", default=None)
+
+
+def statement_shape(statement: str) -> str:
+    """Нормализует SQL для группировки одинаковых запросов"""
+    shape = _WHITESPACE_RE.sub(" ", statement).strip()
+    return _IN_LIST_RE.sub("(?)", shape)
+
+
+def truncate_parameters(parameters):
+    """Обрезает длинные списки параметров (IN (...), executemany) для лога"""
+    if isinstance(parameters, (list, tuple)) and len(parameters) > SLOW_QUERY_MAX_PARAMS:
+        return list(parameters[:SLOW_QUERY_MAX_PARAMS]) + [f"... всего {len(parameters)}"]
+    return parameters
+
+
+def start_request_stats() -> QueryStats:
+    stats = QueryStats()
+    _current_stats.set(stats)
+    return stats
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current_stats.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_start_time"].pop()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.total_ms += elapsed_ms
+        stats.shapes[statement_shape(statement)] += 1
+
+    if elapsed_ms >= SLOW_QUERY_MS:
+        record = {
+            "event": "slow_query",
+            "duration_ms": round(elapsed_ms, 2),
+            "statement": statement_shape(statement),
+            "parameter_count": len(parameters) if parameters else 0,
+            "executemany": executemany,
+        }
+        if SLOW_QUERY_LOG_PARAMS:
+            record["parameters"] = truncate_parameters(parameters)
+        slow_query_logger.warning(json.dumps(record, ensure_ascii=False, default=str))
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute не вызывается при ошибке — убираем время старта упавшего запроса
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_start_time"):
+        connection.info["query_start_time"].pop()
+
+
+def instrument_engine(engine: AsyncEngine):
+    """Подключает обработчики событий к движку"""
+    sync_engine = engine.sync_engine
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+def add_query_stats_middleware(app):
+    """Middleware: заголовки X-DB-*, структурированный лог запроса и предупреждения N+1"""
+
+    @app.middleware("http")
+    async def query_stats_middleware(request, call_next):
+        stats = start_request_stats()
+        started = time.perf_counter()
+        response = await call_next(request)
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        response.headers["X-DB-Query-Count"] = str(stats.count)
+        response.headers["X-DB-Time-Ms"] = f"{stats.total_ms:.2f}"
+
+        route = request.scope.get("route")
+        request_logger.info(json.dumps({
+            "event": "request",
+            "method": request.method,
+            "path": request.url.path,
+            "route": getattr(route, "path", None),
+            "status": response.status_code,
+            "duration_ms": round(duration_ms, 2),
+            "db_queries": stats.count,
+            "db_time_ms": round(stats.total_ms, 2),
+        }, ensure_ascii=False))
+
+        for shape, n in stats.repeated_shapes(N_PLUS_ONE_THRESHOLD):
+            n_plus_one_logger.warning(json.dumps({
+                "event": "n_plus_one",
+                "method": request.method,
+                "path": request.url.path,
+                "repeats": n,
+                "statement": shape,
+            }, ensure_ascii=False))
+
+        return response
+
+    return query_stats_middleware
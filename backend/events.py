@@ -0,0 +1,123 @@
+"""
+Лента событий пробника для телеграм-бота (long-poll).
+
+Маршруты публикуют события после успешного commit:
+- probnik_activated / probnik_deactivated / probnik_updated — изменения пробника;
+- registration_changed — запись создана, перенесена, подтверждена или удалена.
+
+Бот держит запрос GET /telegram/events?after=<id>&timeout=<сек>: ответ приходит
+сразу, если после after уже есть события, иначе — при первом новом событии или
+по таймауту с пустым списком.
+
+События хранятся в памяти, в кольцевом буфере последних EVENTS_BUFFER_SIZE штук.
+Идентификаторы растут монотонно и начинаются с текущего времени в миллисекундах,
+поэтому после перезапуска бэкенда новые id больше старых. Если клиент просит
+события после id, которых в буфере уже нет (буфер переполнился или бэкенд
+перезапускался), ответ содержит reset=true — клиент должен заново прочитать
+состояние (активный пробник) и продолжать с last_id.
+
+Буфер общий для одного процесса: бэкенд запускается одним воркером uvicorn.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", "1000"))
+# Максимальное время ожидания одного long-poll запроса, секунды
+EVENTS_MAX_TIMEOUT = float(os.getenv("EVENTS_MAX_TIMEOUT", "55"))
+
+PROBNIK_ACTIVATED = "probnik_activated"
+PROBNIK_DEACTIVATED = "probnik_deactivated"
+PROBNIK_UPDATED = "probnik_updated"
+REGISTRATION_CHANGED = "registration_changed"
+LOTTERY_WAITLISTED = "lottery_waitlisted"
+
+
+class EventFeed:
+    def __init__(self, size: int = EVENTS_BUFFER_SIZE):
+        self._events: Deque[Dict] = deque(maxlen=size)
+        self._last_id = int(time.time() * 1000)
+        self._changed = asyncio.Event()
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    def publish(self, event_type: str, **payload) -> Dict:
+        self._last_id += 1
+        event = {
+            "id": self._last_id,
+            "type": event_type,
+            "created_at": datetime.utcnow().isoformat(),
+            "data": payload,
+        }
+        self._events.append(event)
+        # Будим всех ожидающих и сразу готовим новое событие для следующих
+        self._changed.set()
+        self._changed = asyncio.Event()
+        logger.info(f"Событие {event_type} #{event['id']}: {payload}")
+        return event
+
+    def since(self, after: int) -> Optional[List[Dict]]:
+        """События после after; None — часть событий потеряна, нужен reset"""
+        if after > self._last_id:
+            return None
+        if after == self._last_id:
+            return []
+        oldest = self._events[0]["id"] if self._events else self._last_id + 1
+        if after < oldest - 1:
+            return None
+        return [event for event in self._events if event["id"] > after]
+
+    async def wait(self, after: Optional[int], timeout: float) -> Dict:
+        if after is None:
+            return {"events": [], "last_id": self._last_id, "reset": True}
+
+        events = self.since(after)
+        if events is None:
+            return {"events": [], "last_id": self._last_id, "reset": True}
+        if not events and timeout > 0:
+            changed = self._changed
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=min(timeout, EVENTS_MAX_TIMEOUT))
+            except asyncio.TimeoutError:
+                pass
+            events = self.since(after)
+            if events is None:
+                return {"events": [], "last_id": self._last_id, "reset": True}
+        last_id = events[-1]["id"] if events else after
+        return {"events": events, "last_id": last_id, "reset": False}
+
+
+feed = EventFeed()
+
+
+def publish(event_type: str, **payload) -> Dict:
+    return feed.publish(event_type, **payload)
+
+
+def registration_payload(registration, action: str) -> Dict:
+    """Данные события registration_changed (без персональных данных ученика)"""
+    exam_date = registration.exam_date
+    if isinstance(exam_date, datetime):
+        exam_date = exam_date.strftime("%Y-%m-%d")
+    return {
+        "action": action,
+        "registration_id": registration.id,
+        "student_id": registration.student_id,
+        "probnik_id": registration.probnik_id,
+        "subject": registration.subject,
+        "exam_date": exam_date,
+        "exam_time": registration.exam_time,
+        "school": registration.school,
+    }
+
+
+def publish_registration_changed(registration, action: str, **extra) -> Dict:
+    return feed.publish(REGISTRATION_CHANGED, **registration_payload(registration, action), **extra)
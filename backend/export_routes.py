@@ -0,0 +1,102 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Optional
+
+from database import get_db
+from auth import get_current_user
+from route_helpers import parse_date, require_admin
+import crud
+import exports
+import schemas
+
+router = APIRouter(prefix="/exports", tags=["exports"])
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+async def _check(db: AsyncSession, user: dict, kind: str, params: Dict):
+    """Проверка прав и параметров: ведомости группы — учителю группы, остальное — администратору"""
+    try:
+        await exports.validate(db, kind, params)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except LookupError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    if kind == "results":
+        if not await crud.can_access_group(db, user, params["group_id"]):
+            raise HTTPException(status_code=403, detail="Нет доступа к этой группе")
+    else:
+        require_admin(user)
+
+
+def _params(probnik_id, school, exam_date, exam_time, group_id, status) -> Dict:
+    return {
+        "probnik_id": probnik_id,
+        "school": school,
+        "exam_date": parse_date(exam_date),
+        "exam_time": exam_time,
+        "group_id": group_id,
+        "status": status,
+    }
+
+
+@router.get("/{kind}.csv")
+async def stream_export(
+    kind: str,
+    probnik_id: Optional[int] = Query(None),
+    school: Optional[str] = Query(None),
+    date: Optional[str] = Query(None, description="Дата в формате YYYY-MM-DD"),
+    time: Optional[str] = Query(None),
+    group_id: Optional[int] = Query(None),
+    status: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """CSV отдается потоком, по мере чтения строк из базы"""
+    params = _params(probnik_id, school, date, time, group_id, status)
+    await _check(db, user, kind, params)
+    return StreamingResponse(
+        exports.stream_csv(kind, params),
+        media_type=MEDIA_TYPES["csv"],
+        headers={"Content-Disposition": f'attachment; filename="{kind}.csv"'}
+    )
+
+
+@router.post("/jobs", response_model=schemas.ExportJobResponse, status_code=202)
+async def create_export_job(
+    request: schemas.ExportJobRequest,
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Фоновая выгрузка (CSV или XLSX): статус — GET /exports/jobs/{id}, файл — .../download"""
+    if request.format not in exports.FORMATS:
+        raise HTTPException(status_code=400, detail="Формат должен быть csv или xlsx")
+    params = _params(request.probnik_id, request.school, request.exam_date, request.exam_time,
+                     request.group_id, request.status)
+    await _check(db, user, request.kind, params)
+    job = exports.start_job(request.kind, request.format, params, owner=user.get("sub"))
+    return job.describe()
+
+
+def _get_job(job_id: str, user: dict) -> exports.ExportJob:
+    job = exports.jobs.get(job_id)
+    if not job or (user.get("role") != "admin" and job.owner != user.get("sub")):
+        raise HTTPException(status_code=404, detail="Выгрузка не найдена")
+    return job
+
+
+@router.get("/jobs/{job_id}", response_model=schemas.ExportJobResponse)
+async def get_export_job(job_id: str, user: dict = Depends(get_current_user)):
+    return _get_job(job_id, user).describe()
+
+
+@router.get("/jobs/{job_id}/download")
+async def download_export(job_id: str, user: dict = Depends(get_current_user)):
+    job = _get_job(job_id, user)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Выгрузка еще не готова (статус {job.status})")
+    return FileResponse(job.path, media_type=MEDIA_TYPES[job.format], filename=job.filename)
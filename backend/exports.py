@@ -0,0 +1,481 @@
+"""
+Выгрузки в CSV и XLSX: списки слотов пробника, ведомости результатов группы
+с баллами по заданиям и списки для обзвона родителей.
+
+Строки читаются потоком (yield_per, по EXPORT_BATCH_SIZE строк за раз):
+
+- CSV отдается клиенту сразу, по мере чтения (stream_csv);
+- XLSX собирается в пуле процессов workers.py: строки уходят туда пачками
+  (write_sheet_rows дописывает их в файл строк листа), затем write_xlsx упаковывает
+  книгу. XML листа и сжатие zip — работа для процессора, в процессе сервера она
+  остановила бы цикл событий.
+
+Большие выгрузки запускаются фоновыми заданиями (start_job): файл пишется в
+EXPORT_DIR, статус доступен по id задания, готовый файл хранится EXPORT_TTL секунд
+(потом его удаляет задача планировщика purge_exports).
+"""
+import asyncio
+import csv
+import io
+import logging
+import os
+import re
+import secrets
+import shutil
+import tempfile
+import time
+import zipfile
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import scoring
+import seating
+import workers
+from database import AsyncSessionLocal
+from models import (
+    Exam, ExamRegistration, ExamType, Probnik, SeatAssignment, Student, StudyGroup, group_student_association
+)
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = os.getenv("EXPORT_DIR") or os.path.join(tempfile.gettempdir(), "exams_exports")
+EXPORT_TTL = int(os.getenv("EXPORT_TTL", "3600"))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+# Одновременно выполняемых фоновых заданий (остальные ждут в очереди)
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", "2"))
+
+KINDS = ("roster", "results", "parent_calls")
+FORMATS = ("csv", "xlsx")
+CONTACT_STATUSES = {
+    "informed": "Информация передана",
+    "callback": "Перезвонить позже",
+    "no_answer": "Нет ответа",
+}
+
+Dataset = Tuple[str, List[str], AsyncIterator[list]]
+
+
+async def _stream(db: AsyncSession, query) -> AsyncIterator:
+    result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    async for partition in result.partitions():
+        for row in partition:
+            yield row
+
+
+def _date(value: Optional[datetime]) -> str:
+    return value.strftime("%Y-%m-%d") if value else ""
+
+
+def _yes(value) -> str:
+    return "да" if value else ""
+
+
+# ==================== НАБОРЫ ДАННЫХ ====================
+
+async def roster(db: AsyncSession, probnik_id: int, school: Optional[str] = None,
+                 exam_date: Optional[datetime] = None, exam_time: Optional[str] = None) -> Dataset:
+    """Записи пробника по слотам (с аудиторией и местом, если рассадка есть)"""
+    probnik = await db.get(Probnik, probnik_id)
+    if not probnik:
+        raise LookupError("Пробник не найден")
+    query = (
+        select(
+            ExamRegistration.exam_date, ExamRegistration.exam_time, ExamRegistration.school,
+            SeatAssignment.room, SeatAssignment.seat, Student.fio, Student.class_num, Student.phone,
+            ExamRegistration.subject, ExamRegistration.confirmed, ExamRegistration.attended,
+            ExamRegistration.submitted_work
+        )
+        .join(Student, Student.id == ExamRegistration.student_id)
+        .outerjoin(SeatAssignment, (SeatAssignment.registration_id == ExamRegistration.id)
+                   & (SeatAssignment.school == ExamRegistration.school)
+                   & (SeatAssignment.exam_date == ExamRegistration.exam_date)
+                   & (SeatAssignment.exam_time == ExamRegistration.exam_time))
+        .where(seating.slot_filters(ExamRegistration, probnik_id, school, exam_date, exam_time))
+        .order_by(
+            ExamRegistration.exam_date, ExamRegistration.exam_time, ExamRegistration.school,
+            SeatAssignment.room.is_(None), SeatAssignment.room, SeatAssignment.seat, Student.fio
+        )
+    )
+    header = ["Дата", "Время", "Школа", "Аудитория", "Место", "ФИО", "Класс", "Телефон",
+              "Предмет", "Подтвердил", "Пришел", "Сдал работу"]
+
+    async def rows():
+        async for (exam_date_value, time_value, school_value, room, seat, fio, class_num, phone,
+                   subject, confirmed, attended, submitted) in _stream(db, query):
+            yield [_date(exam_date_value), time_value, school_value or "", room or "", seat or "",
+                   fio, class_num or "", phone or "", subject, _yes(confirmed), _yes(attended), _yes(submitted)]
+
+    return f"Запись {probnik.name}", header, rows()
+
+
+async def results(db: AsyncSession, group_id: int) -> Dataset:
+    """Ведомость группы: строка на ученика и тип экзамена, баллы по заданиям"""
+    group = await db.get(StudyGroup, group_id)
+    if not group:
+        raise LookupError("Группа не найдена")
+    limits = scoring.max_per_task(group.subject)
+    if limits is not None:
+        tasks = len(limits)
+    else:
+        # Предмет без конфигурации — столько колонок, сколько заданий в самом длинном ответе
+        longest = await db.execute(
+            select(func.max(func.length(Exam.answer) - func.length(func.replace(Exam.answer, ",", ""))))
+            .join(ExamType, ExamType.id == Exam.exam_type_id)
+            .where(ExamType.group_id == group_id)
+        )
+        commas = longest.scalar()
+        tasks = commas + 1 if commas is not None else 0
+    query = (
+        select(Student.fio, Student.class_num, ExamType.name, Exam.subject, Exam.answer, Exam.comment)
+        .join(Exam, Exam.id_student == Student.id)
+        .join(ExamType, ExamType.id == Exam.exam_type_id)
+        .where(ExamType.group_id == group_id)
+        .order_by(Student.fio, Student.id, ExamType.id, Exam.id)
+    )
+    header = (["ФИО", "Класс", "Экзамен"] + [str(n) for n in range(1, tasks + 1)]
+              + ["Первичный балл", "Тестовый балл", "Комментарий"])
+
+    async def rows():
+        async for fio, class_num, exam_name, subject, answer, comment in _stream(db, query):
+            scores = scoring.parse_answer(answer)
+            cells = [("-" if score is None else score) for score in scores[:tasks]]
+            cells += [""] * (tasks - len(cells))
+            primary = scoring.primary_score(subject, scores)
+            yield ([fio, class_num or "", exam_name] + cells
+                   + [primary, scoring.scaled_score(subject, primary), comment or ""])
+
+    return f"Результаты {group.name}", header, rows()
+
+
+async def parent_calls(db: AsyncSession, group_id: Optional[int] = None,
+                       status: Optional[str] = None) -> Dataset:
+    """Список для обзвона родителей: телефон, группы, статус связи и комментарий"""
+    groups = (
+        select(
+            group_student_association.c.student_id,
+            func.group_concat(StudyGroup.name, ", ").label("groups")
+        )
+        .join(StudyGroup, StudyGroup.id == group_student_association.c.group_id)
+        .group_by(group_student_association.c.student_id)
+        .subquery()
+    )
+    query = (
+        select(Student.fio, Student.class_num, Student.phone, groups.c.groups,
+               Student.parent_contact_status, Student.admin_comment)
+        .outerjoin(groups, groups.c.student_id == Student.id)
+        .order_by(Student.fio, Student.id)
+    )
+    if group_id is not None:
+        query = query.where(Student.id.in_(
+            select(group_student_association.c.student_id).where(group_student_association.c.group_id == group_id)
+        ))
+    if status == "none":
+        query = query.where((Student.parent_contact_status.is_(None)) | (Student.parent_contact_status == ""))
+    elif status:
+        query = query.where(Student.parent_contact_status == status)
+    header = ["ФИО", "Класс", "Телефон", "Группы", "Статус связи", "Комментарий"]
+
+    async def rows():
+        async for fio, class_num, phone, group_names, contact_status, comment in _stream(db, query):
+            yield [fio, class_num or "", phone or "", group_names or "",
+                   CONTACT_STATUSES.get(contact_status, contact_status or ""), comment or ""]
+
+    return "Обзвон родителей", header, rows()
+
+
+async def validate(db: AsyncSession, kind: str, params: Dict):
+    """Проверка до начала выгрузки: потоковый ответ уже не может вернуть 400/404"""
+    if kind not in KINDS:
+        raise ValueError(f"Неизвестный тип выгрузки: {kind}")
+    if kind == "roster":
+        if params.get("probnik_id") is None:
+            raise ValueError("Не указан probnik_id")
+        if not await db.get(Probnik, params["probnik_id"]):
+            raise LookupError("Пробник не найден")
+    if kind == "results" and params.get("group_id") is None:
+        raise ValueError("Не указан group_id")
+    if params.get("group_id") is not None and not await db.get(StudyGroup, params["group_id"]):
+        raise LookupError("Группа не найдена")
+
+
+async def dataset(db: AsyncSession, kind: str, params: Dict) -> Dataset:
+    if kind == "roster":
+        if params.get("probnik_id") is None:
+            raise ValueError("Не указан probnik_id")
+        return await roster(db, params["probnik_id"], params.get("school"),
+                            params.get("exam_date"), params.get("exam_time"))
+    if kind == "results":
+        if params.get("group_id") is None:
+            raise ValueError("Не указан group_id")
+        return await results(db, params["group_id"])
+    if kind == "parent_calls":
+        return await parent_calls(db, params.get("group_id"), params.get("status"))
+    raise ValueError(f"Неизвестный тип выгрузки: {kind}")
+
+
+# ==================== CSV ====================
+
+def _csv_line(values: List) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, delimiter=";").writerow(values)
+    return buffer.getvalue()
+
+
+async def _csv_chunks(kind: str, params: Dict, stats: Dict) -> AsyncIterator[bytes]:
+    # Сессия своя: зависимость get_db закрывается раньше, чем потоковый ответ отдан до конца
+    async with AsyncSessionLocal() as db:
+        _, header, rows = await dataset(db, kind, params)
+        chunk = ["\ufeff", _csv_line(header)]
+        async for row in rows:
+            chunk.append(_csv_line(row))
+            stats["rows"] += 1
+            if len(chunk) >= EXPORT_BATCH_SIZE:
+                yield "".join(chunk).encode("utf-8")
+                chunk = []
+        if chunk:
+            yield "".join(chunk).encode("utf-8")
+
+
+def stream_csv(kind: str, params: Dict) -> AsyncIterator[bytes]:
+    """CSV по мере чтения строк (разделитель «;» и BOM — для Excel)"""
+    return _csv_chunks(kind, params, {"rows": 0})
+
+
+async def write_csv_file(path: str, kind: str, params: Dict) -> int:
+    stats = {"rows": 0}
+    with open(path, "wb") as output:
+        async for chunk in _csv_chunks(kind, params, stats):
+            output.write(chunk)
+    return stats["rows"]
+
+
+# ==================== XLSX ====================
+
+_ILLEGAL_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _column(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _cell(ref: str, value, style: int = 0) -> str:
+    style_attr = f' s="{style}"' if style else ""
+    if isinstance(value, bool):
+        value = "да" if value else ""
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"{style_attr}><v>{value}</v></c>'
+    text = escape(_ILLEGAL_XML.sub("", str(value)))
+    if not text:
+        return ""
+    return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+# Стиль 1 — жирный шрифт (заголовок)
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+    '</styleSheet>'
+)
+
+
+def write_sheet_rows(part_path: str, first_number: int, rows: List[list]) -> None:
+    """
+    Дописывает строки листа (XML <row>) в конец part_path, нумерация с first_number;
+    строка 1 — заголовок. Выполняется в пуле процессов, по пачке за вызов.
+    """
+    with open(part_path, "ab") as part:
+        for number, values in enumerate(rows, start=first_number):
+            style = 1 if number == 1 else 0
+            cells = "".join(_cell(f"{_column(index)}{number}", value, style) for index, value in enumerate(values))
+            part.write(f'<row r="{number}">{cells}</row>'.encode("utf-8"))
+
+
+def write_xlsx(path: str, title: str, part_path: str) -> int:
+    """
+    Книга с одним листом (inline-строки, без общей таблицы строк): строки листа
+    копируются в zip из part_path, собранного write_sheet_rows. Выполняется в пуле
+    процессов. Возвращает размер файла.
+    """
+    sheet_name = escape(re.sub(r"[\[\]:*?/\\]", " ", title)[:31] or "Лист1", {'"': "&quot;"})
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        archive.writestr("_rels/.rels", _ROOT_RELS)
+        archive.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        archive.writestr("xl/styles.xml", _STYLES)
+        archive.writestr(
+            "xl/workbook.xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{sheet_name}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        )
+        with archive.open("xl/worksheets/sheet1.xml", "w") as sheet, open(part_path, "rb") as part:
+            sheet.write(
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" '
+                'activePane="bottomLeft" state="frozen"/></sheetView></sheetViews><sheetData>'.encode("utf-8")
+            )
+            shutil.copyfileobj(part, sheet, 1 << 20)
+            sheet.write(b"</sheetData></worksheet>")
+    return os.path.getsize(path)
+
+
+async def build_xlsx(path: str, kind: str, params: Dict) -> int:
+    """
+    Читает строки потоком и отправляет их в пул процессов пачками по
+    EXPORT_BATCH_SIZE: воркер дописывает пачку в файл строк листа рядом с path,
+    в конце из него собирается книга. В памяти сервера — не больше одной пачки.
+    Возвращает число строк.
+    """
+    part_path = f"{path}.rows"
+    count = 0
+    try:
+        async with AsyncSessionLocal() as db:
+            title, header, rows = await dataset(db, kind, params)
+            batch = [header]
+            async for row in rows:
+                batch.append(row)
+                if len(batch) >= EXPORT_BATCH_SIZE:
+                    await workers.run(write_sheet_rows, part_path, count + 1, batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                await workers.run(write_sheet_rows, part_path, count + 1, batch)
+                count += len(batch)
+        await workers.run(write_xlsx, path, title, part_path)
+    finally:
+        try:
+            os.remove(part_path)
+        except FileNotFoundError:
+            pass
+    return count - 1
+
+
+# ==================== ФОНОВЫЕ ЗАДАНИЯ ====================
+
+class ExportJob:
+    def __init__(self, kind: str, fmt: str, params: Dict, owner: Optional[str]):
+        self.id = secrets.token_urlsafe(12)
+        self.kind = kind
+        self.format = fmt
+        self.params = params
+        self.owner = owner
+        self.status = "pending"  # pending, running, done, failed
+        self.rows: Optional[int] = None
+        self.size: Optional[int] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self.path = os.path.join(EXPORT_DIR, f"{self.id}.{fmt}")
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def filename(self) -> str:
+        return f"{self.kind}_{self.created_at.strftime('%Y%m%d_%H%M%S')}.{self.format}"
+
+    def describe(self) -> Dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "format": self.format,
+            "status": self.status,
+            "rows": self.rows,
+            "size": self.size,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+jobs: Dict[str, ExportJob] = {}
+_slots: Optional[asyncio.Semaphore] = None
+
+
+async def _run(job: ExportJob):
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(EXPORT_CONCURRENCY)
+    async with _slots:
+        job.status = "running"
+        started = time.perf_counter()
+        try:
+            os.makedirs(EXPORT_DIR, exist_ok=True)
+            if job.format == "xlsx":
+                job.rows = await build_xlsx(job.path, job.kind, job.params)
+            else:
+                job.rows = await write_csv_file(job.path, job.kind, job.params)
+            job.size = os.path.getsize(job.path)
+            job.status = "done"
+            logger.info(
+                f"Выгрузка {job.id} ({job.kind}.{job.format}): {job.rows} строк, "
+                f"{job.size} байт за {time.perf_counter() - started:.2f} с"
+            )
+        except Exception as exc:
+            job.status = "failed"
+            job.error = str(exc)
+            logger.exception(f"Ошибка выгрузки {job.id} ({job.kind}.{job.format})")
+        finally:
+            job.finished_at = datetime.utcnow()
+
+
+def start_job(kind: str, fmt: str, params: Dict, owner: Optional[str]) -> ExportJob:
+    job = ExportJob(kind, fmt, params, owner)
+    jobs[job.id] = job
+    job.task = asyncio.create_task(_run(job))
+    return job
+
+
+def purge_expired(now: Optional[datetime] = None) -> int:
+    """Удаляет завершенные задания старше EXPORT_TTL вместе с файлами"""
+    now = now or datetime.utcnow()
+    expired = [
+        job for job in jobs.values()
+        if job.finished_at and (now - job.finished_at).total_seconds() > EXPORT_TTL
+    ]
+    for job in expired:
+        jobs.pop(job.id, None)
+        try:
+            os.remove(job.path)
+        except FileNotFoundError:
+            pass
+    return len(expired)
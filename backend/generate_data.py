@@ -0,0 +1,300 @@
+"""
+Генератор синтетических данных для локальной проверки на объемах продакшена.
+
+Заполняет пустую базу учителями, группами с расписанием, учениками,
+типами экзаменов с completed_tasks, результатами экзаменов (ответы в формате
+"1,0,2,-,1" по заданиям предмета) и пробником с записями.
+
+Пример:
+    python generate_data.py --database-url sqlite+aiosqlite:///./synthetic.db --scale medium
+    python generate_data.py --database-url sqlite+aiosqlite:///./big.db --students 50000 --seed 7
+
+Все учителя получают пароль из --password (по умолчанию "password"),
+администратор — логин admin.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import (  # noqa: E402
+    Base, Employee, Exam, ExamRegistration, ExamType, Probnik, Student, StudyGroup,
+    group_student_association
+)
+
+# Максимальный балл по каждому заданию (как SUBJECT_TASKS во фронтенде)
+SUBJECT_TASKS: Dict[str, List[int]] = {
+    'rus': [1, 1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 1, 22],
+    'math_profile': [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 3, 3, 3, 4, 5],
+    'math_base': [1] * 21,
+    'phys': [1, 1, 1, 1, 2, 2, 1, 1, 2, 2, 1, 1, 1, 2, 2, 1, 2, 2, 1, 1, 3, 2, 2, 3, 3, 4],
+    'infa': [1] * 25 + [2, 2],
+    'soc': [1, 2, 1, 2, 2, 2, 2, 2, 1, 2, 2, 1, 2, 2, 2, 2, 2, 2, 3, 3, 3, 4, 3, 4, 6],
+    'math_9': [1] * 19 + [2] * 6,
+    'rus_9': [6, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 7, 3, 3, 3, 3, 1],
+    'infa_9': [1] * 12 + [2, 2, 3, 2, 2],
+    'soc_9': [2, 1, 1, 1, 3, 2, 1, 1, 1, 1, 1, 4, 1, 1, 2, 1, 1, 1, 1, 1, 2, 2, 3, 2],
+}
+EGE_SUBJECT_CODES = ['rus', 'math_profile', 'math_base', 'phys', 'infa', 'soc']
+OGE_SUBJECT_CODES = ['math_9', 'rus_9', 'infa_9', 'soc_9']
+
+# Названия предметов для записи на пробник (как в telegram_routes)
+OGE_SUBJECTS = ["Русский язык", "Математика", "Обществознание", "История", "Биология",
+                "Химия", "Физика", "Информатика", "География"]
+EGE_SUBJECTS = ["Русский язык", "Математика (профиль)", "Математика (база)", "Обществознание",
+                "История", "Биология", "Химия", "Физика", "Информатика", "Английский язык"]
+
+SCHOOLS = ["Байкальская", "Лермонтова"]
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday"]
+LESSON_TIMES = ["10:00-12:00", "14:00-16:00", "16:00-18:00", "18:00-20:00"]
+
+LAST_NAMES = ["Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов",
+              "Новиков", "Федоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семенов", "Егоров",
+              "Павлов", "Козлов", "Степанов", "Николаев", "Орлов", "Андреев", "Макаров", "Никитин"]
+FIRST_NAMES_M = ["Александр", "Дмитрий", "Максим", "Сергей", "Андрей", "Алексей", "Артем", "Илья",
+                 "Кирилл", "Михаил", "Никита", "Матвей", "Роман", "Егор", "Иван"]
+FIRST_NAMES_F = ["Анастасия", "Мария", "Анна", "Виктория", "Екатерина", "Наталья", "Марина",
+                 "Полина", "София", "Дарья", "Алиса", "Ксения", "Елизавета", "Вероника"]
+PATRONYMICS = ["Александров", "Дмитриев", "Сергеев", "Андреев", "Алексеев", "Михайлов", "Игорев",
+               "Владимиров", "Николаев", "Евгеньев"]
+
+SCALES = {
+    "small": {"teachers": 10, "groups": 40, "students": 2000, "exam_types_per_group": 6, "registrations": 1500},
+    "medium": {"teachers": 40, "groups": 300, "students": 20000, "exam_types_per_group": 8, "registrations": 15000},
+    "large": {"teachers": 80, "groups": 800, "students": 50000, "exam_types_per_group": 10, "registrations": 40000},
+}
+
+BATCH_SIZE = 5000
+
+
+def random_fio(rng: random.Random) -> str:
+    last = rng.choice(LAST_NAMES)
+    if rng.random() < 0.5:
+        return f"{last} {rng.choice(FIRST_NAMES_M)} {rng.choice(PATRONYMICS)}ич"
+    return f"{last}а {rng.choice(FIRST_NAMES_F)} {rng.choice(PATRONYMICS)}на"
+
+
+def random_answer(rng: random.Random, max_per_task: List[int], skill: float) -> str:
+    """Ответ в формате фронтенда: баллы по заданиям через запятую, "-" — не приступал"""
+    parts = []
+    for max_score in max_per_task:
+        if rng.random() < 0.05:
+            parts.append("-")
+            continue
+        # Число набранных баллов: биномиальное с вероятностью, зависящей от уровня ученика
+        parts.append(str(sum(1 for _ in range(max_score) if rng.random() < skill)))
+    return ",".join(parts)
+
+
+async def _insert_batches(conn, table, rows: List[dict]):
+    for start in range(0, len(rows), BATCH_SIZE):
+        await conn.execute(insert(table), rows[start:start + BATCH_SIZE])
+
+
+async def generate(database_url: str, teachers: int, groups: int, students: int,
+                   exam_types_per_group: int, registrations: int, seed: int = 42,
+                   password: str = "password", participation: float = 0.85,
+                   progress=print) -> Dict[str, int]:
+    """Заполняет пустую базу синтетическими данными. Возвращает количество созданных строк"""
+    from auth import hash_password
+
+    rng = random.Random(seed)
+    engine = create_async_engine(database_url)
+    counts: Dict[str, int] = {}
+
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            existing = (await conn.execute(select(func.count()).select_from(Student))).scalar()
+            if existing:
+                raise RuntimeError(f"База не пустая ({existing} учеников) — укажите новый файл базы")
+
+            started = time.perf_counter()
+            password_hash = hash_password(password)
+
+            # Сотрудники: администратор + учителя
+            employee_rows = [{"id": 1, "username": "admin", "password_hash": password_hash,
+                              "role": "admin", "teacher_name": "Администратор"}]
+            for i in range(teachers):
+                employee_rows.append({
+                    "id": i + 2, "username": f"teacher{i + 1}", "password_hash": password_hash,
+                    "role": "teacher", "teacher_name": random_fio(rng)
+                })
+            await _insert_batches(conn, Employee.__table__, employee_rows)
+            counts["employees"] = len(employee_rows)
+
+            # Группы: ОГЭ для 9 класса, ЕГЭ для 10-11
+            group_rows = []
+            for group_id in range(1, groups + 1):
+                is_oge = rng.random() < 0.4
+                subject = rng.choice(OGE_SUBJECT_CODES if is_oge else EGE_SUBJECT_CODES)
+                days = rng.sample(WEEKDAYS, 2)
+                group_rows.append({
+                    "id": group_id,
+                    "name": f"{subject}-{group_id}",
+                    "school": rng.choice(SCHOOLS),
+                    "exam_type": "ОГЭ" if is_oge else "ЕГЭ",
+                    "subject": subject,
+                    "teacher_id": rng.randint(2, teachers + 1),
+                    "schedule": {day: rng.choice(LESSON_TIMES) for day in days},
+                })
+            await _insert_batches(conn, StudyGroup.__table__, group_rows)
+            counts["groups"] = len(group_rows)
+            oge_groups = [g["id"] for g in group_rows if g["exam_type"] == "ОГЭ"] or [group_rows[0]["id"]]
+            ege_groups = [g["id"] for g in group_rows if g["exam_type"] == "ЕГЭ"] or [group_rows[0]["id"]]
+
+            # Ученики; часть привязана к Telegram
+            now = datetime.utcnow()
+            student_rows = []
+            for student_id in range(1, students + 1):
+                has_telegram = rng.random() < 0.6
+                student_rows.append({
+                    "id": student_id,
+                    "fio": random_fio(rng),
+                    "phone": f"+79{rng.randint(100000000, 999999999)}",
+                    "class_num": rng.choice([9, 10, 11]),
+                    "user_id": 100000000 + student_id if has_telegram else None,
+                    "confirmed_at": now - timedelta(days=rng.randint(0, 60)) if has_telegram else None,
+                    "parent_contact_status": rng.choice([None, None, "informed", "callback", "no_answer"]),
+                })
+            await _insert_batches(conn, Student.__table__, student_rows)
+            counts["students"] = len(student_rows)
+
+            # Членство в группах: 1-3 группы своего уровня
+            members: Dict[int, List[int]] = {g["id"]: [] for g in group_rows}
+            for student in student_rows:
+                pool = oge_groups if student["class_num"] == 9 else ege_groups
+                for group_id in rng.sample(pool, min(len(pool), rng.choice([1, 1, 2, 2, 3]))):
+                    members[group_id].append(student["id"])
+            link_rows = [
+                {"group_id": group_id, "student_id": student_id}
+                for group_id, student_ids in members.items() for student_id in student_ids
+            ]
+            await _insert_batches(conn, group_student_association, link_rows)
+            counts["group_links"] = len(link_rows)
+            progress(f"  сотрудники, группы, ученики: {time.perf_counter() - started:.1f} с")
+
+            # Типы экзаменов и результаты
+            skills = {s["id"]: rng.uniform(0.25, 0.95) for s in student_rows}
+            exam_type_rows, exam_rows = [], []
+            exam_type_id = 0
+            for group in group_rows:
+                max_per_task = SUBJECT_TASKS[group["subject"]]
+                for n in range(1, exam_types_per_group + 1):
+                    exam_type_id += 1
+                    covered = max(1, len(max_per_task) * n // exam_types_per_group)
+                    exam_type_rows.append({
+                        "id": exam_type_id,
+                        "name": f"Пробник {n}",
+                        "group_id": group["id"],
+                        "completed_tasks": list(range(1, covered + 1)),
+                    })
+                    for student_id in members[group["id"]]:
+                        if rng.random() > participation:
+                            continue
+                        exam_rows.append({
+                            "exam_type_id": exam_type_id,
+                            "id_student": student_id,
+                            "subject": group["subject"],
+                            "answer": random_answer(rng, max_per_task, skills[student_id]),
+                            "comment": None,
+                        })
+            await _insert_batches(conn, ExamType.__table__, exam_type_rows)
+            await _insert_batches(conn, Exam.__table__, exam_rows)
+            counts["exam_types"] = len(exam_type_rows)
+            counts["exams"] = len(exam_rows)
+            progress(f"  типы экзаменов и результаты: {time.perf_counter() - started:.1f} с")
+
+            # Активный пробник и записи на него
+            first_day = date.today() + timedelta(days=14)
+            exam_days = [first_day + timedelta(days=i) for i in range(4)]
+            times = ["9:00", "12:00"]
+            exam_dates = [{"label": d.strftime("%d.%m.%y"), "date": d.isoformat(), "times": times} for d in exam_days]
+            slots = {t: 45 for t in times}
+            probnik_id = (await conn.execute(insert(Probnik.__table__).values(
+                name="Зимний пробник", is_active=True, created_at=now,
+                slots_baikalskaya=slots, slots_lermontova=slots,
+                exam_dates=exam_dates, exam_times=times,
+                exam_dates_baikalskaya=exam_dates, exam_dates_lermontova=exam_dates,
+                exam_times_baikalskaya=times, exam_times_lermontova=times,
+                max_registrations=4
+            ))).inserted_primary_key[0]
+            counts["probniks"] = 1
+
+            telegram_students = [s for s in student_rows if s["user_id"]]
+            registration_rows = []
+            per_student: Dict[int, int] = {}
+            # Не больше вместимости слота (школа, день, время), как при записи через бота
+            slot_counts: Dict[tuple, int] = {}
+            for _ in range(min(registrations, len(telegram_students) * 4)):
+                student = rng.choice(telegram_students)
+                slot = (rng.choice(SCHOOLS), rng.choice(exam_days), rng.choice(times))
+                if per_student.get(student["id"], 0) >= 4 or slot_counts.get(slot, 0) >= slots[slot[2]]:
+                    continue
+                per_student[student["id"]] = per_student.get(student["id"], 0) + 1
+                slot_counts[slot] = slot_counts.get(slot, 0) + 1
+                confirmed = rng.random() < 0.5
+                registration_rows.append({
+                    "student_id": student["id"],
+                    "subject": rng.choice(OGE_SUBJECTS if student["class_num"] == 9 else EGE_SUBJECTS),
+                    "exam_date": datetime.combine(slot[1], datetime.min.time()),
+                    "exam_time": slot[2],
+                    "school": slot[0],
+                    "created_at": now - timedelta(hours=rng.randint(0, 240)),
+                    "confirmed": confirmed,
+                    "confirmed_at": now if confirmed else None,
+                    "attended": False,
+                    "submitted_work": False,
+                    "probnik_id": probnik_id,
+                })
+            await _insert_batches(conn, ExamRegistration.__table__, registration_rows)
+            counts["registrations"] = len(registration_rows)
+            progress(f"  пробник и записи: {time.perf_counter() - started:.1f} с")
+    finally:
+        await engine.dispose()
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True, help="URL новой (пустой) базы")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small", help="Готовый набор объемов")
+    parser.add_argument("--teachers", type=int, help="Количество учителей")
+    parser.add_argument("--groups", type=int, help="Количество групп")
+    parser.add_argument("--students", type=int, help="Количество учеников")
+    parser.add_argument("--exam-types-per-group", type=int, help="Типов экзаменов на группу")
+    parser.add_argument("--registrations", type=int, help="Записей на пробник")
+    parser.add_argument("--participation", type=float, default=0.85, help="Доля учеников группы, сдававших каждый экзамен")
+    parser.add_argument("--password", default="password", help="Пароль всех сотрудников")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    config = dict(SCALES[args.scale])
+    for key in config:
+        value = getattr(args, key)
+        if value is not None:
+            config[key] = value
+
+    print(f"Генерация ({args.scale}): {config}")
+    started = time.perf_counter()
+    counts = asyncio.run(generate(
+        args.database_url, seed=args.seed, password=args.password,
+        participation=args.participation, **config
+    ))
+    print(f"Готово за {time.perf_counter() - started:.1f} с:")
+    for name, count in counts.items():
+        print(f"  {name}: {count}")
+
+
+if __name__ == "__main__":
+    main()
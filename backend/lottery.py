@@ -0,0 +1,270 @@
+"""
+Режим лотереи при открытии записи на пробник.
+
+Если у пробника задан lottery_minutes, после активации запись идет не в порядке
+прихода: заявки (lottery_request) собираются lottery_minutes минут, а затем места
+распределяются одним розыгрышем в одной транзакции:
+
+- порядок учеников — перемешивание random.Random(lottery_seed) отсортированного
+  списка, поэтому результат воспроизводится по сохраненному зерну;
+- распределение по кругам: за круг каждый ученик в порядке розыгрыша получает
+  не больше одного места — первую из своих заявок (в порядке подачи), на которую
+  есть место. Так один ученик не забирает все места раньше, чем остальные
+  получат хотя бы одно;
+- учитываются max_registrations, вместимость слотов, пересечения по времени
+  и повтор предмета (заявки на один предмет в разное время — запасные варианты);
+- заявки на заполненные слоты уходят в лист ожидания в порядке розыгрыша.
+
+Записи и места в очереди вставляются пачками (executemany / INSERT ... RETURNING),
+статусы заявок обновляются одним flush.
+"""
+import logging
+import random
+import secrets
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import events
+import waitlist
+from models import ExamRegistration, LotteryRequest, Probnik, Student, WaitlistEntry
+
+logger = logging.getLogger(__name__)
+
+
+def start_window(probnik: Probnik, now: Optional[datetime] = None):
+    """Открывает окно приема заявок при активации пробника (если режим лотереи включен)"""
+    if not probnik.lottery_minutes:
+        probnik.lottery_ends_at = None
+        probnik.lottery_seed = None
+        probnik.lottery_drawn_at = None
+        return
+    now = now or datetime.utcnow()
+    probnik.lottery_ends_at = now + timedelta(minutes=probnik.lottery_minutes)
+    probnik.lottery_seed = secrets.randbelow(2 ** 31)
+    probnik.lottery_drawn_at = None
+
+
+def is_open(probnik: Probnik, now: Optional[datetime] = None) -> bool:
+    """Идет прием заявок"""
+    now = now or datetime.utcnow()
+    return bool(probnik.lottery_ends_at and probnik.lottery_drawn_at is None and now < probnik.lottery_ends_at)
+
+
+def is_pending(probnik: Probnik) -> bool:
+    """Окно лотереи открыто или розыгрыш еще не проведен — обычная запись закрыта"""
+    return bool(probnik.lottery_ends_at and probnik.lottery_drawn_at is None)
+
+
+async def draw(db: AsyncSession, probnik_id: int) -> Optional[Dict]:
+    """
+    Розыгрыш мест по заявкам пробника. Commit делает вызывающий код.
+    Возвращает None, если розыгрыш уже проведен (или лотерея не включалась).
+    """
+    # Отмечаем розыгрыш проведенным до распределения: параллельный вызов (задача
+    # планировщика и ручной запуск) увидит rowcount 0 и ничего не сделает
+    claimed = await db.execute(
+        update(Probnik)
+        .where(Probnik.id == probnik_id, Probnik.lottery_ends_at.isnot(None), Probnik.lottery_drawn_at.is_(None))
+        .values(lottery_drawn_at=datetime.utcnow())
+    )
+    if claimed.rowcount == 0:
+        return None
+    result = await db.execute(
+        select(Probnik).where(Probnik.id == probnik_id).execution_options(populate_existing=True)
+    )
+    probnik = result.scalar_one()
+    max_registrations = probnik.max_registrations if probnik.max_registrations is not None else waitlist.DEFAULT_MAX_REGISTRATIONS
+
+    requests_result = await db.execute(
+        select(LotteryRequest)
+        .where(LotteryRequest.probnik_id == probnik_id, LotteryRequest.status == 'pending')
+        .order_by(LotteryRequest.id)
+    )
+    requests = requests_result.scalars().all()
+
+    # Уже существующие записи и очереди (например, добавленные администратором)
+    slot_counts: Counter = Counter()
+    student_counts: Counter = Counter()
+    student_times = set()
+    student_subjects = set()
+    existing = await db.execute(
+        select(ExamRegistration.student_id, ExamRegistration.subject, ExamRegistration.school,
+               ExamRegistration.exam_date, ExamRegistration.exam_time)
+        .where(ExamRegistration.probnik_id == probnik_id)
+    )
+    for student_id, subject, school, exam_date, exam_time in existing.all():
+        slot_counts[(school, exam_date, exam_time)] += 1
+        student_counts[student_id] += 1
+        student_times.add((student_id, exam_date, exam_time))
+        student_subjects.add((student_id, subject))
+    queue_lengths: Counter = Counter()
+    queued = set()
+    existing_entries = await db.execute(
+        select(WaitlistEntry.student_id, WaitlistEntry.subject, WaitlistEntry.school,
+               WaitlistEntry.exam_date, WaitlistEntry.exam_time)
+        .where(WaitlistEntry.probnik_id == probnik_id)
+    )
+    for student_id, subject, school, exam_date, exam_time in existing_entries.all():
+        queue_lengths[(school, exam_date, exam_time)] += 1
+        queued.add((student_id, subject, exam_date, exam_time))
+
+    queues: Dict[int, Deque[LotteryRequest]] = {}
+    for request in requests:
+        queues.setdefault(request.student_id, deque()).append(request)
+    order = sorted(queues)
+    random.Random(probnik.lottery_seed).shuffle(order)
+
+    won: List[LotteryRequest] = []
+    full: List[LotteryRequest] = []
+    rejected = 0
+    while order:
+        next_round = []
+        for student_id in order:
+            queue = queues[student_id]
+            while queue:
+                request = queue.popleft()
+                slot = (request.school, request.exam_date, request.exam_time)
+                if (student_counts[student_id] >= max_registrations
+                        or (student_id, request.exam_date, request.exam_time) in student_times
+                        or (student_id, request.subject) in student_subjects):
+                    request.status = 'rejected'
+                    rejected += 1
+                    continue
+                if slot_counts[slot] >= waitlist.slot_capacity(probnik, request.school, request.exam_time):
+                    full.append(request)
+                    continue
+                request.status = 'won'
+                slot_counts[slot] += 1
+                student_counts[student_id] += 1
+                student_times.add((student_id, request.exam_date, request.exam_time))
+                student_subjects.add((student_id, request.subject))
+                won.append(request)
+                break
+            if queue:
+                next_round.append(student_id)
+        order = next_round
+
+    # Заявки на заполненные слоты — в лист ожидания в порядке розыгрыша, если этот
+    # предмет ученик не получил по другой заявке (например, на другое время)
+    waitlisted: List[Tuple[LotteryRequest, int]] = []
+    for request in full:
+        if (request.student_id, request.subject) in student_subjects:
+            request.status = 'rejected'
+            rejected += 1
+            continue
+        request.status = 'waitlisted'
+        if (request.student_id, request.subject, request.exam_date, request.exam_time) not in queued:
+            slot = (request.school, request.exam_date, request.exam_time)
+            queue_lengths[slot] += 1
+            waitlisted.append((request, queue_lengths[slot]))
+
+    # add_all + flush: SQLAlchemy вставляет записи пачками (INSERT ... RETURNING),
+    # а события сессии обновляют сводные счетчики (rollups.py)
+    registrations = [
+        ExamRegistration(
+            student_id=request.student_id,
+            subject=request.subject,
+            exam_date=request.exam_date,
+            exam_time=request.exam_time,
+            school=request.school,
+            probnik_id=probnik_id
+        )
+        for request in won
+    ]
+    db.add_all(registrations)
+    await db.flush()
+    for request, registration in zip(won, registrations):
+        request.registration_id = registration.id
+    if waitlisted:
+        await db.execute(
+            insert(WaitlistEntry),
+            [
+                {
+                    "student_id": request.student_id,
+                    "probnik_id": probnik_id,
+                    "subject": request.subject,
+                    "exam_date": request.exam_date,
+                    "exam_time": request.exam_time,
+                    "school": request.school,
+                    "created_at": datetime.utcnow(),
+                }
+                for request, _ in waitlisted
+            ]
+        )
+    await db.flush()
+
+    logger.info(
+        f"Розыгрыш пробника {probnik_id} (зерно {probnik.lottery_seed}): заявок {len(requests)}, "
+        f"записано {len(won)}, в очереди {len(waitlisted)}, отклонено {rejected}"
+    )
+    return {
+        "probnik_id": probnik_id,
+        "seed": probnik.lottery_seed,
+        "requests": len(requests),
+        "won": len(won),
+        "waitlisted": len(waitlisted),
+        "rejected": rejected,
+        "registrations": registrations,
+        "waitlisted_requests": waitlisted,
+    }
+
+
+async def publish_results(db: AsyncSession, result: Dict):
+    """После commit: напоминания и события для учеников (бот сообщает итоги розыгрыша)"""
+    await waitlist.publish_promoted(db, result["registrations"], action="lottery")
+    waitlisted = result["waitlisted_requests"]
+    if waitlisted:
+        students = await db.execute(
+            select(Student.id, Student.user_id).where(Student.id.in_({request.student_id for request, _ in waitlisted}))
+        )
+        user_ids = dict(students.all())
+        for request, position in waitlisted:
+            events.publish(
+                events.LOTTERY_WAITLISTED,
+                user_id=user_ids.get(request.student_id),
+                student_id=request.student_id,
+                probnik_id=request.probnik_id,
+                subject=request.subject,
+                exam_date=request.exam_date.strftime("%Y-%m-%d"),
+                exam_time=request.exam_time,
+                school=request.school,
+                position=position
+            )
+    events.publish(events.PROBNIK_UPDATED, probnik_id=result["probnik_id"], is_active=True)
+
+
+def summary(result: Dict) -> Dict:
+    return {key: result[key] for key in ("probnik_id", "seed", "requests", "won", "waitlisted", "rejected")}
+
+
+async def draw_due(db: AsyncSession) -> List[Dict]:
+    """Розыгрыш для всех активных пробников, у которых закончилось окно приема заявок"""
+    result = await db.execute(
+        select(Probnik.id).where(
+            Probnik.is_active == True,
+            Probnik.lottery_ends_at <= datetime.utcnow(),
+            Probnik.lottery_drawn_at.is_(None)
+        )
+    )
+    drawn = []
+    for probnik_id in result.scalars().all():
+        outcome = await draw(db, probnik_id)
+        await db.commit()
+        if outcome:
+            await publish_results(db, outcome)
+            drawn.append(summary(outcome))
+    return drawn
+
+
+async def count_requests(db: AsyncSession, probnik_id: int, student_id: int) -> int:
+    result = await db.execute(
+        select(func.count(LotteryRequest.id)).where(
+            LotteryRequest.probnik_id == probnik_id,
+            LotteryRequest.student_id == student_id
+        )
+    )
+    return result.scalar_one()
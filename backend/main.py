@@ -1,25 +1,51 @@
 from fastapi import FastAPI, Depends, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
+from sqlalchemy import func
 from typing import List, Optional
 from datetime import datetime
+import logging
 import os
 
-from database import get_db, create_tables
+from database import get_db, create_tables, AsyncSessionLocal
+from db_instrumentation import add_query_stats_middleware
+import events
+import lottery
+import maintenance
+import metrics
+import reminders
+import reportcards
+import rollups
+import seating
+import summaries
+import trends
+import waitlist
+import workers
 import crud
 import schemas
 from schemas import GroupStudentsUpdate, GroupUpdate
 from models import Base, Student, Exam, StudyGroup, Employee, ExamRegistration, Probnik, ExamType, group_student_association
 
 from auth_routes import router as auth_router
-from auth import get_current_user
+from auth import get_current_user, hash_password_async
+from route_helpers import parse_date
 from telegram_routes import router as telegram_router
+from checkin_routes import router as checkin_router
+from export_routes import router as export_router
+from ranking_routes import router as ranking_router
+from similarity_routes import router as similarity_router
 
 
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="Student Exam System", version="1.0.0")
 
 def normalize_student_data(student):
@@ -77,21 +103,97 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Метрики Prometheus (подключаются первыми, чтобы оказаться внутри счетчика SQL-запросов)
+metrics.add_metrics_middleware(app)
+
+# Счетчики SQL-запросов на каждый HTTP-запрос и лог медленных запросов
+add_query_stats_middleware(app)
+
 os.makedirs("static", exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 app.include_router(auth_router)
 app.include_router(telegram_router)
+app.include_router(checkin_router)
+app.include_router(export_router)
+app.include_router(ranking_router)
+app.include_router(similarity_router)
+
+job_scheduler = maintenance.create_scheduler()
 
 @app.on_event("startup")
 async def startup_event():
     await create_tables()
+    # Периодическое обслуживание (ANALYZE, очистка и досоздание напоминаний)
+    await job_scheduler.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await job_scheduler.stop()
+    workers.shutdown()
+
+@app.get("/scheduler/jobs")
+async def get_scheduler_jobs(user: dict = Depends(get_current_user)):
+    """Состояние периодических задач (только для администратора)"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Доступ запрещен. Только для администратора")
+    return job_scheduler.describe()
 
 # Обработчик OPTIONS для всех путей (для CORS preflight запросов)
 @app.options("/{full_path:path}")
 async def options_handler(full_path: str):
     return {"message": "OK"}
 
+async def collect_probnik_slots():
+    """Записи и вместимость по слотам активного пробника (считаются в момент опроса /metrics)"""
+    async with AsyncSessionLocal() as db:
+        probnik = (await db.execute(select(Probnik).where(Probnik.is_active == True))).scalar_one_or_none()
+        if not probnik:
+            return []
+        rows = await db.execute(
+            select(
+                ExamRegistration.school,
+                ExamRegistration.exam_date,
+                ExamRegistration.exam_time,
+                func.count(ExamRegistration.id)
+            )
+            .where(ExamRegistration.probnik_id == probnik.id)
+            .group_by(ExamRegistration.school, ExamRegistration.exam_date, ExamRegistration.exam_time)
+        )
+        rows = rows.all()
+
+    label_names = ("probnik_id", "school", "date", "time")
+    lines = [
+        "# HELP probnik_slot_registrations Записи на слот активного пробника",
+        "# TYPE probnik_slot_registrations gauge",
+    ]
+    capacity_lines = [
+        "# HELP probnik_slot_capacity Вместимость слота активного пробника",
+        "# TYPE probnik_slot_capacity gauge",
+    ]
+    slots_by_school = {
+        "Байкальская": probnik.slots_baikalskaya or {},
+        "Лермонтова": probnik.slots_lermontova or {},
+    }
+    for school, exam_date, exam_time, count in rows:
+        labels = metrics.format_labels(
+            label_names, (probnik.id, school or "", exam_date.strftime("%Y-%m-%d"), exam_time)
+        )
+        lines.append(f"probnik_slot_registrations{labels} {count}")
+        capacity = slots_by_school.get(school, {}).get(exam_time, 45)
+        capacity_lines.append(f"probnik_slot_capacity{labels} {capacity}")
+    return lines + capacity_lines
+
+metrics.registry.add_collector(collect_probnik_slots)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Метрики в формате Prometheus"""
+    return PlainTextResponse(
+        await metrics.registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 @app.get("/")
 async def read_root():
     return FileResponse("static/index.html")
@@ -135,15 +237,27 @@ async def update_student(
         raise HTTPException(status_code=404, detail="Student not found")
     return student
 
-@app.delete("/students/{student_id}")
+@app.delete("/students/{student_id}", response_model=schemas.DeleteResponse)
 async def delete_student(
     student_id: int,
     db: AsyncSession = Depends(get_db)
 ):
-    success = await crud.delete_student(db=db, student_id=student_id)
-    if not success:
+    deleted = await crud.delete_student(db=db, student_id=student_id)
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Student not found")
-    return {"message": "Student deleted successfully"}
+    return schemas.DeleteResponse(message="Student deleted successfully", deleted=deleted)
+
+@app.post("/students/bulk-delete", response_model=schemas.DeleteResponse)
+async def bulk_delete_students(
+    data: schemas.BulkDeleteRequest,
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Массовое удаление студентов со всеми их экзаменами и записями (только для администратора)"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Доступ запрещен. Только для администратора")
+    deleted = await crud.delete_students(db=db, student_ids=data.ids)
+    return schemas.DeleteResponse(message="Студенты удалены", deleted=deleted)
 
 @app.get("/students/{student_id}/exams", response_model=schemas.StudentWithExamsResponse)
 async def read_student_with_exams(student_id: int, db: AsyncSession = Depends(get_db)):
@@ -303,16 +417,12 @@ async def create_exam_type(
     if not exam_type.name.strip():
         raise HTTPException(status_code=400, detail="Название типа экзамена не может быть пустым")
     try:
-        # Логируем полученные данные для отладки
-        import json
-        print(f"API: Creating exam type: name={exam_type.name}, group_id={exam_type.group_id}, completed_tasks={exam_type.completed_tasks}, type={type(exam_type.completed_tasks)}")
         result = await crud.create_exam_type(
             db, 
             exam_type.name.strip(), 
             exam_type.group_id,
             completed_tasks=exam_type.completed_tasks
         )
-        print(f"API: Created exam type: id={result.id}, completed_tasks={result.completed_tasks}, type={type(result.completed_tasks)}")
         # Явно создаем ответ, чтобы убедиться, что completed_tasks включен
         # В Pydantic v1 используем parse_obj или просто конструктор
         response = schemas.ExamTypeResponse.parse_obj({
@@ -321,9 +431,6 @@ async def create_exam_type(
             'group_id': result.group_id,
             'completed_tasks': result.completed_tasks
         })
-        # Проверяем, что completed_tasks включен в сериализацию
-        response_dict = response.dict(exclude_none=False)
-        print(f"API: Response dict: {response_dict}")
         return response
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -336,13 +443,25 @@ async def create_exam_type(
             )
         raise HTTPException(status_code=500, detail=f"Ошибка создания типа экзамена: {str(e)}")
 
-@app.delete("/exam-types/{exam_type_id}")
+@app.delete("/exam-types/{exam_type_id}", response_model=schemas.DeleteResponse)
 async def delete_exam_type(exam_type_id: int, db: AsyncSession = Depends(get_db)):
     """Удаление типа экзамена. Все связанные экзамены также будут удалены."""
-    success = await crud.delete_exam_type(db=db, exam_type_id=exam_type_id)
-    if not success:
+    deleted = await crud.delete_exam_type(db=db, exam_type_id=exam_type_id)
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Exam type not found")
-    return {"message": "Exam type and all related exams deleted successfully"}
+    return schemas.DeleteResponse(message="Exam type and all related exams deleted successfully", deleted=deleted)
+
+@app.post("/exam-types/bulk-delete", response_model=schemas.DeleteResponse)
+async def bulk_delete_exam_types(
+    data: schemas.BulkDeleteRequest,
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Массовое удаление типов экзаменов вместе с экзаменами (только для администратора)"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Доступ запрещен. Только для администратора")
+    deleted = await crud.delete_exam_types(db=db, exam_type_ids=data.ids)
+    return schemas.DeleteResponse(message="Типы экзаменов удалены", deleted=deleted)
 
 # Group endpoints
 @app.post("/groups/", response_model=schemas.GroupResponse)
@@ -354,9 +473,7 @@ async def create_group(group: schemas.GroupCreate, db: AsyncSession = Depends(ge
         if not teacher:
             raise HTTPException(status_code=404, detail="Учитель не найден")
         
-        print(f"Creating group: {group}")
         created_group = await crud.create_group(db=db, group=group)
-        print(f"Group created with id: {created_group.id}")
         
         # Делаем commit после создания группы
         await db.commit()
@@ -373,16 +490,11 @@ async def create_group(group: schemas.GroupCreate, db: AsyncSession = Depends(ge
         if not group_with_teacher:
             raise HTTPException(status_code=404, detail="Созданная группа не найдена")
         
-        print(f"Group loaded: id={group_with_teacher.id}, teacher={group_with_teacher.teacher}")
-        response = schemas.GroupResponse.from_orm_with_teacher(group_with_teacher)
-        print(f"Response created successfully")
-        return response
+        return schemas.GroupResponse.from_orm_with_teacher(group_with_teacher)
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in create_group endpoint: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Ошибка создания группы")
         raise HTTPException(status_code=500, detail=f"Ошибка создания группы: {str(e)}")
 
 @app.get("/groups/", response_model=List[schemas.GroupBase])
@@ -466,6 +578,101 @@ async def read_group(group_id: int, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Группа не найдена")
     return schemas.GroupResponse.from_orm_with_teacher(group)
 
+async def _require_group_access(db: AsyncSession, user: dict, group_id: int) -> StudyGroup:
+    """Группа для эндпоинтов /groups/{id}/...: 404 — группы нет, 403 — чужая группа"""
+    group = await db.get(StudyGroup, group_id)
+    if not group:
+        raise HTTPException(status_code=404, detail="Группа не найдена")
+    if not await crud.can_access_group(db, user, group_id):
+        raise HTTPException(status_code=403, detail="Доступ запрещен")
+    return group
+
+@app.get("/groups/{group_id}/results-matrix", response_model=schemas.GroupResultsMatrix)
+async def group_results_matrix(
+    group_id: int,
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Все результаты группы одной таблицей (ученики × типы экзаменов)"""
+    await _require_group_access(db, user, group_id)
+    matrix = await crud.get_group_results_matrix(db, group_id)
+    if matrix is None:
+        raise HTTPException(status_code=404, detail="Группа не найдена")
+    return matrix
+
+@app.get("/groups/{group_id}/trends", response_model=schemas.GroupTrend)
+async def group_trends(
+    group_id: int,
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Динамика группы по типам экзаменов: баллы, скользящие средние, освоение заданий"""
+    await _require_group_access(db, user, group_id)
+    rollup = await trends.rollup(db, group_id)
+    if rollup is None:
+        raise HTTPException(status_code=404, detail="Группа не найдена")
+    return rollup.group_payload()
+
+@app.get("/groups/{group_id}/trends/students/{student_id}", response_model=schemas.StudentTrend)
+async def student_trends(
+    group_id: int,
+    student_id: int,
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Динамика ученика в группе, включая освоение каждого задания"""
+    await _require_group_access(db, user, group_id)
+    rollup = await trends.rollup(db, group_id)
+    if rollup is None:
+        raise HTTPException(status_code=404, detail="Группа не найдена")
+    payload = rollup.student_payload(student_id)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Ученик не состоит в группе")
+    return payload
+
+@app.get("/groups/{group_id}/results-summary", response_model=List[schemas.ExamSummaryResponse])
+async def group_results_summary(
+    group_id: int,
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Результаты группы: строка на ученика и тип экзамена со всеми посчитанными показателями"""
+    await _require_group_access(db, user, group_id)
+    rows = await summaries.load_group(db, group_id)
+    return [schemas.ExamSummaryResponse(**row._mapping) for row in rows]
+
+@app.get("/groups/{group_id}/report-cards.zip")
+async def group_report_cards(
+    group_id: int,
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Карточки успеваемости всех учеников группы (HTML для печати) одним архивом"""
+    group = await _require_group_access(db, user, group_id)
+    content = await reportcards.group_zip(db, group)
+    return Response(
+        content,
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="report_cards_{group_id}.zip"'}
+    )
+
+@app.get("/students/{student_id}/report-card", response_class=HTMLResponse)
+async def student_report_card(
+    student_id: int,
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Карточка ученика: администратору — по всем группам, учителю — по его группам"""
+    student = await db.get(Student, student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+    group_ids = await crud.accessible_student_groups(db, user, student_id)
+    if user.get("role") != "admin" and not group_ids:
+        raise HTTPException(status_code=403, detail="Доступ запрещен")
+    card = await reportcards.load_student(db, student, group_ids)
+    pages = await reportcards.render([card])
+    return HTMLResponse(pages[0])
+
 @app.put("/groups/{group_id}", response_model=schemas.GroupResponse)
 async def update_group(
     group_id: int,
@@ -484,48 +691,54 @@ async def update_group(
         raise HTTPException(status_code=404, detail="Группа не найдена")
     return schemas.GroupResponse.from_orm_with_teacher(group)
 
-@app.put("/groups/{group_id}/students/")
+@app.put("/groups/{group_id}/students/", response_model=schemas.GroupStudentsDelta)
 async def update_group_students(
     group_id: int,
     data: GroupStudentsUpdate,
     db: AsyncSession = Depends(get_db)
 ):
-    group = await crud.update_group_students(db=db, group_id=group_id, student_ids=data.student_ids)
-    if not group:
+    delta = await crud.update_group_students(db=db, group_id=group_id, student_ids=data.student_ids)
+    if delta is None:
+        raise HTTPException(404, "Группа не найдена")
+    return schemas.GroupStudentsDelta(message="Состав группы обновлён", **delta)
+
+@app.post("/groups/{group_id}/students/{student_id}", response_model=schemas.GroupStudentsDelta)
+async def add_group_student(group_id: int, student_id: int, db: AsyncSession = Depends(get_db)):
+    """Добавление одного студента в группу"""
+    delta = await crud.add_group_student(db=db, group_id=group_id, student_id=student_id)
+    if delta is None:
+        raise HTTPException(404, "Группа не найдена")
+    if delta["unknown"]:
+        raise HTTPException(404, "Студент не найден")
+    return schemas.GroupStudentsDelta(message="Студент добавлен в группу", **delta)
+
+@app.delete("/groups/{group_id}/students/{student_id}", response_model=schemas.GroupStudentsDelta)
+async def remove_group_student(group_id: int, student_id: int, db: AsyncSession = Depends(get_db)):
+    """Удаление одного студента из группы"""
+    delta = await crud.remove_group_student(db=db, group_id=group_id, student_id=student_id)
+    if delta is None:
         raise HTTPException(404, "Группа не найдена")
-    return {"message": "Состав группы обновлён"}
+    return schemas.GroupStudentsDelta(message="Студент удалён из группы", **delta)
 
-@app.delete("/groups/{group_id}")
+@app.delete("/groups/{group_id}", response_model=schemas.DeleteResponse)
 async def delete_group(group_id: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(StudyGroup).where(StudyGroup.id == group_id))
-    group = result.scalar_one_or_none()
-    if not group:
+    # Группа удаляется вместе с типами экзаменов, экзаменами и связями со студентами
+    deleted = await crud.delete_group(db=db, group_id=group_id)
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Группа не найдена")
-    
-    # Сначала получаем все связанные exam_types
-    exam_types_result = await db.execute(
-        select(ExamType).where(ExamType.group_id == group_id)
-    )
-    exam_types = exam_types_result.scalars().all()
-    exam_type_ids = [et.id for et in exam_types]
-    
-    # Удаляем все exams, связанные с этими exam_types
-    if exam_type_ids:
-        exams_result = await db.execute(
-            select(Exam).where(Exam.exam_type_id.in_(exam_type_ids))
-        )
-        exams = exams_result.scalars().all()
-        for exam in exams:
-            await db.delete(exam)
-    
-    # Затем удаляем exam_types
-    for exam_type in exam_types:
-        await db.delete(exam_type)
-    
-    # И наконец удаляем саму группу
-    await db.delete(group)
-    await db.commit()
-    return {"message": "Группа удалена"}
+    return schemas.DeleteResponse(message="Группа удалена", deleted=deleted)
+
+@app.post("/groups/bulk-delete", response_model=schemas.DeleteResponse)
+async def bulk_delete_groups(
+    data: schemas.BulkDeleteRequest,
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Массовое удаление групп (только для администратора)"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Доступ запрещен. Только для администратора")
+    deleted = await crud.delete_groups(db=db, group_ids=data.ids)
+    return schemas.DeleteResponse(message="Группы удалены", deleted=deleted)
 
 # Employee endpoints
 @app.get("/teachers/", response_model=List[schemas.EmployeeOut])
@@ -562,10 +775,9 @@ async def create_teacher(
     if existing_user:
         raise HTTPException(status_code=400, detail="Пользователь с таким именем уже существует")
     
-    from auth import hash_password
     new_teacher = Employee(
         username=teacher_data.username,
-        password_hash=hash_password(teacher_data.password),
+        password_hash=await hash_password_async(teacher_data.password),
         role="teacher",
         teacher_name=teacher_data.teacher_name
     )
@@ -610,8 +822,7 @@ async def update_teacher(
     
     # Если обновляется пароль, хешируем его
     if "password" in update_data:
-        from auth import hash_password
-        teacher.password_hash = hash_password(update_data["password"])
+        teacher.password_hash = await hash_password_async(update_data["password"])
     
     if "teacher_name" in update_data:
         teacher.teacher_name = update_data["teacher_name"]
@@ -663,6 +874,18 @@ async def delete_teacher(
     
     return {"message": "Учитель успешно удален"}
 
+@app.post("/teachers/bulk-delete", response_model=schemas.DeleteResponse)
+async def bulk_delete_teachers(
+    data: schemas.BulkDeleteRequest,
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Массовое удаление учителей (только для администратора). Учителя с группами пропускаются."""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Доступ запрещен. Только для администратора")
+    result = await crud.delete_teachers(db=db, teacher_ids=data.ids)
+    return schemas.DeleteResponse(message="Учителя удалены", **result)
+
 # Exam registrations endpoints
 @app.get("/exam-registrations/", response_model=List[schemas.ExamRegistrationWithStudentResponse])
 async def get_exam_registrations(
@@ -778,6 +1001,18 @@ async def get_exam_registrations(
     return result_list
 
 
+@app.post("/exam-registrations/bulk-attendance", response_model=schemas.BulkAttendanceResponse)
+async def bulk_mark_attendance(
+    data: schemas.BulkAttendanceRequest,
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Массовая отметка явки и сдачи работы в день экзамена (только для администратора)"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Доступ запрещен. Только для администратора")
+    return await crud.mark_attendance(db=db, marks=data.items)
+
+
 @app.put("/exam-registrations/{registration_id}", response_model=schemas.ExamRegistrationWithStudentResponse)
 async def update_exam_registration(
     registration_id: int,
@@ -800,13 +1035,29 @@ async def update_exam_registration(
     if not registration:
         raise HTTPException(status_code=404, detail="Запись не найдена")
     
+    old_slot = (registration.probnik_id, registration.school, registration.exam_date, registration.exam_time)
+    
     # Обновляем поля
     update_data = registration_update.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(registration, field, value)
+    if "attended" in update_data or "submitted_work" in update_data:
+        # Время отметки — для синхронизации с устройствами на входе (checkin.py)
+        registration.attendance_marked_at = datetime.utcnow()
+    
+    # Если запись перенесли, освободившееся место — первому из листа ожидания
+    promoted = []
+    if old_slot[0] and old_slot != (registration.probnik_id, registration.school, registration.exam_date, registration.exam_time):
+        await db.flush()
+        promoted = await waitlist.promote_slot(db, *old_slot)
     
     await db.commit()
     await db.refresh(registration)
+    scheduled = await reminders.schedule_registration(db, registration)
+    events.publish_registration_changed(
+        registration, "updated", reminders=reminders.reminders_payload(scheduled)
+    )
+    await waitlist.publish_promoted(db, promoted)
     
     # Формируем ответ
     exam_date_str = ""
@@ -897,13 +1148,18 @@ async def get_all_probniks(
             created_at=p.created_at.isoformat() if p.created_at else None,
             slots_baikalskaya=p.slots_baikalskaya,
             slots_lermontova=p.slots_lermontova,
+            rooms_baikalskaya=p.rooms_baikalskaya,
+            rooms_lermontova=p.rooms_lermontova,
             exam_dates=p.exam_dates,
             exam_times=p.exam_times,
             exam_dates_baikalskaya=exam_dates_baikalskaya_dict,
             exam_dates_lermontova=exam_dates_lermontova_dict,
             exam_times_baikalskaya=p.exam_times_baikalskaya,
             exam_times_lermontova=p.exam_times_lermontova,
-            max_registrations=p.max_registrations if p.max_registrations is not None else 4
+            max_registrations=p.max_registrations if p.max_registrations is not None else 4,
+            lottery_minutes=p.lottery_minutes,
+            lottery_ends_at=p.lottery_ends_at.isoformat() if p.lottery_ends_at else None,
+            lottery_drawn_at=p.lottery_drawn_at.isoformat() if p.lottery_drawn_at else None
         ))
     return response
 
@@ -933,13 +1189,18 @@ async def get_active_probnik(db: AsyncSession = Depends(get_db)):
         created_at=probnik.created_at.isoformat() if probnik.created_at else None,
         slots_baikalskaya=probnik.slots_baikalskaya,
         slots_lermontova=probnik.slots_lermontova,
+        rooms_baikalskaya=probnik.rooms_baikalskaya,
+        rooms_lermontova=probnik.rooms_lermontova,
         exam_dates=probnik.exam_dates,
         exam_times=probnik.exam_times,
         exam_dates_baikalskaya=exam_dates_baikalskaya_dict,
         exam_dates_lermontova=exam_dates_lermontova_dict,
         exam_times_baikalskaya=probnik.exam_times_baikalskaya,
         exam_times_lermontova=probnik.exam_times_lermontova,
-        max_registrations=probnik.max_registrations if probnik.max_registrations is not None else 4
+        max_registrations=probnik.max_registrations if probnik.max_registrations is not None else 4,
+        lottery_minutes=probnik.lottery_minutes,
+        lottery_ends_at=probnik.lottery_ends_at.isoformat() if probnik.lottery_ends_at else None,
+        lottery_drawn_at=probnik.lottery_drawn_at.isoformat() if probnik.lottery_drawn_at else None
     )
 
 
@@ -954,13 +1215,12 @@ async def create_probnik(
         raise HTTPException(status_code=403, detail="Доступ запрещен")
     
     # Если создаем активный пробник, деактивируем остальные
+    deactivated_ids = []
     if probnik.is_active:
-        await db.execute(
-            select(Probnik).where(Probnik.is_active == True)
-        )
         result = await db.execute(select(Probnik).where(Probnik.is_active == True))
         for p in result.scalars().all():
             p.is_active = False
+            deactivated_ids.append(p.id)
     
     # Преобразуем exam_dates в словари
     exam_dates_dict = None
@@ -992,17 +1252,27 @@ async def create_probnik(
         is_active=probnik.is_active,
         slots_baikalskaya=probnik.slots_baikalskaya,
         slots_lermontova=probnik.slots_lermontova,
+        rooms_baikalskaya=probnik.rooms_baikalskaya,
+        rooms_lermontova=probnik.rooms_lermontova,
         exam_dates=exam_dates_dict,
         exam_times=probnik.exam_times,
         exam_dates_baikalskaya=exam_dates_baikalskaya_dict,
         exam_dates_lermontova=exam_dates_lermontova_dict,
         exam_times_baikalskaya=probnik.exam_times_baikalskaya,
-        exam_times_lermontova=probnik.exam_times_lermontova
+        exam_times_lermontova=probnik.exam_times_lermontova,
+        lottery_minutes=probnik.lottery_minutes
     )
+    if db_probnik.is_active:
+        lottery.start_window(db_probnik)
     db.add(db_probnik)
     await db.commit()
     await db.refresh(db_probnik)
     
+    for deactivated_id in deactivated_ids:
+        events.publish(events.PROBNIK_DEACTIVATED, probnik_id=deactivated_id)
+    if db_probnik.is_active:
+        events.publish(events.PROBNIK_ACTIVATED, probnik_id=db_probnik.id, name=db_probnik.name)
+    
     return schemas.ProbnikResponse(
         id=db_probnik.id,
         name=db_probnik.name,
@@ -1010,13 +1280,18 @@ async def create_probnik(
         created_at=db_probnik.created_at.isoformat() if db_probnik.created_at else None,
         slots_baikalskaya=db_probnik.slots_baikalskaya,
         slots_lermontova=db_probnik.slots_lermontova,
+        rooms_baikalskaya=db_probnik.rooms_baikalskaya,
+        rooms_lermontova=db_probnik.rooms_lermontova,
         exam_dates=db_probnik.exam_dates,
         exam_times=db_probnik.exam_times,
         exam_dates_baikalskaya=db_probnik.exam_dates_baikalskaya,
         exam_dates_lermontova=db_probnik.exam_dates_lermontova,
         exam_times_baikalskaya=db_probnik.exam_times_baikalskaya,
         exam_times_lermontova=db_probnik.exam_times_lermontova,
-        max_registrations=db_probnik.max_registrations if db_probnik.max_registrations is not None else 4
+        max_registrations=db_probnik.max_registrations if db_probnik.max_registrations is not None else 4,
+        lottery_minutes=db_probnik.lottery_minutes,
+        lottery_ends_at=db_probnik.lottery_ends_at.isoformat() if db_probnik.lottery_ends_at else None,
+        lottery_drawn_at=db_probnik.lottery_drawn_at.isoformat() if db_probnik.lottery_drawn_at else None
     )
 
 
@@ -1042,10 +1317,12 @@ async def update_probnik(
     becoming_active = probnik_update.is_active == True
     
     # Если активируем этот пробник, деактивируем остальные
+    deactivated_ids = []
     if probnik_update.is_active:
         other_result = await db.execute(select(Probnik).where(Probnik.id != probnik_id, Probnik.is_active == True))
         for p in other_result.scalars().all():
             p.is_active = False
+            deactivated_ids.append(p.id)
     
     update_data = probnik_update.dict(exclude_unset=True)
     
@@ -1076,8 +1353,28 @@ async def update_probnik(
     for field, value in update_data.items():
         setattr(probnik, field, value)
     
+    # Запись открывается — в режиме лотереи начинается прием заявок
+    if was_inactive and probnik.is_active:
+        lottery.start_window(probnik)
+    
+    # Вместимость слотов увеличили — переводим ожидающих на новые места
+    promoted = []
+    if {'slots_baikalskaya', 'slots_lermontova'} & update_data.keys():
+        await db.flush()
+        promoted = await waitlist.promote_probnik(db, probnik.id)
+    
     await db.commit()
     await db.refresh(probnik)
+    await waitlist.publish_promoted(db, promoted)
+    
+    for deactivated_id in deactivated_ids:
+        events.publish(events.PROBNIK_DEACTIVATED, probnik_id=deactivated_id)
+    if was_inactive and probnik.is_active:
+        events.publish(events.PROBNIK_ACTIVATED, probnik_id=probnik.id, name=probnik.name)
+    elif not was_inactive and not probnik.is_active:
+        events.publish(events.PROBNIK_DEACTIVATED, probnik_id=probnik.id)
+    else:
+        events.publish(events.PROBNIK_UPDATED, probnik_id=probnik.id, is_active=probnik.is_active)
     
     # Преобразуем exam_dates_baikalskaya и exam_dates_lermontova если есть
     exam_dates_baikalskaya_dict = None
@@ -1113,16 +1410,129 @@ async def update_probnik(
         created_at=probnik.created_at.isoformat() if probnik.created_at else None,
         slots_baikalskaya=probnik.slots_baikalskaya,
         slots_lermontova=probnik.slots_lermontova,
+        rooms_baikalskaya=probnik.rooms_baikalskaya,
+        rooms_lermontova=probnik.rooms_lermontova,
         exam_dates=probnik.exam_dates,
         exam_times=probnik.exam_times,
         exam_dates_baikalskaya=exam_dates_baikalskaya_dict,
         exam_dates_lermontova=exam_dates_lermontova_dict,
         exam_times_baikalskaya=probnik.exam_times_baikalskaya,
         exam_times_lermontova=probnik.exam_times_lermontova,
-        max_registrations=probnik.max_registrations if probnik.max_registrations is not None else 4
+        max_registrations=probnik.max_registrations if probnik.max_registrations is not None else 4,
+        lottery_minutes=probnik.lottery_minutes,
+        lottery_ends_at=probnik.lottery_ends_at.isoformat() if probnik.lottery_ends_at else None,
+        lottery_drawn_at=probnik.lottery_drawn_at.isoformat() if probnik.lottery_drawn_at else None
     )
 
 
+@app.get("/probnik/{probnik_id}/stats", response_model=schemas.RegistrationStatsResponse)
+async def get_probnik_stats(
+    probnik_id: int,
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Статистика записи на пробник (из сводной таблицы и агрегатов SQL)"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Доступ запрещен. Только для администратора")
+    
+    probnik = await db.get(Probnik, probnik_id)
+    if not probnik:
+        raise HTTPException(status_code=404, detail="Пробник не найден")
+    return await rollups.probnik_stats(db, probnik)
+
+
+@app.post("/probnik/{probnik_id}/seating/allocate", response_model=schemas.SeatingAllocateResponse)
+async def allocate_probnik_seating(
+    probnik_id: int,
+    request: schemas.SeatingAllocateRequest,
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Рассадка по аудиториям: новые записи получают места, у остальных места сохраняются"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Доступ запрещен. Только для администратора")
+    
+    probnik = await db.get(Probnik, probnik_id)
+    if not probnik:
+        raise HTTPException(status_code=404, detail="Пробник не найден")
+    if not (probnik.rooms_baikalskaya or probnik.rooms_lermontova):
+        raise HTTPException(status_code=400, detail="Не заданы аудитории филиалов (rooms_baikalskaya / rooms_lermontova)")
+    
+    slots = await seating.allocate_probnik(
+        db, probnik,
+        school=request.school,
+        exam_date=parse_date(request.exam_date),
+        exam_time=request.exam_time,
+        rebuild=request.rebuild
+    )
+    return schemas.SeatingAllocateResponse(probnik_id=probnik_id, slots=slots)
+
+
+@app.get("/probnik/{probnik_id}/seating", response_model=List[schemas.SeatingRow])
+async def get_probnik_seating(
+    probnik_id: int,
+    school: Optional[str] = Query(None),
+    date: Optional[str] = Query(None, description="Дата в формате YYYY-MM-DD"),
+    time: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Рассадка пробника по аудиториям и местам (записи без места — в конце слота)"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Доступ запрещен. Только для администратора")
+    
+    probnik = await db.get(Probnik, probnik_id)
+    if not probnik:
+        raise HTTPException(status_code=404, detail="Пробник не найден")
+    return await seating.seating_rows(db, probnik, school, parse_date(date), time)
+
+
+@app.get("/probnik/{probnik_id}/seating.csv")
+async def export_probnik_seating(
+    probnik_id: int,
+    school: Optional[str] = Query(None),
+    date: Optional[str] = Query(None, description="Дата в формате YYYY-MM-DD"),
+    time: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Рассадка в CSV для печати списков по аудиториям"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Доступ запрещен. Только для администратора")
+    
+    probnik = await db.get(Probnik, probnik_id)
+    if not probnik:
+        raise HTTPException(status_code=404, detail="Пробник не найден")
+    rows = await seating.seating_rows(db, probnik, school, parse_date(date), time)
+    return PlainTextResponse(
+        seating.to_csv(rows),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="seating_{probnik_id}.csv"'}
+    )
+
+
+@app.post("/probnik/{probnik_id}/lottery/draw", response_model=schemas.LotteryDrawResponse)
+async def draw_probnik_lottery(
+    probnik_id: int,
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Провести розыгрыш мест сейчас, не дожидаясь конца окна приема заявок"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Доступ запрещен. Только для администратора")
+    
+    probnik = await db.get(Probnik, probnik_id)
+    if not probnik:
+        raise HTTPException(status_code=404, detail="Пробник не найден")
+    
+    result = await lottery.draw(db, probnik_id)
+    if result is None:
+        raise HTTPException(status_code=400, detail="Лотерея не включена или розыгрыш уже проведен")
+    await db.commit()
+    await lottery.publish_results(db, result)
+    return lottery.summary(result)
+
+
 @app.delete("/probnik/{probnik_id}")
 async def delete_probnik(
     probnik_id: int,
@@ -1139,8 +1549,11 @@ async def delete_probnik(
     if not probnik:
         raise HTTPException(status_code=404, detail="Пробник не найден")
     
+    was_active = probnik.is_active
     await db.delete(probnik)
     await db.commit()
+    if was_active:
+        events.publish(events.PROBNIK_DEACTIVATED, probnik_id=probnik_id)
     
     return {"message": "Пробник удален"}
 
@@ -0,0 +1,150 @@
+"""
+Периодическое обслуживание бэкенда на планировщике common/scheduler.py.
+
+- analyze_database — ANALYZE (свежая статистика для планировщика запросов SQLite);
+- purge_sent_reminders — удаление давно отправленных напоминаний из очереди;
+- schedule_missing_reminders — страховка: напоминания для записей, у которых их
+  нет (например, созданных не через API);
+- draw_lotteries — розыгрыш мест у пробников, где закончилось окно приема заявок;
+- rebuild_registration_rollups — пересборка сводной таблицы статистики из записей
+  (исправляет расхождения после изменений в обход ORM); первый запуск — при старте;
+- purge_exports — удаление файлов фоновых выгрузок старше EXPORT_TTL;
+- rebuild_exam_summaries — пересборка сводки результатов из экзаменов (заполняет
+  таблицу после миграции и исправляет расхождения); первый запуск — при старте;
+- find_similar_sheets — поиск подозрительно похожих работ по всем экзаменам
+  (similarity.py), результаты — в similarity_flag.
+
+Расписание настраивается переменными окружения; cron-выражения — во времени UTC.
+Состояние задач хранится в таблице scheduler_job_state.
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict
+
+from sqlalchemy import delete, select, text
+
+import exports
+import lottery
+import metrics
+import rankings
+import reminders
+import rollups
+import similarity
+import summaries
+from common.scheduler import CronTrigger, IntervalTrigger, JobStateStore, Scheduler
+from database import AsyncSessionLocal, engine
+from models import ScheduledReminder, SchedulerJobState
+
+logger = logging.getLogger(__name__)
+
+# 19:30 UTC — 03:30 по местному времени (UTC+8), когда нагрузки нет
+ANALYZE_CRON = os.getenv("ANALYZE_CRON", "30 19 * * *")
+PURGE_REMINDERS_CRON = os.getenv("PURGE_REMINDERS_CRON", "0 20 * * *")
+SENT_REMINDERS_RETENTION_DAYS = int(os.getenv("SENT_REMINDERS_RETENTION_DAYS", "30"))
+MISSING_REMINDERS_INTERVAL = int(os.getenv("MISSING_REMINDERS_INTERVAL", "3600"))
+# Как часто проверять окончание окна лотереи (задержка розыгрыша не больше интервала)
+LOTTERY_CHECK_INTERVAL = int(os.getenv("LOTTERY_CHECK_INTERVAL", "10"))
+ROLLUP_REBUILD_INTERVAL = int(os.getenv("ROLLUP_REBUILD_INTERVAL", str(6 * 3600)))
+PURGE_EXPORTS_INTERVAL = int(os.getenv("PURGE_EXPORTS_INTERVAL", "600"))
+SUMMARY_REBUILD_INTERVAL = int(os.getenv("SUMMARY_REBUILD_INTERVAL", str(6 * 3600)))
+SIMILARITY_CRON = os.getenv("SIMILARITY_CRON", "0 20 * * *")
+
+
+class SqlJobStateStore(JobStateStore):
+    """Состояние задач в таблице scheduler_job_state"""
+
+    async def load(self) -> Dict[str, Dict]:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(SchedulerJobState))
+            return {
+                row.name: {
+                    "last_run_at": row.last_run_at,
+                    "last_success_at": row.last_success_at,
+                    "last_duration": row.last_duration,
+                    "last_error": row.last_error,
+                }
+                for row in result.scalars().all()
+            }
+
+    async def save(self, name: str, state: Dict):
+        async with AsyncSessionLocal() as db:
+            await db.merge(SchedulerJobState(name=name, **state))
+            await db.commit()
+
+
+async def analyze_database():
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE"))
+
+
+async def purge_sent_reminders():
+    border = datetime.utcnow() - timedelta(days=SENT_REMINDERS_RETENTION_DAYS)
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            delete(ScheduledReminder).where(
+                ScheduledReminder.sent_at.isnot(None),
+                ScheduledReminder.sent_at < border
+            )
+        )
+        await db.commit()
+    if result.rowcount:
+        logger.info(f"Удалено отправленных напоминаний: {result.rowcount}")
+
+
+async def schedule_missing_reminders():
+    async with AsyncSessionLocal() as db:
+        await reminders.schedule_missing(db)
+
+
+async def draw_lotteries():
+    async with AsyncSessionLocal() as db:
+        await lottery.draw_due(db)
+
+
+async def rebuild_registration_rollups():
+    async with AsyncSessionLocal() as db:
+        await rollups.rebuild(db)
+
+
+async def rebuild_exam_summaries():
+    async with AsyncSessionLocal() as db:
+        await summaries.rebuild(db)
+    rankings.clear()
+
+
+async def find_similar_sheets():
+    async with AsyncSessionLocal() as db:
+        result = await similarity.run_all(db)
+    if result["flags"]:
+        logger.info(f"Похожих пар работ: {result['flags']} (экзаменов проверено: {result['cohorts']})")
+
+
+async def purge_exports():
+    removed = exports.purge_expired()
+    if removed:
+        logger.info(f"Удалено устаревших выгрузок: {removed}")
+
+
+def create_scheduler() -> Scheduler:
+    scheduler = Scheduler(store=SqlJobStateStore(), on_run=metrics.record_job_run)
+    scheduler.add_job("analyze_database", analyze_database, CronTrigger(ANALYZE_CRON), jitter=60)
+    scheduler.add_job("purge_sent_reminders", purge_sent_reminders, CronTrigger(PURGE_REMINDERS_CRON), jitter=60)
+    scheduler.add_job(
+        "schedule_missing_reminders", schedule_missing_reminders,
+        IntervalTrigger(MISSING_REMINDERS_INTERVAL), jitter=30
+    )
+    # Раз в LOTTERY_CHECK_INTERVAL секунд: состояние не сохраняем, чтобы не занимать блокировку
+    # записи SQLite во время открытия записи на пробник
+    scheduler.add_job("draw_lotteries", draw_lotteries, IntervalTrigger(LOTTERY_CHECK_INTERVAL), persist=False)
+    scheduler.add_job(
+        "rebuild_registration_rollups", rebuild_registration_rollups,
+        IntervalTrigger(ROLLUP_REBUILD_INTERVAL), jitter=60
+    )
+    scheduler.add_job("purge_exports", purge_exports, IntervalTrigger(PURGE_EXPORTS_INTERVAL))
+    scheduler.add_job(
+        "rebuild_exam_summaries", rebuild_exam_summaries,
+        IntervalTrigger(SUMMARY_REBUILD_INTERVAL), jitter=60
+    )
+    scheduler.add_job("find_similar_sheets", find_similar_sheets, CronTrigger(SIMILARITY_CRON), jitter=60)
+    return scheduler
@@ -0,0 +1,154 @@
+"""
+Метрики приложения в формате Prometheus. Реестр и типы метрик — в common/metrics.py
+(общий с ботом); здесь метрики бэкенда, middleware по маршрутам и события пула
+SQLAlchemy.
+
+Метрики, которые дешевле посчитать в момент опроса (состояние пула, записи по
+слотам пробника), регистрируются как коллекторы реестра.
+"""
+import time
+from typing import List
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from common.metrics import Counter, Gauge, Histogram, Registry, format_labels
+
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+# Метка для запросов, не попавших ни в один маршрут (чтобы 404 на случайные пути не раздували метрики)
+UNMATCHED_ROUTE = "__unmatched__"
+
+
+registry = Registry()
+
+http_requests_total = registry.register(Counter(
+    "http_requests_total", "Количество HTTP-запросов", ("method", "route", "status")
+))
+http_request_duration_seconds = registry.register(Histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса", ("method", "route")
+))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP-запросы в обработке"
+))
+http_request_db_queries = registry.register(Histogram(
+    "http_request_db_queries", "Количество SQL-запросов на один HTTP-запрос", ("method", "route"),
+    buckets=QUERY_COUNT_BUCKETS
+))
+db_pool_checkouts_total = registry.register(Counter(
+    "db_pool_checkouts_total", "Выдачи соединений из пула"
+))
+db_pool_connections_created_total = registry.register(Counter(
+    "db_pool_connections_created_total", "Новые соединения с БД"
+))
+db_pool_wait_seconds = registry.register(Histogram(
+    "db_pool_wait_seconds", "Ожидание соединения из пула",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+))
+cache_requests_total = registry.register(Counter(
+    "cache_requests_total", "Обращения к кешам приложения", ("cache", "result")
+))
+scheduler_job_runs_total = registry.register(Counter(
+    "scheduler_job_runs_total", "Запуски периодических задач", ("job", "result")
+))
+scheduler_job_duration_seconds = registry.register(Histogram(
+    "scheduler_job_duration_seconds", "Длительность периодических задач", ("job",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+))
+scheduler_job_last_success = registry.register(Gauge(
+    "scheduler_job_last_success_timestamp_seconds", "Время последнего успешного запуска задачи", ("job",)
+))
+
+admission_requests_total = registry.register(Counter(
+    "admission_requests_total", "Решения контроля допуска запросов", ("limiter", "result")
+))
+admission_wait_seconds = registry.register(Histogram(
+    "admission_wait_seconds", "Ожидание токена перед обработкой запроса", ("limiter",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0)
+))
+
+
+def record_cache_hit(cache: str):
+    cache_requests_total.inc(cache, "hit")
+
+
+def record_cache_miss(cache: str):
+    cache_requests_total.inc(cache, "miss")
+
+
+def record_job_run(job: str, result: str, duration: float):
+    """Обработчик on_run планировщика"""
+    scheduler_job_runs_total.inc(job, result)
+    if result == "skipped":
+        return
+    scheduler_job_duration_seconds.observe(duration, job)
+    if result == "success":
+        scheduler_job_last_success.set(job, value=time.time())
+
+
+def route_template(request) -> str:
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+def add_metrics_middleware(app):
+    """Middleware: счетчики и гистограммы по шаблону маршрута.
+
+    Должно подключаться раньше add_query_stats_middleware, чтобы оказаться внутри него
+    и видеть счетчики SQL-запросов текущего HTTP-запроса.
+    """
+    from db_instrumentation import current_stats
+
+    @app.middleware("http")
+    async def metrics_middleware(request, call_next):
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            duration = time.perf_counter() - started
+            http_requests_in_flight.dec()
+            route = route_template(request)
+            http_requests_total.inc(request.method, route, status)
+            http_request_duration_seconds.observe(duration, request.method, route)
+            stats = current_stats()
+            if stats is not None:
+                http_request_db_queries.observe(stats.count, request.method, route)
+
+    return metrics_middleware
+
+
+def instrument_pool(engine: AsyncEngine):
+    """Счетчики выдачи соединений и коллектор состояния пула"""
+    sync_engine = engine.sync_engine
+
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        db_pool_checkouts_total.inc()
+
+    def _on_connect(dbapi_connection, connection_record):
+        db_pool_connections_created_total.inc()
+
+    if not event.contains(sync_engine, "checkout", _on_checkout):
+        event.listen(sync_engine, "checkout", _on_checkout)
+        event.listen(sync_engine, "connect", _on_connect)
+
+    async def collect_pool_state() -> List[str]:
+        pool = sync_engine.pool
+        lines = []
+        for name, attr, documentation in (
+            ("db_pool_size", "size", "Размер пула соединений"),
+            ("db_pool_checked_out", "checkedout", "Соединения, выданные из пула"),
+            ("db_pool_overflow", "overflow", "Соединения сверх размера пула"),
+        ):
+            getter = getattr(pool, attr, None)
+            if getter is None:
+                continue
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {getter()}")
+        return lines
+
+    registry.add_collector(collect_pool_state)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Table, Text, JSON, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, Table, Text, JSON, DateTime, Boolean, Float, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
@@ -9,8 +9,8 @@ Base = declarative_base()
 group_student_association = Table(
     'group_student',
     Base.metadata,
-    Column('group_id', Integer, ForeignKey('study_group.id'), primary_key=True),
-    Column('student_id', Integer, ForeignKey('student.id'), primary_key=True)
+    Column('group_id', Integer, ForeignKey('study_group.id', ondelete='CASCADE'), primary_key=True),
+    Column('student_id', Integer, ForeignKey('student.id', ondelete='CASCADE'), primary_key=True)
 )
 
 class StudyGroup(Base):
@@ -29,9 +29,9 @@ class StudyGroup(Base):
     # Пример: {"monday": "10:00-12:00", "wednesday": "14:00-16:00", ...}
     schedule = Column(JSON, nullable=True)
     
-    students = relationship("Student", secondary=group_student_association, back_populates="groups")
+    students = relationship("Student", secondary=group_student_association, back_populates="groups", passive_deletes=True)
     teacher = relationship("Employee", back_populates="groups")
-    exam_types = relationship("ExamType", back_populates="group")
+    exam_types = relationship("ExamType", back_populates="group", passive_deletes=True)
 
 class Student(Base):
     __tablename__ = 'student'
@@ -49,28 +49,36 @@ class Student(Base):
     class_num = Column(Integer, nullable=True)  # Класс ученика (9, 10, 11)
     confirmed_at = Column(DateTime, nullable=True)  # Время подтверждения регистрации в боте
     
-    exams = relationship("Exam", back_populates="student")
-    groups = relationship("StudyGroup", secondary=group_student_association, back_populates="students")
-    exam_registrations = relationship("ExamRegistration", back_populates="student")
+    exams = relationship("Exam", back_populates="student", passive_deletes=True)
+    groups = relationship("StudyGroup", secondary=group_student_association, back_populates="students", passive_deletes=True)
+    exam_registrations = relationship("ExamRegistration", back_populates="student", passive_deletes=True)
 
 
 class ExamType(Base):
     __tablename__ = 'exam_types'
+    __table_args__ = (
+        Index('ix_exam_types_group', 'group_id'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False)  # Убрали unique, так как для разных групп могут быть одинаковые названия
-    group_id = Column(Integer, ForeignKey('study_group.id'), nullable=False)
+    group_id = Column(Integer, ForeignKey('study_group.id', ondelete='CASCADE'), nullable=False)
     completed_tasks = Column(JSON, nullable=True)  # Массив номеров пройденных заданий, например [1, 2, 3, 5, 7]
 
-    exams = relationship("Exam", back_populates="exam_type")
+    exams = relationship("Exam", back_populates="exam_type", passive_deletes=True)
     group = relationship("StudyGroup", back_populates="exam_types")
 
 class Exam(Base):
     __tablename__ = 'exam'
+    __table_args__ = (
+        # Результаты группы (по типам экзаменов) и экзамены ученика
+        Index('ix_exam_type_student', 'exam_type_id', 'id_student'),
+        Index('ix_exam_student', 'id_student'),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    exam_type_id = Column(Integer, ForeignKey('exam_types.id'), nullable=False)  # Связь с типом экзамена (название берется оттуда)
-    id_student = Column(Integer, ForeignKey('student.id'), nullable=False)
+    exam_type_id = Column(Integer, ForeignKey('exam_types.id', ondelete='CASCADE'), nullable=False)  # Связь с типом экзамена (название берется оттуда)
+    id_student = Column(Integer, ForeignKey('student.id', ondelete='CASCADE'), nullable=False)
     subject = Column(String(100), nullable=False)
     answer = Column(Text)
     comment = Column(Text)
@@ -92,9 +100,13 @@ class Employee(Base):
 class ExamRegistration(Base):
     """Запись на зимний пробник"""
     __tablename__ = 'exam_registration'
+    __table_args__ = (
+        # Подсчет мест в слоте и выборки по пробнику
+        Index('ix_exam_registration_probnik_slot', 'probnik_id', 'school', 'exam_date', 'exam_time'),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    student_id = Column(Integer, ForeignKey('student.id'), nullable=False)
+    student_id = Column(Integer, ForeignKey('student.id', ondelete='CASCADE'), nullable=False)
     subject = Column(String(100), nullable=False)  # Предмет экзамена
     exam_date = Column(DateTime, nullable=False)  # Дата и время экзамена
     exam_time = Column(String(10), nullable=False)  # "9:00" или "12:00"
@@ -104,10 +116,127 @@ class ExamRegistration(Base):
     confirmed_at = Column(DateTime, nullable=True)  # Когда подтвердил участие
     attended = Column(Boolean, default=False)  # Пришел на экзамен
     submitted_work = Column(Boolean, default=False)  # Сдал работу
-    probnik_id = Column(Integer, ForeignKey('probnik.id'), nullable=True)  # Связь с пробником
+    attendance_marked_at = Column(DateTime, nullable=True)  # Когда последний раз меняли явку/сдачу (UTC, для синхронизации отметок)
+    probnik_id = Column(Integer, ForeignKey('probnik.id', ondelete='SET NULL'), nullable=True)  # Связь с пробником
     
     student = relationship("Student", back_populates="exam_registrations")
     probnik = relationship("Probnik", back_populates="registrations")
+    reminders = relationship("ScheduledReminder", back_populates="registration", passive_deletes=True)
+
+
+class RegistrationRollup(Base):
+    """Сводные счетчики записей пробника по слоту и предмету (поддерживаются в rollups.py)"""
+    __tablename__ = 'registration_rollup'
+    __table_args__ = (
+        UniqueConstraint('probnik_id', 'school', 'exam_date', 'exam_time', 'subject', name='uq_registration_rollup_key'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    probnik_id = Column(Integer, ForeignKey('probnik.id', ondelete='CASCADE'), nullable=False)
+    school = Column(String(100), nullable=True)
+    exam_date = Column(DateTime, nullable=False)
+    exam_time = Column(String(10), nullable=False)
+    subject = Column(String(100), nullable=False)
+    registered = Column(Integer, nullable=False, default=0)
+    confirmed = Column(Integer, nullable=False, default=0)
+    attended = Column(Integer, nullable=False, default=0)
+    submitted = Column(Integer, nullable=False, default=0)
+
+
+class ScheduledReminder(Base):
+    """Напоминание о записи, которое бот отправит в due_at (UTC)"""
+    __tablename__ = 'scheduled_reminder'
+    
+    id = Column(Integer, primary_key=True, index=True)
+    registration_id = Column(Integer, ForeignKey('exam_registration.id', ondelete='CASCADE'), nullable=False, index=True)
+    kind = Column(String(30), nullable=False)  # "reminder_3d", "reminder_1d", "reminder_2h", ...
+    due_at = Column(DateTime, nullable=False, index=True)  # Когда отправить (UTC)
+    claimed_at = Column(DateTime, nullable=True)  # Когда бот забрал напоминание на отправку
+    sent_at = Column(DateTime, nullable=True)  # Когда бот подтвердил отправку
+    attempts = Column(Integer, default=0)  # Сколько раз бот забирал напоминание
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    registration = relationship("ExamRegistration", back_populates="reminders")
+
+
+class WaitlistEntry(Base):
+    """Место в листе ожидания на заполненный слот (порядок очереди — по id)"""
+    __tablename__ = 'waitlist_entry'
+    __table_args__ = (
+        Index('ix_waitlist_entry_slot', 'probnik_id', 'school', 'exam_date', 'exam_time', 'id'),
+        UniqueConstraint('student_id', 'probnik_id', 'subject', 'exam_date', 'exam_time', name='uq_waitlist_entry_student_slot'),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(Integer, ForeignKey('student.id', ondelete='CASCADE'), nullable=False, index=True)
+    probnik_id = Column(Integer, ForeignKey('probnik.id', ondelete='CASCADE'), nullable=False)
+    subject = Column(String(100), nullable=False)
+    exam_date = Column(DateTime, nullable=False)
+    exam_time = Column(String(10), nullable=False)
+    school = Column(String(100), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ExamSummary(Base):
+    """Результат ученика по типу экзамена: баллы, процентиль в группе, изменение (поддерживается в summaries.py)"""
+    __tablename__ = 'exam_summary'
+    __table_args__ = (
+        UniqueConstraint('student_id', 'exam_type_id', name='uq_exam_summary_student_type'),
+        Index('ix_exam_summary_exam_type', 'exam_type_id'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    student_id = Column(Integer, ForeignKey('student.id', ondelete='CASCADE'), nullable=False)
+    exam_type_id = Column(Integer, ForeignKey('exam_types.id', ondelete='CASCADE'), nullable=False)
+    exam_id = Column(Integer, ForeignKey('exam.id', ondelete='CASCADE'), nullable=False)  # Экзамен, по которому посчитано (последний)
+    primary_score = Column(Integer, nullable=False)
+    scaled_score = Column(Integer, nullable=False)
+    percentile = Column(Float, nullable=False, default=0.0)  # Процентиль среди написавших этот экзамен в группе, 0–100
+    delta = Column(Integer, nullable=True)  # Изменение первичного балла к предыдущему экзамену группы; None — первый
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class SimilarityFlag(Base):
+    """Пара подозрительно похожих работ одного экзамена (находит similarity.py, проверяет администратор)"""
+    __tablename__ = 'similarity_flag'
+    __table_args__ = (
+        UniqueConstraint('exam_a_id', 'exam_b_id', name='uq_similarity_flag_pair'),
+        Index('ix_similarity_flag_exam', 'exam_name', 'subject'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    exam_name = Column(String(200), nullable=False)
+    subject = Column(String(100), nullable=False)
+    exam_a_id = Column(Integer, ForeignKey('exam.id', ondelete='CASCADE'), nullable=False)  # Меньший id из пары
+    exam_b_id = Column(Integer, ForeignKey('exam.id', ondelete='CASCADE'), nullable=False)
+    student_a_id = Column(Integer, ForeignKey('student.id', ondelete='CASCADE'), nullable=False)
+    student_b_id = Column(Integer, ForeignKey('student.id', ondelete='CASCADE'), nullable=False)
+    matched_tasks = Column(Integer, nullable=False)  # Заданий с одинаковым результатом
+    total_tasks = Column(Integer, nullable=False)
+    shared_wrong = Column(Integer, nullable=False)  # Из них с одинаковым неполным результатом
+    score = Column(Float, nullable=False)  # Сумма весов редкости общих неполных результатов
+    # new — не просмотрена; confirmed — списывание подтверждено; dismissed — совпадение случайно
+    status = Column(String(20), nullable=False, default='new')
+    detected_at = Column(DateTime, default=datetime.utcnow)
+    reviewed_at = Column(DateTime, nullable=True)
+
+class SeatAssignment(Base):
+    """Место ученика в аудитории на слот пробника (распределяет seating.py)"""
+    __tablename__ = 'seat_assignment'
+    __table_args__ = (
+        Index('ix_seat_assignment_slot', 'probnik_id', 'school', 'exam_date', 'exam_time'),
+        UniqueConstraint('probnik_id', 'school', 'exam_date', 'exam_time', 'room', 'seat', name='uq_seat_assignment_seat'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    registration_id = Column(Integer, ForeignKey('exam_registration.id', ondelete='CASCADE'), nullable=False, unique=True)
+    probnik_id = Column(Integer, ForeignKey('probnik.id', ondelete='CASCADE'), nullable=False)
+    school = Column(String(100), nullable=False)
+    exam_date = Column(DateTime, nullable=False)
+    exam_time = Column(String(10), nullable=False)
+    room = Column(String(50), nullable=False)
+    seat = Column(Integer, nullable=False)  # Номер места в аудитории, с 1
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 
 class Probnik(Base):
@@ -123,6 +252,10 @@ class Probnik(Base):
     slots_baikalskaya = Column(JSON, nullable=True)
     slots_lermontova = Column(JSON, nullable=True)
     
+    # Аудитории для рассадки в JSON: {"101": 15, "102": 20} (название — число мест)
+    rooms_baikalskaya = Column(JSON, nullable=True)
+    rooms_lermontova = Column(JSON, nullable=True)
+    
     # Дни проведения в JSON: [{"label": "Понедельник 5.01.26", "date": "2026-01-05"}, ...]
     exam_dates = Column(JSON, nullable=True)
     
@@ -140,4 +273,43 @@ class Probnik(Base):
     # Максимальное количество записей на одного ученика
     max_registrations = Column(Integer, default=4, nullable=True)
     
-    registrations = relationship("ExamRegistration", back_populates="probnik") 
\ No newline at end of file
+    # Режим лотереи: после открытия записи заявки собираются lottery_minutes минут,
+    # затем места распределяются розыгрышем (None или 0 — обычная запись)
+    lottery_minutes = Column(Integer, nullable=True)
+    lottery_ends_at = Column(DateTime, nullable=True)  # UTC, задается при активации
+    lottery_seed = Column(Integer, nullable=True)  # Зерно розыгрыша (для проверки результата)
+    lottery_drawn_at = Column(DateTime, nullable=True)
+    
+    registrations = relationship("ExamRegistration", back_populates="probnik", passive_deletes=True) 
+
+
+class LotteryRequest(Base):
+    """Заявка на место, поданная в окно лотереи"""
+    __tablename__ = 'lottery_request'
+    __table_args__ = (
+        Index('ix_lottery_request_probnik_status', 'probnik_id', 'status'),
+        UniqueConstraint('student_id', 'probnik_id', 'subject', 'exam_date', 'exam_time', name='uq_lottery_request_student_slot'),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(Integer, ForeignKey('student.id', ondelete='CASCADE'), nullable=False, index=True)
+    probnik_id = Column(Integer, ForeignKey('probnik.id', ondelete='CASCADE'), nullable=False)
+    subject = Column(String(100), nullable=False)
+    exam_date = Column(DateTime, nullable=False)
+    exam_time = Column(String(10), nullable=False)
+    school = Column(String(100), nullable=False)
+    # pending — ждет розыгрыша; won — записан; waitlisted — в листе ожидания; rejected — лимит или пересечение
+    status = Column(String(20), nullable=False, default='pending')
+    registration_id = Column(Integer, ForeignKey('exam_registration.id', ondelete='SET NULL'), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class SchedulerJobState(Base):
+    """Состояние периодической задачи планировщика (чтобы перезапуск не запускал ее раньше срока)"""
+    __tablename__ = 'scheduler_job_state'
+    
+    name = Column(String(100), primary_key=True)
+    last_run_at = Column(DateTime, nullable=True)
+    last_success_at = Column(DateTime, nullable=True)
+    last_duration = Column(Float, nullable=True)  # Секунды
+    last_error = Column(Text, nullable=True)
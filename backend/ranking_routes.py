@@ -0,0 +1,79 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+from database import get_db
+from auth import get_current_user
+from models import Student
+import crud
+import rankings
+import schemas
+
+router = APIRouter(prefix="/rankings", tags=["rankings"])
+
+
+async def _board(db: AsyncSession, exam_name: str, subject: str) -> rankings.Board:
+    board = await rankings.board(db, exam_name, subject)
+    if not board.scores:
+        raise HTTPException(status_code=404, detail="Результатов по этому экзамену нет")
+    return board
+
+
+@router.get("/exams", response_model=List[schemas.RankingExam])
+async def ranking_exams(db: AsyncSession = Depends(get_db), user: dict = Depends(get_current_user)):
+    """Экзамены (название и предмет), по которым есть рейтинг"""
+    return await rankings.exams(db)
+
+
+@router.get("/leaderboard", response_model=schemas.LeaderboardResponse)
+async def leaderboard(
+    exam_name: str = Query(...),
+    subject: str = Query(...),
+    school: Optional[str] = Query(None),
+    group_id: Optional[int] = Query(None),
+    class_num: Optional[int] = Query(None),
+    limit: int = Query(50, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """
+    Таблица лидеров экзамена по всем группам. Учителю — только по своей группе
+    (group_id обязателен), место и процентиль при этом — среди всех написавших.
+    """
+    if user.get("role") != "admin":
+        if group_id is None or not await crud.can_access_group(db, user, group_id):
+            raise HTTPException(status_code=403, detail="Доступ запрещен")
+    board = await _board(db, exam_name, subject)
+    return rankings.leaderboard(board, school=school, group_id=group_id, class_num=class_num, limit=limit)
+
+
+@router.get("/schools", response_model=List[schemas.SchoolRanking])
+async def school_rankings(
+    exam_name: str = Query(...),
+    subject: str = Query(...),
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Сравнение филиалов по экзамену"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Доступ запрещен. Только для администратора")
+    board = await _board(db, exam_name, subject)
+    return rankings.schools(board)
+
+
+@router.get("/students/{student_id}", response_model=List[schemas.StudentStanding])
+async def student_standings(
+    student_id: int,
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Место ученика во всех рейтингах: администратору — по всем группам, учителю — по своим"""
+    student = await db.get(Student, student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+    group_ids = None
+    if user.get("role") != "admin":
+        group_ids = await crud.accessible_student_groups(db, user, student_id)
+        if not group_ids:
+            raise HTTPException(status_code=403, detail="Доступ запрещен")
+    return await rankings.student_standings(db, student_id, group_ids)
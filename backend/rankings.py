@@ -0,0 +1,262 @@
+"""
+Рейтинги по пробникам среди всех групп и филиалов.
+
+Рейтинг (Board) строится на пару (название экзамена, предмет): все ученики,
+написавшие экзамен с таким названием, в любой группе. Баллы берутся из сводки
+exam_summary (summaries.py). Рейтинг хранит отсортированный список баллов —
+место и процентиль считаются бинарным поиском за O(log n) — и список для
+таблицы лидеров, упорядоченный по убыванию балла.
+
+Рейтинги загружаются по первому запросу и живут в памяти процесса. После
+записи экзамена crud вызывает refresh: затронутые строки переставляются в уже
+загруженных рейтингах без перечитывания остальных. Массовые изменения
+(удаление учеников и типов, пересборка сводки) сбрасывают рейтинги (clear).
+Рейтинг старше RANKING_TTL перечитывается, чтобы изменения из других процессов
+тоже доходили.
+"""
+import os
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import metrics
+import summaries
+from models import Exam, ExamSummary, ExamType, Student, StudyGroup
+
+RANKING_TTL = int(os.getenv("RANKING_TTL", "600"))
+
+BoardKey = Tuple[str, str]
+Pair = Tuple[int, int]  # (student_id, exam_type_id)
+
+
+def _entries_query():
+    return (
+        select(
+            ExamSummary.student_id, ExamSummary.exam_type_id, ExamSummary.primary_score, ExamSummary.scaled_score,
+            ExamType.name.label("exam_name"), Exam.subject, Student.fio, Student.class_num,
+            StudyGroup.id.label("group_id"), StudyGroup.name.label("group_name"), StudyGroup.school
+        )
+        .join(ExamType, ExamType.id == ExamSummary.exam_type_id)
+        .join(Exam, Exam.id == ExamSummary.exam_id)
+        .join(Student, Student.id == ExamSummary.student_id)
+        .join(StudyGroup, StudyGroup.id == ExamType.group_id)
+    )
+
+
+class Board:
+    """Рейтинг одного экзамена: отсортированные баллы и порядок для таблицы лидеров"""
+
+    def __init__(self, key: BoardKey):
+        self.key = key
+        self.entries: Dict[Pair, Dict] = {}
+        self.scores: List[int] = []  # По возрастанию
+        self.school_scores: Dict[Optional[str], List[int]] = defaultdict(list)
+        self.order: List[Tuple] = []  # (-балл, ФИО, ученик, тип экзамена)
+        self.loaded_at = time.monotonic()
+
+    @staticmethod
+    def _order_key(entry: Dict) -> Tuple:
+        return (-entry["primary_score"], entry["fio"], entry["student_id"], entry["exam_type_id"])
+
+    def add(self, entry: Dict):
+        pair = (entry["student_id"], entry["exam_type_id"])
+        self.discard(pair)
+        self.entries[pair] = entry
+        insort(self.scores, entry["primary_score"])
+        insort(self.school_scores[entry["school"]], entry["primary_score"])
+        insort(self.order, self._order_key(entry))
+
+    def discard(self, pair: Pair):
+        entry = self.entries.pop(pair, None)
+        if entry is None:
+            return
+        del self.scores[bisect_left(self.scores, entry["primary_score"])]
+        school = self.school_scores[entry["school"]]
+        del school[bisect_left(school, entry["primary_score"])]
+        del self.order[bisect_left(self.order, self._order_key(entry))]
+
+    def rank(self, score: int) -> int:
+        """Место балла: 1 + число баллов выше (равные делят место)"""
+        return len(self.scores) - bisect_right(self.scores, score) + 1
+
+    def school_rank(self, score: int, school: Optional[str]) -> int:
+        scores = self.school_scores.get(school, [])
+        return len(scores) - bisect_right(scores, score) + 1
+
+    def percentile(self, score: int) -> float:
+        return summaries.percentile_rank(self.scores, score)
+
+    def expired(self) -> bool:
+        return time.monotonic() - self.loaded_at > RANKING_TTL
+
+
+_boards: Dict[BoardKey, Board] = {}
+_locations: Dict[Pair, BoardKey] = {}
+
+
+def _forget(key: BoardKey):
+    board = _boards.pop(key, None)
+    if board:
+        for pair in board.entries:
+            _locations.pop(pair, None)
+
+
+def clear():
+    _boards.clear()
+    _locations.clear()
+
+
+async def board(db: AsyncSession, exam_name: str, subject: str) -> Board:
+    key = (exam_name, subject)
+    cached = _boards.get(key)
+    if cached is not None and not cached.expired():
+        metrics.record_cache_hit("rankings")
+        return cached
+    metrics.record_cache_miss("rankings")
+    _forget(key)
+    result = await db.execute(_entries_query().where(ExamType.name == exam_name, Exam.subject == subject))
+    loaded = Board(key)
+    for row in result.all():
+        loaded.add(dict(row._mapping))
+    # Пустой рейтинг не запоминаем: ключ приходит из запроса
+    if loaded.entries:
+        _boards[key] = loaded
+        for pair in loaded.entries:
+            _locations[pair] = key
+    return loaded
+
+
+async def refresh(db: AsyncSession, pairs: Iterable[Tuple[int, int]]):
+    """Переставляет строки пар (ученик, тип экзамена) в загруженных рейтингах после записи экзамена"""
+    pairs = set(pairs)
+    if not pairs or not _boards:
+        return
+    for pair in pairs:
+        key = _locations.pop(pair, None)
+        if key in _boards:
+            _boards[key].discard(pair)
+    result = await db.execute(
+        _entries_query().where(or_(*(
+            and_(ExamSummary.student_id == student_id, ExamSummary.exam_type_id == exam_type_id)
+            for student_id, exam_type_id in pairs
+        )))
+    )
+    for row in result.all():
+        entry = dict(row._mapping)
+        key = (entry["exam_name"], entry["subject"])
+        if key in _boards:
+            _boards[key].add(entry)
+            _locations[(entry["student_id"], entry["exam_type_id"])] = key
+
+
+def _matches(entry: Dict, school: Optional[str], group_id: Optional[int], class_num: Optional[int]) -> bool:
+    return (
+        (school is None or entry["school"] == school)
+        and (group_id is None or entry["group_id"] == group_id)
+        and (class_num is None or entry["class_num"] == class_num)
+    )
+
+
+def leaderboard(
+    current: Board,
+    school: Optional[str] = None,
+    group_id: Optional[int] = None,
+    class_num: Optional[int] = None,
+    limit: int = 50
+) -> Dict:
+    """
+    Таблица лидеров с фильтрами. Место и процентиль — среди всех написавших,
+    место в выборке (position) — среди прошедших фильтр.
+    """
+    items = []
+    total = 0
+    for _, _, student_id, exam_type_id in current.order:
+        entry = current.entries[(student_id, exam_type_id)]
+        if not _matches(entry, school, group_id, class_num):
+            continue
+        total += 1
+        if len(items) < limit:
+            items.append(_standing(current, entry, position=total))
+    return {
+        "exam_name": current.key[0],
+        "subject": current.key[1],
+        "participants": len(current.scores),
+        "matched": total,
+        "items": items,
+    }
+
+
+def _standing(current: Board, entry: Dict, **extra) -> Dict:
+    score = entry["primary_score"]
+    return {
+        "student_id": entry["student_id"],
+        "fio": entry["fio"],
+        "class_num": entry["class_num"],
+        "group_id": entry["group_id"],
+        "group_name": entry["group_name"],
+        "school": entry["school"],
+        "primary_score": score,
+        "scaled_score": entry["scaled_score"],
+        "rank": current.rank(score),
+        "percentile": current.percentile(score),
+        **extra,
+    }
+
+
+def schools(current: Board) -> List[Dict]:
+    """Сравнение филиалов по экзамену: участники, средний и медианный балл, средний процентиль"""
+    result = []
+    for school, scores in current.school_scores.items():
+        if not scores:
+            continue
+        middle = len(scores) // 2
+        median = scores[middle] if len(scores) % 2 else (scores[middle - 1] + scores[middle]) / 2
+        result.append({
+            "school": school,
+            "participants": len(scores),
+            "average": round(sum(scores) / len(scores), 2),
+            "median": median,
+            "average_percentile": round(sum(current.percentile(score) for score in scores) / len(scores), 1),
+        })
+    result.sort(key=lambda item: -item["average"])
+    for place, item in enumerate(result, start=1):
+        item["rank"] = place
+    return result
+
+
+async def student_standings(db: AsyncSession, student_id: int, group_ids: Optional[List[int]] = None) -> List[Dict]:
+    """Место ученика во всех рейтингах, где у него есть результат (по группам group_ids, если заданы)"""
+    query = _entries_query().where(ExamSummary.student_id == student_id)
+    if group_ids is not None:
+        query = query.where(StudyGroup.id.in_(group_ids))
+    result = await db.execute(query.order_by(ExamSummary.exam_type_id))
+    standings = []
+    for row in result.all():
+        entry = dict(row._mapping)
+        current = await board(db, entry["exam_name"], entry["subject"])
+        standings.append(_standing(
+            current, entry,
+            exam_type_id=entry["exam_type_id"],
+            exam_name=entry["exam_name"],
+            subject=entry["subject"],
+            participants=len(current.scores),
+            school_rank=current.school_rank(entry["primary_score"], entry["school"]),
+            school_participants=len(current.school_scores.get(entry["school"], [])),
+        ))
+    return standings
+
+
+async def exams(db: AsyncSession) -> List[Dict]:
+    """Рейтинги, которые можно построить: название экзамена, предмет и число участников"""
+    result = await db.execute(
+        select(ExamType.name, Exam.subject, func.count(ExamSummary.id))
+        .join(ExamType, ExamType.id == ExamSummary.exam_type_id)
+        .join(Exam, Exam.id == ExamSummary.exam_id)
+        .group_by(ExamType.name, Exam.subject)
+        .order_by(ExamType.name, Exam.subject)
+    )
+    return [{"exam_name": name, "subject": subject, "participants": count} for name, subject, count in result.all()]
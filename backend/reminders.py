@@ -0,0 +1,267 @@
+"""
+Точные напоминания о записях на пробник.
+
+Время каждого напоминания считается один раз — при создании или изменении записи
+(schedule_registration) — и сохраняется в таблице scheduled_reminder. Эта таблица —
+очередь: бот держит в памяти min-heap по due_at, просыпается к ближайшему
+напоминанию, забирает пачку пришедших (claim_reminders) и подтверждает отправку
+(ack_reminders).
+
+Напоминания: за 3 дня и за 1 день до начала экзамена, плюс дополнительные из
+REMINDER_EXTRA_HOURS (часы до начала через запятую, например "2" — за 2 часа).
+Если записались позже всех сроков, одно напоминание уходит сразу. Подтвердившие
+участие напоминаний не получают.
+
+Экзамены записываются в местном времени (дата + "9:00"), очередь хранится в UTC;
+смещение местного времени задает EXAM_UTC_OFFSET_HOURS.
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from models import ExamRegistration, Probnik, ScheduledReminder
+
+logger = logging.getLogger(__name__)
+
+EXAM_UTC_OFFSET_HOURS = float(os.getenv("EXAM_UTC_OFFSET_HOURS", "8"))
+REMINDER_EXTRA_HOURS = os.getenv("REMINDER_EXTRA_HOURS", "")
+# Через сколько секунд неподтвержденное (забранное, но не отправленное) напоминание можно забрать снова
+REMINDER_LEASE_SECONDS = int(os.getenv("REMINDER_LEASE_SECONDS", "300"))
+REMINDER_MAX_ATTEMPTS = int(os.getenv("REMINDER_MAX_ATTEMPTS", "3"))
+# Очередь для бота: только напоминания ближайших часов и не больше лимита строк,
+# остальные бот получает при следующей загрузке очереди
+REMINDER_PENDING_HORIZON_HOURS = float(os.getenv("REMINDER_PENDING_HORIZON_HOURS", "24"))
+REMINDER_PENDING_LIMIT = int(os.getenv("REMINDER_PENDING_LIMIT", "1000"))
+
+
+def _reminder_offsets() -> Dict[str, timedelta]:
+    offsets = {
+        "reminder_3d": timedelta(days=3),
+        "reminder_1d": timedelta(days=1),
+    }
+    for value in REMINDER_EXTRA_HOURS.split(","):
+        value = value.strip()
+        if not value:
+            continue
+        try:
+            hours = float(value)
+        except ValueError:
+            logger.warning(f"REMINDER_EXTRA_HOURS: некорректное значение {value!r}")
+            continue
+        offsets[f"reminder_{value}h"] = timedelta(hours=hours)
+    return offsets
+
+
+REMINDER_OFFSETS = _reminder_offsets()
+
+
+def exam_start_utc(registration) -> Optional[datetime]:
+    """Начало экзамена в UTC (exam_date — полночь местного дня, exam_time — "9:00")"""
+    if not registration.exam_date:
+        return None
+    try:
+        hours, minutes = (int(part) for part in registration.exam_time.split(":"))
+    except (AttributeError, ValueError):
+        hours, minutes = 0, 0
+    local_start = datetime.combine(registration.exam_date.date(), datetime.min.time()) + timedelta(hours=hours, minutes=minutes)
+    return local_start - timedelta(hours=EXAM_UTC_OFFSET_HOURS)
+
+
+def compute_due_times(registration, now: Optional[datetime] = None, already_sent: bool = False) -> Dict[str, datetime]:
+    """Время отправки каждого напоминания (только будущие)"""
+    now = now or datetime.utcnow()
+    start = exam_start_utc(registration)
+    if start is None or start <= now:
+        return {}
+    due_times = {kind: start - offset for kind, offset in REMINDER_OFFSETS.items() if start - offset > now}
+    if not due_times and not already_sent:
+        # Записались позже всех сроков — напоминаем сразу
+        due_times = {min(REMINDER_OFFSETS, key=REMINDER_OFFSETS.get): now}
+    return due_times
+
+
+async def schedule_registration(db: AsyncSession, registration) -> List[ScheduledReminder]:
+    """Пересчитывает очередь напоминаний записи: неотправленные заменяются новыми"""
+    result = await db.execute(
+        select(ScheduledReminder).where(ScheduledReminder.registration_id == registration.id)
+    )
+    existing = result.scalars().all()
+    sent = {(r.kind, r.due_at) for r in existing if r.sent_at}
+    await db.execute(
+        delete(ScheduledReminder).where(
+            ScheduledReminder.registration_id == registration.id,
+            ScheduledReminder.sent_at.is_(None)
+        )
+    )
+
+    created = []
+    if not registration.confirmed:
+        for kind, due_at in compute_due_times(registration, already_sent=bool(sent)).items():
+            if (kind, due_at) in sent:
+                continue
+            created.append(ScheduledReminder(registration_id=registration.id, kind=kind, due_at=due_at, attempts=0))
+        db.add_all(created)
+    await db.commit()
+    return created
+
+
+def reminders_payload(reminders: List[ScheduledReminder]) -> List[Dict]:
+    return [{"id": r.id, "due_at": r.due_at.isoformat()} for r in reminders]
+
+
+async def schedule_missing(db: AsyncSession) -> int:
+    """Заполняет очередь для записей активного пробника без напоминаний (при старте)"""
+    has_reminders = select(ScheduledReminder.id).where(ScheduledReminder.registration_id == ExamRegistration.id)
+    result = await db.execute(
+        select(ExamRegistration)
+        .join(Probnik, ExamRegistration.probnik_id == Probnik.id)
+        .where(
+            Probnik.is_active == True,
+            ExamRegistration.confirmed == False,
+            ExamRegistration.exam_date >= datetime.combine(datetime.utcnow().date(), datetime.min.time()),
+            ~has_reminders.exists()
+        )
+    )
+    registrations = result.scalars().all()
+    now = datetime.utcnow()
+    created = [
+        ScheduledReminder(registration_id=registration.id, kind=kind, due_at=due_at, attempts=0)
+        for registration in registrations
+        for kind, due_at in compute_due_times(registration, now).items()
+    ]
+    db.add_all(created)
+    await db.commit()
+    if created:
+        logger.info(f"Запланировано {len(created)} напоминаний для {len(registrations)} записей")
+    return len(created)
+
+
+async def pending_reminders(db: AsyncSession) -> List[Dict]:
+    """
+    Неотправленные напоминания со временем, когда их можно забрать: ближайшие
+    REMINDER_PENDING_HORIZON_HOURS часов, не больше REMINDER_PENDING_LIMIT, по due_at
+    """
+    horizon = datetime.utcnow() + timedelta(hours=REMINDER_PENDING_HORIZON_HOURS)
+    result = await db.execute(
+        select(ScheduledReminder)
+        .where(
+            ScheduledReminder.sent_at.is_(None),
+            ScheduledReminder.attempts < REMINDER_MAX_ATTEMPTS,
+            ScheduledReminder.due_at <= horizon
+        )
+        .order_by(ScheduledReminder.due_at)
+        .limit(REMINDER_PENDING_LIMIT)
+    )
+    lease = timedelta(seconds=REMINDER_LEASE_SECONDS)
+    pending = []
+    for reminder in result.scalars().all():
+        due_at = reminder.due_at
+        if reminder.claimed_at and reminder.claimed_at + lease > due_at:
+            due_at = reminder.claimed_at + lease
+        pending.append({"id": reminder.id, "due_at": due_at.isoformat()})
+    return pending
+
+
+def _plural_days(days: int) -> str:
+    if days % 10 == 1 and days % 100 != 11:
+        return f"{days} день"
+    if 2 <= days % 10 <= 4 and not 12 <= days % 100 <= 14:
+        return f"{days} дня"
+    return f"{days} дней"
+
+
+def reminder_message(registration, now: Optional[datetime] = None) -> str:
+    now = now or datetime.utcnow()
+    local_today = (now + timedelta(hours=EXAM_UTC_OFFSET_HOURS)).date()
+    days_left = (registration.exam_date.date() - local_today).days
+    exam_date = registration.exam_date.strftime("%d.%m.%Y")
+    if days_left <= 0:
+        return f"Сегодня у вас экзамен по {registration.subject} в {registration.exam_time}. Подтвердите участие."
+    if days_left == 1:
+        return f"Завтра у вас экзамен по {registration.subject} в {registration.exam_time}. Подтвердите участие."
+    return (
+        f"Через {_plural_days(days_left)} у вас экзамен по {registration.subject} "
+        f"({exam_date} в {registration.exam_time}). Подтвердите участие."
+    )
+
+
+async def claim_reminders(db: AsyncSession, ids: List[int]) -> List[Dict]:
+    """Забирает пришедшие напоминания на отправку. Неактуальные (участие подтверждено,
+    пробник закрыт, нет Telegram, экзамен уже начался — например, после простоя
+    бота) удаляются из очереди."""
+    if not ids:
+        return []
+    now = datetime.utcnow()
+    result = await db.execute(
+        select(ScheduledReminder)
+        .options(
+            selectinload(ScheduledReminder.registration).selectinload(ExamRegistration.student),
+            selectinload(ScheduledReminder.registration).selectinload(ExamRegistration.probnik)
+        )
+        .where(
+            ScheduledReminder.id.in_(ids),
+            ScheduledReminder.sent_at.is_(None),
+            ScheduledReminder.due_at <= now,
+            ScheduledReminder.attempts < REMINDER_MAX_ATTEMPTS
+        )
+    )
+    lease_expired = now - timedelta(seconds=REMINDER_LEASE_SECONDS)
+    claimed, stale_ids = [], []
+    for reminder in result.scalars().all():
+        registration = reminder.registration
+        student = registration.student
+        start = exam_start_utc(registration)
+        if (
+            registration.confirmed
+            or start is None
+            or start <= now
+            or not (registration.probnik and registration.probnik.is_active)
+            or not (student and student.user_id and student.user_id > 0)
+        ):
+            stale_ids.append(reminder.id)
+            continue
+        if reminder.claimed_at and reminder.claimed_at > lease_expired:
+            continue  # Уже отправляется
+        reminder.claimed_at = now
+        reminder.attempts = (reminder.attempts or 0) + 1
+        claimed.append({
+            "id": reminder.id,
+            "type": reminder.kind,
+            "user_id": student.user_id,
+            "registration_id": registration.id,
+            "subject": registration.subject,
+            "exam_date": registration.exam_date.strftime("%d.%m.%Y"),
+            "exam_time": registration.exam_time,
+            "message": reminder_message(registration, now),
+        })
+    if stale_ids:
+        await db.execute(delete(ScheduledReminder).where(ScheduledReminder.id.in_(stale_ids)))
+    await db.commit()
+    return claimed
+
+
+async def ack_reminders(db: AsyncSession, sent: List[int], failed: List[int]) -> Dict[str, int]:
+    """Отмечает отправленные; неудачные снова можно забрать (до REMINDER_MAX_ATTEMPTS попыток)"""
+    now = datetime.utcnow()
+    sent_count = failed_count = 0
+    if sent:
+        result = await db.execute(
+            update(ScheduledReminder)
+            .where(ScheduledReminder.id.in_(sent), ScheduledReminder.sent_at.is_(None))
+            .values(sent_at=now)
+        )
+        sent_count = result.rowcount
+    if failed:
+        result = await db.execute(
+            update(ScheduledReminder)
+            .where(ScheduledReminder.id.in_(failed), ScheduledReminder.sent_at.is_(None))
+            .values(claimed_at=None)
+        )
+        failed_count = result.rowcount
+    await db.commit()
+    return {"sent": sent_count, "failed": failed_count}
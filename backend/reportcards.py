@@ -0,0 +1,322 @@
+"""
+Карточки успеваемости учеников для родительских собраний (HTML для печати).
+
+Карточка — раздел на каждую группу ученика: результаты по всем типам экзаменов
+группы (первичный и тестовый балл, изменение к прошлому экзамену, средний по
+группе), график динамики и самые слабые задания среди пройденных (completed_tasks
+типа экзамена: непройденные темы слабыми не считаются).
+
+Данные группы загружаются несколькими запросами независимо от ее размера
+(load_group), отрисовка идет в пуле процессов workers.py пачками по RENDER_BATCH
+карточек. Готовые карточки кешируются по хешу входных данных: любое изменение
+экзаменов группы (ответ, новый тип экзамена, пройденные задания) меняет ключ,
+поэтому отдельная инвалидация не нужна.
+"""
+import asyncio
+import hashlib
+import html
+import io
+import json
+import os
+import re
+import zipfile
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import metrics
+import scoring
+import workers
+from models import Employee, Exam, ExamType, Student, StudyGroup, group_student_association
+
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "2000"))
+RENDER_BATCH = int(os.getenv("REPORT_RENDER_BATCH", "25"))
+WEAK_TASKS_LIMIT = 5
+
+_cache: "OrderedDict[str, str]" = OrderedDict()
+
+
+# ==================== ЗАГРУЗКА ДАННЫХ ====================
+
+async def load_group(db: AsyncSession, group: StudyGroup) -> Tuple[List[Dict], Dict[int, Dict]]:
+    """
+    Ученики группы и раздел карточки для каждого: четыре запроса на группу.
+    Возвращает (ученики по порядку ФИО, {student_id: раздел}).
+    """
+    teacher = await db.execute(select(Employee.teacher_name).where(Employee.id == group.teacher_id))
+    teacher_name = teacher.scalar_one_or_none()
+    types_result = await db.execute(
+        select(ExamType.id, ExamType.name, ExamType.completed_tasks)
+        .where(ExamType.group_id == group.id)
+        .order_by(ExamType.id)
+    )
+    exam_types = types_result.all()
+    students_result = await db.execute(
+        select(Student.id, Student.fio, Student.class_num)
+        .join(group_student_association, group_student_association.c.student_id == Student.id)
+        .where(group_student_association.c.group_id == group.id)
+        .order_by(Student.fio, Student.id)
+    )
+    students = [{"id": sid, "fio": fio, "class_num": class_num} for sid, fio, class_num in students_result.all()]
+
+    type_index = {type_id: index for index, (type_id, _, _) in enumerate(exam_types)}
+    answers: Dict[int, List[Optional[str]]] = {student["id"]: [None] * len(exam_types) for student in students}
+    exam_subject = None
+    if exam_types and students:
+        exams_result = await db.execute(
+            select(Exam.id_student, Exam.exam_type_id, Exam.subject, Exam.answer)
+            .where(Exam.exam_type_id.in_(list(type_index)))
+            .order_by(Exam.id)
+        )
+        for student_id, exam_type_id, subject, answer in exams_result.all():
+            if student_id in answers:
+                # Несколько результатов на один тип — берется последний
+                answers[student_id][type_index[exam_type_id]] = answer or ""
+                exam_subject = exam_subject or subject
+
+    subject = group.subject or exam_subject
+    averages = []
+    for index in range(len(exam_types)):
+        written = [
+            scoring.primary_score(subject, scoring.parse_answer(row[index]))
+            for row in answers.values() if row[index] is not None
+        ]
+        averages.append(round(sum(written) / len(written), 1) if written else None)
+
+    base = {
+        "group": group.name,
+        "subject": subject,
+        "teacher": teacher_name,
+        "exam_types": [
+            {"name": name, "completed_tasks": sorted(completed or [])}
+            for _, name, completed in exam_types
+        ],
+        "group_average": averages,
+    }
+    sections = {student["id"]: {**base, "answers": answers[student["id"]]} for student in students}
+    return students, sections
+
+
+async def load_student(db: AsyncSession, student: Student, group_ids: List[int]) -> Dict:
+    """Карточка ученика по указанным группам"""
+    sections = []
+    if group_ids:
+        groups = await db.execute(select(StudyGroup).where(StudyGroup.id.in_(group_ids)).order_by(StudyGroup.id))
+        for group in groups.scalars().all():
+            _, group_sections = await load_group(db, group)
+            if student.id in group_sections:
+                sections.append(group_sections[student.id])
+    return payload(student.fio, student.class_num, sections)
+
+
+def payload(fio: str, class_num: Optional[int], sections: List[Dict]) -> Dict:
+    return {"student": {"fio": fio, "class_num": class_num}, "sections": sections}
+
+
+# ==================== ОТРИСОВКА (в пуле процессов) ====================
+
+def _section_stats(section: Dict) -> Dict:
+    subject = section["subject"]
+    limits = scoring.max_per_task(subject) or []
+    max_primary = scoring.max_primary(subject)
+    rows = []
+    previous = None
+    got = [0] * len(limits)
+    possible = [0] * len(limits)
+    for exam_type, answer, average in zip(section["exam_types"], section["answers"], section["group_average"]):
+        if answer is None:
+            rows.append({"name": exam_type["name"], "written": False, "average": average})
+            continue
+        scores = scoring.parse_answer(answer)
+        primary = scoring.primary_score(subject, scores)
+        rows.append({
+            "name": exam_type["name"],
+            "written": True,
+            "primary": primary,
+            "scaled": scoring.scaled_score(subject, primary),
+            "delta": primary - previous if previous is not None else None,
+            "average": average,
+            "percent": primary / max_primary if max_primary else None,
+        })
+        previous = primary
+        # Освоение задания считается только по экзаменам, где тема уже пройдена
+        for task in exam_type["completed_tasks"]:
+            index = task - 1
+            if 0 <= index < len(limits):
+                possible[index] += limits[index]
+                score = scores[index] if index < len(scores) else None
+                got[index] += min(score or 0, limits[index])
+
+    covered = [index for index in range(len(limits)) if possible[index]]
+    weak = sorted(covered, key=lambda index: (got[index] / possible[index], index))[:WEAK_TASKS_LIMIT]
+    last_completed = section["exam_types"][-1]["completed_tasks"] if section["exam_types"] else []
+    return {
+        "rows": rows,
+        "max_primary": max_primary,
+        "weak": [
+            {"task": index + 1, "mastery": got[index] / possible[index], "got": got[index], "possible": possible[index]}
+            for index in weak if got[index] < possible[index]
+        ],
+        "uncovered": max(len(limits) - len(last_completed), 0) if limits else 0,
+    }
+
+
+def _chart(rows: List[Dict], max_primary: Optional[int]) -> str:
+    """SVG-график первичного балла (сплошная линия) и среднего по группе (пунктир)"""
+    if len(rows) < 2:
+        return ""
+    width, height, pad = 520, 150, 24
+    top = max_primary or max(
+        [row.get("primary", 0) for row in rows] + [row["average"] or 0 for row in rows] + [1]
+    )
+    step = (width - 2 * pad) / (len(rows) - 1)
+
+    def point(index: int, value: float) -> str:
+        return f"{pad + index * step:.1f},{height - pad - (height - 2 * pad) * value / top:.1f}"
+
+    student = [point(i, row["primary"]) for i, row in enumerate(rows) if row["written"]]
+    average = [point(i, row["average"]) for i, row in enumerate(rows) if row["average"] is not None]
+    parts = [
+        f'<svg class="chart" viewBox="0 0 {width} {height}" width="{width}" height="{height}">',
+        f'<line x1="{pad}" y1="{height - pad}" x2="{width - pad}" y2="{height - pad}" stroke="#bbb"/>',
+    ]
+    if len(average) > 1:
+        parts.append(f'<polyline points="{" ".join(average)}" fill="none" stroke="#999" stroke-dasharray="4 3"/>')
+    if len(student) > 1:
+        parts.append(f'<polyline points="{" ".join(student)}" fill="none" stroke="#2563eb" stroke-width="2"/>')
+    for coords in student:
+        x, y = coords.split(",")
+        parts.append(f'<circle cx="{x}" cy="{y}" r="3" fill="#2563eb"/>')
+    for index, row in enumerate(rows):
+        label = html.escape(row["name"][:12])
+        parts.append(f'<text x="{pad + index * step:.1f}" y="{height - 6}" font-size="9" text-anchor="middle">{label}</text>')
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+def _section_html(section: Dict) -> str:
+    stats = _section_stats(section)
+    max_primary = stats["max_primary"]
+    title = html.escape(f'{section["group"]} — {scoring.subject_name(section["subject"])}')
+    teacher = f'<div class="muted">Преподаватель: {html.escape(section["teacher"])}</div>' if section["teacher"] else ""
+    lines = [f"<section><h2>{title}</h2>{teacher}"]
+    if not stats["rows"]:
+        lines.append('<p class="muted">Экзаменов в группе пока не было.</p></section>')
+        return "".join(lines)
+    lines.append(
+        "<table><tr><th>Экзамен</th><th>Первичный балл</th><th>Тестовый балл</th>"
+        "<th>Изменение</th><th>Средний по группе</th></tr>"
+    )
+    for row in stats["rows"]:
+        average = f'{row["average"]:g}' if row["average"] is not None else "—"
+        if not row["written"]:
+            lines.append(f'<tr class="muted"><td>{html.escape(row["name"])}</td><td colspan="3">не писал</td><td>{average}</td></tr>')
+            continue
+        primary = f'{row["primary"]} из {max_primary}' if max_primary else str(row["primary"])
+        delta = "" if row["delta"] is None else f'{row["delta"]:+d}'
+        delta_class = "up" if (row["delta"] or 0) > 0 else "down" if (row["delta"] or 0) < 0 else ""
+        lines.append(
+            f'<tr><td>{html.escape(row["name"])}</td><td>{primary}</td><td>{row["scaled"]}</td>'
+            f'<td class="{delta_class}">{delta}</td><td>{average}</td></tr>'
+        )
+    lines.append("</table>")
+    lines.append(_chart(stats["rows"], max_primary))
+    if stats["weak"]:
+        lines.append("<h3>Задания, на которые стоит обратить внимание</h3><ul>")
+        for item in stats["weak"]:
+            lines.append(
+                f'<li>Задание {item["task"]}: {item["mastery"]:.0%} '
+                f'({item["got"]} из {item["possible"]} баллов)</li>'
+            )
+        lines.append("</ul>")
+    if stats["uncovered"]:
+        lines.append(f'<p class="muted">Еще не пройдено заданий: {stats["uncovered"]}</p>')
+    lines.append("</section>")
+    return "".join(lines)
+
+
+_STYLE = (
+    "body{font-family:Arial,sans-serif;font-size:13px;color:#111;max-width:760px;margin:24px auto}"
+    "h1{font-size:20px;margin:0 0 4px}h2{font-size:16px;margin:20px 0 4px}h3{font-size:14px;margin:12px 0 4px}"
+    "table{border-collapse:collapse;width:100%;margin:8px 0}th,td{border:1px solid #ccc;padding:4px 6px;text-align:left}"
+    "th{background:#f3f4f6}.muted{color:#777}.up{color:#15803d}.down{color:#b91c1c}.chart{display:block;margin:8px 0}"
+    "@page{size:A4;margin:15mm}@media print{body{margin:0}section{page-break-inside:avoid}}"
+)
+
+
+def render_card(card: Dict) -> str:
+    student = card["student"]
+    name = html.escape(student["fio"])
+    class_line = f'<div class="muted">{student["class_num"]} класс</div>' if student["class_num"] else ""
+    sections = "".join(_section_html(section) for section in card["sections"])
+    if not sections:
+        sections = '<p class="muted">Нет групп с результатами.</p>'
+    return (
+        f'<!DOCTYPE html><html lang="ru"><head><meta charset="utf-8"><title>{name}</title>'
+        f"<style>{_STYLE}</style></head><body><h1>{name}</h1>{class_line}{sections}</body></html>"
+    )
+
+
+def render_batch(cards: List[Dict]) -> List[str]:
+    return [render_card(card) for card in cards]
+
+
+# ==================== КЕШ ====================
+
+def _key(card: Dict) -> str:
+    return hashlib.sha1(json.dumps(card, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+async def render(cards: List[Dict]) -> List[str]:
+    """Карточки из кеша, недостающие — отрисовка в пуле процессов пачками"""
+    keys = [_key(card) for card in cards]
+    rendered: List[Optional[str]] = [None] * len(cards)
+    missing: List[int] = []
+    for index, key in enumerate(keys):
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            rendered[index] = cached
+            metrics.record_cache_hit("report_cards")
+        else:
+            missing.append(index)
+            metrics.record_cache_miss("report_cards")
+
+    batches = [missing[start:start + RENDER_BATCH] for start in range(0, len(missing), RENDER_BATCH)]
+    results = await asyncio.gather(*(
+        workers.run(render_batch, [cards[index] for index in batch]) for batch in batches
+    ))
+    for batch, pages in zip(batches, results):
+        for index, page in zip(batch, pages):
+            rendered[index] = page
+            _cache[keys[index]] = page
+    while len(_cache) > REPORT_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return rendered
+
+
+# ==================== АРХИВ ====================
+
+def _file_name(number: int, fio: str) -> str:
+    return f"{number:03d} {re.sub(r'[^0-9A-Za-zА-Яа-яЁё .-]', '_', fio).strip()}.html"
+
+
+def build_zip(files: List[Tuple[str, str]]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in files:
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+async def group_zip(db: AsyncSession, group: StudyGroup) -> bytes:
+    """ZIP с карточками всех учеников группы"""
+    students, sections = await load_group(db, group)
+    cards = [payload(student["fio"], student["class_num"], [sections[student["id"]]]) for student in students]
+    pages = await render(cards)
+    files = [(_file_name(number, student["fio"]), page)
+             for number, (student, page) in enumerate(zip(students, pages), start=1)]
+    # zlib отпускает GIL — сжатие в потоке не мешает циклу событий
+    return await asyncio.to_thread(build_zip, files)
@@ -0,0 +1,275 @@
+"""
+Сводная таблица записей на пробник (registration_rollup) для статистики.
+
+Строка на (probnik_id, school, exam_date, exam_time, subject) со счетчиками
+registered / confirmed / attended / submitted. Счетчики поддерживаются
+инкрементально: обработчики событий сессии SQLAlchemy собирают изменения
+ExamRegistration при flush (новые, удаленные, измененные — старые значения
+из истории атрибутов) и применяют дельты в той же транзакции. Поэтому
+статистика не требует чтения всех записей и откатывается вместе с транзакцией.
+
+Изменения в обход ORM (массовые UPDATE/DELETE, каскадное удаление в БД)
+счетчики не видят: такой код вызывает subtract_matching / apply_deltas сам,
+а задача планировщика периодически пересобирает таблицу из exam_registration
+(rebuild), исправляя возможное расхождение.
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, delete, event, func, insert, inspect, select, true, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import reminders
+import waitlist
+from models import ExamRegistration, Probnik, RegistrationRollup, Student
+
+RollupKey = Tuple[int, Optional[str], object, str, str]
+COUNTERS = ("registered", "confirmed", "attended", "submitted")
+_KEY_FIELDS = ("probnik_id", "school", "exam_date", "exam_time", "subject")
+_FLAG_FIELDS = ("confirmed", "attended", "submitted_work")
+_DELTAS_KEY = "registration_rollup_deltas"
+
+
+def _values(registration: ExamRegistration, old: bool = False) -> Dict:
+    """Значения полей записи: текущие или до изменения в этом flush"""
+    state = inspect(registration)
+    values = {}
+    for field in _KEY_FIELDS + _FLAG_FIELDS:
+        if old:
+            history = state.attrs[field].history
+            if history.deleted:
+                values[field] = history.deleted[0]
+                continue
+        values[field] = getattr(registration, field)
+    return values
+
+
+def _add(deltas: Dict[RollupKey, List[int]], values: Dict, sign: int):
+    if values["probnik_id"] is None:
+        return
+    key = tuple(values[field] for field in _KEY_FIELDS)
+    counters = deltas[key]
+    counters[0] += sign
+    counters[1] += sign if values["confirmed"] else 0
+    counters[2] += sign if values["attended"] else 0
+    counters[3] += sign if values["submitted_work"] else 0
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_deltas(session: Session, flush_context, instances):
+    deltas = session.info.setdefault(_DELTAS_KEY, defaultdict(lambda: [0, 0, 0, 0]))
+    for obj in session.new:
+        if isinstance(obj, ExamRegistration):
+            _add(deltas, _values(obj), 1)
+    for obj in session.deleted:
+        if isinstance(obj, ExamRegistration):
+            _add(deltas, _values(obj, old=True), -1)
+    for obj in session.dirty:
+        if isinstance(obj, ExamRegistration) and session.is_modified(obj, include_collections=False):
+            _add(deltas, _values(obj, old=True), -1)
+            _add(deltas, _values(obj), 1)
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_collected(session: Session, flush_context):
+    deltas = session.info.pop(_DELTAS_KEY, None)
+    if deltas:
+        _apply(session.connection(), deltas)
+
+
+@event.listens_for(Session, "after_rollback")
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_deltas(session: Session, previous_transaction=None):
+    """Дельты неудавшегося flush не должны попасть в следующий"""
+    session.info.pop(_DELTAS_KEY, None)
+
+
+def _apply(connection, deltas: Dict[RollupKey, List[int]]):
+    for key, counters in deltas.items():
+        if not any(counters):
+            continue
+        probnik_id, school, exam_date, exam_time, subject = key
+        values = {
+            name: getattr(RegistrationRollup, name) + amount
+            for name, amount in zip(COUNTERS, counters)
+        }
+        result = connection.execute(
+            update(RegistrationRollup)
+            .where(
+                RegistrationRollup.probnik_id == probnik_id,
+                RegistrationRollup.school == school,
+                RegistrationRollup.exam_date == exam_date,
+                RegistrationRollup.exam_time == exam_time,
+                RegistrationRollup.subject == subject
+            )
+            .values(**values)
+        )
+        if result.rowcount == 0:
+            connection.execute(
+                insert(RegistrationRollup).values(
+                    probnik_id=probnik_id, school=school, exam_date=exam_date,
+                    exam_time=exam_time, subject=subject,
+                    **{name: amount for name, amount in zip(COUNTERS, counters)}
+                )
+            )
+
+
+async def apply_deltas(db: AsyncSession, deltas: Dict[RollupKey, List[int]]):
+    """Применяет дельты счетчиков для изменений, сделанных в обход ORM"""
+    await db.run_sync(lambda session: _apply(session.connection(), deltas))
+
+
+def _grouped_counts(condition):
+    return (
+        select(
+            ExamRegistration.probnik_id,
+            ExamRegistration.school,
+            ExamRegistration.exam_date,
+            ExamRegistration.exam_time,
+            ExamRegistration.subject,
+            func.count(ExamRegistration.id),
+            func.sum(case((ExamRegistration.confirmed == True, 1), else_=0)),
+            func.sum(case((ExamRegistration.attended == True, 1), else_=0)),
+            func.sum(case((ExamRegistration.submitted_work == True, 1), else_=0)),
+        )
+        .where(ExamRegistration.probnik_id.isnot(None), condition)
+        .group_by(
+            ExamRegistration.probnik_id, ExamRegistration.school, ExamRegistration.exam_date,
+            ExamRegistration.exam_time, ExamRegistration.subject
+        )
+    )
+
+
+async def subtract_matching(db: AsyncSession, condition):
+    """Вычитает из счетчиков записи, которые сейчас будут удалены массовым DELETE"""
+    result = await db.execute(_grouped_counts(condition))
+    deltas = {tuple(row[:5]): [-int(value or 0) for value in row[5:]] for row in result.all()}
+    if deltas:
+        await apply_deltas(db, deltas)
+
+
+async def rebuild(db: AsyncSession, probnik_id: Optional[int] = None):
+    """Пересобирает сводную таблицу из exam_registration (целиком или для одного пробника)"""
+    delete_stmt = delete(RegistrationRollup)
+    condition = true()
+    if probnik_id is not None:
+        delete_stmt = delete_stmt.where(RegistrationRollup.probnik_id == probnik_id)
+        condition = ExamRegistration.probnik_id == probnik_id
+    await db.execute(delete_stmt)
+    await db.execute(
+        insert(RegistrationRollup).from_select(list(_KEY_FIELDS) + list(COUNTERS), _grouped_counts(condition))
+    )
+    await db.commit()
+
+
+async def load(db: AsyncSession, probnik_id: int) -> List[RegistrationRollup]:
+    result = await db.execute(
+        select(RegistrationRollup)
+        .where(RegistrationRollup.probnik_id == probnik_id, RegistrationRollup.registered > 0)
+        .order_by(RegistrationRollup.exam_date, RegistrationRollup.school, RegistrationRollup.exam_time, RegistrationRollup.subject)
+    )
+    return result.scalars().all()
+
+
+def _rates(registered: int, confirmed: int, attended: int, submitted: int) -> Dict:
+    return {
+        "registered": registered,
+        "confirmed": confirmed,
+        "attended": attended,
+        "submitted": submitted,
+        "confirmation_rate": round(confirmed / registered, 4) if registered else 0.0,
+        "attendance_rate": round(attended / registered, 4) if registered else 0.0,
+        # Доля сдавших работу среди пришедших
+        "submission_rate": round(submitted / attended, 4) if attended else 0.0,
+    }
+
+
+async def probnik_stats(db: AsyncSession, probnik: Probnik) -> Dict:
+    """
+    Статистика пробника: заполненность слотов и предметов — из сводной таблицы,
+    разбивка по классам и динамика записи — агрегатами SQL по exam_registration
+    (индекс ix_exam_registration_probnik_slot). Строки записей не читаются.
+    """
+    rows = await load(db, probnik.id)
+
+    slots: Dict[Tuple, Dict] = {}
+    subjects: Dict[str, List[int]] = {}
+    totals = [0, 0, 0, 0]
+    for row in rows:
+        counters = [row.registered, row.confirmed, row.attended, row.submitted]
+        slot_key = (row.school, row.exam_date, row.exam_time)
+        slot = slots.setdefault(slot_key, {"counters": [0, 0, 0, 0], "subjects": []})
+        slot["subjects"].append({"subject": row.subject, **_rates(*counters)})
+        for index, value in enumerate(counters):
+            slot["counters"][index] += value
+            totals[index] += value
+        subject_counters = subjects.setdefault(row.subject, [0, 0, 0, 0])
+        for index, value in enumerate(counters):
+            subject_counters[index] += value
+
+    slot_list = []
+    for (school, exam_date, exam_time), slot in slots.items():
+        capacity = waitlist.slot_capacity(probnik, school, exam_time)
+        slot_list.append({
+            "school": school,
+            "date": exam_date.strftime("%Y-%m-%d"),
+            "time": exam_time,
+            "capacity": capacity,
+            "fill_rate": round(slot["counters"][0] / capacity, 4) if capacity else 0.0,
+            **_rates(*slot["counters"]),
+            "subjects": slot["subjects"],
+        })
+
+    class_rows = await db.execute(
+        select(
+            Student.class_num,
+            ExamRegistration.subject,
+            func.count(func.distinct(ExamRegistration.student_id)),
+            func.count(ExamRegistration.id)
+        )
+        .join(Student, Student.id == ExamRegistration.student_id)
+        .where(ExamRegistration.probnik_id == probnik.id)
+        .group_by(Student.class_num, ExamRegistration.subject)
+    )
+    students_by_class = await db.execute(
+        select(Student.class_num, func.count(func.distinct(ExamRegistration.student_id)))
+        .join(Student, Student.id == ExamRegistration.student_id)
+        .where(ExamRegistration.probnik_id == probnik.id)
+        .group_by(Student.class_num)
+    )
+    by_class: Dict[Optional[int], Dict] = {
+        class_num: {"class_num": class_num, "students": students, "registrations": 0, "subjects": {}}
+        for class_num, students in students_by_class.all()
+    }
+    for class_num, subject, students, registrations in class_rows.all():
+        entry = by_class[class_num]
+        entry["registrations"] += registrations
+        entry["subjects"][subject] = students
+
+    # Динамика записи по дням (местное время экзаменов)
+    local_day = func.date(ExamRegistration.created_at, f"{reminders.EXAM_UTC_OFFSET_HOURS:+g} hours")
+    timeline_rows = await db.execute(
+        select(local_day, func.count(ExamRegistration.id))
+        .where(ExamRegistration.probnik_id == probnik.id, ExamRegistration.created_at.isnot(None))
+        .group_by(local_day)
+        .order_by(local_day)
+    )
+    timeline = []
+    cumulative = 0
+    for day, count in timeline_rows.all():
+        cumulative += count
+        timeline.append({"date": day, "registrations": count, "cumulative": cumulative})
+
+    return {
+        "probnik_id": probnik.id,
+        "probnik_name": probnik.name,
+        "totals": {"students": sum(entry["students"] for entry in by_class.values()), **_rates(*totals)},
+        "slots": slot_list,
+        "subjects": [
+            {"subject": subject, **_rates(*counters)}
+            for subject, counters in sorted(subjects.items(), key=lambda item: -item[1][0])
+        ],
+        "by_class": sorted(by_class.values(), key=lambda entry: (entry["class_num"] is None, entry["class_num"] or 0)),
+        "timeline": timeline,
+    }
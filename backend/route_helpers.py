@@ -0,0 +1,24 @@
+"""
+Общие проверки для обработчиков API: права администратора и даты из параметров запроса.
+"""
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException
+
+
+def require_admin(user: dict):
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Доступ запрещен. Только для администратора")
+
+
+def parse_date(value: Optional[str], required: bool = False) -> Optional[datetime]:
+    """YYYY-MM-DD -> datetime на полночь; пустое значение — None (или 400, если дата обязательна)"""
+    if not value:
+        if required:
+            raise HTTPException(status_code=400, detail="Не указана дата")
+        return None
+    try:
+        return datetime.combine(datetime.strptime(value, "%Y-%m-%d").date(), datetime.min.time())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный формат даты. Используйте YYYY-MM-DD")
@@ -1,7 +1,11 @@
 from pydantic import BaseModel, field_validator, validator, Field
 from typing import Optional, List, Dict
+from datetime import datetime
+import logging
 import re
 
+logger = logging.getLogger(__name__)
+
 def normalize_student_for_response(student):
     """Нормализует данные студента для создания StudentResponse"""
     user_id = student.user_id
@@ -161,6 +165,18 @@ class ExamTypeResponse(ExamTypeBase):
             data['completed_tasks'] = self.completed_tasks
         return data
 
+class ExamSummaryResponse(BaseModel):
+    """Готовый результат ученика по типу экзамена (из сводки exam_summary)"""
+    student_id: int
+    fio: str
+    exam_type_id: int
+    exam_name: str
+    exam_id: int
+    primary_score: int
+    scaled_score: int
+    percentile: float  # Среди написавших этот экзамен в группе, 0–100
+    delta: Optional[int] = None  # Изменение первичного балла к предыдущему экзамену группы
+
 class StudentWithExamsResponse(StudentResponse):
     exams: List[ExamResponse] = []
 
@@ -227,8 +243,8 @@ class GroupResponse(BaseModel):
                         # Нормализуем данные и создаем StudentResponse
                         student_dict = normalize_student_for_response(s)
                         students.append(StudentResponse(**student_dict))
-                    except Exception as e:
-                        print(f"Error creating StudentResponse for student {s.id}: {e}")
+                    except Exception:
+                        logger.warning("Не удалось сериализовать студента %s", s.id, exc_info=True)
                         # Пропускаем проблемного студента, но продолжаем
                         continue
             
@@ -244,12 +260,8 @@ class GroupResponse(BaseModel):
                 'students': students
             }
             return cls(**data)
-        except Exception as e:
-            print(f"Error in from_orm_with_teacher: {e}")
-            print(f"Object type: {type(obj)}")
-            print(f"Object attributes: {dir(obj)}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Ошибка сериализации группы %s", getattr(obj, 'id', None))
             raise
 
 class GroupWithStudentsResponse(BaseModel):
@@ -282,9 +294,76 @@ class GroupWithStudentsResponse(BaseModel):
         }
         return cls(**data)
 
+class GroupResultsMatrix(BaseModel):
+    """Результаты группы по колонкам: ячейка (ученик i, тип j) — индекс i * len(exam_type_ids) + j"""
+    group_id: int
+    group_name: str
+    subject: Optional[str] = None
+    max_score: Optional[int] = None  # Максимальный первичный балл предмета
+    exam_type_ids: List[int]
+    exam_type_names: List[str]
+    completed_tasks: List[List[int]]
+    student_ids: List[int]
+    student_names: List[str]
+    class_nums: List[Optional[int]]
+    exam_ids: List[Optional[int]]
+    answers: List[Optional[str]]
+    scores: List[Optional[int]]  # Первичный балл
+    comments: List[Optional[str]]
+
+class TrendBase(BaseModel):
+    """Ряды по типам экзаменов группы в порядке создания; None — нет результата"""
+    group_id: int
+    group_name: str
+    subject: Optional[str] = None
+    max_score: Optional[int] = None
+    window: int  # Окно скользящих средних (экзаменов)
+    exam_type_ids: List[int]
+    exam_type_names: List[str]
+    completed_tasks: List[List[int]]
+
+class GroupTrend(TrendBase):
+    participants: List[int]
+    primary_mean: List[Optional[float]]
+    primary_median: List[Optional[float]]
+    primary_p25: List[Optional[float]]
+    primary_p75: List[Optional[float]]
+    primary_rolling: List[Optional[float]]
+    scaled_mean: List[Optional[float]]
+    covered_mastery: List[Optional[float]]  # Освоение пройденных тем, 0–1
+    uncovered_mastery: List[Optional[float]]  # Результат по непройденным темам, 0–1
+    task_mastery: List[List[Optional[float]]]  # Тип экзамена × задание
+    task_rolling: List[List[Optional[float]]]  # Скользящее освоение, только пройденные темы
+    student_ids: List[int]
+    student_names: List[str]
+    student_primary: List[List[Optional[float]]]  # Ученик × тип экзамена
+    student_rolling: List[List[Optional[float]]]
+    student_slope: List[Optional[float]]  # Изменение первичного балла за экзамен (тренд)
+
+class StudentTrend(TrendBase):
+    student_id: int
+    fio: str
+    primary: List[Optional[float]]
+    scaled: List[Optional[float]]
+    primary_rolling: List[Optional[float]]
+    vs_group: List[Optional[float]]  # Разница со средним по группе
+    slope: Optional[float] = None
+    covered_mastery: List[Optional[float]]
+    uncovered_mastery: List[Optional[float]]
+    task_mastery: List[List[Optional[float]]]
+    task_rolling: List[List[Optional[float]]]
+
 class GroupStudentsUpdate(BaseModel):
     student_ids: List[int] = []
 
+class GroupStudentsDelta(BaseModel):
+    """Изменение состава группы: только затронутые студенты"""
+    message: str
+    group_id: int
+    added: List[int] = []  # ID добавленных студентов
+    removed: List[int] = []  # ID удаленных из группы студентов
+    unknown: List[int] = []  # ID, которых нет в базе (пропущены)
+
 class GroupBase(BaseModel):
     id: int
     name: str
@@ -311,6 +390,58 @@ class GroupBase(BaseModel):
         }
         return cls(**data)
 
+# ==== МАССОВОЕ УДАЛЕНИЕ ====
+
+class BulkDeleteRequest(BaseModel):
+    ids: List[int]
+
+class AttendanceMark(BaseModel):
+    """Отметка для одной записи: не переданное поле не меняется"""
+    id: int
+    attended: Optional[bool] = None
+    submitted_work: Optional[bool] = None
+    marked_at: Optional[datetime] = None  # Когда отметили на устройстве (UTC); None — сейчас
+
+class BulkAttendanceRequest(BaseModel):
+    items: List[AttendanceMark] = Field(..., max_length=2000)
+
+class BulkAttendanceResponse(BaseModel):
+    """Дельта массовой отметки: только измененные записи"""
+    updated: int
+    unchanged: int
+    stale: List[int] = []  # Отметки старше уже сохраненных (побеждает последняя)
+    not_found: List[int] = []
+    changes: List[AttendanceMark] = []
+
+class RosterSnapshot(BaseModel):
+    """Список слота для отметки на входе: строки — массивы в порядке columns"""
+    probnik_id: int
+    school: str
+    exam_date: str
+    exam_time: str
+    version: str
+    columns: List[str]
+    rows: List[list]
+
+class CheckinSyncRequest(BaseModel):
+    probnik_id: int
+    school: str
+    exam_date: str  # YYYY-MM-DD
+    exam_time: str
+    version: Optional[str] = None  # Версия списка на устройстве
+    sent_at: Optional[datetime] = None  # Часы устройства при отправке — для поправки marked_at
+    marks: List[AttendanceMark] = Field(default=[], max_length=2000)
+
+class CheckinSyncResponse(BulkAttendanceResponse):
+    version: str
+    snapshot: Optional[RosterSnapshot] = None  # Только если список изменился
+
+class DeleteResponse(BaseModel):
+    """Результат удаления: количество удаленных строк по таблицам"""
+    message: str
+    deleted: Dict[str, int]
+    skipped: List[int] = []  # ID, которые нельзя удалить (например, учителя с группами)
+
 # Для регистрации
 class EmployeeCreate(BaseModel):
     username: str
@@ -369,6 +500,28 @@ class ExamRegistrationCreate(BaseModel):
     exam_time: str  # "9:00" или "12:00"
     school: Optional[str] = None  # "Байкальская" или "Лермонтова"
 
+class RegistrationMoveRequest(BaseModel):
+    exam_date: str  # Новая дата в формате "YYYY-MM-DD"
+    exam_time: str
+    school: Optional[str] = None  # Не указана — школа остается прежней
+
+class WaitlistJoinRequest(BaseModel):
+    student_id: int
+    subject: str
+    exam_date: str  # Дата в формате "YYYY-MM-DD"
+    exam_time: str  # "9:00" или "12:00"
+    school: str  # "Байкальская" или "Лермонтова"
+
+class WaitlistEntryResponse(BaseModel):
+    id: int
+    student_id: int
+    subject: str
+    exam_date: str
+    exam_time: str
+    school: str
+    position: int  # 1 — следующий на освободившееся место
+    created_at: str
+
 class ExamRegistrationResponse(BaseModel):
     id: int
     student_id: int
@@ -439,6 +592,9 @@ class ProbnikCreate(BaseModel):
     is_active: bool = False
     slots_baikalskaya: Optional[Dict[str, int]] = None  # {"9:00": 45, "12:00": 45}
     slots_lermontova: Optional[Dict[str, int]] = None
+    # Аудитории филиалов для рассадки: {"101": 15, "102": 20}
+    rooms_baikalskaya: Optional[Dict[str, int]] = None
+    rooms_lermontova: Optional[Dict[str, int]] = None
     exam_dates: Optional[List[ProbnikDateItem]] = None
     exam_times: Optional[List[str]] = None  # ["9:00", "12:00"]
     # Отдельные дни и время для каждого филиала
@@ -447,12 +603,15 @@ class ProbnikCreate(BaseModel):
     exam_times_baikalskaya: Optional[List[str]] = None
     exam_times_lermontova: Optional[List[str]] = None
     max_registrations: Optional[int] = 4  # Максимальное количество записей на одного ученика
+    lottery_minutes: Optional[int] = None  # Окно лотереи после открытия записи (None — обычная запись)
 
 class ProbnikUpdate(BaseModel):
     name: Optional[str] = None
     is_active: Optional[bool] = None
     slots_baikalskaya: Optional[Dict[str, int]] = None
     slots_lermontova: Optional[Dict[str, int]] = None
+    rooms_baikalskaya: Optional[Dict[str, int]] = None
+    rooms_lermontova: Optional[Dict[str, int]] = None
     exam_dates: Optional[List[ProbnikDateItem]] = None
     exam_times: Optional[List[str]] = None
     # Отдельные дни и время для каждого филиала
@@ -461,6 +620,7 @@ class ProbnikUpdate(BaseModel):
     exam_times_baikalskaya: Optional[List[str]] = None
     exam_times_lermontova: Optional[List[str]] = None
     max_registrations: Optional[int] = None
+    lottery_minutes: Optional[int] = None
 
 class ProbnikResponse(BaseModel):
     id: int
@@ -469,6 +629,8 @@ class ProbnikResponse(BaseModel):
     created_at: Optional[str] = None
     slots_baikalskaya: Optional[Dict[str, int]] = None
     slots_lermontova: Optional[Dict[str, int]] = None
+    rooms_baikalskaya: Optional[Dict[str, int]] = None
+    rooms_lermontova: Optional[Dict[str, int]] = None
     exam_dates: Optional[List[ProbnikDateItem]] = None
     exam_times: Optional[List[str]] = None
     # Отдельные дни и время для каждого филиала
@@ -477,6 +639,204 @@ class ProbnikResponse(BaseModel):
     exam_times_baikalskaya: Optional[List[str]] = None
     exam_times_lermontova: Optional[List[str]] = None
     max_registrations: Optional[int] = 4
+    lottery_minutes: Optional[int] = None
+    lottery_ends_at: Optional[str] = None
+    lottery_drawn_at: Optional[str] = None
     
     class Config:
         from_attributes = True
+
+
+class LotteryDrawResponse(BaseModel):
+    probnik_id: int
+    seed: int
+    requests: int
+    won: int
+    waitlisted: int
+    rejected: int
+
+
+class SeatingAllocateRequest(BaseModel):
+    """Какие слоты рассадить (не заданы — все слоты пробника)"""
+    school: Optional[str] = None
+    exam_date: Optional[str] = None  # YYYY-MM-DD
+    exam_time: Optional[str] = None
+    rebuild: bool = False  # Рассадить заново, не сохраняя текущие места
+
+class SeatingSlotSummary(BaseModel):
+    school: str
+    exam_date: str
+    exam_time: str
+    rooms: int
+    seats: int
+    registrations: int
+    kept: int  # Остались на прежних местах
+    assigned: int  # Получили новое место
+    unassigned: List[int] = []  # Записи, которым не хватило мест
+
+class SeatingAllocateResponse(BaseModel):
+    probnik_id: int
+    slots: List[SeatingSlotSummary]
+
+class SeatingRow(BaseModel):
+    registration_id: int
+    student_fio: str
+    student_class: Optional[int] = None
+    subject: str
+    school: Optional[str] = None
+    exam_date: str
+    exam_time: str
+    room: Optional[str] = None
+    seat: Optional[int] = None
+
+
+class ExportJobRequest(BaseModel):
+    """Фоновая выгрузка: kind — roster, results или parent_calls"""
+    kind: str
+    format: str = "xlsx"  # xlsx или csv
+    probnik_id: Optional[int] = None  # roster
+    school: Optional[str] = None
+    exam_date: Optional[str] = None  # YYYY-MM-DD
+    exam_time: Optional[str] = None
+    group_id: Optional[int] = None  # results (обязательно), parent_calls
+    status: Optional[str] = None  # parent_calls: informed, callback, no_answer или none
+
+class ExportJobResponse(BaseModel):
+    id: str
+    kind: str
+    format: str
+    status: str  # pending, running, done, failed
+    rows: Optional[int] = None
+    size: Optional[int] = None
+    error: Optional[str] = None
+    created_at: str
+    finished_at: Optional[str] = None
+
+
+class RankingExam(BaseModel):
+    exam_name: str
+    subject: str
+    participants: int
+
+class RankingEntry(BaseModel):
+    student_id: int
+    fio: str
+    class_num: Optional[int] = None
+    group_id: int
+    group_name: str
+    school: Optional[str] = None
+    primary_score: int
+    scaled_score: int
+    rank: int  # Место среди всех написавших экзамен (равные баллы делят место)
+    percentile: float
+    position: Optional[int] = None  # Место в отфильтрованной таблице
+
+class LeaderboardResponse(BaseModel):
+    exam_name: str
+    subject: str
+    participants: int
+    matched: int  # Сколько участников прошло фильтр
+    items: List[RankingEntry]
+
+class SchoolRanking(BaseModel):
+    school: Optional[str] = None
+    participants: int
+    average: float
+    median: float
+    average_percentile: float
+    rank: int
+
+class StudentStanding(RankingEntry):
+    exam_type_id: int
+    exam_name: str
+    subject: str
+    participants: int
+    school_rank: int
+    school_participants: int
+
+class SimilarityFlagResponse(BaseModel):
+    id: int
+    exam_name: str
+    subject: str
+    exam_a_id: int
+    exam_b_id: int
+    student_a_id: int
+    student_a_fio: str
+    student_a_group: Optional[str] = None
+    student_b_id: int
+    student_b_fio: str
+    student_b_group: Optional[str] = None
+    matched_tasks: int
+    total_tasks: int
+    shared_wrong: int  # Совпавших неполных результатов
+    score: float  # Сумма весов редкости общих неполных результатов
+    status: str
+    detected_at: Optional[datetime] = None
+    reviewed_at: Optional[datetime] = None
+
+class SimilarityFlagUpdate(BaseModel):
+    status: str
+
+    @field_validator('status')
+    @classmethod
+    def validate_status(cls, v):
+        if v not in ['new', 'confirmed', 'dismissed']:
+            raise ValueError('Статус должен быть: new, confirmed или dismissed')
+        return v
+
+class SimilarityRunResponse(BaseModel):
+    cohorts: int  # Проверено экзаменов (название и предмет)
+    flags: int
+
+
+class StatsCounters(BaseModel):
+    registered: int
+    confirmed: int
+    attended: int
+    submitted: int
+    confirmation_rate: float  # confirmed / registered
+    attendance_rate: float  # attended / registered
+    submission_rate: float  # submitted / attended
+
+class SubjectStats(StatsCounters):
+    subject: str
+
+class SlotStats(StatsCounters):
+    school: Optional[str] = None
+    date: str
+    time: str
+    capacity: int
+    fill_rate: float  # registered / capacity
+    subjects: List[SubjectStats]
+
+class ClassStats(BaseModel):
+    class_num: Optional[int] = None
+    students: int
+    registrations: int
+    subjects: Dict[str, int]  # Предмет -> количество учеников
+
+class TimelinePoint(BaseModel):
+    date: str
+    registrations: int
+    cumulative: int
+
+class StatsTotals(StatsCounters):
+    students: int
+
+class RegistrationStatsResponse(BaseModel):
+    probnik_id: int
+    probnik_name: str
+    totals: StatsTotals
+    slots: List[SlotStats]
+    subjects: List[SubjectStats]
+    by_class: List[ClassStats]
+    timeline: List[TimelinePoint]
+
+
+class ReminderClaimRequest(BaseModel):
+    ids: List[int]
+
+
+class ReminderAckRequest(BaseModel):
+    sent: List[int] = []
+    failed: List[int] = []
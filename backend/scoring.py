@@ -0,0 +1,114 @@
+"""
+Подсчет баллов по ответам экзамена (как utils/calculations.js во фронтенде).
+
+Exam.answer — баллы по заданиям через запятую, "-" — ученик не приступал.
+Первичный балл — сумма баллов с ограничением максимумом задания (SUBJECT_TASKS,
+копия services/constants.js), тестовый — по шкале перевода предмета. Для
+предметов без шкалы тестовый балл равен первичному.
+"""
+from typing import Dict, List, Optional
+
+# Предметы: название и максимальный балл за каждое задание (как во фронтенде)
+SUBJECT_TASKS: Dict[str, Dict] = {
+    'rus': {'name': 'Русский язык', 'maxPerTask': [1, 1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 1, 22]},
+    'math_profile': {'name': 'Математика (профиль)', 'maxPerTask': [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 3, 3, 3, 4, 5]},
+    'math_base': {'name': 'Математика (база)', 'maxPerTask': [1] * 21},
+    'phys': {'name': 'Физика', 'maxPerTask': [1, 1, 1, 1, 2, 2, 1, 1, 2, 2, 1, 1, 1, 2, 2, 1, 2, 2, 1, 1, 3, 2, 2, 3, 3, 4]},
+    'infa': {'name': 'Информатика', 'maxPerTask': [1] * 25 + [2, 2]},
+    'chem': {'name': 'Химия', 'maxPerTask': [1, 1, 1, 1, 1, 2, 2, 2, 1, 1, 1, 1, 1, 2, 2, 1, 1, 1, 1, 1, 1, 2, 2, 2, 1, 1, 1, 1, 2, 2, 4, 5, 3, 4]},
+    'bio': {'name': 'Биология', 'maxPerTask': [1, 2, 1, 1, 1, 2, 2, 2, 1, 2, 2, 2, 1, 2, 2, 2, 2, 2, 2, 2, 2, 3, 3, 3, 3, 3, 3, 3]},
+    'hist': {'name': 'История', 'maxPerTask': [2, 1, 2, 3, 2, 2, 2, 1, 1, 1, 1, 2, 2, 2, 2, 2, 3, 3, 2, 3, 3]},
+    'soc': {'name': 'Обществознание', 'maxPerTask': [1, 2, 1, 2, 2, 2, 2, 2, 1, 2, 2, 1, 2, 2, 2, 2, 2, 2, 3, 3, 3, 4, 3, 4, 6]},
+    'eng': {'name': 'Английский язык', 'maxPerTask': [2, 3, 1, 1, 1, 1, 1, 1, 1, 3, 2] + [1] * 25 + [6, 14, 1, 4, 5, 10]},
+    # ОГЭ
+    'math_9': {'name': 'Математика', 'maxPerTask': [1] * 19 + [2] * 6},
+    'rus_9': {'name': 'Русский язык', 'maxPerTask': [6, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 7, 3, 3, 3, 3, 1]},
+    'infa_9': {'name': 'Информатика', 'maxPerTask': [1] * 12 + [2, 2, 3, 2, 2]},  # 13.1 и 13.2 — альтернативы
+    'soc_9': {'name': 'Обществознание', 'maxPerTask': [2, 1, 1, 1, 3, 2, 1, 1, 1, 1, 1, 4, 1, 1, 2, 1, 1, 1, 1, 1, 2, 2, 3, 2]},
+    'hist_9': {'name': 'История', 'maxPerTask': [6, 1, 1, 1, 1, 1, 1, 1, 1, 6, 4, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 8, 12, 5, 7, 8]},
+    'phys_9': {'name': 'Физика', 'maxPerTask': [2, 2, 1, 2, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 1, 2, 3, 2, 2, 3, 3, 3]},
+    'bio_9': {'name': 'Биология', 'maxPerTask': [1, 1, 1, 2, 2, 1, 2, 1, 2, 2, 2, 1, 3, 1, 1, 2, 2, 2, 2, 1, 2, 2, 2, 3, 3, 3]},
+    'geo_9': {'name': 'География', 'maxPerTask': [1] * 11 + [2] + [1] * 18},
+    'eng_9': {'name': 'Английский язык', 'maxPerTask': [1, 1, 1, 1, 5, 1, 1, 1, 1, 1, 1, 6] + [1] * 22 + [10, 2, 6, 7]},
+    'chem_9': {'name': 'Химия', 'maxPerTask': [1, 1, 1, 2, 1, 1, 1, 1, 2, 2, 1, 2, 1, 1, 1, 1, 2, 1, 1, 3, 3, 3, 5]},
+}
+
+# Шкалы перевода первичного балла в тестовый (индекс — первичный балл)
+SCALES: Dict[str, List[int]] = {
+    'math_profile': [0, 6, 11, 17, 22, 27, 34, 40, 46, 52, 58, 64, 70, 72, 74, 76, 78, 80, 82, 84, 86, 88, 90, 92, 94, 95, 96, 97, 98, 99, 100, 100, 100],
+    'infa': [0, 7, 14, 20, 27, 34, 40, 43, 46, 48, 51, 54, 56, 59, 62, 64, 67, 70, 72, 75, 78, 80, 83, 85, 88, 90, 93, 95, 98, 100],
+    'rus': [0, 3, 5, 8, 10, 12, 14, 17, 20, 22, 24, 27, 29, 32, 34, 36, 37, 39, 40, 42, 43, 45, 46, 48, 49, 51, 52, 54, 55, 57, 58, 60, 61, 63, 64, 66, 67, 69, 70, 70, 73, 75, 78, 81, 83, 86, 89, 91, 94, 97, 100],
+    'soc': [0, 2, 4, 6, 8, 10, 12, 14, 16, 18, 20, 22, 24, 26, 28, 30, 32, 34, 36, 38, 40, 42, 44, 45, 47, 48, 49, 51, 52, 53, 55, 56, 57, 59, 60, 62, 63, 64, 66, 67, 68, 70, 71, 72, 73, 75, 77, 79, 81, 83, 85, 86, 88, 90, 92, 94, 96, 98, 100],
+    'eng': [0, 2, 3, 4, 5, 7, 8, 9, 10, 11, 13, 14, 15, 16, 18, 19, 20, 21, 22, 24, 25, 26, 27, 28, 29, 30, 31, 32, 33, 34, 36, 37, 38, 39, 40, 41, 42, 43, 44, 45, 46, 48, 49, 50, 51, 52, 53, 54, 55, 56, 57, 58, 60, 61, 62, 63, 64, 65, 66, 67, 68, 69, 70, 71, 73, 74, 75, 76, 77, 78, 79, 80, 81, 82, 84, 86, 88, 90, 92, 94, 96, 98, 100],
+    'math_base': [2, 2, 2, 2, 2, 2, 2, 3, 3, 3, 3, 3, 4, 4, 4, 4, 4, 5, 5, 5, 5, 5],
+    'phys': [0, 5, 9, 14, 18, 23, 27, 32, 36, 39, 41, 43, 44, 46, 48, 49, 51, 53, 54, 56, 58, 59, 61, 62, 64, 65, 67, 68, 70, 71, 73, 74, 76, 77, 79, 80, 82, 84, 86, 88, 90, 92, 94, 96, 98, 100],
+    'hist': [0, 4, 8, 12, 16, 20, 24, 28, 32, 34, 36, 38, 40, 42, 44, 45, 47, 49, 51, 53, 55, 57, 58, 60, 62, 64, 66, 68, 70, 72, 74, 76, 78, 80, 82, 84, 87, 89, 91, 93, 95, 97, 100],
+    'bio': [0, 3, 5, 7, 10, 12, 14, 17, 19, 21, 24, 26, 28, 31, 33, 36, 38, 40, 41, 43, 45, 46, 48, 50, 51, 53, 55, 56, 58, 60, 61, 63, 65, 66, 68, 70, 71, 72, 73, 74, 75, 76, 77, 78, 79, 80, 81, 83, 85, 86, 88, 90, 91, 93, 95, 96, 98, 100],
+}
+
+
+def subject_name(subject: Optional[str]) -> str:
+    if subject in SUBJECT_TASKS:
+        return SUBJECT_TASKS[subject]['name']
+    return {'geo': 'География', 'custom': 'Другое'}.get(subject, subject or "")
+
+
+def max_per_task(subject: Optional[str]) -> Optional[List[int]]:
+    config = SUBJECT_TASKS.get(subject)
+    return config['maxPerTask'] if config else None
+
+
+def parse_answer(answer: Optional[str]) -> List[Optional[int]]:
+    """Баллы по заданиям; None — задание не выполнялось ("-")"""
+    if not answer or not answer.strip():
+        return []
+    scores: List[Optional[int]] = []
+    for part in answer.split(','):
+        part = part.strip()
+        if part == '-':
+            scores.append(None)
+            continue
+        try:
+            scores.append(int(part))
+        except ValueError:
+            scores.append(0)
+    return scores
+
+
+def _capped(score: Optional[int], index: int, limits: Optional[List[int]]) -> int:
+    if not score:
+        return 0
+    if limits and index < len(limits):
+        return min(score, limits[index])
+    return score
+
+
+def primary_score(subject: Optional[str], scores: List[Optional[int]]) -> int:
+    """Первичный балл (как calculatePrimaryScore)"""
+    limits = max_per_task(subject)
+    if subject == 'infa_9' and len(scores) > 12:
+        # Задания 13.1 и 13.2 — альтернативы: засчитывается 13.1, если оно решено, иначе 13.2
+        total = sum(_capped(scores[i], i, limits) for i in range(min(12, len(scores))))
+        first = _capped(scores[12], 12, limits)
+        second = _capped(scores[13], 13, limits) if len(scores) > 13 else 0
+        total += first if first > 0 else second
+        total += sum(_capped(scores[i], i, limits) for i in range(14, len(scores)))
+        return total
+    return sum(_capped(score, index, limits) for index, score in enumerate(scores))
+
+
+def scaled_score(subject: Optional[str], primary: int) -> int:
+    """Тестовый балл по шкале предмета (как calculateTotalScore)"""
+    scale = SCALES.get(subject)
+    if scale is None:
+        return primary
+    return scale[primary] if primary < len(scale) else scale[-1]
+
+
+def max_primary(subject: Optional[str]) -> Optional[int]:
+    limits = max_per_task(subject)
+    if limits is None:
+        return None
+    if subject == 'infa_9':
+        return sum(limits) - limits[13]
+    return sum(limits)
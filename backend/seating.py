@@ -0,0 +1,304 @@
+"""
+Рассадка учеников по аудиториям и местам на слот пробника.
+
+Аудитории филиала задаются в пробнике (rooms_baikalskaya / rooms_lermontova:
+название — число мест). Для каждого слота (школа, дата, время):
+
+- по аудиториям — группами по предмету: предметы от крупных к мелким, предмет
+  целиком в аудиторию, где он уже сидит, иначе в самую маленькую подходящую
+  (best fit), а если целиком не помещается нигде — частями в самые свободные;
+- по местам внутри аудитории — соседние места (n и n ± 1) по возможности
+  получают ученики из разных учебных групп: на каждое место берется самая
+  многочисленная из оставшихся групп, не совпадающая с соседями (куча);
+- повторный расчет сохраняет существующие места: рассаживаются только новые
+  записи, места ушедших и перенесенных освобождаются. rebuild=True — заново.
+
+Расчет в памяти за O(n log n) на слот, в БД — удаление освободившихся мест
+и один INSERT (executemany) новых.
+"""
+import csv
+import heapq
+import io
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud
+from models import ExamRegistration, Probnik, SeatAssignment, Student, group_student_association
+
+Person = Tuple[int, str, Hashable]  # (id записи, предмет, ключ учебной группы)
+Seat = Tuple[str, int]  # (аудитория, место)
+
+
+def rooms_for(probnik: Probnik, school: Optional[str]) -> Dict[str, int]:
+    """Аудитории филиала в порядке из настроек пробника"""
+    if school == "Байкальская":
+        rooms = probnik.rooms_baikalskaya
+    elif school == "Лермонтова":
+        rooms = probnik.rooms_lermontova
+    else:
+        rooms = None
+    return {str(name): int(seats) for name, seats in (rooms or {}).items() if seats and int(seats) > 0}
+
+
+def allocate(rooms: Dict[str, int], people: List[Person],
+             existing: Optional[Dict[int, Seat]] = None) -> Tuple[Dict[int, Seat], List[int]]:
+    """
+    Рассадка одного слота. existing — текущие места (сохраняются, если запись
+    еще в слоте и место существует). Возвращает места и id не поместившихся.
+    """
+    by_id = {person[0]: person for person in people}
+    taken: Dict[str, Dict[int, int]] = {room: {} for room in rooms}
+    result: Dict[int, Seat] = {}
+    for registration_id, (room, seat) in sorted((existing or {}).items()):
+        if (registration_id in by_id and room in rooms and 1 <= seat <= rooms[room]
+                and seat not in taken[room]):
+            taken[room][seat] = registration_id
+            result[registration_id] = (room, seat)
+
+    room_subjects = {room: {by_id[r][1] for r in seats.values()} for room, seats in taken.items()}
+    free = {room: rooms[room] - len(taken[room]) for room in rooms}
+
+    by_subject: Dict[str, List[Person]] = defaultdict(list)
+    for person in people:
+        if person[0] not in result:
+            by_subject[person[1]].append(person)
+
+    placed: Dict[str, List[Person]] = defaultdict(list)
+    unassigned: List[int] = []
+    for subject, remaining in sorted(by_subject.items(), key=lambda item: (-len(item[1]), item[0])):
+        while remaining:
+            candidates = [room for room in rooms if free[room] > 0]
+            if not candidates:
+                unassigned.extend(person[0] for person in remaining)
+                break
+            with_subject = [room for room in candidates if subject in room_subjects[room]]
+            fitting = [room for room in candidates if free[room] >= len(remaining)]
+            fitting_with_subject = [room for room in with_subject if room in fitting]
+            if fitting_with_subject:
+                room = min(fitting_with_subject, key=free.get)
+            elif fitting:
+                room = min(fitting, key=free.get)
+            elif with_subject:
+                room = max(with_subject, key=free.get)
+            else:
+                room = max(candidates, key=free.get)
+            count = min(free[room], len(remaining))
+            placed[room].extend(remaining[:count])
+            remaining = remaining[count:]
+            free[room] -= count
+            room_subjects[room].add(subject)
+
+    for room, group in placed.items():
+        _seat_room(rooms[room], taken[room], group, by_id, room, result)
+    return result, unassigned
+
+
+def _seat_room(capacity: int, taken: Dict[int, int], group: List[Person],
+               by_id: Dict[int, Person], room: str, result: Dict[int, Seat]):
+    """Места в аудитории: соседи по возможности из разных учебных групп"""
+    members: Dict[Hashable, List[int]] = defaultdict(list)
+    for registration_id, _, key in group:
+        members[key].append(registration_id)
+    # (-осталось, порядок, ключ): порядок делает кучу детерминированной и не сравнивает ключи
+    heap = [(-len(ids), order, key) for order, (key, ids) in enumerate(members.items())]
+    heapq.heapify(heap)
+    for ids in members.values():
+        ids.reverse()  # pop() с конца — в порядке id
+
+    for seat in range(1, capacity + 1):
+        if not heap:
+            break
+        if seat in taken:
+            continue
+        neighbours = {by_id[taken[n]][2] for n in (seat - 1, seat + 1) if n in taken}
+        skipped = []
+        entry = heapq.heappop(heap)
+        while entry[2] in neighbours and heap:
+            skipped.append(entry)
+            entry = heapq.heappop(heap)
+        if entry[2] in neighbours and skipped:
+            # Все оставшиеся группы совпадают с соседями — берем самую многочисленную
+            skipped.append(entry)
+            entry = skipped.pop(0)
+        for other in skipped:
+            heapq.heappush(heap, other)
+        count, order, key = entry
+        registration_id = members[key].pop()
+        taken[seat] = registration_id
+        result[registration_id] = (room, seat)
+        if count + 1 < 0:
+            heapq.heappush(heap, (count + 1, order, key))
+
+
+async def _group_keys(db: AsyncSession, students: Dict[int, Optional[int]]) -> Dict[int, Hashable]:
+    """Ключ «одноклассников»: первая учебная группа ученика, без группы — класс"""
+    keys: Dict[int, Hashable] = {student_id: ("class", class_num) for student_id, class_num in students.items()}
+    for chunk in crud.chunked(students):
+        result = await db.execute(
+            select(group_student_association.c.student_id, func.min(group_student_association.c.group_id))
+            .where(group_student_association.c.student_id.in_(chunk))
+            .group_by(group_student_association.c.student_id)
+        )
+        for student_id, group_id in result.all():
+            keys[student_id] = ("group", group_id)
+    return keys
+
+
+def slot_filters(model, probnik_id: int, school: Optional[str], exam_date: Optional[datetime], exam_time: Optional[str]):
+    conditions = [model.probnik_id == probnik_id]
+    if school:
+        conditions.append(model.school == school)
+    if exam_date is not None:
+        conditions.append(model.exam_date == exam_date)
+    if exam_time:
+        conditions.append(model.exam_time == exam_time)
+    return and_(*conditions)
+
+
+async def allocate_probnik(db: AsyncSession, probnik: Probnik, school: Optional[str] = None,
+                           exam_date: Optional[datetime] = None, exam_time: Optional[str] = None,
+                           rebuild: bool = False) -> List[Dict]:
+    """Рассаживает слоты пробника (все или отобранные фильтрами) и сохраняет места"""
+    result = await db.execute(
+        select(
+            ExamRegistration.id, ExamRegistration.subject, ExamRegistration.school,
+            ExamRegistration.exam_date, ExamRegistration.exam_time,
+            Student.id, Student.class_num
+        )
+        .join(Student, Student.id == ExamRegistration.student_id)
+        .where(
+            slot_filters(ExamRegistration, probnik.id, school, exam_date, exam_time),
+            ExamRegistration.school.isnot(None)
+        )
+        .order_by(ExamRegistration.id)
+    )
+    rows = result.all()
+    keys = await _group_keys(db, {row[5]: row[6] for row in rows})
+    slots: Dict[Tuple, List[Person]] = defaultdict(list)
+    for registration_id, subject, reg_school, reg_date, reg_time, student_id, _ in rows:
+        slots[(reg_school, reg_date, reg_time)].append((registration_id, subject, keys[student_id]))
+
+    assignments = await db.execute(
+        select(
+            SeatAssignment.id, SeatAssignment.registration_id, SeatAssignment.school,
+            SeatAssignment.exam_date, SeatAssignment.exam_time, SeatAssignment.room, SeatAssignment.seat
+        ).where(slot_filters(SeatAssignment, probnik.id, school, exam_date, exam_time))
+    )
+    existing: Dict[Tuple, Dict[int, Seat]] = defaultdict(dict)
+    assignment_ids: Dict[Tuple, int] = {}
+    for assignment_id, registration_id, a_school, a_date, a_time, room, seat in assignments.all():
+        existing[(a_school, a_date, a_time)][registration_id] = (room, seat)
+        assignment_ids[(registration_id, a_school, a_date, a_time, room, seat)] = assignment_id
+
+    kept_ids = set()
+    new_rows = []
+    summary = []
+    for slot in sorted(slots, key=lambda s: (s[1], s[2], s[0])):
+        slot_school, slot_date, slot_time = slot
+        rooms = rooms_for(probnik, slot_school)
+        seats, unassigned = allocate(rooms, slots[slot], None if rebuild else existing.get(slot))
+        kept = 0
+        for registration_id, (room, seat) in seats.items():
+            assignment_id = assignment_ids.get((registration_id, slot_school, slot_date, slot_time, room, seat))
+            if assignment_id is not None and not rebuild:
+                kept_ids.add(assignment_id)
+                kept += 1
+                continue
+            new_rows.append({
+                "registration_id": registration_id,
+                "probnik_id": probnik.id,
+                "school": slot_school,
+                "exam_date": slot_date,
+                "exam_time": slot_time,
+                "room": room,
+                "seat": seat,
+                "created_at": datetime.utcnow(),
+            })
+        summary.append({
+            "school": slot_school,
+            "exam_date": slot_date.strftime("%Y-%m-%d"),
+            "exam_time": slot_time,
+            "rooms": len(rooms),
+            "seats": sum(rooms.values()),
+            "registrations": len(slots[slot]),
+            "kept": kept,
+            "assigned": len(seats) - kept,
+            "unassigned": sorted(unassigned),
+        })
+
+    # Сначала освобождаем места (ушедшие, перенесенные, пересаженные), потом вставляем новые
+    released = [assignment_id for assignment_id in assignment_ids.values() if assignment_id not in kept_ids]
+    for chunk in crud.chunked(released):
+        await db.execute(delete(SeatAssignment).where(SeatAssignment.id.in_(chunk)))
+    # Место в слоте вне фильтров (запись перенесли оттуда) тоже освобождаем
+    for chunk in crud.chunked(row["registration_id"] for row in new_rows):
+        await db.execute(delete(SeatAssignment).where(SeatAssignment.registration_id.in_(chunk)))
+    if new_rows:
+        await db.execute(insert(SeatAssignment), new_rows)
+    await db.commit()
+    return summary
+
+
+async def seating_rows(db: AsyncSession, probnik: Probnik, school: Optional[str] = None,
+                       exam_date: Optional[datetime] = None, exam_time: Optional[str] = None) -> List[Dict]:
+    """Записи слотов с местами (без места — room и seat равны None), по аудиториям и местам"""
+    result = await db.execute(
+        select(
+            ExamRegistration.id, Student.fio, Student.class_num, ExamRegistration.subject,
+            ExamRegistration.school, ExamRegistration.exam_date, ExamRegistration.exam_time,
+            SeatAssignment.room, SeatAssignment.seat
+        )
+        .join(Student, Student.id == ExamRegistration.student_id)
+        .outerjoin(SeatAssignment, and_(
+            SeatAssignment.registration_id == ExamRegistration.id,
+            # Место от старого слота (запись перенесли) не показываем
+            SeatAssignment.school == ExamRegistration.school,
+            SeatAssignment.exam_date == ExamRegistration.exam_date,
+            SeatAssignment.exam_time == ExamRegistration.exam_time
+        ))
+        .where(slot_filters(ExamRegistration, probnik.id, school, exam_date, exam_time))
+    )
+    room_order = {
+        reg_school: {room: index for index, room in enumerate(rooms_for(probnik, reg_school))}
+        for reg_school in ("Байкальская", "Лермонтова")
+    }
+    rows = [
+        {
+            "registration_id": registration_id,
+            "student_fio": fio,
+            "student_class": class_num,
+            "subject": subject,
+            "school": reg_school,
+            "exam_date": reg_date.strftime("%Y-%m-%d"),
+            "exam_time": reg_time,
+            "room": room,
+            "seat": seat,
+        }
+        for registration_id, fio, class_num, subject, reg_school, reg_date, reg_time, room, seat in result.all()
+    ]
+    rows.sort(key=lambda row: (
+        row["exam_date"], row["exam_time"], row["school"] or "",
+        row["room"] is None,
+        room_order.get(row["school"], {}).get(row["room"], len(room_order.get(row["school"], {}))),
+        row["room"] or "", row["seat"] or 0, row["student_fio"]
+    ))
+    return rows
+
+
+def to_csv(rows: List[Dict]) -> str:
+    """CSV для печати списков по аудиториям (разделитель «;» и BOM — для Excel)"""
+    buffer = io.StringIO()
+    buffer.write("\ufeff")
+    writer = csv.writer(buffer, delimiter=";")
+    writer.writerow(["Дата", "Время", "Школа", "Аудитория", "Место", "ФИО", "Класс", "Предмет"])
+    for row in rows:
+        writer.writerow([
+            row["exam_date"], row["exam_time"], row["school"] or "",
+            row["room"] or "без места", row["seat"] or "",
+            row["student_fio"], row["student_class"] or "", row["subject"]
+        ])
+    return buffer.getvalue()
@@ -0,0 +1,273 @@
+"""
+Поиск подозрительно похожих работ (возможное списывание).
+
+Exam.answer хранит баллы по заданиям, а не сами ответы, поэтому «одинаковый
+неверный ответ» здесь — одинаковый неполный результат задания: тот же
+частичный балл, ноль или пропуск. Совпадение полных баллов уликой не считается.
+Вес общего неполного результата — его редкость среди всех работ: -ln(доля
+работ с таким же результатом задания). Общий ноль на задании, которое решили
+почти все, весит много, общий ноль на задании, которое не решил никто, — почти ничего.
+
+Работы сравниваются внутри когорты — все экзамены с одним названием и
+предметом во всех группах (на пробнике ученики разных групп пишут в одних
+аудиториях). Когорта кодируется матрицей one-hot (работа × пара
+«задание, результат»), и для блока строк одним умножением матриц считаются
+число совпавших заданий, суммарный вес общих неполных результатов и их число
+со всеми остальными работами. В больших когортах (от LSH_MIN_SHEETS работ)
+пары-кандидаты сначала отбираются MinHash/LSH по множествам неполных
+результатов, и точные показатели считаются только для них.
+
+Расчет (analyze) выполняется в пуле процессов workers.py. Пара помечается,
+если совпало не меньше MIN_MATCH заданий и вес общих неполных результатов не
+меньше MIN_EVIDENCE. Отметки хранятся в similarity_flag. Повторный анализ
+обновляет показатели, не трогает статус уже просмотренных отметок и удаляет
+непросмотренные, которые больше не проходят порог.
+"""
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import delete, distinct, select, update
+from sqlalchemy.orm import aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import scoring
+import workers
+from models import Exam, ExamType, SimilarityFlag, Student, StudyGroup
+
+BLOCK_SIZE = int(os.getenv("SIMILARITY_BLOCK_SIZE", "512"))
+LSH_MIN_SHEETS = int(os.getenv("SIMILARITY_LSH_MIN_SHEETS", "3000"))
+MIN_MATCH = float(os.getenv("SIMILARITY_MIN_MATCH", "0.85"))  # Доля совпавших заданий
+MIN_EVIDENCE = float(os.getenv("SIMILARITY_MIN_EVIDENCE", "12"))
+MIN_SHARED_WRONG = 3
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16  # По 4 значения подписи в полосе
+LSH_MAX_BUCKET = 200  # Большие корзины — массовые одинаковые результаты, не списывание
+_PRIME = 2_147_483_647
+
+# ==================== РАСЧЕТ (в пуле процессов) ====================
+
+def encode(answers: List[Optional[str]], limits: Optional[List[int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+    """
+    Кодирование работ: матрица one-hot (работа × «задание, результат»), вес
+    каждого столбца (редкость неполного результата, у полного — 0), признак
+    неполного результата и число заданий. Пропуск ("-") кодируется как -1.
+    """
+    parsed = [scoring.parse_answer(answer) for answer in answers]
+    tasks = len(limits) if limits else max((len(scores) for scores in parsed), default=0)
+    values = np.full((len(parsed), tasks), -1, dtype=np.int16)
+    for row, scores in enumerate(parsed):
+        for task, score in enumerate(scores[:tasks]):
+            if score is not None:
+                values[row, task] = score
+
+    codes = np.empty(values.shape, dtype=np.int64)
+    weights, wrong = [np.zeros(0)], [np.zeros(0, dtype=bool)]
+    offset = 0
+    for task in range(tasks):
+        uniques, inverse, counts = np.unique(values[:, task], return_inverse=True, return_counts=True)
+        codes[:, task] = inverse.reshape(-1) + offset
+        offset += len(uniques)
+        weights.append(-np.log(counts / len(parsed)))
+        wrong.append(uniques < (limits[task] if limits else uniques.max()))
+    onehot = np.zeros((len(parsed), offset), dtype=np.float32)
+    onehot[np.arange(len(parsed))[:, None], codes] = 1.0
+    wrong_mask = np.concatenate(wrong).astype(np.float32)
+    return onehot, np.concatenate(weights).astype(np.float32) * wrong_mask, wrong_mask, tasks
+
+
+def _passes(matched: np.ndarray, evidence: np.ndarray, shared: np.ndarray, tasks: int) -> np.ndarray:
+    return (matched >= MIN_MATCH * tasks) & (evidence >= MIN_EVIDENCE) & (shared >= MIN_SHARED_WRONG)
+
+
+def _blocked_pairs(onehot: np.ndarray, evidence_weight: np.ndarray, wrong_mask: np.ndarray,
+                   owners: np.ndarray, tasks: int) -> List[Tuple[int, int, int, float, int]]:
+    """Все пары блоками строк: три умножения матриц на блок"""
+    total = onehot.shape[0]
+    weighted = onehot * evidence_weight
+    wrong = onehot * wrong_mask
+    transposed = onehot.T
+    result = []
+    for start in range(0, total, BLOCK_SIZE):
+        end = min(start + BLOCK_SIZE, total)
+        matched = onehot[start:end] @ transposed
+        evidence = weighted[start:end] @ transposed
+        shared = wrong[start:end] @ transposed
+        mask = _passes(matched, evidence, shared, tasks)
+        # Только пары i < j и работы разных учеников
+        mask &= np.arange(total)[None, :] > np.arange(start, end)[:, None]
+        mask &= owners[start:end, None] != owners[None, :]
+        for i, j in zip(*np.nonzero(mask)):
+            result.append((start + int(i), int(j), int(matched[i, j]), float(evidence[i, j]), int(shared[i, j])))
+    return result
+
+
+def _minhash(wrong: np.ndarray) -> np.ndarray:
+    """MinHash-подписи множеств неполных результатов (работа × перестановка)"""
+    rng = np.random.default_rng(20261019)
+    a = rng.integers(1, _PRIME, size=MINHASH_PERMUTATIONS, dtype=np.int64)
+    b = rng.integers(0, _PRIME, size=MINHASH_PERMUTATIONS, dtype=np.int64)
+    tokens = np.arange(wrong.shape[1], dtype=np.int64)
+    hashes = (a[:, None] * tokens[None, :] + b[:, None]) % _PRIME  # перестановка × столбец
+    signatures = np.empty((wrong.shape[0], MINHASH_PERMUTATIONS), dtype=np.int64)
+    for start in range(0, wrong.shape[0], BLOCK_SIZE):
+        block = wrong[start:start + BLOCK_SIZE] > 0
+        signatures[start:start + BLOCK_SIZE] = np.where(block[:, None, :], hashes[None, :, :], _PRIME).min(axis=2)
+    return signatures
+
+
+def _lsh_pairs(onehot: np.ndarray, evidence_weight: np.ndarray, wrong_mask: np.ndarray,
+               owners: np.ndarray, tasks: int) -> List[Tuple[int, int, int, float, int]]:
+    """Кандидаты по полосам MinHash, точные показатели — только для них"""
+    wrong = onehot * wrong_mask
+    eligible = np.nonzero(wrong.sum(axis=1) >= MIN_SHARED_WRONG)[0]
+    if len(eligible) < 2:
+        return []
+    signatures = _minhash(wrong[eligible])
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    candidates = set()
+    for band in range(LSH_BANDS):
+        keys = signatures[:, band * rows:(band + 1) * rows]
+        _, bucket_of, sizes = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+        bucket_of = bucket_of.reshape(-1)
+        for bucket in np.nonzero((sizes > 1) & (sizes <= LSH_MAX_BUCKET))[0]:
+            members = eligible[bucket_of == bucket]
+            for position, first in enumerate(members):
+                for second in members[position + 1:]:
+                    candidates.add((int(first), int(second)))
+    if not candidates:
+        return []
+
+    pairs = np.array(sorted(candidates), dtype=np.int64)
+    weighted = onehot * evidence_weight
+    result = []
+    for start in range(0, len(pairs), BLOCK_SIZE * 8):
+        left, right = pairs[start:start + BLOCK_SIZE * 8].T
+        matched = (onehot[left] * onehot[right]).sum(axis=1)
+        evidence = (weighted[left] * onehot[right]).sum(axis=1)
+        shared = (wrong[left] * onehot[right]).sum(axis=1)
+        mask = _passes(matched, evidence, shared, tasks) & (owners[left] != owners[right])
+        for index in np.nonzero(mask)[0]:
+            result.append((int(left[index]), int(right[index]), int(matched[index]), float(evidence[index]), int(shared[index])))
+    return result
+
+
+def analyze(subject: str, exam_ids: List[int], student_ids: List[int], answers: List[Optional[str]]) -> List[Dict]:
+    """Подозрительные пары работ когорты (выполняется в пуле процессов)"""
+    if len(answers) < 2:
+        return []
+    onehot, evidence_weight, wrong_mask, tasks = encode(answers, scoring.max_per_task(subject))
+    if not tasks:
+        return []
+    owners = np.asarray(student_ids)
+    find = _lsh_pairs if len(answers) >= LSH_MIN_SHEETS else _blocked_pairs
+    flags = []
+    for i, j, matched, evidence, shared in find(onehot, evidence_weight, wrong_mask, owners, tasks):
+        first, second = sorted((i, j), key=lambda index: exam_ids[index])
+        flags.append({
+            "exam_a_id": exam_ids[first], "exam_b_id": exam_ids[second],
+            "student_a_id": student_ids[first], "student_b_id": student_ids[second],
+            "matched_tasks": matched, "total_tasks": tasks,
+            "shared_wrong": shared, "score": round(evidence, 2),
+        })
+    return flags
+
+
+# ==================== КОГОРТЫ И ОТМЕТКИ ====================
+
+async def cohorts(db: AsyncSession) -> List[Tuple[str, str]]:
+    result = await db.execute(
+        select(distinct(ExamType.name), Exam.subject)
+        .join(Exam, Exam.exam_type_id == ExamType.id)
+        .order_by(ExamType.name, Exam.subject)
+    )
+    return [(name, subject) for name, subject in result.all()]
+
+
+async def run(db: AsyncSession, exam_name: str, subject: str) -> int:
+    """Анализ одной когорты и обновление отметок. Возвращает число отметок когорты."""
+    result = await db.execute(
+        select(Exam.id, Exam.id_student, Exam.answer)
+        .join(ExamType, ExamType.id == Exam.exam_type_id)
+        .where(ExamType.name == exam_name, Exam.subject == subject, Exam.answer.isnot(None))
+        .order_by(Exam.id)
+    )
+    rows = result.all()
+    flags = await workers.run(
+        analyze, subject, [row.id for row in rows], [row.id_student for row in rows], [row.answer for row in rows]
+    )
+
+    existing_result = await db.execute(
+        select(SimilarityFlag.id, SimilarityFlag.exam_a_id, SimilarityFlag.exam_b_id, SimilarityFlag.status)
+        .where(SimilarityFlag.exam_name == exam_name, SimilarityFlag.subject == subject)
+    )
+    existing = {(row.exam_a_id, row.exam_b_id): row for row in existing_result.all()}
+    now = datetime.utcnow()
+    found = set()
+    for flag in flags:
+        key = (flag["exam_a_id"], flag["exam_b_id"])
+        found.add(key)
+        metrics = {name: flag[name] for name in ("matched_tasks", "total_tasks", "shared_wrong", "score")}
+        if key in existing:
+            await db.execute(
+                update(SimilarityFlag).where(SimilarityFlag.id == existing[key].id).values(detected_at=now, **metrics)
+            )
+        else:
+            db.add(SimilarityFlag(exam_name=exam_name, subject=subject, status="new", detected_at=now, **flag))
+    stale = [row.id for key, row in existing.items() if key not in found and row.status == "new"]
+    if stale:
+        await db.execute(delete(SimilarityFlag).where(SimilarityFlag.id.in_(stale)))
+    await db.commit()
+    return len(found)
+
+
+async def run_all(db: AsyncSession) -> Dict[str, int]:
+    checked = 0
+    flagged = 0
+    for exam_name, subject in await cohorts(db):
+        flagged += await run(db, exam_name, subject)
+        checked += 1
+    return {"cohorts": checked, "flags": flagged}
+
+
+async def flags(
+    db: AsyncSession,
+    exam_name: Optional[str] = None,
+    subject: Optional[str] = None,
+    status: Optional[str] = None,
+    limit: int = 200
+) -> List[Dict]:
+    """Отметки для проверки с ФИО и группами учеников, самые весомые первыми"""
+    student_a, student_b = aliased(Student), aliased(Student)
+    exam_a, exam_b = aliased(Exam), aliased(Exam)
+    type_a, type_b = aliased(ExamType), aliased(ExamType)
+    group_a, group_b = aliased(StudyGroup), aliased(StudyGroup)
+    query = (
+        select(
+            SimilarityFlag,
+            student_a.fio.label("student_a_fio"), group_a.name.label("student_a_group"),
+            student_b.fio.label("student_b_fio"), group_b.name.label("student_b_group")
+        )
+        .join(student_a, student_a.id == SimilarityFlag.student_a_id)
+        .join(student_b, student_b.id == SimilarityFlag.student_b_id)
+        .join(exam_a, exam_a.id == SimilarityFlag.exam_a_id)
+        .join(exam_b, exam_b.id == SimilarityFlag.exam_b_id)
+        .join(type_a, type_a.id == exam_a.exam_type_id)
+        .join(type_b, type_b.id == exam_b.exam_type_id)
+        .outerjoin(group_a, group_a.id == type_a.group_id)
+        .outerjoin(group_b, group_b.id == type_b.group_id)
+    )
+    if exam_name is not None:
+        query = query.where(SimilarityFlag.exam_name == exam_name)
+    if subject is not None:
+        query = query.where(SimilarityFlag.subject == subject)
+    if status is not None:
+        query = query.where(SimilarityFlag.status == status)
+    result = await db.execute(query.order_by(SimilarityFlag.score.desc(), SimilarityFlag.id).limit(limit))
+    items = []
+    for flag, fio_a, group_name_a, fio_b, group_name_b in result.all():
+        item = {column.name: getattr(flag, column.name) for column in SimilarityFlag.__table__.columns}
+        item.update(student_a_fio=fio_a, student_a_group=group_name_a, student_b_fio=fio_b, student_b_group=group_name_b)
+        items.append(item)
+    return items
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+from database import get_db
+from auth import get_current_user
+from route_helpers import require_admin
+from models import SimilarityFlag
+import schemas
+import similarity
+
+router = APIRouter(prefix="/similarity", tags=["similarity"])
+
+
+@router.post("/run", response_model=schemas.SimilarityRunResponse)
+async def run_similarity(
+    exam_name: Optional[str] = Query(None),
+    subject: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Поиск похожих работ: по одному экзамену (exam_name и subject) или по всем"""
+    require_admin(user)
+    if exam_name is None and subject is None:
+        return await similarity.run_all(db)
+    if exam_name is None or subject is None:
+        raise HTTPException(status_code=400, detail="Укажите и exam_name, и subject")
+    return {"cohorts": 1, "flags": await similarity.run(db, exam_name, subject)}
+
+
+@router.get("/flags", response_model=List[schemas.SimilarityFlagResponse])
+async def similarity_flags(
+    exam_name: Optional[str] = Query(None),
+    subject: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    limit: int = Query(200, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Найденные пары похожих работ, самые весомые первыми"""
+    require_admin(user)
+    return await similarity.flags(db, exam_name=exam_name, subject=subject, status=status, limit=limit)
+
+
+@router.put("/flags/{flag_id}")
+async def review_similarity_flag(
+    flag_id: int,
+    review: schemas.SimilarityFlagUpdate,
+    db: AsyncSession = Depends(get_db),
+    user: dict = Depends(get_current_user)
+):
+    """Результат проверки пары: confirmed — списывание, dismissed — случайное совпадение"""
+    require_admin(user)
+    flag = await db.get(SimilarityFlag, flag_id)
+    if not flag:
+        raise HTTPException(status_code=404, detail="Отметка не найдена")
+    flag.status = review.status
+    flag.reviewed_at = None if review.status == "new" else datetime.utcnow()
+    await db.commit()
+    return {"message": "Статус обновлен"}
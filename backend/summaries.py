@@ -0,0 +1,209 @@
+"""
+Сводка результатов (exam_summary) для экранов результатов.
+
+Строка на (ученик, тип экзамена): первичный и тестовый балл (scoring.py) по
+последнему экзамену пары, процентиль среди написавших этот экзамен в группе и
+изменение первичного балла к предыдущему экзамену группы. Экраны читают одну
+готовую строку вместо пересчета по сырым ответам.
+
+Сводка обновляется в той же транзакции, что и экзамены: crud.create_exam /
+update_exam / delete_exam вызывают refresh для затронутых пар, массовые
+удаления — discard до DELETE. Пересчитывается только строка пары, процентили ее
+типа экзамена (одна выборка баллов, бинарный поиск по отсортированному списку)
+и изменения ученика по экзаменам той же группы. Задача планировщика
+периодически пересобирает таблицу целиком (rebuild), как сводку записей в rollups.py.
+"""
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import scoring
+from models import Exam, ExamSummary, ExamType, Student
+
+_table = ExamSummary.__table__
+
+
+def percentile_rank(ordered: List[int], score: int) -> float:
+    """Процентильный ранг балла в отсортированном списке: доля баллов ниже плюс половина равных, 0–100"""
+    if not ordered:
+        return 0.0
+    below = bisect_left(ordered, score)
+    equal = bisect_right(ordered, score) - below
+    return round((below + equal / 2) / len(ordered) * 100, 1)
+
+
+def percentiles(scores: List[int]) -> List[float]:
+    """Процентильный ранг каждого балла среди scores"""
+    ordered = sorted(scores)
+    return [percentile_rank(ordered, score) for score in scores]
+
+
+def deltas(scores: List[int]) -> List[Optional[int]]:
+    """Изменение к предыдущему баллу; у первого — None"""
+    return [None] + [current - previous for previous, current in zip(scores, scores[1:])]
+
+
+def _scores(subject: str, answer: Optional[str]) -> Tuple[int, int]:
+    primary = scoring.primary_score(subject, scoring.parse_answer(answer))
+    return primary, scoring.scaled_score(subject, primary)
+
+
+async def _set_changed(db: AsyncSession, column: str, changed: List[Dict]):
+    if changed:
+        await db.execute(
+            update(_table).where(_table.c.id == bindparam("b_id")).values({column: bindparam("b_value")}),
+            changed
+        )
+
+
+async def _rerank(db: AsyncSession, exam_type_ids: Set[int]):
+    """Процентили по типам экзаменов"""
+    if not exam_type_ids:
+        return
+    result = await db.execute(
+        select(ExamSummary.id, ExamSummary.exam_type_id, ExamSummary.primary_score, ExamSummary.percentile)
+        .where(ExamSummary.exam_type_id.in_(exam_type_ids))
+    )
+    by_type = defaultdict(list)
+    for row in result.all():
+        by_type[row.exam_type_id].append(row)
+    changed = []
+    for rows in by_type.values():
+        for row, value in zip(rows, percentiles([row.primary_score for row in rows])):
+            if row.percentile != value:
+                changed.append({"b_id": row.id, "b_value": value})
+    await _set_changed(db, "percentile", changed)
+
+
+async def _redelta(db: AsyncSession, pairs: Set[Tuple[int, int]]):
+    """Изменения баллов для пар (ученик, группа): экзамены группы по порядку создания типов"""
+    if not pairs:
+        return
+    result = await db.execute(
+        select(ExamSummary.id, ExamSummary.student_id, ExamType.group_id, ExamSummary.primary_score, ExamSummary.delta)
+        .join(ExamType, ExamType.id == ExamSummary.exam_type_id)
+        .where(
+            ExamSummary.student_id.in_({student_id for student_id, _ in pairs}),
+            ExamType.group_id.in_({group_id for _, group_id in pairs})
+        )
+        .order_by(ExamSummary.exam_type_id)
+    )
+    sequences = defaultdict(list)
+    for row in result.all():
+        if (row.student_id, row.group_id) in pairs:
+            sequences[(row.student_id, row.group_id)].append(row)
+    changed = []
+    for rows in sequences.values():
+        for row, value in zip(rows, deltas([row.primary_score for row in rows])):
+            if row.delta != value:
+                changed.append({"b_id": row.id, "b_value": value})
+    await _set_changed(db, "delta", changed)
+
+
+async def refresh(db: AsyncSession, pairs: Iterable[Tuple[int, int]]):
+    """
+    Пересчет сводки после изменения экзаменов пар (ученик, тип экзамена).
+    Вызывается до commit — сводка сохраняется вместе с экзаменом.
+    """
+    pairs = set(pairs)
+    groups_result = await db.execute(
+        select(ExamType.id, ExamType.group_id).where(ExamType.id.in_({exam_type_id for _, exam_type_id in pairs}))
+    )
+    groups = dict(groups_result.all())
+    now = datetime.utcnow()
+    for student_id, exam_type_id in pairs:
+        pair_condition = (_table.c.student_id == student_id) & (_table.c.exam_type_id == exam_type_id)
+        exam_result = await db.execute(
+            select(Exam.id, Exam.subject, Exam.answer)
+            .where(Exam.id_student == student_id, Exam.exam_type_id == exam_type_id)
+            .order_by(Exam.id.desc())
+            .limit(1)
+        )
+        exam = exam_result.first()
+        if exam is None or exam_type_id not in groups:
+            await db.execute(delete(_table).where(pair_condition))
+            continue
+        primary, scaled = _scores(exam.subject, exam.answer)
+        values = {"exam_id": exam.id, "primary_score": primary, "scaled_score": scaled, "updated_at": now}
+        result = await db.execute(update(_table).where(pair_condition).values(**values))
+        if result.rowcount == 0:
+            await db.execute(
+                insert(_table).values(student_id=student_id, exam_type_id=exam_type_id, percentile=0.0, **values)
+            )
+
+    await _rerank(db, set(groups))
+    await _redelta(db, {(student_id, groups[exam_type_id]) for student_id, exam_type_id in pairs if exam_type_id in groups})
+
+
+async def discard(db: AsyncSession, condition):
+    """
+    Удаляет строки сводки под условием (перед массовым удалением учеников или
+    типов экзаменов) и пересчитывает процентили и изменения оставшихся.
+    """
+    result = await db.execute(
+        select(ExamSummary.student_id, ExamSummary.exam_type_id, ExamType.group_id)
+        .join(ExamType, ExamType.id == ExamSummary.exam_type_id)
+        .where(condition)
+    )
+    rows = result.all()
+    if not rows:
+        return
+    await db.execute(delete(ExamSummary).where(condition))
+    await _rerank(db, {row.exam_type_id for row in rows})
+    await _redelta(db, {(row.student_id, row.group_id) for row in rows})
+
+
+async def rebuild(db: AsyncSession):
+    """Пересобирает сводку целиком из таблицы exam"""
+    result = await db.execute(
+        select(Exam.id, Exam.id_student, Exam.exam_type_id, Exam.subject, Exam.answer, ExamType.group_id)
+        .join(ExamType, ExamType.id == Exam.exam_type_id)
+        .order_by(Exam.id)
+    )
+    # Последний экзамен пары перезаписывает предыдущие
+    latest = {(row.id_student, row.exam_type_id): row for row in result.all()}
+
+    rows = []
+    by_type = defaultdict(list)
+    by_student_group = defaultdict(list)
+    now = datetime.utcnow()
+    for (student_id, exam_type_id), exam in sorted(latest.items(), key=lambda item: item[0][1]):
+        primary, scaled = _scores(exam.subject, exam.answer)
+        row = {
+            "student_id": student_id, "exam_type_id": exam_type_id, "exam_id": exam.id,
+            "primary_score": primary, "scaled_score": scaled, "percentile": 0.0, "delta": None, "updated_at": now,
+        }
+        rows.append(row)
+        by_type[exam_type_id].append(row)
+        by_student_group[(student_id, exam.group_id)].append(row)
+    for group_rows in by_type.values():
+        for row, value in zip(group_rows, percentiles([row["primary_score"] for row in group_rows])):
+            row["percentile"] = value
+    for sequence in by_student_group.values():
+        for row, value in zip(sequence, deltas([row["primary_score"] for row in sequence])):
+            row["delta"] = value
+
+    await db.execute(delete(ExamSummary))
+    if rows:
+        await db.execute(insert(_table), rows)
+    await db.commit()
+
+
+async def load_group(db: AsyncSession, group_id: int) -> List:
+    """Строки сводки группы с ФИО и названием экзамена — одним запросом"""
+    result = await db.execute(
+        select(
+            ExamSummary.student_id, Student.fio, ExamSummary.exam_type_id, ExamType.name.label("exam_name"),
+            ExamSummary.exam_id, ExamSummary.primary_score, ExamSummary.scaled_score,
+            ExamSummary.percentile, ExamSummary.delta
+        )
+        .join(ExamType, ExamType.id == ExamSummary.exam_type_id)
+        .join(Student, Student.id == ExamSummary.student_id)
+        .where(ExamType.group_id == group_id)
+        .order_by(ExamSummary.exam_type_id, Student.fio, ExamSummary.student_id)
+    )
+    return result.all()
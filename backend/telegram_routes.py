@@ -1,14 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 from sqlalchemy import func
-from typing import List
+from typing import List, Optional
 from datetime import datetime, timedelta
 import re
 
 from database import get_db
-from models import Student, StudyGroup, ExamRegistration, group_student_association, Probnik
+import admission
+import events
+import lottery
+import reminders
+import waitlist
+from models import Student, StudyGroup, ExamRegistration, group_student_association, Probnik, WaitlistEntry, LotteryRequest
 import schemas
 
 router = APIRouter(prefix="/telegram", tags=["telegram"])
@@ -274,7 +279,9 @@ async def get_active_probnik(db: AsyncSession = Depends(get_db)):
         "exam_dates_lermontova": probnik.exam_dates_lermontova,
         "exam_times_baikalskaya": probnik.exam_times_baikalskaya,
         "exam_times_lermontova": probnik.exam_times_lermontova,
-        "max_registrations": probnik.max_registrations if probnik.max_registrations is not None else 4
+        "max_registrations": probnik.max_registrations if probnik.max_registrations is not None else 4,
+        "lottery_ends_at": probnik.lottery_ends_at.isoformat() if probnik.lottery_ends_at else None,
+        "lottery_drawn_at": probnik.lottery_drawn_at.isoformat() if probnik.lottery_drawn_at else None
     }
 
 
@@ -293,7 +300,11 @@ async def get_users_with_telegram(db: AsyncSession = Depends(get_db)):
         "users": [{"user_id": s.user_id, "fio": s.fio} for s in students]
     }
 
-@router.post("/register-exam", response_model=schemas.ExamRegistrationResponse)
+@router.post(
+    "/register-exam",
+    response_model=schemas.ExamRegistrationResponse,
+    dependencies=[Depends(admission.admit_registration)]
+)
 async def register_exam(
     registration: schemas.ExamRegistrationCreate,
     db: AsyncSession = Depends(get_db)
@@ -312,6 +323,10 @@ async def register_exam(
     probnik_result = await db.execute(select(Probnik).where(Probnik.is_active == True))
     active_probnik = probnik_result.scalar_one_or_none()
     
+    # В режиме лотереи места распределяет розыгрыш
+    if active_probnik and lottery.is_pending(active_probnik):
+        raise HTTPException(status_code=409, detail="Идет прием заявок в лотерею — подайте заявку вместо записи")
+    
     # Получаем максимальное количество записей из активного пробника
     max_registrations = 4  # Значение по умолчанию
     if active_probnik:
@@ -335,11 +350,13 @@ async def register_exam(
         exam_date_obj = datetime.strptime(registration.exam_date, "%Y-%m-%d").date()
     except ValueError:
         raise HTTPException(status_code=400, detail="Некорректный формат даты. Используйте YYYY-MM-DD")
+    # exam_date хранится как DateTime (полночь) — сравниваем с ним, а не с date
+    exam_datetime = datetime.combine(exam_date_obj, datetime.min.time())
     
     # Проверяем количество записей на этот день и время для активного пробника
     if active_probnik:
         count_query = select(ExamRegistration).where(
-            ExamRegistration.exam_date == exam_date_obj,
+            ExamRegistration.exam_date == exam_datetime,
             ExamRegistration.exam_time == registration.exam_time,
             ExamRegistration.probnik_id == active_probnik.id
         )
@@ -365,7 +382,7 @@ async def register_exam(
             select(ExamRegistration).where(
                 ExamRegistration.student_id == registration.student_id,
                 ExamRegistration.subject == registration.subject,
-                ExamRegistration.exam_date == exam_date_obj,
+                ExamRegistration.exam_date == exam_datetime,
                 ExamRegistration.exam_time == registration.exam_time,
                 ExamRegistration.probnik_id == active_probnik.id
             )
@@ -374,7 +391,6 @@ async def register_exam(
             raise HTTPException(status_code=400, detail="Вы уже записаны на этот экзамен")
     
     # Создаем запись (exam_date хранится как DateTime, но используем только дату)
-    exam_datetime = datetime.combine(exam_date_obj, datetime.min.time())
     db_registration = ExamRegistration(
         student_id=registration.student_id,
         subject=registration.subject,
@@ -384,8 +400,17 @@ async def register_exam(
         probnik_id=active_probnik.id if active_probnik else None
     )
     db.add(db_registration)
+    if active_probnik:
+        # Записался сам — из листа ожидания на это время больше не нужен
+        await waitlist.remove_student_entries(
+            db, registration.student_id, active_probnik.id, registration.subject, exam_datetime, registration.exam_time
+        )
     await db.commit()
     await db.refresh(db_registration)
+    scheduled = await reminders.schedule_registration(db, db_registration)
+    events.publish_registration_changed(
+        db_registration, "created", reminders=reminders.reminders_payload(scheduled)
+    )
     
     return schemas.ExamRegistrationResponse(
         id=db_registration.id,
@@ -562,6 +587,9 @@ async def confirm_participation(
     registration.confirmed = True
     registration.confirmed_at = datetime.utcnow()
     await db.commit()
+    # Подтвердившим участие напоминания больше не нужны
+    await reminders.schedule_registration(db, registration)
+    events.publish_registration_changed(registration, "confirmed")
     
     return {"message": "Участие подтверждено"}
 
@@ -579,11 +607,315 @@ async def delete_registration(
     if not registration:
         raise HTTPException(status_code=404, detail="Запись не найдена")
     
+    payload = events.registration_payload(registration, "deleted")
     await db.delete(registration)
+    await db.flush()
+    # Освободившееся место — первому из листа ожидания, в той же транзакции
+    promoted = []
+    if registration.probnik_id:
+        promoted = await waitlist.promote_slot(
+            db, registration.probnik_id, registration.school, registration.exam_date, registration.exam_time
+        )
     await db.commit()
+    events.publish(events.REGISTRATION_CHANGED, **payload)
+    await waitlist.publish_promoted(db, promoted)
     
     return {"message": "Запись удалена"}
 
+
+def _registration_response(registration: ExamRegistration) -> schemas.ExamRegistrationResponse:
+    return schemas.ExamRegistrationResponse(
+        id=registration.id,
+        student_id=registration.student_id,
+        subject=registration.subject,
+        exam_date=registration.exam_date.strftime("%Y-%m-%d"),
+        exam_time=registration.exam_time,
+        school=registration.school,
+        created_at=registration.created_at.isoformat() if registration.created_at else "",
+        confirmed=registration.confirmed,
+        confirmed_at=registration.confirmed_at.isoformat() if registration.confirmed_at else None,
+        attended=registration.attended,
+        submitted_work=registration.submitted_work
+    )
+
+
+@router.post(
+    "/registration/{registration_id}/move",
+    response_model=schemas.ExamRegistrationResponse,
+    dependencies=[Depends(admission.admit_registration)]
+)
+async def move_registration(
+    registration_id: int,
+    move: schemas.RegistrationMoveRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Перенос записи на другую дату, время или школу одной транзакцией.
+    
+    Сначала обновляется сама запись — это первая запись в транзакции, и SQLite
+    с этого момента держит блокировку записи. Затем при ней проверяются места
+    в новом слоте (перенесенная запись уже учтена в подсчете): если мест нет,
+    транзакция откатывается и ученик остается на старом месте. Освободившееся
+    старое место в той же транзакции достается первому из листа ожидания.
+    """
+    result = await db.execute(
+        select(ExamRegistration).where(ExamRegistration.id == registration_id)
+    )
+    registration = result.scalar_one_or_none()
+    if not registration:
+        raise HTTPException(status_code=404, detail="Запись не найдена")
+    
+    probnik = await db.get(Probnik, registration.probnik_id) if registration.probnik_id else None
+    if not probnik or not probnik.is_active:
+        raise HTTPException(status_code=400, detail="Запись на этот пробник закрыта")
+    if lottery.is_pending(probnik):
+        raise HTTPException(status_code=409, detail="Идет прием заявок в лотерею — перенос откроется после розыгрыша")
+    
+    try:
+        exam_date_obj = datetime.strptime(move.exam_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный формат даты. Используйте YYYY-MM-DD")
+    exam_datetime = datetime.combine(exam_date_obj, datetime.min.time())
+    school = move.school or registration.school
+    
+    old_slot = (registration.school, registration.exam_date, registration.exam_time)
+    if old_slot == (school, exam_datetime, move.exam_time):
+        return _registration_response(registration)
+    
+    registration.exam_date = exam_datetime
+    registration.exam_time = move.exam_time
+    registration.school = school
+    # Новое время — подтверждение и напоминания заново
+    registration.confirmed = False
+    registration.confirmed_at = None
+    await db.flush()
+    
+    clash_result = await db.execute(
+        select(func.count(ExamRegistration.id)).where(
+            ExamRegistration.student_id == registration.student_id,
+            ExamRegistration.probnik_id == probnik.id,
+            ExamRegistration.exam_date == exam_datetime,
+            ExamRegistration.exam_time == move.exam_time,
+            ExamRegistration.id != registration.id
+        )
+    )
+    if clash_result.scalar_one():
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="У вас уже есть запись на это время в этот день")
+    
+    registered = await waitlist.registered_count(db, probnik.id, school, exam_datetime, move.exam_time)
+    if registered > waitlist.slot_capacity(probnik, school, move.exam_time):
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="На это время нет свободных мест")
+    
+    await waitlist.remove_student_entries(
+        db, registration.student_id, probnik.id, registration.subject, exam_datetime, move.exam_time
+    )
+    promoted = await waitlist.promote_slot(db, probnik.id, *old_slot)
+    await db.commit()
+    await db.refresh(registration)
+    
+    scheduled = await reminders.schedule_registration(db, registration)
+    events.publish_registration_changed(
+        registration, "moved", reminders=reminders.reminders_payload(scheduled)
+    )
+    await waitlist.publish_promoted(db, promoted)
+    return _registration_response(registration)
+
+
+def _waitlist_entry_response(entry: WaitlistEntry, position: int) -> schemas.WaitlistEntryResponse:
+    return schemas.WaitlistEntryResponse(
+        id=entry.id,
+        student_id=entry.student_id,
+        subject=entry.subject,
+        exam_date=entry.exam_date.strftime("%Y-%m-%d"),
+        exam_time=entry.exam_time,
+        school=entry.school,
+        position=position,
+        created_at=entry.created_at.isoformat() if entry.created_at else ""
+    )
+
+
+@router.post("/waitlist", response_model=schemas.WaitlistEntryResponse)
+async def join_waitlist(
+    request: schemas.WaitlistJoinRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """Встать в лист ожидания на заполненный слот"""
+    probnik_result = await db.execute(select(Probnik).where(Probnik.is_active == True))
+    active_probnik = probnik_result.scalar_one_or_none()
+    if not active_probnik:
+        raise HTTPException(status_code=400, detail="Запись на пробник закрыта")
+    if lottery.is_pending(active_probnik):
+        raise HTTPException(status_code=400, detail="Идет прием заявок в лотерею — лист ожидания откроется после розыгрыша")
+    
+    student = await db.get(Student, request.student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Ученик не найден")
+    
+    try:
+        exam_date_obj = datetime.strptime(request.exam_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный формат даты. Используйте YYYY-MM-DD")
+    exam_datetime = datetime.combine(exam_date_obj, datetime.min.time())
+    
+    existing_result = await db.execute(
+        select(WaitlistEntry).where(
+            WaitlistEntry.student_id == request.student_id,
+            WaitlistEntry.probnik_id == active_probnik.id,
+            WaitlistEntry.subject == request.subject,
+            WaitlistEntry.exam_date == exam_datetime,
+            WaitlistEntry.exam_time == request.exam_time
+        )
+    )
+    entry = existing_result.scalar_one_or_none()
+    if entry:
+        return _waitlist_entry_response(entry, await waitlist.queue_position(db, entry))
+    
+    registered = await waitlist.registered_count(db, active_probnik.id, request.school, exam_datetime, request.exam_time)
+    if registered < waitlist.slot_capacity(active_probnik, request.school, request.exam_time):
+        raise HTTPException(status_code=400, detail="На это время есть свободные места — запишитесь на экзамен")
+    
+    entry = WaitlistEntry(
+        student_id=request.student_id,
+        probnik_id=active_probnik.id,
+        subject=request.subject,
+        exam_date=exam_datetime,
+        exam_time=request.exam_time,
+        school=request.school
+    )
+    if not await waitlist.can_register(db, entry, active_probnik):
+        raise HTTPException(status_code=400, detail="Вы уже записаны на это время или на максимальное количество экзаменов")
+    db.add(entry)
+    await db.commit()
+    await db.refresh(entry)
+    return _waitlist_entry_response(entry, await waitlist.queue_position(db, entry))
+
+
+@router.get("/waitlist/student/{student_id}", response_model=List[schemas.WaitlistEntryResponse])
+async def get_student_waitlist(
+    student_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """Места ученика в листах ожидания активного пробника"""
+    result = await db.execute(
+        select(WaitlistEntry)
+        .join(Probnik, WaitlistEntry.probnik_id == Probnik.id)
+        .where(WaitlistEntry.student_id == student_id, Probnik.is_active == True)
+        .order_by(WaitlistEntry.exam_date, WaitlistEntry.exam_time)
+    )
+    return [
+        _waitlist_entry_response(entry, await waitlist.queue_position(db, entry))
+        for entry in result.scalars().all()
+    ]
+
+
+@router.delete("/waitlist/{entry_id}")
+async def leave_waitlist(
+    entry_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """Выйти из листа ожидания"""
+    entry = await db.get(WaitlistEntry, entry_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Запись в листе ожидания не найдена")
+    await db.delete(entry)
+    await db.commit()
+    return {"message": "Вы вышли из листа ожидания"}
+
+
+def _lottery_request_response(request: LotteryRequest) -> dict:
+    return {
+        "id": request.id,
+        "student_id": request.student_id,
+        "subject": request.subject,
+        "exam_date": request.exam_date.strftime("%Y-%m-%d"),
+        "exam_time": request.exam_time,
+        "school": request.school,
+        "status": request.status,
+        "registration_id": request.registration_id,
+        "created_at": request.created_at.isoformat() if request.created_at else None
+    }
+
+
+@router.post("/lottery")
+async def submit_lottery_request(
+    request: schemas.ExamRegistrationCreate,
+    db: AsyncSession = Depends(get_db)
+):
+    """Заявка на место в окно лотереи (места распределяются розыгрышем после окончания окна)"""
+    probnik_result = await db.execute(select(Probnik).where(Probnik.is_active == True))
+    active_probnik = probnik_result.scalar_one_or_none()
+    if not active_probnik or not lottery.is_open(active_probnik):
+        raise HTTPException(status_code=400, detail="Прием заявок в лотерею закрыт")
+    
+    student = await db.get(Student, request.student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Ученик не найден")
+    if not request.school:
+        raise HTTPException(status_code=400, detail="Укажите школу")
+    
+    try:
+        exam_date_obj = datetime.strptime(request.exam_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный формат даты. Используйте YYYY-MM-DD")
+    exam_datetime = datetime.combine(exam_date_obj, datetime.min.time())
+    
+    existing_result = await db.execute(
+        select(LotteryRequest).where(
+            LotteryRequest.student_id == request.student_id,
+            LotteryRequest.probnik_id == active_probnik.id,
+            LotteryRequest.exam_date == exam_datetime,
+            LotteryRequest.exam_time == request.exam_time
+        )
+    )
+    existing = existing_result.scalar_one_or_none()
+    if existing:
+        if existing.subject == request.subject:
+            return {**_lottery_request_response(existing), "draw_at": active_probnik.lottery_ends_at.isoformat()}
+        raise HTTPException(status_code=400, detail="У вас уже есть заявка на это время в этот день")
+    
+    max_registrations = active_probnik.max_registrations if active_probnik.max_registrations is not None else 4
+    if await lottery.count_requests(db, active_probnik.id, request.student_id) >= max_registrations:
+        raise HTTPException(status_code=400, detail=f"Можно подать не больше {max_registrations} заявок")
+    
+    entry = LotteryRequest(
+        student_id=request.student_id,
+        probnik_id=active_probnik.id,
+        subject=request.subject,
+        exam_date=exam_datetime,
+        exam_time=request.exam_time,
+        school=request.school
+    )
+    db.add(entry)
+    await db.commit()
+    await db.refresh(entry)
+    return {**_lottery_request_response(entry), "draw_at": active_probnik.lottery_ends_at.isoformat()}
+
+
+@router.get("/lottery/student/{student_id}")
+async def get_student_lottery_requests(
+    student_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """Заявки ученика в лотерею активного пробника и их статусы"""
+    result = await db.execute(
+        select(LotteryRequest)
+        .join(Probnik, LotteryRequest.probnik_id == Probnik.id)
+        .where(LotteryRequest.student_id == student_id, Probnik.is_active == True)
+        .order_by(LotteryRequest.id)
+    )
+    return [_lottery_request_response(request) for request in result.scalars().all()]
+
+
+@router.get("/events")
+async def get_events(
+    after: Optional[int] = Query(None, description="id последнего полученного события"),
+    timeout: float = Query(25, ge=0, description="Сколько секунд ждать новых событий"),
+):
+    """Лента событий пробника (long-poll). Без after или при потере событий возвращает reset=true"""
+    return await events.feed.wait(after, timeout)
+
 @router.get("/pending-notifications")
 async def get_pending_notifications(db: AsyncSession = Depends(get_db)):
     """Получение списка уведомлений для отправки"""
@@ -626,65 +958,26 @@ async def get_pending_notifications(db: AsyncSession = Depends(get_db)):
                     "message": "Вы подтвердили регистрацию более 24 часов назад, но еще не записались на экзамен. Пожалуйста, завершите регистрацию."
                 })
     
-    # Уведомления за 3 дня до экзамена (только для активного пробника)
-    notifications_3d = []
-    if active_probnik:
-        three_days_later = now + timedelta(days=3)
-        three_days_date = three_days_later.date()
-        registrations_3d = await db.execute(
-            select(ExamRegistration)
-            .options(selectinload(ExamRegistration.student))
-            .where(
-                ExamRegistration.exam_date >= datetime.combine(three_days_date - timedelta(days=1), datetime.min.time()),
-                ExamRegistration.exam_date <= datetime.combine(three_days_date, datetime.min.time()),
-                ExamRegistration.confirmed == False,
-                ExamRegistration.probnik_id == active_probnik.id
-            )
-        )
-    
-        for reg in registrations_3d.scalars().all():
-            if reg.student and reg.student.user_id:
-                notifications_3d.append({
-                    "user_id": reg.student.user_id,
-                    "type": "reminder_3d",
-                    "registration_id": reg.id,
-                    "subject": reg.subject,
-                    "exam_date": reg.exam_date.strftime("%d.%m.%Y"),
-                    "exam_time": reg.exam_time,
-                    "message": f"Через 3 дня у вас экзамен по {reg.subject} ({reg.exam_date.strftime('%d.%m.%Y')} в {reg.exam_time}). Подтвердите участие."
-                })
-    
-    # Уведомления за 1 день до экзамена (только для активного пробника)
-    notifications_1d = []
-    if active_probnik:
-        one_day_later = now + timedelta(days=1)
-        one_day_date = one_day_later.date()
-        registrations_1d = await db.execute(
-            select(ExamRegistration)
-            .options(selectinload(ExamRegistration.student))
-            .where(
-                ExamRegistration.exam_date >= datetime.combine(one_day_date, datetime.min.time()),
-                ExamRegistration.exam_date <= datetime.combine(one_day_date + timedelta(days=1), datetime.min.time()),
-                ExamRegistration.confirmed == False,
-                ExamRegistration.probnik_id == active_probnik.id
-            )
-        )
-        
-        for reg in registrations_1d.scalars().all():
-            if reg.student and reg.student.user_id:
-                notifications_1d.append({
-                    "user_id": reg.student.user_id,
-                    "type": "reminder_1d",
-                    "registration_id": reg.id,
-                    "subject": reg.subject,
-                    "exam_date": reg.exam_date.strftime("%d.%m.%Y"),
-                    "exam_time": reg.exam_time,
-                    "message": f"Завтра у вас экзамен по {reg.subject} в {reg.exam_time}. Подтвердите участие."
-                })
-    
+    # Напоминания за 3 дня и за 1 день до экзамена — в очереди /telegram/reminders
     return {
-        "reminder_24h": notifications_24h,
-        "reminder_3d": notifications_3d,
-        "reminder_1d": notifications_1d
+        "reminder_24h": notifications_24h
     }
 
+
+@router.get("/reminders/pending")
+async def get_pending_reminders(db: AsyncSession = Depends(get_db)):
+    """Очередь неотправленных напоминаний (id и время отправки) для таймера бота"""
+    return {"reminders": await reminders.pending_reminders(db)}
+
+
+@router.post("/reminders/claim")
+async def claim_reminders(request: schemas.ReminderClaimRequest, db: AsyncSession = Depends(get_db)):
+    """Забрать пришедшие напоминания на отправку (пачкой)"""
+    return {"reminders": await reminders.claim_reminders(db, request.ids)}
+
+
+@router.post("/reminders/ack")
+async def ack_reminders(request: schemas.ReminderAckRequest, db: AsyncSession = Depends(get_db)):
+    """Подтверждение отправки напоминаний ботом"""
+    return await reminders.ack_reminders(db, request.sent, request.failed)
+
@@ -0,0 +1,45 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+# База тестов — временный файл; задается до импорта database
+os.environ["DATABASE_URL"] = "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Бэкенд и корень репозитория (общий каталог common/)
+sys.path[:0] = [BACKEND_DIR, os.path.dirname(BACKEND_DIR)]
+
+import httpx
+import pytest
+
+from auth import create_access_token
+from database import engine
+from models import Base
+
+
+@pytest.fixture
+def run():
+    """Выполняет корутину теста на чистой базе"""
+    async def reset():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(reset())
+    yield loop.run_until_complete
+    loop.run_until_complete(engine.dispose())
+    loop.close()
+
+
+@pytest.fixture
+def client():
+    """Клиент приложения с токеном администратора (без запуска startup-задач)"""
+    from main import app
+
+    token = create_access_token({"sub": "admin", "username": "admin", "role": "admin", "teacher_name": "Администратор"})
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://test",
+        headers={"Authorization": "Bearer " + token},
+    )
@@ -0,0 +1,95 @@
+from datetime import datetime
+
+from sqlalchemy import select
+
+from database import AsyncSessionLocal
+from models import ExamRegistration, Probnik, Student
+
+EXAM_DATE = datetime(2026, 10, 19)
+
+
+async def _registration() -> int:
+    async with AsyncSessionLocal() as db:
+        student = Student(fio="Иванов Иван")
+        probnik = Probnik(name="Пробник")
+        db.add_all([student, probnik])
+        await db.flush()
+        registration = ExamRegistration(
+            student_id=student.id, probnik_id=probnik.id, subject="infa",
+            exam_date=EXAM_DATE, exam_time="9:00", school="Байкальская"
+        )
+        db.add(registration)
+        await db.commit()
+        return registration.id
+
+
+async def _stored(registration_id: int):
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(ExamRegistration.attended, ExamRegistration.attendance_marked_at)
+            .where(ExamRegistration.id == registration_id)
+        )
+        return result.one()
+
+
+def test_bulk_attendance_aware_marked_at(run, client):
+    async def scenario():
+        registration_id = await _registration()
+        async with client:
+            response = await client.post("/exam-registrations/bulk-attendance", json={"items": [
+                {"id": registration_id, "attended": True, "marked_at": "2026-10-19T08:00:00+03:00"},
+            ]})
+            assert response.status_code == 200
+            assert await _stored(registration_id) == (True, datetime(2026, 10, 19, 5, 0))
+
+            response = await client.post("/exam-registrations/bulk-attendance", json={"items": [
+                {"id": registration_id, "attended": False, "marked_at": "2026-10-19T09:00:00+03:00"},
+            ]})
+            assert response.status_code == 200
+            assert response.json()["updated"] == 1
+
+            # Отметка с поясом и без marked_at для одной записи в одном запросе
+            response = await client.post("/exam-registrations/bulk-attendance", json={"items": [
+                {"id": registration_id, "attended": True, "marked_at": "2026-10-19T10:00:00+03:00"},
+                {"id": registration_id, "attended": True},
+            ]})
+            assert response.status_code == 200
+
+    run(scenario())
+
+
+def test_checkin_sync_aware_marked_at(run, client):
+    async def scenario():
+        registration_id = await _registration()
+        slot = {"probnik_id": 1, "school": "Байкальская", "exam_date": "2026-10-19", "exam_time": "9:00"}
+        async with client:
+            for hour, attended in ((8, True), (9, False)):
+                response = await client.post("/checkin/sync", json={**slot, "marks": [
+                    {"id": registration_id, "attended": attended, "marked_at": f"2026-10-19T{hour:02d}:00:00+03:00"},
+                ]})
+                assert response.status_code == 200
+                assert response.json()["updated"] == 1
+            assert await _stored(registration_id) == (False, datetime(2026, 10, 19, 6, 0))
+
+    run(scenario())
+
+
+def test_newer_unchanged_mark_moves_stamp(run, client):
+    async def scenario():
+        registration_id = await _registration()
+
+        async def mark(attended: bool, minute: int):
+            response = await client.post("/exam-registrations/bulk-attendance", json={"items": [
+                {"id": registration_id, "attended": attended, "marked_at": f"2026-10-19T05:{minute:02d}:00"},
+            ]})
+            return response.json()
+
+        async with client:
+            assert (await mark(True, 0))["updated"] == 1
+            # Новее, но без изменений — только сдвигает время решения
+            assert (await mark(True, 30))["unchanged"] == 1
+            # Опоздавшая отметка между ними не перебивает последнее решение
+            assert (await mark(False, 15))["stale"] == [registration_id]
+        assert await _stored(registration_id) == (True, datetime(2026, 10, 19, 5, 30))
+
+    run(scenario())
@@ -0,0 +1,38 @@
+import time
+
+from auth import LoginRateLimiter
+
+
+def test_rate_limiter_limits_attempts():
+    limiter = LoginRateLimiter(limit=2, window=60)
+    assert limiter.hit("admin") and limiter.hit("admin")
+    assert not limiter.hit("admin")
+    assert limiter.retry_after("admin") > 0
+    limiter.reset("admin")
+    assert limiter.hit("admin")
+
+
+def test_rate_limiter_memory_is_bounded(monkeypatch):
+    limiter = LoginRateLimiter(limit=5, window=60, max_usernames=100)
+    for index in range(1000):
+        limiter.hit(f"user{index}")
+    assert len(limiter._attempts) == 100
+    assert not limiter.hit("admin")
+    assert limiter.retry_after("admin") > 0
+
+    # Через окно устаревшие логины удаляются при следующей попытке
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    limiter.hit("admin")
+    assert list(limiter._attempts) == ["admin"]
+
+
+def test_rate_limiter_flood_does_not_reset_lockout():
+    limiter = LoginRateLimiter(limit=5, window=60, max_usernames=100)
+    for _ in range(5):
+        assert limiter.hit("admin")
+    assert not limiter.hit("admin")
+    for index in range(1000):
+        limiter.hit(f"junk{index}")
+    assert not limiter.hit("admin")
+    assert "admin" in limiter._attempts
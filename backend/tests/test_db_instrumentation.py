@@ -0,0 +1,27 @@
+import json
+import logging
+
+import db_instrumentation
+
+
+def _slow_record(monkeypatch, caplog, log_params: bool) -> dict:
+    monkeypatch.setattr(db_instrumentation, "SLOW_QUERY_MS", 0)
+    monkeypatch.setattr(db_instrumentation, "SLOW_QUERY_LOG_PARAMS", log_params)
+    conn = type("Conn", (), {"info": {"query_start_time": [0.0]}})()
+    with caplog.at_level(logging.WARNING, logger="exams.sql.slow"):
+        db_instrumentation._after_cursor_execute(
+            conn, None, "UPDATE employees SET password_hash=? WHERE id=?", ("$2b$12$secret", 7), None, False
+        )
+    return json.loads(caplog.records[-1].getMessage())
+
+
+def test_slow_query_log_omits_parameters_by_default(monkeypatch, caplog):
+    record = _slow_record(monkeypatch, caplog, log_params=False)
+    assert record["parameter_count"] == 2
+    assert "parameters" not in record
+    assert "secret" not in json.dumps(record)
+
+
+def test_slow_query_log_parameters_opt_in(monkeypatch, caplog):
+    record = _slow_record(monkeypatch, caplog, log_params=True)
+    assert record["parameters"] == ["$2b$12$secret", 7]
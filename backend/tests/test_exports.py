@@ -0,0 +1,49 @@
+import re
+import zipfile
+from datetime import datetime
+
+import exports
+import workers
+from database import AsyncSessionLocal
+from models import ExamRegistration, Probnik, Student
+
+
+def test_xlsx_rows_sent_to_worker_in_batches(run, tmp_path, monkeypatch):
+    monkeypatch.setattr(exports, "EXPORT_BATCH_SIZE", 7)
+    sent = []
+    original = workers.run
+
+    async def counting_run(func, *args):
+        if func is exports.write_sheet_rows:
+            sent.append(len(args[2]))
+        return await original(func, *args)
+
+    monkeypatch.setattr(workers, "run", counting_run)
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            probnik = Probnik(name="Пробник", is_active=True)
+            students = [Student(fio=f"Ученик {number:02d}") for number in range(20)]
+            db.add_all([probnik] + students)
+            await db.flush()
+            db.add_all([
+                ExamRegistration(student_id=student.id, probnik_id=probnik.id, subject="infa",
+                                 exam_date=datetime(2026, 11, 1), exam_time="9:00", school="Байкальская")
+                for student in students
+            ])
+            await db.commit()
+        path = str(tmp_path / "roster.xlsx")
+        try:
+            count = await exports.build_xlsx(path, "roster", {"probnik_id": probnik.id})
+        finally:
+            workers.shutdown()
+        return path, count
+
+    path, count = run(scenario())
+    assert count == 20
+    assert sent == [7, 7, 7]
+    assert not (tmp_path / "roster.xlsx.rows").exists()
+    with zipfile.ZipFile(path) as archive:
+        sheet = archive.read("xl/worksheets/sheet1.xml").decode("utf-8")
+    assert re.findall(r'<row r="(\d+)"', sheet) == [str(number) for number in range(1, 22)]
+    assert "Ученик 19" in sheet
@@ -0,0 +1,48 @@
+import pytest
+
+from auth import create_access_token
+from database import AsyncSessionLocal
+from models import Employee, StudyGroup
+
+GROUP_ENDPOINTS = (
+    "/groups/{id}/results-matrix",
+    "/groups/{id}/trends",
+    "/groups/{id}/trends/students/1",
+    "/groups/{id}/results-summary",
+    "/groups/{id}/report-cards.zip",
+)
+
+
+async def _group() -> int:
+    async with AsyncSessionLocal() as db:
+        owner = Employee(username="owner", password_hash="x", role="teacher", teacher_name="Владелец")
+        db.add(owner)
+        await db.flush()
+        group = StudyGroup(name="11А", teacher_id=owner.id)
+        db.add(group)
+        await db.commit()
+        return group.id
+
+
+@pytest.mark.parametrize("path", GROUP_ENDPOINTS)
+def test_group_endpoints_missing_group_is_404(run, client, path):
+    async def scenario():
+        async with client:
+            response = await client.get(path.format(id=999))
+        assert response.status_code == 404
+
+    run(scenario())
+
+
+@pytest.mark.parametrize("path", GROUP_ENDPOINTS)
+def test_group_endpoints_foreign_group_is_403(run, client, path):
+    token = create_access_token({"sub": "other", "username": "other", "role": "teacher", "teacher_name": "Другой"})
+    client.headers["Authorization"] = "Bearer " + token
+
+    async def scenario():
+        group_id = await _group()
+        async with client:
+            response = await client.get(path.format(id=group_id))
+        assert response.status_code == 403
+
+    run(scenario())
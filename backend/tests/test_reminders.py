@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+import reminders
+from database import AsyncSessionLocal
+from models import ExamRegistration, Probnik, ScheduledReminder, Student
+
+
+async def _reminder(exam_date: datetime, due_at: datetime) -> int:
+    async with AsyncSessionLocal() as db:
+        student = Student(fio="Иванов Иван", user_id=1001)
+        probnik = Probnik(name="Пробник", is_active=True)
+        db.add_all([student, probnik])
+        await db.flush()
+        registration = ExamRegistration(
+            student_id=student.id, probnik_id=probnik.id, subject="infa",
+            exam_date=exam_date, exam_time="9:00", school="Байкальская"
+        )
+        db.add(registration)
+        await db.flush()
+        reminder = ScheduledReminder(registration_id=registration.id, kind="reminder_1d", due_at=due_at, attempts=0)
+        db.add(reminder)
+        await db.commit()
+        return reminder.id
+
+
+def test_claim_drops_reminders_for_started_exams(run):
+    async def scenario():
+        now = datetime.utcnow()
+        past = await _reminder(datetime.combine(now.date() - timedelta(days=2), datetime.min.time()), now - timedelta(days=3))
+        upcoming = await _reminder(datetime.combine(now.date() + timedelta(days=2), datetime.min.time()), now - timedelta(minutes=1))
+        async with AsyncSessionLocal() as db:
+            claimed = await reminders.claim_reminders(db, [past, upcoming])
+            assert [item["id"] for item in claimed] == [upcoming]
+            remaining = (await db.execute(select(ScheduledReminder.id))).scalars().all()
+            assert past not in remaining
+
+    run(scenario())
+
+
+def test_pending_reminders_bounded_by_horizon(run):
+    async def scenario():
+        now = datetime.utcnow()
+        exam_date = datetime.combine(now.date() + timedelta(days=10), datetime.min.time())
+        soon = await _reminder(exam_date, now + timedelta(hours=1))
+        await _reminder(exam_date, now + timedelta(hours=reminders.REMINDER_PENDING_HORIZON_HOURS + 1))
+        async with AsyncSessionLocal() as db:
+            assert [item["id"] for item in await reminders.pending_reminders(db)] == [soon]
+
+    run(scenario())
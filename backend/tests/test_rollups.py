@@ -0,0 +1,33 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from database import AsyncSessionLocal
+from models import ExamRegistration, Probnik, RegistrationRollup, Student
+
+
+def test_failed_flush_does_not_leak_deltas(run):
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            student = Student(fio="Иванов Иван")
+            probnik = Probnik(name="Пробник", is_active=True)
+            db.add_all([student, probnik])
+            await db.commit()
+            student_id = student.id
+
+            slot = dict(probnik_id=probnik.id, subject="infa", exam_date=datetime(2026, 11, 1),
+                        exam_time="9:00", school="Байкальская")
+            # Несуществующий ученик: flush падает на внешнем ключе после сбора дельт
+            db.add(ExamRegistration(student_id=student_id + 100, **slot))
+            with pytest.raises(IntegrityError):
+                await db.flush()
+            await db.rollback()
+
+            db.add(ExamRegistration(student_id=student_id, **slot))
+            await db.commit()
+            rollup = (await db.execute(select(RegistrationRollup))).scalars().one()
+            assert rollup.registered == 1
+
+    run(scenario())
@@ -0,0 +1,22 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from route_helpers import parse_date, require_admin
+
+
+def test_parse_date():
+    assert parse_date("2026-10-19") == datetime(2026, 10, 19)
+    assert parse_date("") is None
+    for value, required in (("19.10.2026", False), ("", True)):
+        with pytest.raises(HTTPException) as error:
+            parse_date(value, required=required)
+        assert error.value.status_code == 400
+
+
+def test_require_admin():
+    require_admin({"role": "admin"})
+    with pytest.raises(HTTPException) as error:
+        require_admin({"role": "teacher"})
+    assert error.value.status_code == 403
@@ -0,0 +1,27 @@
+from common.scheduler import IntervalTrigger, JobStateStore, Scheduler
+
+
+class RecordingStore(JobStateStore):
+    def __init__(self):
+        self.saved = []
+
+    async def save(self, name, state):
+        self.saved.append(name)
+
+
+def test_run_job_skips_state_save_for_non_persistent_jobs(run):
+    async def noop():
+        pass
+
+    store = RecordingStore()
+    scheduler = Scheduler(store=store)
+    frequent = scheduler.add_job("frequent", noop, IntervalTrigger(10), persist=False)
+    daily = scheduler.add_job("daily", noop, IntervalTrigger(86400))
+
+    async def scenario():
+        assert await scheduler.run_job(frequent)
+        assert await scheduler.run_job(daily)
+
+    run(scenario())
+    assert store.saved == ["daily"]
+    assert frequent.last_success_at is not None
@@ -0,0 +1,322 @@
+"""
+Динамика результатов группы: ряды первичного и тестового балла и освоения
+заданий по типам экзаменов в порядке их создания.
+
+Данные группы загружаются тремя запросами (только нужные столбцы), ответы
+разбираются одной пачкой и раскладываются в массивы NumPy (Rollup): баллы
+ученик × тип экзамена и освоение задания ученик × тип × задание (доля от
+максимума задания, "-" — 0, как в карточках reportcards.py). Пропущенный
+экзамен — NaN. Ряды группы (среднее, медиана, квартили), скользящие средние за
+ROLLING_WINDOW экзаменов и наклон линейного тренда ученика считаются по целым
+массивам, без циклов по ученикам.
+
+Освоение задания отдельно считается по пройденным темам (completed_tasks типа
+экзамена) и по непройденным: низкий результат по непройденной теме ожидаем и
+в скользящее освоение задания не входит.
+
+Сводка группы хранится в памяти процесса (до TREND_CACHE_SIZE групп) и
+собирается один раз — ответ из нее не зависит от длины истории. Запись
+экзамена, новый тип экзамена и изменение состава группы сбрасывают сводку
+группы (crud), массовые удаления — все сводки. Сводка старше TREND_TTL
+пересобирается, чтобы доходили изменения из других процессов.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import metrics
+import scoring
+from models import Exam, ExamType, Student, StudyGroup, group_student_association
+
+TREND_CACHE_SIZE = int(os.getenv("TREND_CACHE_SIZE", "256"))
+TREND_TTL = int(os.getenv("TREND_TTL", "600"))
+ROLLING_WINDOW = int(os.getenv("TREND_ROLLING_WINDOW", "3"))
+
+
+# ==================== СТАТИСТИКА ПО МАССИВАМ ====================
+
+def rolling_mean(values: np.ndarray, window: int, axis: int = -1) -> np.ndarray:
+    """Скользящее среднее за window позиций вдоль axis без учета NaN; окно без значений — NaN"""
+    values = np.moveaxis(values, axis, -1)
+    valid = ~np.isnan(values)
+    sums = np.cumsum(np.where(valid, values, 0.0), axis=-1)
+    counts = np.cumsum(valid, axis=-1)
+    if values.shape[-1] > window:
+        sums[..., window:] = sums[..., window:] - sums[..., :-window].copy()
+        counts[..., window:] = counts[..., window:] - counts[..., :-window].copy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+    return np.moveaxis(result, -1, axis)
+
+
+def slopes(values: np.ndarray) -> np.ndarray:
+    """Наклон прямой МНК по каждой строке (изменение за один экзамен); меньше двух точек — NaN"""
+    valid = ~np.isnan(values)
+    x = np.arange(values.shape[-1], dtype=np.float64)
+    y = np.where(valid, values, 0.0)
+    n = valid.sum(axis=-1)
+    sx = (valid * x).sum(axis=-1)
+    sy = y.sum(axis=-1)
+    sxx = (valid * x * x).sum(axis=-1)
+    sxy = (y * x).sum(axis=-1)
+    denominator = n * sxx - sx * sx
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where((n >= 2) & (denominator > 0), (n * sxy - sx * sy) / denominator, np.nan)
+
+
+def _nan_stat(function, values: np.ndarray, axis: int) -> np.ndarray:
+    """nanmean/nanmedian/... без предупреждений на пустых срезах (результат NaN)"""
+    with np.errstate(invalid="ignore"):
+        if values.size == 0 or values.shape[axis] == 0:
+            return np.full(np.delete(values.shape, axis), np.nan)
+        empty = np.isnan(values).all(axis=axis)
+        filled = np.where(np.expand_dims(empty, axis), 0.0, values)
+        return np.where(empty, np.nan, function(filled, axis=axis))
+
+
+def _masked_mean(values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Среднее по последней оси только по позициям mask (NaN, если таких нет)"""
+    return _nan_stat(np.nanmean, np.where(mask, values, np.nan), axis=-1)
+
+
+def _list(values: np.ndarray, digits: int = 2) -> List:
+    """Массив в списки для JSON: NaN — None"""
+    result = np.round(values.astype(np.float64), digits).astype(object)
+    result[np.isnan(values)] = None
+    return result.tolist()
+
+
+# ==================== СВОДКА ГРУППЫ ====================
+
+def parse_scores(answers: List[Optional[str]], tasks: int) -> np.ndarray:
+    """
+    Баллы по заданиям пачкой работ: матрица работа × задание. "-", пустое и
+    нечисловое — 0 (как в scoring.primary_score), лишние задания отбрасываются.
+    """
+    fields: List[str] = []
+    for answer in answers:
+        parts = (answer or "").split(",")[:tasks]
+        fields.extend(parts)
+        fields.extend([""] * (tasks - len(parts)))
+    # Различных значений в ответах единицы — каждое разбирается один раз
+    lookup = {field: int(field) if field.strip().isdigit() else 0 for field in set(fields)}
+    values = np.fromiter(map(lookup.__getitem__, fields), dtype=np.int64, count=len(fields))
+    return values.reshape(len(answers), tasks)
+
+
+def primary_scores(subject: Optional[str], scores: np.ndarray) -> np.ndarray:
+    """Первичный балл по строкам матрицы баллов (как scoring.primary_score)"""
+    limits = scoring.max_per_task(subject)
+    capped = np.minimum(scores, limits) if limits else scores
+    total = capped.sum(axis=-1)
+    if subject == 'infa_9' and scores.shape[-1] > 13:
+        # 13.2 засчитывается, только если не решено 13.1
+        total -= np.where(capped[..., 12] > 0, capped[..., 13], 0)
+    return total
+
+
+def scaled_scores(subject: Optional[str], primary: np.ndarray) -> np.ndarray:
+    """Тестовый балл по шкале предмета (как scoring.scaled_score)"""
+    scale = scoring.SCALES.get(subject)
+    if scale is None:
+        return primary
+    return np.asarray(scale)[np.minimum(primary, len(scale) - 1)]
+
+
+class Rollup:
+    """Массивы результатов группы и готовые ряды группы"""
+
+    def __init__(
+        self,
+        group_id: int,
+        group_name: str,
+        subject: Optional[str],
+        exam_types: List,
+        students: List,
+        exams: List,
+        window: int = ROLLING_WINDOW
+    ):
+        self.group_id = group_id
+        self.group_name = group_name
+        self.subject = subject
+        self.max_score = scoring.max_primary(subject)
+        self.window = window
+        self.exam_type_ids = [row.id for row in exam_types]
+        self.exam_type_names = [row.name for row in exam_types]
+        self.completed_tasks = [sorted(row.completed_tasks or []) for row in exam_types]
+        self.student_ids = [row.id for row in students]
+        self.student_names = [row.fio for row in students]
+        self.positions = {student_id: index for index, student_id in enumerate(self.student_ids)}
+        self.loaded_at = time.monotonic()
+
+        # Ячейки (ученик, тип экзамена) с результатом; несколько экзаменов одного типа — последний
+        type_positions = {exam_type_id: index for index, exam_type_id in enumerate(self.exam_type_ids)}
+        cells: Dict[Tuple[int, int], Optional[str]] = {}
+        for exam in exams:
+            if exam.id_student in self.positions and exam.exam_type_id in type_positions:
+                cells[(self.positions[exam.id_student], type_positions[exam.exam_type_id])] = exam.answer
+        rows = np.array([row for row, _ in cells], dtype=np.int64)
+        columns = np.array([column for _, column in cells], dtype=np.int64)
+
+        limits = scoring.max_per_task(subject)
+        width = len(limits) if limits else max((len((answer or "").split(",")) for answer in cells.values()), default=0)
+        scores = parse_scores(list(cells.values()), width)
+        students_count, types_count = len(self.student_ids), len(self.exam_type_ids)
+        self.primary = np.full((students_count, types_count), np.nan)
+        self.scaled = np.full((students_count, types_count), np.nan)
+        primary = primary_scores(subject, scores)
+        self.primary[rows, columns] = primary
+        self.scaled[rows, columns] = scaled_scores(subject, primary)
+
+        # Освоение задания — доля от максимума; по предмету без максимумов не считается
+        tasks = len(limits) if limits else 0
+        self.mastery = np.full((students_count, types_count, tasks), np.nan)
+        if tasks:
+            self.mastery[rows, columns] = np.minimum(scores, limits) / np.asarray(limits, dtype=np.float64)
+
+        # Пройденные темы: тип экзамена × задание
+        self.covered = np.zeros((types_count, tasks), dtype=bool)
+        for exam_type, completed in enumerate(self.completed_tasks):
+            for task in completed:
+                if 1 <= task <= tasks:
+                    self.covered[exam_type, task - 1] = True
+
+        self.group_primary = _nan_stat(np.nanmean, self.primary, axis=0)
+        self.primary_rolling = rolling_mean(self.primary, window)
+        self.primary_slope = slopes(self.primary)
+        self.covered_mastery = _masked_mean(self.mastery, self.covered[None, :, :])
+        self.uncovered_mastery = _masked_mean(self.mastery, ~self.covered[None, :, :])
+        self.task_rolling = rolling_mean(np.where(self.covered[None, :, :], self.mastery, np.nan), window, axis=1)
+        self._payload: Optional[Dict] = None
+
+    def expired(self) -> bool:
+        return time.monotonic() - self.loaded_at > TREND_TTL
+
+    def _header(self) -> Dict:
+        return {
+            "group_id": self.group_id,
+            "group_name": self.group_name,
+            "subject": self.subject,
+            "max_score": self.max_score,
+            "window": self.window,
+            "exam_type_ids": self.exam_type_ids,
+            "exam_type_names": self.exam_type_names,
+            "completed_tasks": self.completed_tasks,
+        }
+
+    def group_payload(self) -> Dict:
+        """Ряды группы и краткие ряды учеников (собираются один раз на сводку)"""
+        if self._payload is None:
+            task_mastery = _nan_stat(np.nanmean, self.mastery, axis=0)
+            self._payload = {
+                **self._header(),
+                "participants": (~np.isnan(self.primary)).sum(axis=0).tolist(),
+                "primary_mean": _list(self.group_primary),
+                "primary_median": _list(_nan_stat(np.nanmedian, self.primary, axis=0)),
+                "primary_p25": _list(_nan_stat(lambda a, axis: np.nanpercentile(a, 25, axis=axis), self.primary, axis=0)),
+                "primary_p75": _list(_nan_stat(lambda a, axis: np.nanpercentile(a, 75, axis=axis), self.primary, axis=0)),
+                "primary_rolling": _list(rolling_mean(self.group_primary, self.window)),
+                "scaled_mean": _list(_nan_stat(np.nanmean, self.scaled, axis=0)),
+                "covered_mastery": _list(_nan_stat(np.nanmean, self.covered_mastery, axis=0), 3),
+                "uncovered_mastery": _list(_nan_stat(np.nanmean, self.uncovered_mastery, axis=0), 3),
+                "task_mastery": _list(task_mastery, 3),
+                "task_rolling": _list(rolling_mean(np.where(self.covered, task_mastery, np.nan), self.window, axis=0), 3),
+                "student_ids": self.student_ids,
+                "student_names": self.student_names,
+                "student_primary": _list(self.primary),
+                "student_rolling": _list(self.primary_rolling),
+                "student_slope": _list(self.primary_slope),
+            }
+        return self._payload
+
+    def student_payload(self, student_id: int) -> Optional[Dict]:
+        """Ряды одного ученика; None, если его нет в группе"""
+        index = self.positions.get(student_id)
+        if index is None:
+            return None
+        return {
+            **self._header(),
+            "student_id": student_id,
+            "fio": self.student_names[index],
+            "primary": _list(self.primary[index]),
+            "scaled": _list(self.scaled[index]),
+            "primary_rolling": _list(self.primary_rolling[index]),
+            "vs_group": _list(self.primary[index] - self.group_primary),
+            "slope": _list(self.primary_slope)[index],
+            "covered_mastery": _list(self.covered_mastery[index], 3),
+            "uncovered_mastery": _list(self.uncovered_mastery[index], 3),
+            "task_mastery": _list(self.mastery[index], 3),
+            "task_rolling": _list(self.task_rolling[index], 3),
+        }
+
+
+_rollups: "OrderedDict[int, Rollup]" = OrderedDict()
+
+
+def invalidate(group_id: int):
+    _rollups.pop(group_id, None)
+
+
+def discard_exam_types(exam_type_ids: Iterable[int]):
+    """Сбрасывает сводки групп, в которых есть эти типы экзаменов (после записи экзамена)"""
+    exam_type_ids = set(exam_type_ids)
+    for group_id, cached in list(_rollups.items()):
+        if exam_type_ids.intersection(cached.exam_type_ids):
+            del _rollups[group_id]
+
+
+def clear():
+    _rollups.clear()
+
+
+async def _load(db: AsyncSession, group_id: int) -> Optional[Rollup]:
+    """Сводка группы тремя запросами: группа с типами экзаменов, ученики, экзамены группы"""
+    types_result = await db.execute(
+        select(StudyGroup.name.label("group_name"), StudyGroup.subject, ExamType.id, ExamType.name, ExamType.completed_tasks)
+        .outerjoin(ExamType, ExamType.group_id == StudyGroup.id)
+        .where(StudyGroup.id == group_id)
+        .order_by(ExamType.id)
+    )
+    type_rows = types_result.all()
+    if not type_rows:
+        return None
+    students_result = await db.execute(
+        select(Student.id, Student.fio)
+        .join(group_student_association, group_student_association.c.student_id == Student.id)
+        .where(group_student_association.c.group_id == group_id)
+        .order_by(Student.fio, Student.id)
+    )
+    exams_result = await db.execute(
+        select(Exam.id_student, Exam.exam_type_id, Exam.answer)
+        .join(ExamType, ExamType.id == Exam.exam_type_id)
+        .where(ExamType.group_id == group_id)
+        .order_by(Exam.id)
+    )
+    return Rollup(
+        group_id, type_rows[0].group_name, type_rows[0].subject,
+        [row for row in type_rows if row.id is not None], students_result.all(), exams_result.all()
+    )
+
+
+async def rollup(db: AsyncSession, group_id: int) -> Optional[Rollup]:
+    """Сводка группы из кеша или собранная заново; None — группы нет"""
+    cached = _rollups.get(group_id)
+    if cached is not None and not cached.expired():
+        _rollups.move_to_end(group_id)
+        metrics.record_cache_hit("trends")
+        return cached
+    metrics.record_cache_miss("trends")
+    built = await _load(db, group_id)
+    if built is None:
+        invalidate(group_id)
+        return None
+    _rollups[group_id] = built
+    _rollups.move_to_end(group_id)
+    while len(_rollups) > TREND_CACHE_SIZE:
+        _rollups.popitem(last=False)
+    return built
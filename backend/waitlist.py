@@ -0,0 +1,182 @@
+"""
+Лист ожидания на заполненные слоты пробника.
+
+Очередь — таблица waitlist_entry: порядок FIFO задает автоинкрементный id,
+составной индекс (probnik_id, school, exam_date, exam_time, id) дает первую
+запись слота и позицию в очереди поиском по B-дереву, без сортировки всей таблицы.
+
+Когда место освобождается (удаление или перенос записи, увеличение вместимости),
+promote_slot в той же транзакции, что и освобождение, переводит первых из очереди
+в записи. Освобождение (DELETE/UPDATE) выполняется раньше подсчета мест: после
+первой записи в транзакции SQLite держит блокировку записи, поэтому подсчет
+и перевод не пересекаются с параллельными записями на тот же слот.
+
+После commit вызывающий код публикует события (publish_promoted) — бот сообщает
+ученикам, что они записаны.
+"""
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import events
+import reminders
+from models import ExamRegistration, Probnik, Student, WaitlistEntry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOT_CAPACITY = 45
+DEFAULT_MAX_REGISTRATIONS = 4
+
+
+def slot_capacity(probnik: Probnik, school: Optional[str], exam_time: str) -> int:
+    """Вместимость слота (как в register_exam)"""
+    if school == "Байкальская" and probnik.slots_baikalskaya:
+        return probnik.slots_baikalskaya.get(exam_time, DEFAULT_SLOT_CAPACITY)
+    if school == "Лермонтова" and probnik.slots_lermontova:
+        return probnik.slots_lermontova.get(exam_time, DEFAULT_SLOT_CAPACITY)
+    return DEFAULT_SLOT_CAPACITY
+
+
+def _slot_filter(model, probnik_id: int, school: Optional[str], exam_date: datetime, exam_time: str):
+    conditions = [
+        model.probnik_id == probnik_id,
+        model.exam_date == exam_date,
+        model.exam_time == exam_time,
+    ]
+    if school:
+        conditions.append(model.school == school)
+    return and_(*conditions)
+
+
+async def registered_count(db: AsyncSession, probnik_id: int, school: Optional[str],
+                           exam_date: datetime, exam_time: str) -> int:
+    result = await db.execute(
+        select(func.count(ExamRegistration.id))
+        .where(_slot_filter(ExamRegistration, probnik_id, school, exam_date, exam_time))
+    )
+    return result.scalar_one()
+
+
+async def queue_position(db: AsyncSession, entry: WaitlistEntry) -> int:
+    """Позиция в очереди слота (1 — следующий на место)"""
+    result = await db.execute(
+        select(func.count(WaitlistEntry.id)).where(
+            WaitlistEntry.probnik_id == entry.probnik_id,
+            WaitlistEntry.school == entry.school,
+            WaitlistEntry.exam_date == entry.exam_date,
+            WaitlistEntry.exam_time == entry.exam_time,
+            WaitlistEntry.id <= entry.id
+        )
+    )
+    return result.scalar_one()
+
+
+async def can_register(db: AsyncSession, entry: WaitlistEntry, probnik: Probnik) -> bool:
+    """Ученик все еще может занять место: нет такой же записи и не превышен лимит экзаменов"""
+    max_registrations = probnik.max_registrations if probnik.max_registrations is not None else DEFAULT_MAX_REGISTRATIONS
+    result = await db.execute(
+        select(
+            func.count(ExamRegistration.id),
+            func.count(ExamRegistration.id).filter(
+                ExamRegistration.exam_date == entry.exam_date,
+                ExamRegistration.exam_time == entry.exam_time
+            )
+        ).where(
+            ExamRegistration.student_id == entry.student_id,
+            ExamRegistration.probnik_id == probnik.id
+        )
+    )
+    total, same_time = result.one()
+    return total < max_registrations and same_time == 0
+
+
+async def promote_slot(db: AsyncSession, probnik_id: int, school: Optional[str],
+                       exam_date: datetime, exam_time: str) -> List[ExamRegistration]:
+    """Переводит первых из очереди в записи, пока в слоте есть места. Commit — за вызывающим"""
+    probnik = await db.get(Probnik, probnik_id)
+    if not probnik or not probnik.is_active:
+        return []
+
+    free = slot_capacity(probnik, school, exam_time) - await registered_count(db, probnik_id, school, exam_date, exam_time)
+    promoted: List[ExamRegistration] = []
+    while free > 0:
+        result = await db.execute(
+            select(WaitlistEntry)
+            .where(
+                WaitlistEntry.probnik_id == probnik_id,
+                WaitlistEntry.school == school,
+                WaitlistEntry.exam_date == exam_date,
+                WaitlistEntry.exam_time == exam_time
+            )
+            .order_by(WaitlistEntry.id)
+            .limit(1)
+        )
+        entry = result.scalar_one_or_none()
+        if entry is None:
+            break
+        await db.delete(entry)
+        if not await can_register(db, entry, probnik):
+            # Ученик уже записался сам или набрал максимум — место достается следующему
+            continue
+        registration = ExamRegistration(
+            student_id=entry.student_id,
+            subject=entry.subject,
+            exam_date=entry.exam_date,
+            exam_time=entry.exam_time,
+            school=entry.school,
+            probnik_id=probnik_id
+        )
+        db.add(registration)
+        await db.flush()
+        promoted.append(registration)
+        free -= 1
+    if promoted:
+        logger.info(f"Из листа ожидания записано {len(promoted)} на {exam_date:%Y-%m-%d} {exam_time} ({school})")
+    return promoted
+
+
+async def promote_probnik(db: AsyncSession, probnik_id: int) -> List[ExamRegistration]:
+    """Перевод из очереди по всем слотам пробника (например, после увеличения вместимости)"""
+    result = await db.execute(
+        select(WaitlistEntry.school, WaitlistEntry.exam_date, WaitlistEntry.exam_time)
+        .where(WaitlistEntry.probnik_id == probnik_id)
+        .distinct()
+    )
+    promoted: List[ExamRegistration] = []
+    for school, exam_date, exam_time in result.all():
+        promoted.extend(await promote_slot(db, probnik_id, school, exam_date, exam_time))
+    return promoted
+
+
+async def publish_promoted(db: AsyncSession, promoted: List[ExamRegistration], action: str = "promoted"):
+    """После commit: напоминания и события для переведенных из очереди (бот уведомит учеников)"""
+    if not promoted:
+        return
+    result = await db.execute(
+        select(Student.id, Student.user_id).where(Student.id.in_({r.student_id for r in promoted}))
+    )
+    user_ids: Dict[int, Optional[int]] = dict(result.all())
+    for registration in promoted:
+        scheduled = await reminders.schedule_registration(db, registration)
+        events.publish_registration_changed(
+            registration, action,
+            user_id=user_ids.get(registration.student_id),
+            reminders=reminders.reminders_payload(scheduled)
+        )
+
+
+async def remove_student_entries(db: AsyncSession, student_id: int, probnik_id: int, subject: str,
+                                 exam_date: datetime, exam_time: str):
+    """Убирает ученика из очереди слота, если он записался сам"""
+    await db.execute(
+        delete(WaitlistEntry).where(
+            WaitlistEntry.student_id == student_id,
+            WaitlistEntry.probnik_id == probnik_id,
+            WaitlistEntry.subject == subject,
+            WaitlistEntry.exam_date == exam_date,
+            WaitlistEntry.exam_time == exam_time
+        )
+    )
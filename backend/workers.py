@@ -0,0 +1,35 @@
+"""
+Общий пул процессов для работы, которая грузит процессор (сборка XLSX,
+отрисовка отчетов): в процессе сервера она останавливала бы цикл событий.
+Пул создается при первом обращении и закрывается при остановке приложения.
+Процессы запускаются через spawn: при fork они унаследовали бы слушающий сокет
+и состояние цикла событий сервера.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "2"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=WORKER_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+async def run(func: Callable, *args):
+    """Выполняет func(*args) в пуле процессов (функция и аргументы должны сериализоваться)"""
+    return await asyncio.get_running_loop().run_in_executor(get_pool(), func, *args)
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
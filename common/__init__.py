@@ -0,0 +1,4 @@
+"""
+Код, общий для бэкенда и Telegram-бота. Каталог копируется в оба образа
+(/app/common); при локальном запуске корень репозитория должен быть в PYTHONPATH.
+"""
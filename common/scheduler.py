@@ -0,0 +1,314 @@
+"""
+Планировщик периодических задач внутри процесса (asyncio).
+
+- IntervalTrigger — каждые N секунд, CronTrigger — по cron-выражению
+  ("мин час день месяц день_недели", время UTC);
+- jitter — случайная задержка до N секунд перед запуском, чтобы задачи разных
+  процессов не стартовали одновременно;
+- у каждой задачи свой цикл: следующий запуск планируется только после окончания
+  текущего, поэтому медленный запуск не накладывается на следующий — пропущенные
+  за время работы запуски не догоняются, а считаются как skipped;
+- время последнего запуска сохраняется в хранилище состояния (JobStateStore),
+  поэтому после перезапуска процесса задача не запускается заново раньше срока;
+  если срок прошел, пока процесс не работал, задача выполняется один раз сразу.
+  Частым задачам (persist=False) срок после перезапуска безразличен — их состояние
+  не сохраняется, чтобы не писать в хранилище каждые несколько секунд;
+- длительность и результат каждого запуска передаются в on_run (метрики).
+
+Общий модуль бэкенда и бота (common/ копируется в оба образа).
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+JobFunc = Callable[[], Awaitable[None]]
+RunHook = Callable[[str, str, float], None]
+
+
+class IntervalTrigger:
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError("Интервал должен быть больше нуля")
+        self.interval = timedelta(seconds=seconds)
+
+    def first_fire(self, now: datetime) -> datetime:
+        return now
+
+    def next_fire(self, after: datetime) -> datetime:
+        return after + self.interval
+
+    def __repr__(self):
+        return f"every {self.interval.total_seconds():g}s"
+
+
+def _parse_cron_field(field: str, low: int, high: int) -> Set[int]:
+    values: Set[int] = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step <= 0:
+                raise ValueError(f"Некорректный шаг в cron: {field!r}")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end:
+            raise ValueError(f"Значение вне диапазона {low}-{high} в cron: {field!r}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronTrigger:
+    """Cron-выражение из 5 полей: минута, час, день месяца, месяц, день недели (0 и 7 — воскресенье)"""
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron-выражение должно содержать 5 полей: {expression!r}")
+        self.expression = expression
+        self.minutes = _parse_cron_field(fields[0], 0, 59)
+        self.hours = _parse_cron_field(fields[1], 0, 23)
+        self.days = _parse_cron_field(fields[2], 1, 31)
+        self.months = _parse_cron_field(fields[3], 1, 12)
+        weekdays = _parse_cron_field(fields[4], 0, 7)
+        # В cron 0 — воскресенье, в Python weekday() 6 — воскресенье
+        self.weekdays = {(day - 1) % 7 for day in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = moment.weekday() in self.weekdays
+        # Как в cron: если ограничены и день месяца, и день недели, достаточно одного
+        if not self.any_day and not self.any_weekday:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def first_fire(self, now: datetime) -> datetime:
+        return self.next_fire(now)
+
+    def next_fire(self, after: datetime) -> datetime:
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                year, month = (moment.year + 1, 1) if moment.month == 12 else (moment.year, moment.month + 1)
+                moment = moment.replace(year=year, month=month, day=1, hour=0, minute=0)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron-выражение никогда не срабатывает: {self.expression!r}")
+
+    def __repr__(self):
+        return f"cron {self.expression!r}"
+
+
+class Job:
+    def __init__(self, name: str, func: JobFunc, trigger, jitter: float = 0.0, persist: bool = True):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.jitter = jitter
+        self.persist = persist
+        self.running = False
+        self.next_run_at: Optional[datetime] = None
+        self.last_run_at: Optional[datetime] = None
+        self.last_success_at: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def state(self) -> Dict:
+        return {
+            "last_run_at": self.last_run_at,
+            "last_success_at": self.last_success_at,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+        }
+
+    def restore(self, state: Dict):
+        self.last_run_at = state.get("last_run_at")
+        self.last_success_at = state.get("last_success_at")
+        self.last_duration = state.get("last_duration")
+        self.last_error = state.get("last_error")
+
+
+class JobStateStore:
+    """Хранилище состояния задач в памяти (без сохранения между перезапусками)"""
+
+    async def load(self) -> Dict[str, Dict]:
+        return {}
+
+    async def save(self, name: str, state: Dict):
+        pass
+
+
+class JsonFileJobStateStore(JobStateStore):
+    """Состояние задач в JSON-файле"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._states: Dict[str, Dict] = {}
+
+    async def load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error(f"Не удалось прочитать состояние планировщика {self.path}: {e}")
+            return {}
+        for name, state in raw.items():
+            self._states[name] = {
+                key: datetime.fromisoformat(value) if key.endswith("_at") and value else value
+                for key, value in state.items()
+            }
+        return dict(self._states)
+
+    async def save(self, name: str, state: Dict):
+        self._states[name] = state
+        serializable = {
+            job_name: {key: value.isoformat() if isinstance(value, datetime) else value for key, value in job_state.items()}
+            for job_name, job_state in self._states.items()
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(serializable, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
+
+
+class Scheduler:
+    def __init__(self, store: Optional[JobStateStore] = None, on_run: Optional[RunHook] = None):
+        self.store = store or JobStateStore()
+        self.on_run = on_run
+        self.jobs: Dict[str, Job] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def add_job(self, name: str, func: JobFunc, trigger, jitter: float = 0.0, persist: bool = True) -> Job:
+        if name in self.jobs:
+            raise ValueError(f"Задача {name} уже зарегистрирована")
+        job = Job(name, func, trigger, jitter, persist)
+        self.jobs[name] = job
+        return job
+
+    async def start(self):
+        try:
+            states = await self.store.load()
+        except Exception:
+            logger.exception("Не удалось загрузить состояние планировщика")
+            states = {}
+        for job in self.jobs.values():
+            if job.name in states:
+                job.restore(states[job.name])
+            self._tasks.append(asyncio.create_task(self._job_loop(job), name=f"job:{job.name}"))
+        logger.info("Планировщик запущен: " + ", ".join(f"{job.name} ({job.trigger!r})" for job in self.jobs.values()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def _first_run_at(self, job: Job, now: datetime) -> datetime:
+        if job.last_run_at is None:
+            return job.trigger.first_fire(now)
+        # Срок прошел, пока процесс не работал, — один запуск сразу
+        return max(job.trigger.next_fire(job.last_run_at), now)
+
+    def _next_run_at(self, job: Job, started: datetime, now: datetime) -> datetime:
+        run_at = job.trigger.next_fire(started)
+        skipped = 0
+        while run_at <= now:
+            skipped += 1
+            run_at = job.trigger.next_fire(run_at)
+        if skipped:
+            logger.warning(f"Задача {job.name} работала дольше периода, пропущено запусков: {skipped}")
+            for _ in range(skipped):
+                self._report(job.name, "skipped", 0.0)
+        return run_at
+
+    async def _job_loop(self, job: Job):
+        run_at = self._first_run_at(job, datetime.utcnow())
+        while True:
+            job.next_run_at = run_at
+            delay = (run_at - datetime.utcnow()).total_seconds()
+            if job.jitter:
+                delay += random.uniform(0, job.jitter)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            started = datetime.utcnow()
+            await self.run_job(job)
+            run_at = self._next_run_at(job, started, datetime.utcnow())
+
+    async def run_job(self, job: Job) -> bool:
+        """Один запуск задачи (повторный вызов во время работы пропускается)"""
+        if job.running:
+            self._report(job.name, "skipped", 0.0)
+            return False
+        job.running = True
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        result = "success"
+        try:
+            await job.func()
+            job.last_error = None
+        except Exception as e:
+            result = "error"
+            job.last_error = f"{type(e).__name__}: {e}"
+            logger.exception(f"Ошибка в задаче {job.name}")
+        finally:
+            job.running = False
+            duration = time.perf_counter() - started
+            job.last_run_at = started_at
+            job.last_duration = duration
+            if result == "success":
+                job.last_success_at = started_at
+            self._report(job.name, result, duration)
+        if job.persist:
+            try:
+                await self.store.save(job.name, job.state())
+            except Exception:
+                logger.exception(f"Не удалось сохранить состояние задачи {job.name}")
+        return result == "success"
+
+    def _report(self, name: str, result: str, duration: float):
+        if self.on_run:
+            try:
+                self.on_run(name, result, duration)
+            except Exception:
+                logger.exception("Ошибка в обработчике метрик планировщика")
+
+    def describe(self) -> List[Dict]:
+        return [
+            {
+                "name": job.name,
+                "trigger": repr(job.trigger),
+                "running": job.running,
+                "next_run_at": job.next_run_at.isoformat() if job.next_run_at else None,
+                "last_run_at": job.last_run_at.isoformat() if job.last_run_at else None,
+                "last_success_at": job.last_success_at.isoformat() if job.last_success_at else None,
+                "last_duration": job.last_duration,
+                "last_error": job.last_error,
+            }
+            for job in self.jobs.values()
+        ]
@@ -3,6 +3,9 @@ import api from '../../services/api';
 import { getSubjectDisplayName, SUBJECT_TASKS } from '../../services/constants';
 import './RegistrationsView.css';
 
+// Максимум записей в одном запросе bulk-attendance (BulkAttendanceRequest.items на бэкенде)
+const BULK_ATTENDANCE_BATCH = 2000;
+
 const RegistrationsView = ({ showNotification }) => {
   const [registrations, setRegistrations] = useState([]);
   const [allRegistrations, setAllRegistrations] = useState([]); // Все загруженные записи (для фильтрации)
@@ -159,6 +162,40 @@ const RegistrationsView = ({ showNotification }) => {
     }
   };
 
+  // Отметка сразу для всех записей в таблице (например, всей аудитории): пачками по BULK_ATTENDANCE_BATCH
+  const handleBulkChange = async (field, value) => {
+    const items = registrations
+      .filter(reg => Boolean(reg[field]) !== value)
+      .map(reg => ({ id: reg.id, [field]: value }));
+    if (items.length === 0) return;
+    if (!value && !window.confirm(`Снять отметку у всех записей в таблице (${items.length})?`)) return;
+    let updated = 0;
+    try {
+      for (let start = 0; start < items.length; start += BULK_ATTENDANCE_BATCH) {
+        const response = await api.post('/exam-registrations/bulk-attendance', {
+          items: items.slice(start, start + BULK_ATTENDANCE_BATCH)
+        });
+        const changes = new Map(response.data.changes.map(change => [change.id, change]));
+        setRegistrations(prevRegs =>
+          prevRegs.map(reg => {
+            const change = changes.get(reg.id);
+            return change
+              ? { ...reg, attended: change.attended, submitted_work: change.submitted_work }
+              : reg;
+          })
+        );
+        updated += response.data.updated;
+      }
+      showNotification(`Обновлено записей: ${updated}`, 'success');
+    } catch (err) {
+      console.error('Ошибка массового обновления статуса:', err);
+      showNotification(
+        updated ? `Ошибка обновления статуса (успели обновить: ${updated})` : 'Ошибка обновления статуса',
+        'error'
+      );
+    }
+  };
+
   const formatDate = (dateStr) => {
     if (!dateStr) return '';
     try {
@@ -447,8 +484,30 @@ const RegistrationsView = ({ showNotification }) => {
                 <th>Время</th>
                 <th>Школа</th>
                 <th>Подтверждено</th>
-                <th>Пришел на экзамен</th>
-                <th>Сдал работу</th>
+                <th>
+                  <label className="checkbox-container" title="Отметить всех в таблице">
+                    <input
+                      type="checkbox"
+                      checked={registrations.length > 0 && registrations.every(reg => reg.attended)}
+                      disabled={registrations.length === 0}
+                      onChange={(e) => handleBulkChange('attended', e.target.checked)}
+                    />
+                    <span className="checkmark"></span>
+                  </label>
+                  Пришел на экзамен
+                </th>
+                <th>
+                  <label className="checkbox-container" title="Отметить всех в таблице">
+                    <input
+                      type="checkbox"
+                      checked={registrations.length > 0 && registrations.every(reg => reg.submitted_work)}
+                      disabled={registrations.length === 0}
+                      onChange={(e) => handleBulkChange('submitted_work', e.target.checked)}
+                    />
+                    <span className="checkmark"></span>
+                  </label>
+                  Сдал работу
+                </th>
               </tr>
             </thead>
             <tbody>
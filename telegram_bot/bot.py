@@ -1,6 +1,10 @@
 import asyncio
+import heapq
 import logging
+import math
 import os
+import random
+import time
 from datetime import datetime, timedelta
 from typing import Dict, Optional, List
 
@@ -19,6 +23,18 @@ from aiogram.types import (
     BotCommand
 )
 
+from bot_metrics import (
+    HandlerMetricsMiddleware,
+    TelegramRequestMetricsMiddleware,
+    add_collector,
+    observe_api_request,
+    record_broadcast,
+    record_job_run,
+    start_metrics_server,
+)
+from common.metrics import gauge_lines
+from common.scheduler import IntervalTrigger, JsonFileJobStateStore, Scheduler
+
 # Настройка логирования
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -29,6 +45,23 @@ logger = logging.getLogger(__name__)
 # URL API бэкенда (можно переопределить через переменную окружения)
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
 
+# Повторы запросов, на которые бэкенд ответил 429 (перегрузка при открытии записи)
+API_RETRY_ATTEMPTS = int(os.getenv("API_RETRY_ATTEMPTS", "3"))
+API_RETRY_MAX_DELAY = float(os.getenv("API_RETRY_MAX_DELAY", "10"))
+
+# Сколько секунд бэкенд держит запрос к ленте событий, если событий нет
+EVENTS_POLL_TIMEOUT = int(os.getenv("EVENTS_POLL_TIMEOUT", "25"))
+
+# Файл с временем последнего запуска периодических задач (чтобы перезапуск не повторял их раньше срока)
+SCHEDULER_STATE_FILE = os.getenv("SCHEDULER_STATE_FILE", "scheduler_state.json")
+
+# Сколько напоминаний забирать с бэкенда за раз и через сколько секунд повторять неудачные
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "50"))
+REMINDER_RETRY_SECONDS = int(os.getenv("REMINDER_RETRY_SECONDS", "300"))
+# Бэкенд отдает очередь только на ближайшие часы (REMINDER_PENDING_HORIZON_HOURS) —
+# перезагружаем ее чаще, чем проходит этот горизонт
+REMINDER_RELOAD_INTERVAL = int(os.getenv("REMINDER_RELOAD_INTERVAL", "3600"))
+
 # Кэш активного пробника
 active_probnik_cache: Optional[Dict] = None
 
@@ -59,6 +92,12 @@ last_probnik_active: bool = False
 # Отслеживание отправленных уведомлений reminder_24h (чтобы не отправлять повторно)
 sent_24h_notifications: Dict[int, datetime] = {}  # {user_id: timestamp}
 
+# Таймер напоминаний о записях: min-heap (due_at UTC, reminder_id).
+# Сама очередь хранится на бэкенде (/telegram/reminders), здесь — только ее копия для таймера
+reminder_heap: List[tuple] = []
+queued_reminder_ids: set = set()
+reminder_wakeup = asyncio.Event()
+
 
 async def get_active_probnik() -> Optional[Dict]:
     """Получение активного пробника из API"""
@@ -125,68 +164,41 @@ def get_exam_times_from_probnik(probnik: Dict, school: str = None, date: str = N
 
 async def make_api_request(method: str, endpoint: str, data: Optional[Dict] = None) -> Optional[Dict]:
     """Выполнение HTTP запроса к API"""
+    if method not in ("GET", "POST", "PUT", "DELETE"):
+        return None
     url = f"{API_BASE_URL}{endpoint}"
     async with aiohttp.ClientSession() as session:
-        try:
-            if method == "GET":
-                async with session.get(url) as response:
+        for attempt in range(API_RETRY_ATTEMPTS + 1):
+            status = "error"
+            started = time.perf_counter()
+            try:
+                async with session.request(method, url, json=data if method in ("POST", "PUT") else None) as response:
+                    status = response.status
                     if response.status == 200:
                         result = await response.json()
-                        logger.debug(f"API GET {endpoint}: {result}")
+                        logger.debug(f"API {method} {endpoint}: {result}")
                         return result
                     elif response.status == 404:
                         # 404 - не найдено, это нормально для некоторых запросов
-                        logger.debug(f"API GET {endpoint}: 404 Not Found")
-                        return None
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"API GET {endpoint} error: {response.status} - {error_text}")
-                        return None
-            elif method == "POST":
-                async with session.post(url, json=data) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        logger.debug(f"API POST {endpoint}: {result}")
-                        return result
-                    elif response.status == 404:
-                        logger.debug(f"API POST {endpoint}: 404 Not Found")
-                        return None
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"API POST {endpoint} error: {response.status} - {error_text}")
-                        return None
-            elif method == "PUT":
-                async with session.put(url, json=data) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        logger.debug(f"API PUT {endpoint}: {result}")
-                        return result
-                    elif response.status == 404:
-                        logger.debug(f"API PUT {endpoint}: 404 Not Found")
-                        return None
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"API PUT {endpoint} error: {response.status} - {error_text}")
-                        return None
-            elif method == "DELETE":
-                async with session.delete(url) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        logger.debug(f"API DELETE {endpoint}: {result}")
-                        return result
-                    elif response.status == 404:
-                        logger.debug(f"API DELETE {endpoint}: 404 Not Found")
+                        logger.debug(f"API {method} {endpoint}: 404 Not Found")
                         return None
+                    elif response.status == 429 and attempt < API_RETRY_ATTEMPTS:
+                        # Бэкенд перегружен (контроль допуска) — повторяем, когда он просит
+                        retry_after = min(float(response.headers.get("Retry-After", "1")), API_RETRY_MAX_DELAY)
+                        logger.warning(f"API {method} {endpoint}: 429, retry in {retry_after}s")
                     else:
                         error_text = await response.text()
-                        logger.error(f"API DELETE {endpoint} error: {response.status} - {error_text}")
+                        logger.error(f"API {method} {endpoint} error: {response.status} - {error_text}")
                         return None
-        except aiohttp.ClientError as e:
-            logger.error(f"API request connection error {endpoint}: {e}")
-            return None
-        except Exception as e:
-            logger.error(f"API request error {endpoint}: {e}")
-            return None
+            except aiohttp.ClientError as e:
+                logger.error(f"API request connection error {endpoint}: {e}")
+                return None
+            except Exception as e:
+                logger.error(f"API request error {endpoint}: {e}")
+                return None
+            finally:
+                observe_api_request(method, endpoint, status, time.perf_counter() - started)
+            await asyncio.sleep(retry_after + random.uniform(0, 0.5))
     return None
 
 
@@ -912,8 +924,8 @@ async def handle_date_selection(callback: CallbackQuery, state: FSMContext):
                 )])
             else:
                 keyboard.append([InlineKeyboardButton(
-                    text=f"{time} (занято)",
-                    callback_data="time_full"
+                    text=f"{time} (занято — встать в очередь)",
+                    callback_data=f"waitlist_{time}"
                 )])
     else:
         for time in exam_times:
@@ -1101,6 +1113,59 @@ async def handle_school_selection(callback: CallbackQuery, state: FSMContext):
     await state.set_state(RegistrationStates.waiting_for_date)
 
 
+async def handle_waitlist_join(callback: CallbackQuery, state: FSMContext):
+    """Встать в лист ожидания на занятое время"""
+    user_id = callback.from_user.id
+    
+    if not await ensure_user_data(user_id):
+        await callback.answer()
+        await callback.message.edit_text("Ошибка: студент не найден. Пожалуйста, начните регистрацию заново с команды /start")
+        await state.clear()
+        return
+    
+    time = callback.data.replace("waitlist_", "")
+    student_id = user_data[user_id].get("student_id")
+    subject = user_data[user_id].get("current_subject")
+    date = user_data[user_id].get("current_date")
+    school = user_data[user_id].get("current_school")
+    
+    if not student_id or not subject or not date or not school:
+        await callback.answer()
+        await callback.message.edit_text("Ошибка: неполные данные. Пожалуйста, начните регистрацию заново.")
+        await state.clear()
+        return
+    
+    result = await make_api_request("POST", "/telegram/waitlist", {
+        "student_id": student_id,
+        "subject": subject,
+        "exam_date": date,
+        "exam_time": time,
+        "school": school
+    })
+    
+    if not result:
+        await callback.answer(
+            "Не удалось встать в очередь: возможно, место уже освободилось. Выберите время еще раз.",
+            show_alert=True
+        )
+        return
+    
+    await callback.answer()
+    await callback.message.edit_text(
+        f"⏳ Вы в листе ожидания (место в очереди: {result['position']}):\n\n"
+        f"Предмет: {subject}\n"
+        f"Дата: {date}\n"
+        f"Время: {time}\n"
+        f"Школа: {school}\n\n"
+        "Как только место освободится, мы запишем вас автоматически и пришлем сообщение."
+    )
+    keyboard = [
+        [InlineKeyboardButton(text="◀️ Выбрать другое время", callback_data="back_to_dates")],
+        [InlineKeyboardButton(text="На главную", callback_data="back_to_start")]
+    ]
+    await callback.message.answer("Выберите действие:", reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard))
+
+
 async def handle_time_selection(callback: CallbackQuery, state: FSMContext):
     """Обработка выбора времени"""
     await callback.answer()
@@ -1179,8 +1244,8 @@ async def handle_time_selection(callback: CallbackQuery, state: FSMContext):
                             )])
                         else:
                             keyboard.append([InlineKeyboardButton(
-                                text=f"{time_option} (занято)",
-                                callback_data="time_full"
+                                text=f"{time_option} (занято — встать в очередь)",
+                                callback_data=f"waitlist_{time_option}"
                             )])
                 else:
                     for time_option in exam_times:
@@ -1198,6 +1263,12 @@ async def handle_time_selection(callback: CallbackQuery, state: FSMContext):
                 await callback.message.edit_text(message_text, reply_markup=reply_markup)
                 return
     
+    # В режиме лотереи места распределяет розыгрыш — подаем заявку вместо записи
+    probnik = active_probnik_cache or await get_active_probnik()
+    if probnik and probnik.get("lottery_ends_at") and not probnik.get("lottery_drawn_at"):
+        await submit_lottery_request(callback, state, probnik, student_id, subject, date, time, school)
+        return
+    
     # Регистрируем на экзамен
     result = await make_api_request("POST", "/telegram/register-exam", {
         "student_id": student_id,
@@ -1231,6 +1302,48 @@ async def handle_time_selection(callback: CallbackQuery, state: FSMContext):
     await state.set_state(RegistrationStates.waiting_for_subject)
 
 
+async def submit_lottery_request(callback: CallbackQuery, state: FSMContext, probnik: Dict,
+                                 student_id: int, subject: str, date: str, time: str, school: str):
+    """Заявка на место в окно лотереи"""
+    draw_at = datetime.fromisoformat(probnik["lottery_ends_at"])
+    if datetime.utcnow() >= draw_at:
+        await callback.message.edit_text(
+            "Прием заявок закончился, идет распределение мест. Итоги придут сообщением в течение минуты."
+        )
+        return
+    
+    result = await make_api_request("POST", "/telegram/lottery", {
+        "student_id": student_id,
+        "subject": subject,
+        "exam_date": date,
+        "exam_time": time,
+        "school": school
+    })
+    if not result:
+        await callback.message.edit_text(
+            "Не удалось подать заявку. Возможно, прием заявок закрыт или у вас уже есть заявка на это время."
+        )
+        return
+    
+    minutes = max(1, math.ceil((draw_at - datetime.utcnow()).total_seconds() / 60))
+    await callback.message.edit_text(
+        f"📝 Заявка принята:\n\n"
+        f"Предмет: {subject}\n"
+        f"Дата: {date}\n"
+        f"Время: {time}\n"
+        f"Школа: {school}\n\n"
+        f"Места распределяются розыгрышем через {minutes} мин. — неважно, кто подал заявку раньше. "
+        "Итоги придут сообщением.\n\n"
+        "Хотите подать заявку еще на один экзамен?"
+    )
+    keyboard = [
+        [InlineKeyboardButton(text="Да, записаться еще", callback_data="register_more")],
+        [InlineKeyboardButton(text="Нет, завершить", callback_data="finish_registration")]
+    ]
+    await callback.message.answer("Выберите действие:", reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard))
+    await state.set_state(RegistrationStates.waiting_for_subject)
+
+
 async def register_more_callback(callback: CallbackQuery, state: FSMContext):
     """Обработка кнопки 'Записаться еще'"""
     await callback.answer()
@@ -1651,18 +1764,8 @@ async def handle_edit_time_selection(callback: CallbackQuery, state: FSMContext)
         await state.clear()
         return
     
-    # Удаляем старую запись
-    delete_result = await make_api_request("DELETE", f"/telegram/registration/{registration_id}")
-    
-    if not delete_result:
-        await callback.message.edit_text("Ошибка при удалении старой записи.")
-        await state.clear()
-        return
-    
-    # Создаем новую запись
-    result = await make_api_request("POST", "/telegram/register-exam", {
-        "student_id": student_id,
-        "subject": subject,
+    # Переносим запись одной операцией: если новое место занято, старая запись остается
+    result = await make_api_request("POST", f"/telegram/registration/{registration_id}/move", {
         "exam_date": date,
         "exam_time": time,
         "school": school
@@ -1685,7 +1788,8 @@ async def handle_edit_time_selection(callback: CallbackQuery, state: FSMContext)
         await callback.message.answer("Выберите действие:", reply_markup=reply_markup)
     else:
         await callback.message.edit_text(
-            "Ошибка при создании новой записи. Возможно, все места заняты."
+            "Не удалось перенести запись. Возможно, все места на это время заняты — "
+            "ваша прежняя запись сохранена."
         )
     
     await state.clear()
@@ -1907,6 +2011,7 @@ async def send_notifications(bot: Bot):
     
     # Отправляем уведомления через 24 часа (не чаще раза в 24 часа)
     now = datetime.utcnow()
+    started, sent, failed = time.perf_counter(), 0, 0
     for notification in result.get("reminder_24h", []):
         user_id = notification["user_id"]
         # Проверяем, отправляли ли мы это уведомление в последние 24 часа
@@ -1921,11 +2026,56 @@ async def send_notifications(bot: Bot):
             )
             # Сохраняем время отправки
             sent_24h_notifications[user_id] = now
+            sent += 1
         except Exception as e:
+            failed += 1
             logger.error(f"Error sending 24h reminder: {e}")
+    record_broadcast("reminder_24h", sent, failed, time.perf_counter() - started)
+
+
+def schedule_reminder(reminder_id: int, due_at: datetime):
+    """Добавляет напоминание в таймер (повторное добавление того же id игнорируется)"""
+    if reminder_id in queued_reminder_ids:
+        return
+    queued_reminder_ids.add(reminder_id)
+    heapq.heappush(reminder_heap, (due_at, reminder_id))
+    # Новое напоминание раньше текущего ближайшего — будим таймер
+    if reminder_heap[0][1] == reminder_id:
+        reminder_wakeup.set()
+
+
+async def load_reminder_queue() -> bool:
+    """Загружает очередь напоминаний с бэкенда (при старте и после потери событий)"""
+    result = await make_api_request("GET", "/telegram/reminders/pending")
+    if result is None:
+        return False
+    reminder_heap.clear()
+    queued_reminder_ids.clear()
+    for reminder in result.get("reminders", []):
+        queued_reminder_ids.add(reminder["id"])
+        reminder_heap.append((datetime.fromisoformat(reminder["due_at"]), reminder["id"]))
+    heapq.heapify(reminder_heap)
+    reminder_wakeup.set()
+    logger.info(f"Reminder queue loaded: {len(reminder_heap)} reminders")
+    return True
+
+
+async def deliver_reminders(bot: Bot, reminder_ids: List[int]):
+    """Забирает пачку пришедших напоминаний на бэкенде, отправляет и подтверждает отправку"""
+    result = await make_api_request("POST", "/telegram/reminders/claim", {"ids": reminder_ids})
+    if result is None:
+        # Бэкенд недоступен — попробуем позже
+        retry_at = datetime.utcnow() + timedelta(seconds=REMINDER_RETRY_SECONDS)
+        for reminder_id in reminder_ids:
+            schedule_reminder(reminder_id, retry_at)
+        return
     
-    # Отправляем уведомления за 3 дня
-    for notification in result.get("reminder_3d", []):
+    sent: List[int] = []
+    failed: List[int] = []
+    started = time.perf_counter()
+    counts: Dict[str, List[int]] = {}
+    for notification in result.get("reminders", []):
+        kind_counts = counts.setdefault(notification["type"], [0, 0])
         try:
             keyboard = [
                 [
@@ -1942,29 +2092,50 @@ async def send_notifications(bot: Bot):
                 text=notification["message"],
                 reply_markup=reply_markup
             )
+            sent.append(notification["id"])
+            kind_counts[0] += 1
         except Exception as e:
-            logger.error(f"Error sending 3d reminder: {e}")
-    
-    # Отправляем уведомления за 1 день
-    for notification in result.get("reminder_1d", []):
+            failed.append(notification["id"])
+            kind_counts[1] += 1
+            logger.error(f"Error sending {notification['type']} reminder: {e}")
+    duration = time.perf_counter() - started
+    for kind, (kind_sent, kind_failed) in counts.items():
+        record_broadcast(kind, kind_sent, kind_failed, duration)
+    
+    if sent or failed:
+        await make_api_request("POST", "/telegram/reminders/ack", {"sent": sent, "failed": failed})
+    retry_at = datetime.utcnow() + timedelta(seconds=REMINDER_RETRY_SECONDS)
+    for reminder_id in failed:
+        schedule_reminder(reminder_id, retry_at)
+
+
+async def run_reminder_timer(bot: Bot):
+    """Таймер напоминаний: спит до ближайшего due_at в min-heap и отправляет пришедшие пачками"""
+    while True:
+        reminder_wakeup.clear()
+        timeout = None
+        if reminder_heap:
+            timeout = (reminder_heap[0][0] - datetime.utcnow()).total_seconds()
+        if timeout is None or timeout > 0:
+            try:
+                await asyncio.wait_for(reminder_wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        
+        now = datetime.utcnow()
+        due: List[int] = []
+        while reminder_heap and reminder_heap[0][0] <= now and len(due) < REMINDER_BATCH_SIZE:
+            _, reminder_id = heapq.heappop(reminder_heap)
+            queued_reminder_ids.discard(reminder_id)
+            due.append(reminder_id)
         try:
-            keyboard = [
-                [
-                    InlineKeyboardButton(
-                        text="Подтвердить участие",
-                        callback_data=f"confirm_{notification['registration_id']}"
-                    ),
-                    InlineKeyboardButton(text="Отменить", callback_data="cancel_participation")
-                ]
-            ]
-            reply_markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
-            await bot.send_message(
-                chat_id=notification["user_id"],
-                text=notification["message"],
-                reply_markup=reply_markup
-            )
+            await deliver_reminders(bot, due)
+            if not reminder_heap:
+                # Загруженная часть очереди кончилась — добираем следующую
+                await load_reminder_queue()
         except Exception as e:
-            logger.error(f"Error sending 1d reminder: {e}")
+            logger.error(f"Error delivering reminders: {e}")
 
 
 async def confirm_participation_callback(callback: CallbackQuery):
@@ -1981,83 +2152,192 @@ async def confirm_participation_callback(callback: CallbackQuery):
         await callback.message.edit_text("Ошибка при подтверждении участия.")
 
 
-async def periodic_notifications(bot: Bot):
-    """Периодическая отправка уведомлений"""
-    while True:
-        try:
-            await send_notifications(bot)
-        except Exception as e:
-            logger.error(f"Error in periodic notifications: {e}")
-        await asyncio.sleep(3600)  # Каждый час
+async def cleanup_sent_24h_notifications():
+    """Удаляет из кэша отметки об отправке reminder_24h старше суток (они больше ни на что не влияют)"""
+    border = datetime.utcnow() - timedelta(hours=24)
+    for user_id, sent_at in list(sent_24h_notifications.items()):
+        if sent_at < border:
+            del sent_24h_notifications[user_id]
+
 
+def create_scheduler(bot: Bot) -> Scheduler:
+    """Периодические задачи бота"""
+    scheduler = Scheduler(store=JsonFileJobStateStore(SCHEDULER_STATE_FILE), on_run=record_job_run)
+    scheduler.add_job("reminder_24h", lambda: send_notifications(bot), IntervalTrigger(3600), jitter=60)
+    scheduler.add_job("cleanup_sent_24h", cleanup_sent_24h_notifications, IntervalTrigger(3600))
+    scheduler.add_job("reload_reminder_queue", load_reminder_queue, IntervalTrigger(REMINDER_RELOAD_INTERVAL), jitter=60)
+    return scheduler
 
-async def check_probnik_activation(bot: Bot):
-    """Проверка активации пробника и отправка уведомлений"""
+
+async def announce_probnik_opened(bot: Bot, probnik: Dict):
+    """Рассылка об открытии записи всем пользователям с привязанным Telegram"""
+    logger.info("Probnik activated! Sending notifications...")
+    probnik_name = probnik.get("name", "Пробник")
+    lottery_note = ""
+    if probnik.get("lottery_ends_at") and not probnik.get("lottery_drawn_at"):
+        lottery_note = (
+            "Места распределяются розыгрышем среди заявок, поданных в первые минуты, — "
+            "спешить не нужно.\n\n"
+        )
+    
+    # Получаем всех пользователей с привязанным Telegram
+    users_result = await make_api_request("GET", "/telegram/users-with-telegram")
+    
+    if users_result and users_result.get("users"):
+        started, sent, failed = time.perf_counter(), 0, 0
+        for user_info in users_result["users"]:
+            user_id = user_info.get("user_id")
+            if user_id:
+                try:
+                    keyboard = [[InlineKeyboardButton(text="Записаться", callback_data="continue_registration")]]
+                    reply_markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
+                    
+                    await bot.send_message(
+                        chat_id=user_id,
+                        text=f"🎉 Открыта запись на {probnik_name}!\n\n" + lottery_note +
+                             f"Нажмите кнопку ниже, чтобы записаться на экзамен.",
+                        reply_markup=reply_markup
+                    )
+                    logger.info(f"Notification sent to user {user_id}")
+                    sent += 1
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"Failed to send notification to {user_id}: {e}")
+        record_broadcast("probnik_opened", sent, failed, time.perf_counter() - started)
+    
+    # Очищаем список ожидающих
+    waiting_for_registration.clear()
+
+
+async def sync_probnik_state(bot: Bot):
+    """Сверка с активным пробником на бэкенде (при старте и после потери событий)"""
     global last_probnik_active
     
-    while True:
-        try:
-            probnik = await get_active_probnik()
-            is_active = probnik is not None and probnik.get("is_active", False)
-            
-            # Если пробник только что стал активным
-            if is_active and not last_probnik_active:
-                logger.info("Probnik activated! Sending notifications...")
-                probnik_name = probnik.get("name", "Пробник")
-                
-                # Получаем всех пользователей с привязанным Telegram
-                users_result = await make_api_request("GET", "/telegram/users-with-telegram")
-                
-                if users_result and users_result.get("users"):
-                    for user_info in users_result["users"]:
-                        user_id = user_info.get("user_id")
-                        if user_id:
-                            try:
-                                keyboard = [[InlineKeyboardButton(text="Записаться", callback_data="continue_registration")]]
-                                reply_markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
-                                
-                                await bot.send_message(
-                                    chat_id=user_id,
-                                    text=f"🎉 Открыта запись на {probnik_name}!\n\n"
-                                         f"Нажмите кнопку ниже, чтобы записаться на экзамен.",
-                                    reply_markup=reply_markup
-                                )
-                                logger.info(f"Notification sent to user {user_id}")
-                            except Exception as e:
-                                logger.error(f"Failed to send notification to {user_id}: {e}")
-                
-                # Очищаем список ожидающих
-                waiting_for_registration.clear()
-            
-            last_probnik_active = is_active
-            
-        except Exception as e:
-            logger.error(f"Error checking probnik activation: {e}")
-        
-        await asyncio.sleep(30)  # Проверяем каждые 30 секунд
+    probnik = await get_active_probnik()
+    is_active = probnik is not None and probnik.get("is_active", False)
+    
+    # Если пробник стал активным, пока мы не получали события
+    if is_active and not last_probnik_active:
+        await announce_probnik_opened(bot, probnik)
+    
+    last_probnik_active = is_active
 
 
-async def main():
-    """Запуск бота"""
-    # Получаем токен из переменной окружения
-    token = os.getenv("TELEGRAM_BOT_TOKEN", "8542794827:AAEeNkKJ1CeWT1C09niCJOtmf9aX9zBza8M")
-    if not token:
-        logger.error("TELEGRAM_BOT_TOKEN не установлен!")
-        return
+async def handle_backend_event(bot: Bot, event: Dict):
+    """Обработка события из ленты бэкенда"""
+    global last_probnik_active, active_probnik_cache
     
-    # Создаем бота и диспетчер
-    bot = Bot(token=token)
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+    event_type = event.get("type")
+    data = event.get("data") or {}
     
-    # Устанавливаем команды меню (боковое меню)
-    try:
-        await bot.set_my_commands([
-            BotCommand(command="start", description="🔄 Обновить бота")
-        ])
-        logger.info("Команды меню установлены")
-    except Exception as e:
-        logger.error(f"Ошибка при установке команд меню: {e}")
+    if event_type == "probnik_activated":
+        probnik = await get_active_probnik()
+        if probnik and probnik.get("id") == data.get("probnik_id") and not last_probnik_active:
+            await announce_probnik_opened(bot, probnik)
+        last_probnik_active = probnik is not None
+    elif event_type == "probnik_deactivated":
+        if not active_probnik_cache or active_probnik_cache.get("id") == data.get("probnik_id"):
+            active_probnik_cache = None
+            last_probnik_active = False
+    elif event_type == "probnik_updated":
+        await get_active_probnik()
+    elif event_type == "registration_changed":
+        if data.get("action") in ("promoted", "lottery") and data.get("user_id"):
+            # Ученика записали из листа ожидания или по итогам розыгрыша
+            title = "🎉 Освободилось место!" if data["action"] == "promoted" else "🎉 Итоги розыгрыша мест:"
+            try:
+                await bot.send_message(
+                    chat_id=data["user_id"],
+                    text=(
+                        f"{title} Вы записаны на экзамен:\n\n"
+                        f"Предмет: {data.get('subject')}\n"
+                        f"Дата: {data.get('exam_date')}\n"
+                        f"Время: {data.get('exam_time')}\n"
+                        f"Школа: {data.get('school')}"
+                    )
+                )
+            except Exception as e:
+                logger.error(f"Error sending waitlist promotion to {data['user_id']}: {e}")
+        for reminder in data.get("reminders", []):
+            schedule_reminder(reminder["id"], datetime.fromisoformat(reminder["due_at"]))
+    elif event_type == "lottery_waitlisted":
+        if data.get("user_id"):
+            try:
+                await bot.send_message(
+                    chat_id=data["user_id"],
+                    text=(
+                        "Итоги розыгрыша мест: на это время мест не хватило.\n\n"
+                        f"Предмет: {data.get('subject')}\n"
+                        f"Дата: {data.get('exam_date')}\n"
+                        f"Время: {data.get('exam_time')}\n"
+                        f"Школа: {data.get('school')}\n\n"
+                        f"Вы в листе ожидания (место в очереди: {data.get('position')}). "
+                        "Если место освободится, мы запишем вас автоматически."
+                    )
+                )
+            except Exception as e:
+                logger.error(f"Error sending lottery result to {data['user_id']}: {e}")
+    else:
+        logger.debug(f"Backend event {event_type}: {data}")
+
+
+async def listen_probnik_events(bot: Bot):
+    """Подписка на ленту событий бэкенда (long-poll) вместо периодического опроса пробника"""
+    last_event_id: Optional[int] = None
+    retry_delay = 1
+    
+    while True:
+        endpoint = f"/telegram/events?timeout={EVENTS_POLL_TIMEOUT}"
+        if last_event_id is not None:
+            endpoint += f"&after={last_event_id}"
+        result = await make_api_request("GET", endpoint)
+        
+        if result is None:
+            # Бэкенд недоступен — переподключаемся с растущей паузой, продолжая с last_event_id
+            await asyncio.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, 60)
+            continue
+        retry_delay = 1
+        
+        try:
+            # reset — события до last_id потеряны (первое подключение, перезапуск бэкенда)
+            if result.get("reset"):
+                await sync_probnik_state(bot)
+                await load_reminder_queue()
+            for event in result.get("events", []):
+                await handle_backend_event(bot, event)
+        except Exception as e:
+            logger.error(f"Error handling backend events: {e}")
+        
+        last_event_id = result.get("last_id", last_event_id)
+
+
+def collect_state_metrics(storage: MemoryStorage):
+    """Коллектор метрик, которые считаются в момент опроса: состояния FSM и размеры кэшей"""
+    def collect() -> List[str]:
+        states: Dict[tuple, int] = {}
+        for record in list(storage.storage.values()):
+            key = (record.state or "none",)
+            states[key] = states.get(key, 0) + 1
+        lines = gauge_lines("bot_fsm_states", "Пользователи по состояниям FSM", states, ("state",))
+        lines += gauge_lines("bot_cache_entries", "Размер кэшей в памяти бота", {
+            ("user_data",): len(user_data),
+            ("waiting_for_registration",): len(waiting_for_registration),
+            ("sent_24h_notifications",): len(sent_24h_notifications),
+            ("reminder_queue",): len(reminder_heap),
+            ("active_probnik",): 1 if active_probnik_cache else 0,
+        }, ("cache",))
+        return lines
+    return collect
+
+
+def setup_dispatcher(dp: Dispatcher, bot: Bot, storage: MemoryStorage):
+    """Регистрация обработчиков и middleware (используется и в main, и в нагрузочном тесте)"""
+    # Метрики: время обработчиков, вызовов Telegram API и состояние FSM
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
+    bot.session.middleware(TelegramRequestMetricsMiddleware())
+    add_collector(collect_state_metrics(storage))
     
     # Регистрируем обработчики команд
     dp.message.register(start_command, CommandStart())
@@ -2078,6 +2358,7 @@ async def main():
     dp.callback_query.register(handle_date_selection, F.data.startswith("date_"))
     dp.callback_query.register(handle_school_selection, F.data.startswith("school_"))
     dp.callback_query.register(handle_time_already_booked, F.data == "time_already_booked")
+    dp.callback_query.register(handle_waitlist_join, F.data.startswith("waitlist_"))
     dp.callback_query.register(handle_time_selection, F.data.startswith("time_"))
     dp.callback_query.register(register_more_callback, F.data == "register_more")
     dp.callback_query.register(continue_registration_callback, F.data == "continue_registration")
@@ -2097,18 +2378,50 @@ async def main():
     
     # Регистрируем обработчики состояний
     dp.message.register(handle_fio, RegistrationStates.waiting_for_fio, F.text)
+
+
+async def main():
+    """Запуск бота"""
+    # Получаем токен из переменной окружения
+    token = os.getenv("TELEGRAM_BOT_TOKEN", "8542794827:AAEeNkKJ1CeWT1C09niCJOtmf9aX9zBza8M")
+    if not token:
+        logger.error("TELEGRAM_BOT_TOKEN не установлен!")
+        return
+    
+    # Создаем бота и диспетчер
+    bot = Bot(token=token)
+    storage = MemoryStorage()
+    dp = Dispatcher(storage=storage)
+    setup_dispatcher(dp, bot, storage)
+    metrics_runner = await start_metrics_server()
+    
+    # Устанавливаем команды меню (боковое меню)
+    try:
+        await bot.set_my_commands([
+            BotCommand(command="start", description="🔄 Обновить бота")
+        ])
+        logger.info("Команды меню установлены")
+    except Exception as e:
+        logger.error(f"Ошибка при установке команд меню: {e}")
+    
+    # Запускаем периодические задачи (напоминание через 24 часа и т.п.)
+    scheduler = create_scheduler(bot)
+    await scheduler.start()
     
-    # Запускаем периодическую отправку уведомлений
-    asyncio.create_task(periodic_notifications(bot))
+    # Подписываемся на события пробника (открытие записи и т.п.)
+    asyncio.create_task(listen_probnik_events(bot))
     
-    # Запускаем проверку активации пробника
-    asyncio.create_task(check_probnik_activation(bot))
+    # Запускаем таймер напоминаний о записях (очередь загружается при подключении к событиям)
+    asyncio.create_task(run_reminder_timer(bot))
     
     # Запускаем бота
     logger.info("Бот запущен...")
     try:
         await dp.start_polling(bot, allowed_updates=["message", "callback_query"])
     finally:
+        await scheduler.stop()
+        if metrics_runner:
+            await metrics_runner.cleanup()
         await bot.session.close()
 
 
@@ -0,0 +1,160 @@
+"""
+Метрики бота в формате Prometheus.
+
+- HandlerMetricsMiddleware — время и ошибки каждого обработчика aiogram,
+  состояние FSM, в котором пришло событие;
+- TelegramRequestMetricsMiddleware — время вызовов Telegram Bot API по методам;
+- observe_api_request — время запросов к бэкенду по шаблону эндпоинта;
+- record_broadcast — отправленные/неудачные сообщения рассылок;
+- record_job_run — запуски периодических задач планировщика;
+- start_metrics_server — маленький HTTP-сервер с /metrics.
+
+Реестр и типы метрик — в common/metrics.py (общий с бэкендом).
+"""
+import logging
+import os
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiohttp import web
+
+from common.metrics import Counter, Histogram, Registry
+
+logger = logging.getLogger(__name__)
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# 0 — не поднимать HTTP-сервер метрик
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9101"))
+
+# Числовые части пути и даты заменяем шаблоном, чтобы не плодить метки на каждый id
+_PATH_ID_RE = re.compile(r"/(\d{4}-\d{2}-\d{2}|-?\d+)(?=/|$)")
+
+registry = Registry()
+add_collector = registry.add_collector
+
+handler_duration_seconds = registry.register(Histogram(
+    "bot_handler_duration_seconds", "Время работы обработчика", ("handler",)
+))
+handler_errors_total = registry.register(Counter(
+    "bot_handler_errors_total", "Исключения в обработчиках", ("handler", "error")
+))
+handler_state_total = registry.register(Counter(
+    "bot_handler_updates_total", "События по обработчикам и состоянию FSM на входе", ("handler", "state")
+))
+api_request_duration_seconds = registry.register(Histogram(
+    "bot_api_request_duration_seconds", "Время запроса к бэкенду", ("method", "endpoint")
+))
+api_requests_total = registry.register(Counter(
+    "bot_api_requests_total", "Запросы к бэкенду по статусу ответа", ("method", "endpoint", "status")
+))
+telegram_request_duration_seconds = registry.register(Histogram(
+    "bot_telegram_request_duration_seconds", "Время вызова Telegram Bot API", ("method",)
+))
+telegram_request_errors_total = registry.register(Counter(
+    "bot_telegram_request_errors_total", "Ошибки вызовов Telegram Bot API", ("method", "error")
+))
+broadcast_messages_total = registry.register(Counter(
+    "bot_broadcast_messages_total", "Сообщения рассылок", ("kind", "result")
+))
+broadcast_duration_seconds = registry.register(Histogram(
+    "bot_broadcast_duration_seconds", "Длительность рассылки целиком", ("kind",),
+    buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+))
+scheduler_job_runs_total = registry.register(Counter(
+    "bot_scheduler_job_runs_total", "Запуски периодических задач", ("job", "result")
+))
+scheduler_job_duration_seconds = registry.register(Histogram(
+    "bot_scheduler_job_duration_seconds", "Длительность периодических задач", ("job",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+))
+
+
+def endpoint_template(endpoint: str) -> str:
+    """/telegram/student-registrations/15 -> /telegram/student-registrations/{id}"""
+    path = endpoint.split("?", 1)[0]
+    return _PATH_ID_RE.sub("/{id}", path)
+
+
+def observe_api_request(method: str, endpoint: str, status, duration: float):
+    template = endpoint_template(endpoint)
+    api_request_duration_seconds.observe(duration, method, template)
+    api_requests_total.inc(method, template, status)
+
+
+def record_broadcast(kind: str, sent: int, failed: int, duration: float):
+    if sent:
+        broadcast_messages_total.inc(kind, "sent", amount=sent)
+    if failed:
+        broadcast_messages_total.inc(kind, "failed", amount=failed)
+    broadcast_duration_seconds.observe(duration, kind)
+
+
+def record_job_run(job: str, result: str, duration: float):
+    """Обработчик on_run планировщика"""
+    scheduler_job_runs_total.inc(job, result)
+    if result != "skipped":
+        scheduler_job_duration_seconds.observe(duration, job)
+
+
+def _handler_name(data: Dict[str, Any]) -> str:
+    handler = data.get("handler")
+    callback = getattr(handler, "callback", None)
+    return getattr(callback, "__name__", "unknown")
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: вызывается только для событий, нашедших обработчик"""
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any]
+    ) -> Any:
+        name = _handler_name(data)
+        handler_state_total.inc(name, data.get("raw_state") or "none")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            handler_errors_total.inc(name, type(e).__name__)
+            raise
+        finally:
+            handler_duration_seconds.observe(time.perf_counter() - started, name)
+
+
+class TelegramRequestMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: время каждого вызова Bot API"""
+
+    async def __call__(self, make_request, bot, method):
+        name = getattr(method, "__api_method__", type(method).__name__)
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            telegram_request_errors_total.inc(name, type(e).__name__)
+            raise
+        finally:
+            telegram_request_duration_seconds.observe(time.perf_counter() - started, name)
+
+
+async def _metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=await registry.render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """Поднимает HTTP-сервер с /metrics. Возвращает runner (для остановки) или None"""
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
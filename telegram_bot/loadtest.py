@@ -0,0 +1,428 @@
+"""
+Нагрузочный тест бота: N учеников одновременно проходят запись на пробник.
+
+Синтетические апдейты Telegram подаются прямо в Dispatcher из bot.py
+(с теми же обработчиками и middleware), а вызовы Telegram Bot API уходят
+в заглушку StubTelegramSession, которая запоминает последнее сообщение
+каждого чата. Симулированный ученик читает это сообщение и нажимает
+кнопки: /start → предмет → школа → дата → время → «записаться еще»/«завершить».
+Бэкенд — настоящий, локальный (запущенный отдельно или через --start-backend).
+
+Отчет: задержка каждого шага (p50/p95/p99), число запросов к бэкенду на одну
+запись, вызовы Telegram API, ошибки и зависшие сценарии, переполнение слотов
+(записей больше вместимости) по данным бэкенда после теста.
+
+Пример:
+    python ../backend/generate_data.py --database-url sqlite+aiosqlite:////tmp/load.db --registrations 0
+    python loadtest.py --start-backend --database-url sqlite+aiosqlite:////tmp/load.db --students 300
+    python loadtest.py --backend-url http://127.0.0.1:8000 --students 100 --new-fraction 0.5
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import AsyncGenerator, Dict, List, Optional
+
+import aiohttp
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+# Порядок, в котором симулированный ученик предпочитает нажимать кнопки
+BUTTON_PRIORITY = [
+    "continue_registration", "register", "select_student_", "confirm_student", "class_",
+    "subject_", "school_", "date_", "time_",
+]
+SKIPPED_BUTTONS = ("subject_already_selected_", "time_full", "time_already_booked", "waitlist_")
+FIO_PROMPTS = ("введите вашу Фамилию", "введите Фамилию и Имя")
+SUCCESS_TEXT = "Вы успешно записались"
+REGISTER_FAILED_TEXT = "Ошибка при записи на экзамен"
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def step_name(data: str) -> str:
+    """time_9:00 -> time, select_student_5 -> select_student"""
+    for prefix in ["register_more", "finish_registration", "back_to_"] + BUTTON_PRIORITY:
+        if data.startswith(prefix):
+            return prefix.rstrip("_")
+    return data
+
+
+def make_stub_session_class():
+    from aiogram.client.session.base import BaseSession
+    from aiogram.methods import EditMessageText, SendMessage
+    from aiogram.types import Chat, Message, User
+
+    class StubTelegramSession(BaseSession):
+        """Сессия бота без сети: отвечает на вызовы Bot API и запоминает сообщения"""
+
+        def __init__(self, latency: float = 0.0):
+            super().__init__()
+            self.latency = latency
+            self.calls: Counter = Counter()
+            self.last_message: Dict[int, Message] = {}
+            self.last_keyboard: Dict[int, Message] = {}
+            self.history: Dict[int, List[str]] = defaultdict(list)
+            self._message_ids = itertools.count(1)
+            self._bot_user = User(id=1, is_bot=True, first_name="Бот")
+
+        def _remember(self, bot, chat_id: int, message_id: int, text: str, reply_markup) -> Message:
+            message = Message(
+                message_id=message_id,
+                date=datetime.now(),
+                chat=Chat(id=chat_id, type="private"),
+                from_user=self._bot_user,
+                text=text,
+                reply_markup=reply_markup,
+            ).as_(bot)
+            self.last_message[chat_id] = message
+            self.history[chat_id].append(text or "")
+            if reply_markup is not None:
+                self.last_keyboard[chat_id] = message
+            return message
+
+        async def make_request(self, bot, method, timeout=None):
+            self.calls[method.__api_method__] += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if isinstance(method, SendMessage):
+                return self._remember(bot, int(method.chat_id), next(self._message_ids),
+                                      method.text, method.reply_markup)
+            if isinstance(method, EditMessageText):
+                return self._remember(bot, int(method.chat_id), method.message_id,
+                                      method.text, method.reply_markup)
+            return True
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536,
+                                 raise_for_status=True) -> AsyncGenerator[bytes, None]:
+            # Метод абстрактный в BaseSession; файлов у заглушки нет — отдаем пустое содержимое
+            yield b""
+
+        async def close(self):
+            pass
+
+    return StubTelegramSession
+
+
+class LoadStats:
+    def __init__(self):
+        self.step_latencies: Dict[str, List[float]] = defaultdict(list)
+        self.outcomes: Counter = Counter()
+        self.registrations = 0
+        self.register_failures = 0
+        self.handler_errors: Counter = Counter()
+        self.restarts = 0
+        self.flow_seconds: List[float] = []
+
+
+class SimulatedStudent:
+    def __init__(self, telegram_id: int, student: dict, wanted: int, linked: bool, rng: random.Random):
+        self.telegram_id = telegram_id
+        self.student = student
+        self.wanted = wanted
+        self.linked = linked
+        self.rng = rng
+        self.registered = 0
+        self._update_ids = itertools.count(telegram_id * 1000)
+
+    def _user(self):
+        from aiogram.types import User
+        return User(id=self.telegram_id, is_bot=False, first_name=self.student["fio"].split()[-1])
+
+    def _message_update(self, bot, text: str):
+        from aiogram.types import Chat, Message, Update
+        message = Message(
+            message_id=next(self._update_ids),
+            date=datetime.now(),
+            chat=Chat(id=self.telegram_id, type="private"),
+            from_user=self._user(),
+            text=text,
+        )
+        return Update(update_id=next(self._update_ids), message=message)
+
+    def _callback_update(self, bot, message, data: str):
+        from aiogram.types import CallbackQuery, Update
+        callback = CallbackQuery(
+            id=str(next(self._update_ids)),
+            from_user=self._user(),
+            chat_instance=str(self.telegram_id),
+            message=message,
+            data=data,
+        )
+        return Update(update_id=next(self._update_ids), callback_query=callback)
+
+    def choose_button(self, message) -> Optional[str]:
+        buttons = [
+            button.callback_data
+            for row in message.reply_markup.inline_keyboard
+            for button in row
+            if button.callback_data
+        ]
+        if "register_more" in buttons:
+            return "register_more" if self.registered < self.wanted else "finish_registration"
+        if "finish_registration" in buttons and self.registered >= self.wanted:
+            return "finish_registration"
+        own = f"select_student_{self.student['id']}"
+        if own in buttons:
+            return own
+        for prefix in BUTTON_PRIORITY:
+            candidates = [b for b in buttons if b.startswith(prefix) and not b.startswith(SKIPPED_BUTTONS)]
+            if prefix == "class_":
+                candidates = [b for b in candidates if b == f"class_{self.student.get('class_num')}"] or candidates
+            if candidates:
+                return self.rng.choice(candidates)
+        # Все времена заняты — возвращаемся к выбору даты/школы
+        backs = [b for b in buttons if b.startswith("back_to_")]
+        if backs:
+            return self.rng.choice(backs)
+        if "finish_registration" in buttons:
+            return "finish_registration"
+        return None
+
+    async def run(self, dp, bot, session, stats: LoadStats, max_steps: int, max_restarts: int):
+        started = time.perf_counter()
+        restarts = 0
+        pending = ("start", self._message_update(bot, "/start"))
+        steps = 0
+        outcome = "stuck"
+
+        while pending and steps < max_steps:
+            name, update = pending
+            steps += 1
+            keyboard_before = session.last_keyboard.get(self.telegram_id)
+            history_before = len(session.history[self.telegram_id])
+            step_started = time.perf_counter()
+            try:
+                await dp.feed_update(bot, update)
+            except Exception as e:
+                stats.handler_errors[f"{name}: {type(e).__name__}"] += 1
+            stats.step_latencies[name].append((time.perf_counter() - step_started) * 1000)
+
+            last = session.last_message.get(self.telegram_id)
+            text = (last.text or "") if last else ""
+            if name == "time":
+                replies = "\n".join(session.history[self.telegram_id][history_before:])
+                if SUCCESS_TEXT in replies:
+                    self.registered += 1
+                    stats.registrations += 1
+                elif REGISTER_FAILED_TEXT in replies:
+                    stats.register_failures += 1
+
+            if name == "finish_registration":
+                outcome = "finished"
+                break
+
+            pending = None
+            if last and any(prompt in text for prompt in FIO_PROMPTS):
+                pending = ("fio", self._message_update(bot, self.student["fio"]))
+                continue
+
+            keyboard = session.last_keyboard.get(self.telegram_id)
+            if keyboard is not None and (keyboard is not keyboard_before or last is keyboard):
+                data = self.choose_button(keyboard)
+                if data:
+                    pending = (step_name(data), self._callback_update(bot, keyboard, data))
+                    continue
+
+            # Нет кнопок для продолжения (ошибка записи, лимит и т.п.) — начинаем заново с /start
+            if self.registered < self.wanted and restarts < max_restarts:
+                restarts += 1
+                stats.restarts += 1
+                pending = ("start", self._message_update(bot, "/start"))
+            elif self.registered >= self.wanted:
+                outcome = "finished"
+
+        stats.outcomes[outcome] += 1
+        stats.flow_seconds.append(time.perf_counter() - started)
+
+
+async def fetch_json(http: aiohttp.ClientSession, url: str):
+    async with http.get(url) as response:
+        response.raise_for_status()
+        return await response.json()
+
+
+async def check_overbooking(backend_url: str) -> List[str]:
+    """Слоты активного пробника, где записей больше вместимости"""
+    problems = []
+    async with aiohttp.ClientSession() as http:
+        probnik = await fetch_json(http, f"{backend_url}/telegram/active-probnik")
+        if not probnik:
+            return ["нет активного пробника"]
+        for school, key in (("Байкальская", "baikalskaya"), ("Лермонтова", "lermontova")):
+            capacities = probnik.get(f"slots_{key}") or {}
+            dates = probnik.get(f"exam_dates_{key}") or probnik.get("exam_dates") or []
+            for item in dates:
+                slots = await fetch_json(http, f"{backend_url}/telegram/available-slots/{item['date']}?school={school}")
+                for slot_time, info in slots.get("slots", {}).items():
+                    capacity = capacities.get(slot_time, 45)
+                    if info.get("registered", 0) > capacity:
+                        problems.append(f"{school} {item['date']} {slot_time}: {info['registered']}/{capacity}")
+    return problems
+
+
+async def load_students(backend_url: str) -> List[dict]:
+    async with aiohttp.ClientSession() as http:
+        students = await fetch_json(http, f"{backend_url}/students/")
+    return [s for s in students if s.get("class_num") in (9, 10, 11)]
+
+
+async def wait_for_backend(backend_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as http:
+        while True:
+            try:
+                async with http.get(f"{backend_url}/telegram/subjects/9") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            if time.monotonic() > deadline:
+                raise SystemExit(f"Бэкенд {backend_url} не отвечает")
+            await asyncio.sleep(0.3)
+
+
+def print_report(stats: LoadStats, api_calls: Counter, telegram_calls: Counter, overbooked: List[str], elapsed: float):
+    print(f"\nВремя теста: {elapsed:.1f} с")
+    print(f"{'шаг':<24} {'n':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for name, values in sorted(stats.step_latencies.items(), key=lambda item: -len(item[1])):
+        print(f"{name:<24} {len(values):>6} {percentile(values, 50):>7.1f}мс {percentile(values, 95):>7.1f}мс "
+              f"{percentile(values, 99):>7.1f}мс {max(values):>7.1f}мс")
+
+    flows = stats.flow_seconds
+    print(f"\nСценарии: {dict(stats.outcomes)}; полный сценарий p50={percentile(flows, 50):.2f} с, "
+          f"p95={percentile(flows, 95):.2f} с")
+    print(f"Записей: {stats.registrations}, неудачных попыток записи: {stats.register_failures}, "
+          f"перезапусков /start: {stats.restarts}")
+    if stats.handler_errors:
+        print(f"Исключения в обработчиках: {dict(stats.handler_errors)}")
+
+    total_api = sum(api_calls.values())
+    per_registration = total_api / stats.registrations if stats.registrations else 0
+    print(f"\nЗапросов к бэкенду: {total_api} ({per_registration:.1f} на запись)")
+    for (method, endpoint, status), count in api_calls.most_common(12):
+        print(f"  {count:>7}  {method} {endpoint} [{status}]")
+    print(f"Вызовов Telegram API: {sum(telegram_calls.values())} {dict(telegram_calls)}")
+
+    if overbooked:
+        print(f"\nПЕРЕПОЛНЕНИЕ СЛОТОВ ({len(overbooked)}):")
+        for line in overbooked:
+            print(f"  {line}")
+    else:
+        print("\nПереполненных слотов нет")
+
+
+async def run(args) -> int:
+    os.environ["API_BASE_URL"] = args.backend_url
+    os.environ.setdefault("METRICS_PORT", "0")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    from aiogram import Bot, Dispatcher
+    from aiogram.fsm.storage.memory import MemoryStorage
+
+    import bot as bot_module
+    import bot_metrics
+
+    await wait_for_backend(args.backend_url)
+    rng = random.Random(args.seed)
+    students = await load_students(args.backend_url)
+    if not students:
+        raise SystemExit("В базе нет учеников с классом — заполните ее через generate_data.py")
+
+    chosen = rng.sample(students, min(args.students, len(students)))
+    simulated = []
+    for index, student in enumerate(chosen):
+        linked = bool(student.get("user_id")) and rng.random() >= args.new_fraction
+        # Новые пользователи получают telegram id, которого нет в базе, и проходят поиск по ФИО
+        telegram_id = student["user_id"] if linked else 900_000_000 + index
+        simulated.append(SimulatedStudent(telegram_id, student, rng.randint(1, args.max_exams), linked, rng))
+
+    session = make_stub_session_class()(latency=args.telegram_latency)
+    bot = Bot(token="42:LOADTEST", session=session)
+    storage = MemoryStorage()
+    dp = Dispatcher(storage=storage)
+    bot_module.setup_dispatcher(dp, bot, storage)
+
+    stats = LoadStats()
+    api_before = Counter(bot_metrics.api_requests_total._values)
+    started = time.perf_counter()
+
+    async def launch(student: SimulatedStudent, delay: float):
+        if delay:
+            await asyncio.sleep(delay)
+        await student.run(dp, bot, session, stats, args.max_steps, args.max_restarts)
+
+    await asyncio.gather(*(
+        launch(student, args.ramp * i / max(1, len(simulated)))
+        for i, student in enumerate(simulated)
+    ))
+    elapsed = time.perf_counter() - started
+
+    api_calls = Counter(bot_metrics.api_requests_total._values)
+    api_calls.subtract(api_before)
+    api_calls = Counter({key: value for key, value in api_calls.items() if value > 0})
+    overbooked = await check_overbooking(args.backend_url)
+    print_report(stats, api_calls, session.calls, overbooked, elapsed)
+    await bot.session.close()
+    return 1 if overbooked else 0
+
+
+def start_backend(database_url: str, port: int) -> subprocess.Popen:
+    env = dict(os.environ, DATABASE_URL=database_url, SLOW_QUERY_MS=os.getenv("SLOW_QUERY_MS", "1000"))
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+        stdout=subprocess.DEVNULL if not os.getenv("LOADTEST_BACKEND_LOGS") else None,
+        stderr=None if os.getenv("LOADTEST_BACKEND_LOGS") else subprocess.DEVNULL,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--start-backend", action="store_true", help="Запустить бэкенд (uvicorn) на --database-url")
+    parser.add_argument("--database-url", help="База для --start-backend (заполненная generate_data.py)")
+    parser.add_argument("--port", type=int, default=8765, help="Порт для --start-backend")
+    parser.add_argument("--students", type=int, default=100, help="Одновременных учеников")
+    parser.add_argument("--new-fraction", type=float, default=0.3,
+                        help="Доля учеников, впервые пришедших в бота (поиск по ФИО)")
+    parser.add_argument("--max-exams", type=int, default=3, help="Ученик хочет записаться на 1..N экзаменов")
+    parser.add_argument("--ramp", type=float, default=0.0, help="Растянуть старт учеников на N секунд")
+    parser.add_argument("--telegram-latency", type=float, default=0.0,
+                        help="Искусственная задержка каждого вызова Telegram API, с")
+    parser.add_argument("--max-steps", type=int, default=60, help="Максимум шагов на ученика")
+    parser.add_argument("--max-restarts", type=int, default=2, help="Сколько раз ученик начинает заново")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    backend = None
+    if args.start_backend:
+        if not args.database_url:
+            parser.error("--start-backend требует --database-url")
+        backend = start_backend(args.database_url, args.port)
+        args.backend_url = f"http://127.0.0.1:{args.port}"
+    try:
+        code = asyncio.run(run(args))
+    finally:
+        if backend:
+            backend.terminate()
+            backend.wait(timeout=10)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()